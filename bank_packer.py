@@ -16,6 +16,7 @@ and ensures that entries 0..N-1 always address N distinct physical banks,
 regardless of which memory expansion is installed.
 """
 
+import time
 import logging
 from dataclasses import dataclass, field
 from typing import List, Dict, Optional, Tuple
@@ -97,19 +98,46 @@ class BankPackResult:
     placements: Dict[int, InstrumentPlacement] = field(default_factory=dict)
     bank_utilization: List[float] = field(default_factory=list)  # 0.0-1.0 per bank
     bank_has_codebook: List[bool] = field(default_factory=list)  # per bank
+    bank_codebook_bytes: List[int] = field(default_factory=list)  # per bank ($4000 reserve)
     bank_seq: List[int] = field(default_factory=list)  # Flat PORTB sequence
     total_size: int = 0
     error: str = ""
+    # Set by optimal packing: bank count no packing can beat, and whether
+    # the search proved n_banks_used optimal within its time budget
+    lower_bound: int = 0
+    proven_optimal: bool = False
+    switch_cost: float = 0.0  # co-occurrence weight of instruments in different banks
 
     @property
     def success(self) -> bool:
         return self.error == ""
 
 
+def _page_align(n: int) -> int:
+    return (n + 255) & ~255
+
+
+@dataclass
+class _Bank:
+    """Packing state of one bank. Offsets are relative to its data area,
+    which starts after the codebook reservation (fixed only at the end)."""
+    is_vq: bool
+    reserve: int = 0          # codebook bytes at $4000
+    need: int = 0             # sum of member instruments' codebook needs
+    frozen: bool = False      # reserve fixed: holds a multi-bank chunk
+    used: int = 0             # data bytes including alignment padding
+    items: List[Tuple[int, int]] = field(default_factory=list)  # (inst, offset)
+
+
 def pack_into_banks(inst_sizes: List[Tuple[int, int]],
                     max_banks: int = 64,
                     codebook_size: int = 0,
-                    vq_instruments: Optional[set] = None) -> BankPackResult:
+                    vq_instruments: Optional[set] = None,
+                    inst_codebook_bytes: Optional[Dict[int, int]] = None,
+                    optimal: bool = False,
+                    time_budget: float = 1.0,
+                    cooccurrence: Optional[Dict[Tuple[int, int], float]] = None
+                    ) -> BankPackResult:
     """Pack instrument data into 16KB banks.
     
     Two-phase packing when vq_instruments is provided:
@@ -127,6 +155,19 @@ def pack_into_banks(inst_sizes: List[Tuple[int, int]],
         vq_instruments: Set of instrument indices that are VQ-encoded.
                         If None or empty, all instruments treated as RAW
                         (no codebook overhead in any bank).
+        inst_codebook_bytes: Optional codebook bytes each VQ instrument
+                        needs (see bank_vq.codebook_need). A VQ bank then
+                        reserves the page-aligned sum of its members' needs,
+                        capped at codebook_size, instead of codebook_size.
+                        Banks of a multi-bank instrument share its reserve.
+        optimal: Search for a packing with fewer banks than first-fit-
+                 decreasing (branch-and-bound, see _pack_optimal). The
+                 result reports lower_bound and whether it is proven.
+        time_budget: Seconds the optimal search may take.
+        cooccurrence: {(inst_a, inst_b): weight} of instruments sounding
+                      together (see instrument_cooccurrence). With optimal,
+                      co-occurring instruments are moved into shared banks
+                      where the bank count allows.
     
     Returns:
         BankPackResult with placement info for each instrument.
@@ -150,14 +191,24 @@ def pack_into_banks(inst_sizes: List[Tuple[int, int]],
     vq_items = [(idx, sz) for idx, sz in active if idx in vq_instruments]
     raw_items = [(idx, sz) for idx, sz in active if idx not in vq_instruments]
     
-    # Effective capacities
-    vq_bank_size = BANK_SIZE - codebook_size if codebook_size > 0 else BANK_SIZE
-    raw_bank_size = BANK_SIZE
-    
-    if vq_bank_size <= 0:
+    if codebook_size > 0 and codebook_size >= BANK_SIZE:
         result.error = f"Codebook size ({codebook_size}) >= bank size ({BANK_SIZE})"
         return result
     
+    # Codebook bytes each VQ instrument needs in its bank(s)
+    needs = {}
+    for idx, _ in vq_items:
+        need = codebook_size
+        if inst_codebook_bytes is not None:
+            need = min(codebook_size, inst_codebook_bytes.get(idx, codebook_size))
+        needs[idx] = need
+    
+    # Effective capacities (VQ: smallest possible reservation, optimistic)
+    min_reserve = min((_reserve(codebook_size, n) for n in needs.values()),
+                      default=codebook_size)
+    vq_bank_size = BANK_SIZE - min_reserve
+    raw_bank_size = BANK_SIZE
+    
     # Quick capacity check (optimistic — no alignment waste)
     vq_total = sum(sz for _, sz in vq_items)
     raw_total = sum(sz for _, sz in raw_items)
@@ -170,34 +221,45 @@ def pack_into_banks(inst_sizes: List[Tuple[int, int]],
                        f"~{raw_banks_min * raw_bank_size // 1024}KB RAW capacity)")
         return result
     
-    # Phase 1: Pack VQ instruments (with codebook overhead)
-    # Sort by size descending (first-fit-decreasing)
-    vq_sorted = sorted(vq_items, key=lambda x: x[1], reverse=True)
-    banks = []  # [(remaining_bytes, next_free_offset, has_codebook)]
-    
-    for inst_idx, size in vq_sorted:
-        if not _do_pack_item(result, inst_idx, size, banks, max_banks,
-                             vq_bank_size, codebook_size, is_vq=True):
-            return result
-    
-    # Phase 2: Pack RAW instruments (no codebook overhead)
-    raw_sorted = sorted(raw_items, key=lambda x: x[1], reverse=True)
+    banks: List[_Bank] = []
+    placed = []  # (inst_idx, size, bank indices) in packing order
+    
+    packed = _pack_ffd(result, vq_items, raw_items, needs, codebook_size,
+                       max_banks, banks, placed)
+    if optimal:
+        solved, result.lower_bound, result.proven_optimal = _pack_optimal(
+            vq_items, raw_items, needs, codebook_size, max_banks,
+            banks if packed else None, time_budget, cooccurrence)
+        if solved is not None:
+            banks, placed = solved
+            result.error = ""
+            packed = True
+    if not packed:
+        return result
     
-    for inst_idx, size in raw_sorted:
-        if not _do_pack_item(result, inst_idx, size, banks, max_banks,
-                             raw_bank_size, 0, is_vq=False):
-            return result
+    # Reservations are final: fix addresses
+    for inst_idx, size, bank_indices in placed:
+        if len(bank_indices) == 1:
+            bank = banks[bank_indices[0]]
+            offset = dict(bank.items)[inst_idx]
+            _place_single(result, inst_idx, size, bank_indices[0],
+                          offset, bank.reserve)
+        else:
+            _place_multi(result, inst_idx, size, bank_indices,
+                         banks[bank_indices[0]].reserve)
     
     # Compute utilization and bank metadata
     result.n_banks_used = len(banks)
-    result.bank_utilization = [
-        1.0 - (remaining / BANK_SIZE) for remaining, _, _ in banks
-    ]
-    result.bank_has_codebook = [has_cb for _, _, has_cb in banks]
+    result.bank_utilization = [(b.reserve + b.used) / BANK_SIZE for b in banks]
+    result.bank_has_codebook = [b.is_vq for b in banks]
+    result.bank_codebook_bytes = [b.reserve if b.is_vq else 0 for b in banks]
     
     # Build flat PORTB sequence table
     _build_bank_seq(result)
     
+    if cooccurrence:
+        result.switch_cost = bank_switch_cost(result, cooccurrence)
+    
     logger.info(f"Packed {len(result.placements)} instruments into "
                 f"{result.n_banks_used} banks "
                 f"({result.total_size // 1024}KB total, "
@@ -207,37 +269,68 @@ def pack_into_banks(inst_sizes: List[Tuple[int, int]],
     return result
 
 
+def _pack_ffd(result, vq_items, raw_items, needs, codebook_size, max_banks,
+              banks, placed) -> bool:
+    """First-fit-decreasing in two phases. Returns False (result.error set)
+    if the items do not fit in max_banks."""
+    # Phase 1: Pack VQ instruments (with codebook overhead)
+    # Sort by size descending (first-fit-decreasing)
+    vq_sorted = sorted(vq_items, key=lambda x: x[1], reverse=True)
+    for inst_idx, size in vq_sorted:
+        if not _do_pack_item(result, inst_idx, size, banks, max_banks,
+                             codebook_size, needs[inst_idx], True, placed):
+            return False
+    
+    # Phase 2: Pack RAW instruments (no codebook overhead)
+    raw_sorted = sorted(raw_items, key=lambda x: x[1], reverse=True)
+    for inst_idx, size in raw_sorted:
+        if not _do_pack_item(result, inst_idx, size, banks, max_banks,
+                             0, 0, False, placed):
+            return False
+    return True
+
+
+def _reserve(codebook_size: int, need: int) -> int:
+    """Codebook reservation for a total need: whole pages, at most codebook_size."""
+    return min(codebook_size, _page_align(need))
+
+
 def _do_pack_item(result, inst_idx, size, banks, max_banks,
-                  effective_bank_size, codebook_offset, is_vq):
+                  codebook_size, need, is_vq, placed):
     """Pack one instrument. Returns True on success, False on failure (sets result.error)."""
+    own_reserve = _reserve(codebook_size, need) if is_vq else 0
+    effective_bank_size = BANK_SIZE - own_reserve
     n_banks_needed = (size + effective_bank_size - 1) // effective_bank_size
     
     if n_banks_needed == 1:
         # Single-bank: first-fit with page alignment (only in same-type banks)
-        placed = False
-        for bank_idx, (remaining, offset, has_cb) in enumerate(banks):
+        for bank_idx, bank in enumerate(banks):
             # Only place VQ in VQ banks, RAW in RAW banks
-            if has_cb != is_vq:
+            if bank.is_vq != is_vq:
                 continue
-            aligned_offset = (offset + 255) & ~255
-            waste = aligned_offset - offset
-            if remaining >= size + waste:
-                _place_single(result, inst_idx, size, bank_idx,
-                              aligned_offset, codebook_offset)
-                banks[bank_idx] = (remaining - size - waste,
-                                   aligned_offset + size, has_cb)
-                placed = True
-                break
+            reserve = _reserve(codebook_size, bank.need + need) if is_vq else 0
+            if bank.frozen:
+                # Multi-bank chunk: reservation cannot grow
+                if reserve > bank.reserve:
+                    continue
+                reserve = bank.reserve
+            aligned_offset = _page_align(bank.used)
+            if reserve + aligned_offset + size <= BANK_SIZE:
+                bank.reserve = reserve
+                bank.need += need
+                bank.used = aligned_offset + size
+                bank.items.append((inst_idx, aligned_offset))
+                placed.append((inst_idx, size, [bank_idx]))
+                return True
         
-        if not placed:
-            bank_idx = len(banks)
-            if bank_idx >= max_banks:
-                result.error = (f"Need more than {max_banks} banks. "
-                               f"Reduce samples or use VQ compression.")
-                return False
-            banks.append((effective_bank_size - size, size, is_vq))
-            _place_single(result, inst_idx, size, bank_idx, 0,
-                          codebook_offset)
+        bank_idx = len(banks)
+        if bank_idx >= max_banks:
+            result.error = (f"Need more than {max_banks} banks. "
+                           f"Reduce samples or use VQ compression.")
+            return False
+        banks.append(_Bank(is_vq=is_vq, reserve=own_reserve, need=need,
+                           used=size, items=[(inst_idx, 0)]))
+        placed.append((inst_idx, size, [bank_idx]))
     else:
         # Multi-bank: consecutive new banks
         start_bank = len(banks)
@@ -251,11 +344,11 @@ def _do_pack_item(result, inst_idx, size, banks, max_banks,
         remaining_size = size
         for i in range(n_banks_needed):
             chunk = min(remaining_size, effective_bank_size)
-            banks.append((effective_bank_size - chunk, chunk, is_vq))
+            banks.append(_Bank(is_vq=is_vq, reserve=own_reserve, need=need,
+                               frozen=True, used=chunk, items=[(inst_idx, 0)]))
             bank_indices.append(start_bank + i)
             remaining_size -= chunk
-        
-        _place_multi(result, inst_idx, size, bank_indices, codebook_offset)
+        placed.append((inst_idx, size, bank_indices))
     
     return True
 
@@ -313,6 +406,359 @@ def _place_multi(result: BankPackResult, inst_idx: int, size: int,
     )
 
 
+# =============================================================================
+# OPTIMAL PACKING
+# =============================================================================
+# Exact bin packing of the single-bank instruments of each bank type (VQ,
+# RAW never share a bank). Multi-bank instruments keep their consecutive
+# banks; the room left in their last bank is open like any other bank.
+#
+# Only a bank's member set matters: members start on page boundaries and
+# the one with the most padding goes last, so its data takes
+#     pinned + sum(page_align(size)) - max(page_align(size) - size)
+# bytes after a reservation of _reserve(sum of needs) (VQ banks).
+
+# Bank state: (pinned, pinned_size, sum_aligned, max_pad, need,
+#              frozen_reserve or -1, n_members). pinned is the page-aligned
+# multi-bank chunk at the start of the bank, pinned_size its length.
+_EMPTY_BIN = (0, 0, 0, 0, 0, -1, 0)
+
+_CHECK_EVERY = 1024  # search nodes between deadline checks
+
+
+class _Timeout(Exception):
+    pass
+
+
+def _bin_add(state, size, need, codebook_size, is_vq):
+    """Bank state with one more instrument, or None if it does not fit."""
+    pinned, pinned_size, sum_aligned, max_pad, bin_need, frozen, n = state
+    aligned = _page_align(size)
+    sum_aligned += aligned
+    max_pad = max(max_pad, aligned - size)
+    bin_need += need
+    reserve = _reserve(codebook_size, bin_need) if is_vq else 0
+    if frozen >= 0:
+        if reserve > frozen:
+            return None
+        reserve = frozen
+    if reserve + pinned + sum_aligned - max_pad > BANK_SIZE:
+        return None
+    return (pinned, pinned_size, sum_aligned, max_pad, bin_need, frozen, n + 1)
+
+
+def _bin_free(state, codebook_size, is_vq) -> int:
+    """Free bytes in a bank (optimistic: ignores padding and reserve growth)."""
+    pinned, pinned_size, sum_aligned, max_pad, need, frozen, n = state
+    if frozen >= 0:
+        reserve = frozen
+    else:
+        reserve = _reserve(codebook_size, need) if is_vq else 0
+    data = pinned + sum_aligned - max_pad if n else pinned_size
+    return BANK_SIZE - reserve - data
+
+
+class _BinSearch:
+    """Branch-and-bound over the banks of one type.
+
+    chains: multi-bank instruments [(inst, size, need, reserve, n_banks)]
+    items:  single-bank instruments [(inst, size, need)], largest first
+    """
+    
+    def __init__(self, items, needs, codebook_size, is_vq):
+        self.codebook_size = codebook_size if is_vq else 0
+        self.is_vq = is_vq
+        self.chains = []
+        self.items = []
+        for inst_idx, size in sorted(items, key=lambda x: (-x[1], x[0])):
+            need = needs.get(inst_idx, 0) if is_vq else 0
+            reserve = _reserve(self.codebook_size, need) if is_vq else 0
+            effective = BANK_SIZE - reserve
+            n_banks = (size + effective - 1) // effective
+            if n_banks == 1:
+                self.items.append((inst_idx, size, need))
+            else:
+                self.chains.append((inst_idx, size, need, reserve, n_banks))
+        
+        # Last bank of each chain: pinned tail chunk, frozen reservation
+        self.fixed = []
+        for inst_idx, size, need, reserve, n_banks in self.chains:
+            tail = size - (n_banks - 1) * (BANK_SIZE - reserve)
+            self.fixed.append((_page_align(tail), tail, 0, 0, need, reserve, 0))
+        self.n_chain_banks = sum(c[4] for c in self.chains)
+        
+        self.suffix = [0] * (len(self.items) + 1)
+        for k in range(len(self.items) - 1, -1, -1):
+            self.suffix[k] = self.suffix[k + 1] + self.items[k][1]
+        min_reserve = min((_reserve(self.codebook_size, need)
+                           for _, _, need in self.items), default=0)
+        self.capacity = BANK_SIZE - min_reserve
+        free = sum(_bin_free(b, self.codebook_size, is_vq) for b in self.fixed)
+        self.lower_new = -(-max(0, self.suffix[0] - free) // self.capacity)
+    
+    def _add(self, state, k):
+        _, size, need = self.items[k]
+        return _bin_add(state, size, need, self.codebook_size, self.is_vq)
+    
+    def solve(self, limit: int, deadline: float):
+        """Pack with fewer than limit new banks (besides the chains).
+        
+        Returns (assign, n_new, complete) -- assign[k] is the bank of
+        items[k] (fixed banks first) and complete is False if the deadline
+        cut the search short -- or None if no packing was found.
+        """
+        n_fixed = len(self.fixed)
+        n_items = len(self.items)
+        bins = list(self.fixed)
+        assign = [0] * n_items
+        best = {"n": limit, "assign": None}
+        nodes = [0]
+        
+        def free_total():
+            return sum(_bin_free(b, self.codebook_size, self.is_vq) for b in bins)
+        
+        def search(k):
+            nodes[0] += 1
+            if nodes[0] % _CHECK_EVERY == 0 and time.monotonic() > deadline:
+                raise _Timeout()
+            n_new = len(bins) - n_fixed
+            if k == n_items:
+                best["n"], best["assign"] = n_new, list(assign)
+                return n_new <= self.lower_new
+            short = max(0, self.suffix[k] - free_total())
+            if n_new + -(-short // self.capacity) >= best["n"]:
+                return False
+            seen = set()
+            for b, state in enumerate(bins):
+                if state in seen:
+                    continue
+                seen.add(state)
+                new_state = self._add(state, k)
+                if new_state is None:
+                    continue
+                bins[b] = new_state
+                assign[k] = b
+                done = search(k + 1)
+                bins[b] = state
+                if done:
+                    return True
+            if n_new + 1 < best["n"]:
+                bins.append(self._add(_EMPTY_BIN, k))
+                assign[k] = len(bins) - 1
+                done = search(k + 1)
+                bins.pop()
+                if done:
+                    return True
+            return False
+        
+        complete = True
+        try:
+            search(0)
+        except _Timeout:
+            complete = False
+        if best["assign"] is None:
+            return None
+        return best["assign"], best["n"], complete
+    
+    def bin_states(self, assign):
+        """Bank states for an assignment, None if a bank overflows."""
+        bins = list(self.fixed)
+        for k, b in enumerate(assign):
+            while b >= len(bins):
+                bins.append(_EMPTY_BIN)
+            bins[b] = self._add(bins[b], k)
+            if bins[b] is None:
+                return None
+        return bins
+
+
+def _improve_cooccurrence(search: _BinSearch, assign: List[int],
+                          cooccurrence: Dict[Tuple[int, int], float],
+                          max_passes: int = 50) -> List[int]:
+    """Move and swap instruments between banks while that lowers the
+    co-occurrence weight of instruments in different banks."""
+    if not search.items:
+        return assign
+    assign = list(assign)
+    insts = [item[0] for item in search.items]
+    
+    def weight(a, b):
+        return cooccurrence.get((a, b), 0) + cooccurrence.get((b, a), 0)
+    
+    def members(b):
+        found = [insts[k] for k, bk in enumerate(assign) if bk == b]
+        if b < len(search.chains):
+            found.append(search.chains[b][0])
+        return found
+    
+    def affinity(inst, b, exclude=()):
+        return sum(weight(inst, j) for j in members(b)
+                   if j != inst and j not in exclude)
+    
+    n_bins = max(len(search.fixed), max(assign) + 1)
+    for _ in range(max_passes):
+        improved = False
+        for k in range(len(assign)):
+            a = assign[k]
+            here = affinity(insts[k], a)
+            for b in range(n_bins):
+                if b == a or affinity(insts[k], b) <= here:
+                    continue
+                assign[k] = b
+                if search.bin_states(assign) is not None:
+                    improved = True
+                    break
+                assign[k] = a
+        for k in range(len(assign)):
+            for l in range(k + 1, len(assign)):
+                a, b = assign[k], assign[l]
+                if a == b:
+                    continue
+                i, j = insts[k], insts[l]
+                gain = (affinity(i, b, (j,)) - affinity(i, a)
+                        + affinity(j, a, (i,)) - affinity(j, b))
+                if gain <= 0:
+                    continue
+                assign[k], assign[l] = b, a
+                if search.bin_states(assign) is not None:
+                    improved = True
+                else:
+                    assign[k], assign[l] = a, b
+        if not improved:
+            break
+    
+    # Drop banks the moves emptied
+    used = sorted(set(assign) | set(range(len(search.fixed))))
+    remap = {b: n for n, b in enumerate(used)}
+    return [remap[b] for b in assign]
+
+
+def _layout_banks(search: _BinSearch, assign: List[int], banks: List[_Bank],
+                  placed: list):
+    """Append the banks of one type: chains first, then the other banks.
+    Members follow each other on page boundaries, most padding last."""
+    n_fixed = len(search.fixed)
+    n_bins = max([n_fixed - 1] + list(assign)) + 1
+    bank_of = {}
+    for c, (inst_idx, size, need, reserve, n_banks) in enumerate(search.chains):
+        indices = list(range(len(banks), len(banks) + n_banks))
+        for _ in range(n_banks):
+            banks.append(_Bank(is_vq=search.is_vq, reserve=reserve, need=need,
+                               frozen=True, used=BANK_SIZE - reserve,
+                               items=[(inst_idx, 0)]))
+        tail = size - (n_banks - 1) * (BANK_SIZE - reserve)
+        banks[-1].used = tail
+        bank_of[c] = len(banks) - 1
+        placed.append((inst_idx, size, indices))
+    for b in range(n_fixed, n_bins):
+        bank_of[b] = len(banks)
+        banks.append(_Bank(is_vq=search.is_vq))
+    
+    for b in range(n_bins):
+        bank = banks[bank_of[b]]
+        members = [search.items[k] for k, bk in enumerate(assign) if bk == b]
+        members.sort(key=lambda m: (_page_align(m[1]) - m[1], -m[1], m[0]))
+        offset = _page_align(bank.used) if b < n_fixed else 0
+        for inst_idx, size, need in members:
+            bank.need += need
+            bank.items.append((inst_idx, offset))
+            bank.used = offset + size
+            offset += _page_align(size)
+            placed.append((inst_idx, size, [bank_of[b]]))
+        if search.is_vq and not bank.frozen:
+            bank.reserve = _reserve(search.codebook_size, bank.need)
+
+
+def _pack_optimal(vq_items, raw_items, needs, codebook_size, max_banks,
+                  incumbent, time_budget, cooccurrence):
+    """Branch-and-bound bank packing, seeded with the first-fit-decreasing
+    packing (incumbent, or None if that failed).
+    
+    Returns ((banks, placed) or None, lower_bound, proven_optimal). None
+    means no packing as good as the incumbent was found in time.
+    """
+    start = time.monotonic()
+    searches = [_BinSearch(vq_items, needs, codebook_size, True),
+                _BinSearch(raw_items, needs, codebook_size, False)]
+    n_chain_banks = sum(s.n_chain_banks for s in searches)
+    lower_bound = n_chain_banks + sum(s.lower_new for s in searches)
+    if lower_bound > max_banks:
+        return None, lower_bound, True
+    
+    assigns = []
+    proven = True
+    spare = max_banks - n_chain_banks  # banks left for single instruments
+    for n, search in enumerate(searches):
+        if incumbent is not None:
+            n_type = sum(1 for b in incumbent if b.is_vq == search.is_vq)
+            limit = n_type - search.n_chain_banks + 1
+        else:
+            limit = spare - sum(s.lower_new for s in searches[n + 1:]) + 1
+        # The first type gets half the budget if the second has work to do
+        share = 0.5 if n == 0 and searches[1].items else 1.0
+        solved = search.solve(limit, start + time_budget * share)
+        if solved is None:
+            return None, lower_bound, False
+        assign, n_new, complete = solved
+        proven = proven and complete
+        spare -= n_new
+        if cooccurrence:
+            assign = _improve_cooccurrence(search, assign, cooccurrence)
+        assigns.append(assign)
+    
+    banks: List[_Bank] = []
+    placed = []
+    for search, assign in zip(searches, assigns):
+        _layout_banks(search, assign, banks, placed)
+    proven = proven or len(banks) == lower_bound
+    logger.info(f"Optimal packing: {len(banks)} banks, lower bound {lower_bound}"
+                + ("" if proven else " (search cut by time budget)"))
+    return (banks, placed), lower_bound, proven
+
+
+def bank_switch_cost(result: BankPackResult,
+                     cooccurrence: Dict[Tuple[int, int], float]) -> float:
+    """Co-occurrence weight of instrument pairs that share no bank."""
+    cost = 0.0
+    for (a, b), w in cooccurrence.items():
+        pa = result.placements.get(a)
+        pb = result.placements.get(b)
+        if pa is None or pb is None or a == b:
+            continue
+        if not set(pa.bank_indices) & set(pb.bank_indices):
+            cost += w
+    return cost
+
+
+def instrument_cooccurrence(song) -> Dict[Tuple[int, int], int]:
+    """Rows in which two instruments are held by different channels.
+    
+    Walks the song in order: a note sets its channel's instrument, note-off
+    clears it. Keys are (lower, higher) instrument index.
+    """
+    from constants import MAX_CHANNELS, NOTE_OFF
+    
+    counts: Dict[Tuple[int, int], int] = {}
+    ch_inst = [None] * MAX_CHANNELS
+    for sl in song.songlines:
+        patterns = [song.get_pattern(sl.patterns[ch] if ch < len(sl.patterns) else 0)
+                    for ch in range(MAX_CHANNELS)]
+        for row_idx in range(max(p.length for p in patterns)):
+            for ch, pat in enumerate(patterns):
+                if row_idx >= pat.length:
+                    continue
+                row = pat.rows[row_idx]
+                if row.note == NOTE_OFF:
+                    ch_inst[ch] = None
+                elif row.note > 0:
+                    ch_inst[ch] = row.instrument
+            held = sorted({i for i in ch_inst if i is not None})
+            for n, a in enumerate(held):
+                for b in held[n + 1:]:
+                    counts[(a, b)] = counts.get((a, b), 0) + 1
+    return counts
+
+
 def _build_bank_seq(result: BankPackResult):
     """Build the flat SAMPLE_BANK_SEQ table and per-instrument offsets."""
     seq = []
@@ -332,6 +778,7 @@ def generate_bank_asm(result: BankPackResult, n_instruments: int,
         result: BankPackResult from pack_into_banks
         n_instruments: Total number of instruments (including unused)
         codebook_bytes: Per-bank codebook size in bytes for VQ banks
+                        (result.bank_codebook_bytes takes precedence)
         vq_instruments: Set of VQ instrument indices
     
     Returns:
@@ -363,7 +810,12 @@ def generate_bank_asm(result: BankPackResult, n_instruments: int,
     raw_data_hi = BANK_BASE >> 8  # $40
     for i in range(n_instruments):
         if i in vq_instruments:
-            data_hi_vals.append(f"${vq_data_hi:02X}")
+            hi = vq_data_hi
+            if result.bank_codebook_bytes and i in result.placements:
+                # Per-bank codebook size: data follows this bank's codebook
+                start_bank = result.placements[i].start_bank
+                hi = (BANK_BASE + result.bank_codebook_bytes[start_bank]) >> 8
+            data_hi_vals.append(f"${hi:02X}")
         else:
             data_hi_vals.append(f"${raw_data_hi:02X}")
     lines.append("; Hi byte of data start in bank (per instrument)")
@@ -0,0 +1,380 @@
+"""Per-Bank VQ Codebooks — trains a codebook for each 16KB memory bank.
+
+In banking builds every VQ bank carries its own codebook at $4000.
+reencode_bank_vq() reconstructs a bank's audio vectors from the global
+codebook, trains the bank codebook with k-means and re-encodes the bank's
+indices against it.
+
+Codebooks need not be full 256-entry ones: codebook_need() picks, per
+instrument, the smallest page-sized codebook that re-encodes it above an
+SNR threshold, and the bank packer reserves only that much.
+
+Banks are independent, so train_banks() runs them in a process pool. Each
+bank seeds its own RandomState, which makes the result independent of
+scheduling: the parallel run is byte-identical to the serial one.
+
+The module itself imports no tracker modules. Under the spawn start
+method workers still re-import the __main__ module, which is why the
+frozen app calls freeze_support() in main.py.
+"""
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Below this many banks the pool start-up costs more than it saves
+MIN_PARALLEL_BANKS = 2
+
+
+def bank_volumes(bank_vq_indices: bytes, global_codebook, vec_size: int):
+    """Volume vectors (N, vec_size) float32 that a global-codebook index
+    stream plays, or None if the global codebook holds no full entry.
+
+    Entries past the global codebook's end reconstruct as zeros.
+    """
+    import numpy as np
+    
+    codebook_len = len(global_codebook)
+    if codebook_len < vec_size:
+        return None
+    # global_codebook is flat: entry i = global_codebook[i*vec_size : (i+1)*vec_size]
+    if isinstance(global_codebook, (bytes, bytearray, memoryview)):
+        flat = np.frombuffer(global_codebook, dtype=np.uint8)
+    else:
+        flat = np.asarray(global_codebook).astype(np.uint8)
+    n_entries = min(256, codebook_len // vec_size)
+    table = np.zeros((256, vec_size), dtype=np.uint8)
+    table[:n_entries] = flat[:n_entries * vec_size].reshape(n_entries, vec_size)
+    vectors = table[np.frombuffer(bank_vq_indices, dtype=np.uint8)]
+    # Strip AUDC $10 mask — work with volume nibbles (0-15) for k-means
+    return (vectors & 0x0F).astype(np.float32)
+
+
+def _train_codebook(volumes, n_codes: int, n_iter: int):
+    """(n_codes, vec_size) uint8 volume codebook for the given vectors.
+    
+    If near-silent vectors exist, codebook[0] is reserved for silence.
+    """
+    import numpy as np
+    
+    n_indices, vec_size = volumes.shape
+    
+    # Silence detection (adapted from stream player)
+    max_level = 15  # POKEY volume range 0-15
+    thresh = max(1, max_level // 15)  # ~1
+    if vec_size >= 16:
+        thresh = max(thresh, 2)
+    near_silent_mask = np.all(volumes <= thresh, axis=1)
+    n_near_silent = int(near_silent_mask.sum())
+    
+    if n_near_silent > 0 and n_near_silent < n_indices:
+        # Reserve codebook[0] for silence, train the rest on non-silent
+        non_silent = volumes[~near_silent_mask]
+        cb_rest = bank_kmeans(non_silent, n_codes - 1, n_iter, max_level)
+        
+        codebook_vol = np.zeros((n_codes, vec_size), dtype=np.float32)
+        codebook_vol[1:n_codes] = cb_rest[:n_codes - 1]
+    elif n_near_silent == n_indices:
+        # Entire bank is silent
+        codebook_vol = np.zeros((n_codes, vec_size), dtype=np.float32)
+    else:
+        # No silence — use all codes
+        codebook_vol = bank_kmeans(volumes, n_codes, n_iter, max_level)
+    
+    # Quantize codebook to integer volumes (0-15)
+    return np.clip(np.round(codebook_vol), 0, max_level).astype(np.uint8)
+
+
+def _assign(volumes, codebook_int):
+    """Index of the nearest codebook entry for each vector (uint8)."""
+    import numpy as np
+    
+    n_indices = len(volumes)
+    cb_f = codebook_int.astype(np.float32)
+    chunk_size = max(1, min(50000, n_indices))
+    assignments = np.empty(n_indices, dtype=np.uint8)
+    for s in range(0, n_indices, chunk_size):
+        e = min(s + chunk_size, n_indices)
+        d = np.sum((volumes[s:e, None, :] - cb_f[None, :, :]) ** 2, axis=2)
+        assignments[s:e] = np.argmin(d, axis=1).astype(np.uint8)
+    return assignments
+
+
+def reencode_bank_vq(bank_vq_indices: bytes, global_codebook: list,
+                     vec_size: int, n_iter: int = 20,
+                     n_codes: int = 256) -> tuple:
+    """Re-encode VQ index stream with a per-bank codebook.
+    
+    Takes the original indices (referencing the global codebook),
+    reconstructs the audio vectors, trains a bank-specific codebook of
+    n_codes entries via k-means, and re-encodes all vectors.
+    
+    If near-silent vectors exist, codebook[0] is reserved for silence.
+    
+    Args:
+        bank_vq_indices: Raw VQ index bytes from this bank
+        global_codebook: Global codebook as flat byte list
+                        (256 entries × vec_size bytes each)
+        vec_size: Samples per codebook vector (e.g. 4, 8)
+        n_iter: K-means iterations
+        n_codes: Codebook entries (1-256; see codebook_need)
+    
+    Returns:
+        (codebook_bytes, reencoded_indices) where:
+         codebook_bytes: n_codes * vec_size bytes (per-bank codebook, AUDC-ready)
+         reencoded_indices: bytes (same length as bank_vq_indices)
+    """
+    n_indices = len(bank_vq_indices)
+    
+    if n_indices == 0:
+        # Empty bank — return silence codebook ($10 = AUDC vol 0) + empty indices
+        return bytes([0x10] * (n_codes * vec_size)), b''
+    
+    volumes = bank_volumes(bank_vq_indices, global_codebook, vec_size)
+    if volumes is None:
+        # Codebook too small or empty — can't reconstruct vectors
+        logger.warning(f"Global codebook too small ({len(global_codebook)} bytes, "
+                       f"need {vec_size}+). Returning silence codebook.")
+        silence_cb = bytes([0x10] * (n_codes * vec_size))
+        # Map all indices to 0 (silence)
+        return silence_cb, bytes(n_indices)
+    
+    codebook_int = _train_codebook(volumes, n_codes, n_iter)
+    assignments = _assign(volumes, codebook_int)
+    
+    # Final codebook bytes with $10 AUDC mask
+    return (0x10 | codebook_int).tobytes(), assignments.tobytes()
+
+
+def snr_db(volumes, codebook_int, assignments) -> float:
+    """SNR (dB) of a re-encoding against the vectors it encodes.
+
+    Signal power is the AC power of the volumes; returns inf when the
+    encoding is exact.
+    """
+    import numpy as np
+    
+    if len(volumes) == 0:
+        return float("inf")
+    err = np.asarray(codebook_int, dtype=np.float64)[assignments] - volumes
+    noise = float(np.sum(err * err))
+    if noise == 0.0:
+        return float("inf")
+    signal = float(np.sum((volumes - volumes.mean()) ** 2))
+    return 10.0 * np.log10(max(signal, 1e-12) / noise)
+
+
+def codebook_need(stream: bytes, global_codebook, vec_size: int,
+                  min_snr_db: float, n_iter: int = 20,
+                  max_vectors: int = 16384) -> tuple:
+    """Rate-distortion choice of a codebook size for one instrument.
+
+    Candidate sizes are whole pages (256 // vec_size entries each) so that
+    a bank's data can start on the page after its codebook. The smallest
+    candidate whose re-encoding keeps an SNR of at least min_snr_db
+    against the global-codebook vectors is chosen; a full codebook needs
+    no check. Long streams are analysed on an evenly strided subset.
+
+    Returns:
+        (n_codes, snr_db) -- snr_db is inf for a lossless re-encoding
+    """
+    import numpy as np
+    
+    volumes = bank_volumes(stream, global_codebook, vec_size)
+    if volumes is None or len(volumes) == 0:
+        return 256, float("inf")
+    if len(volumes) > max_vectors:
+        volumes = volumes[np.linspace(0, len(volumes) - 1, max_vectors).astype(np.int64)]
+    
+    step = max(1, 256 // vec_size)
+    candidates = list(range(step, 256, step))
+    
+    # Binary search for the smallest acceptable candidate (SNR grows with k)
+    best, best_snr = 256, float("inf")
+    lo, hi = 0, len(candidates) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        cb = _train_codebook(volumes, candidates[mid], n_iter)
+        s = snr_db(volumes, cb, _assign(volumes, cb))
+        if s >= min_snr_db:
+            best, best_snr = candidates[mid], s
+            hi = mid - 1
+        else:
+            lo = mid + 1
+    return best, best_snr
+
+
+def bank_kmeans(vectors, n_codes, n_iter, max_level):
+    """K-means clustering for per-bank VQ codebook.
+    
+    Args:
+        vectors: (N, vec_size) float32 array of volume vectors
+        n_codes: Number of codebook entries to produce
+        n_iter: Max iterations
+        max_level: Maximum volume value (for clamping)
+    
+    Returns:
+        (n_codes, vec_size) float32 codebook
+    """
+    import numpy as np
+    
+    n_vecs, vec_size = vectors.shape
+    
+    if n_vecs == 0:
+        # No vectors to cluster — return silence codebook
+        return np.zeros((n_codes, vec_size), dtype=np.float32)
+    
+    vf = vectors.astype(np.float32)
+    
+    if n_vecs <= n_codes:
+        rng = np.random.RandomState(42)
+        codebook = np.zeros((n_codes, vec_size), dtype=np.float32)
+        codebook[:n_vecs] = vf
+        for i in range(n_vecs, n_codes):
+            codebook[i] = vf[rng.randint(n_vecs)]
+        return codebook
+    
+    # K-means++ init. dists holds each vector's squared distance to its
+    # nearest chosen centroid and is updated with the newest centroid only.
+    rng = np.random.RandomState(42)
+    indices = [rng.randint(n_vecs)]
+    dists = np.sum((vf - vf[indices[0]]) ** 2, axis=1)
+    for _ in range(1, min(n_codes, n_vecs)):
+        total = dists.sum()
+        if total < 1e-30:
+            probs = np.ones(n_vecs) / n_vecs
+        else:
+            probs = dists / total
+            probs = probs / probs.sum()
+        indices.append(rng.choice(n_vecs, p=probs))
+        np.minimum(dists, np.sum((vf - vf[indices[-1]]) ** 2, axis=1), out=dists)
+    
+    codebook = vf[indices].copy()
+    chunk_size = min(50000, n_vecs)
+    
+    for iteration in range(n_iter):
+        # Assign
+        assignments = np.empty(n_vecs, dtype=np.int32)
+        for s in range(0, n_vecs, chunk_size):
+            e = min(s + chunk_size, n_vecs)
+            d = np.sum((vf[s:e, None, :] - codebook[None, :, :]) ** 2, axis=2)
+            assignments[s:e] = np.argmin(d, axis=1)
+        
+        # Update centroids: members grouped by a stable sort keep their
+        # original order, so each float32 sum accumulates exactly like
+        # np.mean over the cluster's members would.
+        counts = np.bincount(assignments, minlength=n_codes)
+        used = np.flatnonzero(counts)
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[used]
+        sums = np.add.reduceat(vf[order], starts, axis=0)
+        new_cb = codebook.copy()
+        new_cb[used] = sums / counts[used, None].astype(np.float32)
+        
+        if np.allclose(new_cb, codebook, atol=0.01):
+            codebook = new_cb
+            break
+        codebook = new_cb
+    
+    return codebook
+
+
+def _train_one(bank_indices: bytes, global_codebook: bytes, vec_size: int,
+               n_codes: int = 256):
+    """Pool worker: (codebook_bytes, reencoded) or the exception raised."""
+    try:
+        return reencode_bank_vq(bank_indices, memoryview(global_codebook), vec_size,
+                                n_codes=n_codes)
+    except Exception as e:
+        return e
+
+
+def _need_one(stream: bytes, global_codebook: bytes, vec_size: int,
+              min_snr_db: float):
+    """Pool worker: codebook_need() result or the exception raised."""
+    try:
+        return codebook_need(stream, memoryview(global_codebook), vec_size, min_snr_db)
+    except Exception as e:
+        return e
+
+
+def _run_jobs(func, jobs: Dict[int, tuple], workers: Optional[int],
+              progress: Optional[Callable[[int, int, int], None]]) -> Dict:
+    """{key: func(*args)} for jobs {key: args}, on a process pool if worthwhile."""
+    order = sorted(jobs)
+    n_total = len(order)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, n_total)
+
+    results = {}
+    if workers > 1 and n_total >= MIN_PARALLEL_BANKS:
+        try:
+            import multiprocessing
+            # spawn: the build runs on a worker thread of the GUI process,
+            # where fork is unsafe
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                futures = {pool.submit(func, *jobs[k]): k for k in order}
+                for fut in as_completed(futures):
+                    k = futures[fut]
+                    results[k] = fut.result()
+                    if progress:
+                        progress(k, len(results), n_total)
+            return {k: results[k] for k in order}
+        except Exception as e:
+            # No usable pool (restricted environment, broken worker):
+            # finish the remaining jobs serially
+            logger.warning(f"Parallel bank training unavailable ({e}), "
+                           f"continuing serially")
+
+    for k in order:
+        if k not in results:
+            results[k] = func(*jobs[k])
+            if progress:
+                progress(k, len(results), n_total)
+    return {k: results[k] for k in order}
+
+
+def train_banks(bank_indices: Dict[int, bytes], global_codebook,
+                vec_size: int, n_codes: Optional[Dict[int, int]] = None,
+                workers: Optional[int] = None,
+                progress: Optional[Callable[[int, int, int], None]] = None) -> Dict:
+    """Train and re-encode several banks, in parallel when worthwhile.
+
+    Args:
+        bank_indices: {bank_idx: original VQ index bytes of that bank}
+        global_codebook: Global codebook (flat bytes-like)
+        vec_size: Samples per codebook vector
+        n_codes: {bank_idx: codebook entries} (default 256 for every bank)
+        workers: Process count (None = CPU count, 1 = serial)
+        progress: Called as progress(bank_idx, n_done, n_total) when each
+                  bank finishes (from the calling thread)
+
+    Returns:
+        {bank_idx: (codebook_bytes, reencoded) or Exception} for every
+        input bank. A failing bank does not stop the others.
+    """
+    global_codebook = bytes(global_codebook)  # memoryviews do not pickle
+    n_codes = n_codes or {}
+    jobs = {b: (bytes(data), global_codebook, vec_size, n_codes.get(b, 256))
+            for b, data in bank_indices.items()}
+    return _run_jobs(_train_one, jobs, workers, progress)
+
+
+def codebook_needs(streams: Dict[int, bytes], global_codebook,
+                   vec_size: int, min_snr_db: float,
+                   workers: Optional[int] = None,
+                   progress: Optional[Callable[[int, int, int], None]] = None) -> Dict:
+    """codebook_need() for several instruments, in parallel when worthwhile.
+
+    Returns:
+        {inst_idx: (n_codes, snr_db) or Exception}
+    """
+    global_codebook = bytes(global_codebook)
+    jobs = {i: (bytes(data), global_codebook, vec_size, min_snr_db)
+            for i, data in streams.items()}
+    return _run_jobs(_need_one, jobs, workers, progress)
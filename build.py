@@ -17,9 +17,33 @@ from data_model import Song, Pattern, Row
 from state import state
 from constants import MAX_INSTRUMENTS, MAX_VOLUME, MAX_NOTES, MAX_CHANNELS
 import runtime  # For path detection in bundled mode
+from bank_vq import train_banks, codebook_needs, bank_volumes, snr_db
+from build_cache import (BankVQCache, XEX_FILE, load_manifest, sync_build_dir,
+                         input_digest, cached_xex, record_xex)
 
 logger = logging.getLogger(__name__)
 
+# Bulk sample data (codebook, index streams, RAW blocks, bank images) goes
+# to .bin files pulled in with MADS `ins` instead of .byte text: nothing to
+# format, and MADS does not have to lex hundreds of thousands of tokens.
+# Set False to get readable .byte listings in the build directory.
+BINARY_DATA_INCLUDES = True
+
+# Processes for per-bank codebook training (None = one per CPU, 1 = serial)
+BANK_TRAIN_WORKERS = None
+
+# Per-bank codebook sizing: every VQ instrument gets the smallest codebook
+# (whole pages) that re-encodes its global-codebook vectors with at least
+# this SNR, and a bank reserves only what its instruments need. The space
+# freed at $4000 holds sample data. None = always reserve 256 entries.
+BANK_CODEBOOK_MIN_SNR_DB = 30.0
+
+# Bank packing: search for a packing with fewer banks than first-fit-
+# decreasing (bank_packer._pack_optimal) for at most this many seconds.
+# Among equal packings, instruments that play together share banks.
+BANK_PACK_OPTIMAL = True
+BANK_PACK_TIME_BUDGET = 2.0
+
 
 # =============================================================================
 # VALIDATION - Check song data before export
@@ -769,10 +793,32 @@ def _count_asm_bytes(filepath: str) -> int:
                 # .align $100 — worst case adds up to 255 bytes
                 # Average: 128 bytes per alignment directive
                 total += 128
+            elif lower.startswith('ins '):
+                total += _ins_size(stripped, os.path.dirname(filepath))
     
     return total
 
 
+def _ins_size(line: str, base_dir: str) -> int:
+    """Byte count of a MADS `ins 'file'[,offset[,length]]` line."""
+    parts = line[4:].split(',')
+    name = parts[0].strip().strip("'\"")
+    nums = []
+    for p in parts[1:]:
+        p = p.strip()
+        try:
+            nums.append(int(p[1:], 16) if p.startswith('$') else int(p))
+        except ValueError:
+            return 0
+    if len(nums) >= 2:
+        return nums[1]
+    try:
+        size = os.path.getsize(os.path.join(base_dir, name))
+    except OSError:
+        return 0
+    return max(0, size - (nums[0] if nums else 0))
+
+
 def _parse_asm_bytes(filepath: str) -> bytes:
     """Parse .byte directives from an ASM file and return raw binary data."""
     data = bytearray()
@@ -1018,180 +1064,6 @@ def _get_vec_size_from_cfg(vq_output_dir: str) -> int:
     return 8
 
 
-def _reencode_bank_vq(bank_vq_indices: bytes, global_codebook: list,
-                      vec_size: int, n_iter: int = 20) -> tuple:
-    """Re-encode VQ index stream with a per-bank codebook.
-    
-    Takes the original indices (referencing the global codebook),
-    reconstructs the audio vectors, trains a bank-specific 256-entry
-    codebook via k-means, and re-encodes all vectors.
-    
-    If near-silent vectors exist, codebook[0] is reserved for silence.
-    
-    Args:
-        bank_vq_indices: Raw VQ index bytes from this bank
-        global_codebook: Global codebook as flat byte list
-                        (256 entries × vec_size bytes each)
-        vec_size: Samples per codebook vector (e.g. 4, 8)
-        n_iter: K-means iterations
-    
-    Returns:
-        (codebook_bytes, reencoded_indices) where:
-         codebook_bytes: 256 * vec_size bytes (per-bank codebook, AUDC-ready)
-         reencoded_indices: bytes (same length as bank_vq_indices)
-    """
-    import numpy as np
-    
-    n_codes = 256
-    indices = np.frombuffer(bank_vq_indices, dtype=np.uint8)
-    n_indices = len(indices)
-    
-    if n_indices == 0:
-        # Empty bank — return silence codebook ($10 = AUDC vol 0) + empty indices
-        return bytes([0x10] * (n_codes * vec_size)), b''
-    
-    # Validate global codebook has enough data
-    codebook_len = len(global_codebook)
-    if codebook_len < vec_size:
-        # Codebook too small or empty — can't reconstruct vectors
-        logger.warning(f"Global codebook too small ({codebook_len} bytes, "
-                       f"need {vec_size}+). Returning silence codebook.")
-        silence_cb = bytes([0x10] * (n_codes * vec_size))
-        # Map all indices to 0 (silence)
-        return silence_cb, bytes(n_indices)
-    
-    # Reconstruct vectors from global codebook
-    # global_codebook is flat: entry i = global_codebook[i*vec_size : (i+1)*vec_size]
-    vectors = np.zeros((n_indices, vec_size), dtype=np.uint8)
-    for i, idx in enumerate(indices):
-        start = int(idx) * vec_size
-        end = start + vec_size
-        if end <= codebook_len:
-            entry = global_codebook[start:end]
-            # Defensive: verify we actually got vec_size bytes
-            if len(entry) == vec_size:
-                vectors[i] = entry
-            else:
-                vectors[i] = 0x10  # silence fallback
-    
-    # Strip AUDC $10 mask — work with volume nibbles (0-15) for k-means
-    volumes = (vectors & 0x0F).astype(np.float32)
-    
-    # Silence detection (adapted from stream player)
-    max_level = 15  # POKEY volume range 0-15
-    thresh = max(1, max_level // 15)  # ~1
-    if vec_size >= 16:
-        thresh = max(thresh, 2)
-    near_silent_mask = np.all(volumes <= thresh, axis=1)
-    n_near_silent = int(near_silent_mask.sum())
-    
-    if n_near_silent > 0 and n_near_silent < n_indices:
-        # Reserve codebook[0] for silence, train 255 entries on non-silent
-        non_silent = volumes[~near_silent_mask]
-        cb_rest = _bank_kmeans(non_silent, n_codes - 1, n_iter, max_level)
-        
-        codebook_vol = np.zeros((n_codes, vec_size), dtype=np.float32)
-        codebook_vol[1:n_codes] = cb_rest[:n_codes - 1]
-    elif n_near_silent == n_indices:
-        # Entire bank is silent
-        codebook_vol = np.zeros((n_codes, vec_size), dtype=np.float32)
-    else:
-        # No silence — use all 256 codes
-        codebook_vol = _bank_kmeans(volumes, n_codes, n_iter, max_level)
-    
-    # Quantize codebook to integer volumes (0-15)
-    codebook_int = np.clip(np.round(codebook_vol), 0, max_level).astype(np.uint8)
-    
-    # Re-encode: assign each vector to nearest codebook entry
-    cb_f = codebook_int.astype(np.float32)
-    chunk_size = min(50000, n_indices)
-    assignments = np.empty(n_indices, dtype=np.uint8)
-    for s in range(0, n_indices, chunk_size):
-        e = min(s + chunk_size, n_indices)
-        d = np.sum((volumes[s:e, None, :] - cb_f[None, :, :]) ** 2, axis=2)
-        assignments[s:e] = np.argmin(d, axis=1).astype(np.uint8)
-    
-    # Build final codebook bytes with $10 AUDC mask
-    codebook_bytes = bytearray(n_codes * vec_size)
-    for i in range(n_codes):
-        for j in range(vec_size):
-            codebook_bytes[i * vec_size + j] = 0x10 | codebook_int[i, j]
-    
-    return bytes(codebook_bytes), assignments.tobytes()
-
-
-def _bank_kmeans(vectors, n_codes, n_iter, max_level):
-    """K-means clustering for per-bank VQ codebook.
-    
-    Args:
-        vectors: (N, vec_size) float32 array of volume vectors
-        n_codes: Number of codebook entries to produce
-        n_iter: Max iterations
-        max_level: Maximum volume value (for clamping)
-    
-    Returns:
-        (n_codes, vec_size) float32 codebook
-    """
-    import numpy as np
-    
-    n_vecs, vec_size = vectors.shape
-    
-    if n_vecs == 0:
-        # No vectors to cluster — return silence codebook
-        return np.zeros((n_codes, vec_size), dtype=np.float32)
-    
-    vf = vectors.astype(np.float32)
-    
-    if n_vecs <= n_codes:
-        rng = np.random.RandomState(42)
-        codebook = np.zeros((n_codes, vec_size), dtype=np.float32)
-        codebook[:n_vecs] = vf
-        for i in range(n_vecs, n_codes):
-            codebook[i] = vf[rng.randint(n_vecs)]
-        return codebook
-    
-    # K-means++ init
-    rng = np.random.RandomState(42)
-    indices = [rng.randint(n_vecs)]
-    for _ in range(1, min(n_codes, n_vecs)):
-        cb_so_far = vf[indices]
-        dists = np.min(
-            np.sum((vf[:, None, :] - cb_so_far[None, :, :]) ** 2, axis=2),
-            axis=1)
-        total = dists.sum()
-        if total < 1e-30:
-            probs = np.ones(n_vecs) / n_vecs
-        else:
-            probs = dists / total
-            probs = probs / probs.sum()
-        indices.append(rng.choice(n_vecs, p=probs))
-    
-    codebook = vf[indices].copy()
-    chunk_size = min(50000, n_vecs)
-    
-    for iteration in range(n_iter):
-        # Assign
-        assignments = np.empty(n_vecs, dtype=np.int32)
-        for s in range(0, n_vecs, chunk_size):
-            e = min(s + chunk_size, n_vecs)
-            d = np.sum((vf[s:e, None, :] - codebook[None, :, :]) ** 2, axis=2)
-            assignments[s:e] = np.argmin(d, axis=1)
-        
-        # Update centroids
-        new_cb = codebook.copy()
-        for c in range(n_codes):
-            members = vf[assignments == c]
-            if len(members) > 0:
-                new_cb[c] = np.mean(members, axis=0)
-        
-        if np.allclose(new_cb, codebook, atol=0.01):
-            codebook = new_cb
-            break
-        codebook = new_cb
-    
-    return codebook
-
-
 def _generate_banking_vq_tables(build_dir: str, vec_size: int):
     """Generate VQ_LO.asm and VQ_HI.asm for banking mode.
     
@@ -1231,18 +1103,91 @@ def _generate_banking_vq_tables(build_dir: str, vec_size: int):
         f.write('\n'.join(lines))
 
 
+def _read_vq_container(vq_output_dir: str):
+    """Read VQ_DATA.bin written by the converter.
+    
+    Returns (codebook, vq_streams, raw_blocks) as memoryview slices of the
+    container (same contents as _parse_vq_blob / _extract_vq_streams /
+    _extract_raw_blocks), or None if there is no usable container.
+    """
+    try:
+        from pokey_vq.utils.vq_container import open_container
+    except ImportError:
+        return None
+    container = open_container(vq_output_dir)
+    if container is None:
+        return None
+    return container.codebook, container.vq_streams(), container.raw_blocks()
+
+
+def _emit_binary_vq_data(build_dir: str, vq_output_dir: str) -> List[str]:
+    """Write VQ_BLOB / VQ_INDICES / RAW_SAMPLES as .bin + `ins` wrappers.
+    
+    The wrappers define the same labels as the converter's .asm files
+    (VQ_BLOB, VQ_INDICES, RAW_INST_NN/_END with page alignment), so
+    SAMPLE_DIR.asm and VQ_LO/VQ_HI resolve unchanged.
+    
+    Returns the .asm names written, or [] if the converter output has no
+    VQ_DATA.bin container (the text files are copied instead).
+    """
+    try:
+        from pokey_vq.utils.vq_container import open_container
+        from pokey_vq.utils.asm_emit import ins_line, write_binary, write_asm
+    except ImportError:
+        return []
+    container = open_container(vq_output_dir)
+    if container is None:
+        return []
+    
+    with container:
+        write_binary(os.path.join(build_dir, "RAW_SAMPLES.bin"), container.section("raw"))
+        for label, section in (("VQ_BLOB", "codebook"), ("VQ_INDICES", "indices")):
+            data = container.section(section)
+            write_binary(os.path.join(build_dir, f"{label}.bin"), data)
+            lines = [f"{label}_LEN = {len(data)}", label]
+            if len(data):
+                lines.append(ins_line(f"{label}.bin"))
+            write_asm(os.path.join(build_dir, f"{label}.asm"), lines)
+        
+        lines = ["; RAW_SAMPLES.asm - Page-aligned sample data for RAW instruments",
+                 "; Data in RAW_SAMPLES.bin", ""]
+        raw_insts = [i for i in range(len(container.samples)) if container.is_raw(i)]
+        for i in raw_insts:
+            s = container.samples[i]
+            length = s.get("raw_length", 0)
+            lines.append(f"; Instrument {i} ({length // 256} pages)")
+            lines.append("    .align $100       ; page-align to 256 bytes")
+            lines.append(f"RAW_INST_{i:02d}")
+            if length:
+                lines.append(ins_line("RAW_SAMPLES.bin", s.get("raw_offset", 0), length))
+            lines.append(f"RAW_INST_{i:02d}_END")
+            lines.append("")
+        if not raw_insts:
+            lines.append("; (No RAW instruments - all use VQ)")
+        write_asm(os.path.join(build_dir, "RAW_SAMPLES.asm"), lines)
+    
+    return ["VQ_BLOB.asm", "VQ_INDICES.asm", "RAW_SAMPLES.asm"]
+
+
 def _generate_banking_build(build_dir: str, vq_output_dir: str,
-                            song: Song, output_func=None) -> Optional[str]:
+                            song: Song, output_func=None,
+                            binary: bool = None,
+                            bank_cache=None) -> Optional[str]:
     """Generate banking build files with per-bank VQ codebooks.
     
     Each bank stores its own 256-entry codebook at $4000, trained via
     k-means on that bank's audio content. This dramatically improves
     VQ quality vs. a single global codebook.
     
+    binary: write bank images as .bin + `ins` (default BINARY_DATA_INCLUDES).
+    bank_cache: optional build_cache.BankVQCache; banks whose content is
+        unchanged since the last build reuse the stored re-encoding.
+    
     Returns error message on failure, None on success.
     """
     from constants import MEMORY_CONFIGS
-    from bank_packer import pack_into_banks, generate_bank_asm, BANK_SIZE, BANK_BASE, DBANK_TABLE
+    from bank_packer import (pack_into_banks, generate_bank_asm, instrument_cooccurrence,
+                             BANK_SIZE, BANK_BASE, DBANK_TABLE)
     
     _out = output_func or _output
     
@@ -1260,28 +1205,34 @@ def _generate_banking_build(build_dir: str, vq_output_dir: str,
     codebook_size = 256 * vec_size  # bytes reserved at start of each bank
     _out(f"  Per-bank codebook: {codebook_size} bytes (vec_size={vec_size})\n")
     
-    # Parse global codebook from VQ_BLOB.asm (needed for per-bank re-encoding)
-    vq_blob_path = os.path.join(build_dir, "VQ_BLOB.asm")
-    global_codebook = _parse_vq_blob(vq_blob_path)
+    n_inst = len(song.instruments)
+    
+    # Binary container from the converter: no ASM parsing needed
+    container_data = _read_vq_container(vq_output_dir)
+    if container_data is not None:
+        global_codebook, vq_streams, raw_blocks = container_data
+        _out("  Sample data from VQ_DATA.bin\n")
+    else:
+        # Parse global codebook from VQ_BLOB.asm (needed for per-bank re-encoding)
+        vq_blob_path = os.path.join(build_dir, "VQ_BLOB.asm")
+        global_codebook = _parse_vq_blob(vq_blob_path)
+        
+        # Extract per-instrument binary data
+        _out("  Extracting sample data from converter output...\n")
+        
+        vq_indices_path = os.path.join(vq_output_dir, "VQ_INDICES.asm")
+        raw_samples_path = os.path.join(vq_output_dir, "RAW_SAMPLES.asm")
+        sample_dir_path = os.path.join(vq_output_dir, "SAMPLE_DIR.asm")
+        
+        # Get VQ stream data per instrument
+        vq_streams = _extract_vq_streams(vq_indices_path, sample_dir_path, n_inst)
+        
+        # Get RAW data per instrument
+        raw_blocks = _extract_raw_blocks(raw_samples_path)
     if global_codebook:
         _out(f"  Global codebook: {len(global_codebook)} bytes "
              f"({len(global_codebook) // vec_size} entries)\n")
     
-    # Extract per-instrument binary data
-    _out("  Extracting sample data from converter output...\n")
-    
-    vq_indices_path = os.path.join(vq_output_dir, "VQ_INDICES.asm")
-    raw_samples_path = os.path.join(vq_output_dir, "RAW_SAMPLES.asm")
-    sample_dir_path = os.path.join(vq_output_dir, "SAMPLE_DIR.asm")
-    
-    n_inst = len(song.instruments)
-    
-    # Get VQ stream data per instrument
-    vq_streams = _extract_vq_streams(vq_indices_path, sample_dir_path, n_inst)
-    
-    # Get RAW data per instrument
-    raw_blocks = _extract_raw_blocks(raw_samples_path)
-    
     # Determine which instruments are VQ vs RAW
     inst_sizes = []
     for i in range(n_inst):
@@ -1371,11 +1322,24 @@ def _generate_banking_build(build_dir: str, vq_output_dir: str,
             if not has_pitch_control:
                 f.write(f"PITCH_CONTROL = 1  ; (required by tracker player)\n")
     
+    # Codebook size each VQ instrument needs (rate-distortion analysis)
+    inst_cb_bytes = None
+    if (global_codebook and vq_streams and
+            BANK_CODEBOOK_MIN_SNR_DB is not None):
+        inst_cb_bytes = _analyze_codebook_needs(vq_streams, global_codebook,
+                                                vec_size, bank_cache, _out)
+    
     # Pack into banks (two-phase: VQ with codebook, RAW without)
     _out("  Packing into banks...\n")
+    pack_opts = {}
+    if BANK_PACK_OPTIMAL:
+        pack_opts = dict(optimal=True, time_budget=BANK_PACK_TIME_BUDGET,
+                         cooccurrence=instrument_cooccurrence(song))
     pack_result = pack_into_banks(inst_sizes, max_banks,
                                   codebook_size=codebook_size,
-                                  vq_instruments=vq_set)
+                                  vq_instruments=vq_set,
+                                  inst_codebook_bytes=inst_cb_bytes,
+                                  **pack_opts)
     
     if not pack_result.success:
         # Find the smallest config that would work
@@ -1388,7 +1352,9 @@ def _generate_banking_build(build_dir: str, vq_output_dir: str,
             
             test_result = pack_into_banks(inst_sizes, cfg_banks,
                                           codebook_size=codebook_size,
-                                          vq_instruments=vq_set)
+                                          vq_instruments=vq_set,
+                                          inst_codebook_bytes=inst_cb_bytes,
+                                          **pack_opts)
             if test_result.success:
                 suggested_cfg = (cfg_name, cfg_banks)
                 break
@@ -1422,8 +1388,19 @@ def _generate_banking_build(build_dir: str, vq_output_dir: str,
                     f"instruments to VQ, or lower the sample rate.")
     
     _out(f"    Used {pack_result.n_banks_used} of {max_banks} banks\n")
+    if BANK_PACK_OPTIMAL:
+        gap = pack_result.n_banks_used - pack_result.lower_bound
+        if pack_result.proven_optimal:
+            _out(f"    Packing is optimal (lower bound {pack_result.lower_bound})\n")
+        else:
+            _out(f"    {gap} bank(s) above lower bound {pack_result.lower_bound} "
+                 f"(search stopped after {BANK_PACK_TIME_BUDGET}s)\n")
+        if pack_opts["cooccurrence"]:
+            _out(f"    Co-playing instrument rows across banks: "
+                 f"{pack_result.switch_cost:.0f}\n")
     for bi, util in enumerate(pack_result.bank_utilization):
         _out(f"    Bank {bi}: {util*100:.0f}% full\n")
+    bank_cb_bytes = pack_result.bank_codebook_bytes
     
     # Per-bank VQ re-encoding
     bank_codebooks = {}  # bank_idx -> codebook_bytes (256*vec_size)
@@ -1448,7 +1425,7 @@ def _generate_banking_build(build_dir: str, vq_output_dir: str,
                 continue
             p = pack_result.placements[inst_idx]
             
-            effective_bank_size = BANK_SIZE - codebook_size
+            effective_bank_size = BANK_SIZE - bank_cb_bytes[p.start_bank]
             remaining = bytearray(stream)
             
             for bi_offset, bank_idx in enumerate(p.bank_indices):
@@ -1464,24 +1441,62 @@ def _generate_banking_build(build_dir: str, vq_output_dir: str,
                 bank_raw_indices[bank_idx].extend(chunk)
                 bank_chunk_order[bank_idx].append((inst_idx, len(chunk)))
         
-        # Train per-bank codebooks and re-encode
+        # Reuse cached banks; train the rest (in parallel, see bank_vq)
+        bank_results = {}  # bank_idx -> (cb_bytes, reencoded) or Exception
+        cache_keys = {}
+        to_train = {}
+        bank_n_codes = {b: bank_cb_bytes[b] // vec_size for b in bank_raw_indices}
         for bank_idx in sorted(bank_raw_indices.keys()):
             all_bank_indices = bytes(bank_raw_indices[bank_idx])
             if not all_bank_indices:
                 continue  # skip banks with no VQ data
-            try:
-                cb_bytes, reencoded = _reencode_bank_vq(
-                    all_bank_indices, global_codebook, vec_size)
-            except Exception as e:
-                logger.error(f"VQ re-encoding failed for bank {bank_idx}: {e}",
-                             exc_info=True)
+            if bank_cache is not None:
+                params = {}
+                if bank_n_codes[bank_idx] != 256:
+                    params["n_codes"] = bank_n_codes[bank_idx]
+                cache_keys[bank_idx] = bank_cache.key(all_bank_indices,
+                                                      global_codebook, vec_size,
+                                                      **params)
+                cached = bank_cache.get(cache_keys[bank_idx], len(all_bank_indices))
+                if cached is not None:
+                    bank_results[bank_idx] = cached
+                    continue
+            to_train[bank_idx] = all_bank_indices
+        
+        if to_train:
+            _out(f"  Training {len(to_train)} bank codebook(s)"
+                 + (f", {len(bank_results)} cached" if bank_results else "") + "...\n")
+            
+            def _progress(bank_idx, n_done, n_total):
+                _out(f"    [{n_done}/{n_total}] bank {bank_idx} trained\n")
+            
+            trained = train_banks(to_train, global_codebook, vec_size,
+                                  n_codes=bank_n_codes,
+                                  workers=BANK_TRAIN_WORKERS, progress=_progress)
+            for bank_idx, res in trained.items():
+                if bank_idx in cache_keys and not isinstance(res, Exception):
+                    bank_cache.put(cache_keys[bank_idx], *res)
+            bank_results.update(trained)
+        
+        for bank_idx in sorted(bank_results.keys()):
+            all_bank_indices = bytes(bank_raw_indices[bank_idx])
+            res = bank_results[bank_idx]
+            if isinstance(res, Exception):
+                e = res
+                logger.error(f"VQ re-encoding failed for bank {bank_idx}: {e}")
                 _out(f"  WARNING: Bank {bank_idx} VQ re-encoding failed: {e}\n")
                 _out(f"           Using global codebook (lower quality)\n")
-                # Fallback: use global codebook bytes directly
-                cb_bytes = bytes(global_codebook[:256 * vec_size])
-                if len(cb_bytes) < 256 * vec_size:
-                    cb_bytes += bytes([0x10] * (256 * vec_size - len(cb_bytes)))
+                # Fallback: use global codebook bytes directly (indices
+                # past a reduced codebook are clamped to its last entry)
+                n_codes = bank_n_codes[bank_idx]
+                cb_bytes = bytes(global_codebook[:n_codes * vec_size])
+                if len(cb_bytes) < n_codes * vec_size:
+                    cb_bytes += bytes([0x10] * (n_codes * vec_size - len(cb_bytes)))
                 reencoded = all_bank_indices  # keep original indices
+                if n_codes < 256:
+                    reencoded = bytes(min(i, n_codes - 1) for i in reencoded)
+            else:
+                cb_bytes, reencoded = res
             bank_codebooks[bank_idx] = cb_bytes
             
             # Split re-encoded indices back in the SAME order they were concatenated
@@ -1491,7 +1506,16 @@ def _generate_banking_build(build_dir: str, vq_output_dir: str,
                 bank_reencoded[key] = reencoded[pos:pos + chunk_len]
                 pos += chunk_len
             
-            _out(f"    Bank {bank_idx}: re-encoded {len(all_bank_indices)} indices\n")
+            _out(f"    Bank {bank_idx}: re-encoded {len(all_bank_indices)} indices"
+                 + (" (cached)" if bank_idx not in to_train else "") + "\n")
+        
+        if inst_cb_bytes is not None:
+            _report_bank_codebooks(bank_raw_indices, bank_codebooks,
+                                   bank_reencoded, bank_chunk_order,
+                                   global_codebook, vec_size, _out)
+        
+        if bank_cache is not None:
+            bank_cache.prune()
     
     # Generate BANK_CFG.asm
     bank_cfg_asm = generate_bank_asm(pack_result, n_inst,
@@ -1509,7 +1533,8 @@ def _generate_banking_build(build_dir: str, vq_output_dir: str,
     
     # Generate per-bank data files (with codebook prefix)
     _generate_bank_data_files(build_dir, pack_result, vq_streams, raw_blocks,
-                               bank_codebooks, bank_reencoded, codebook_size)
+                               bank_codebooks, bank_reencoded, codebook_size,
+                               binary=binary)
     n_vq_banks = sum(pack_result.bank_has_codebook) if pack_result.bank_has_codebook else 0
     if n_vq_banks > 0:
         _out(f"    + {pack_result.n_banks_used} BANK_DATA files "
@@ -1546,6 +1571,86 @@ def _generate_banking_build(build_dir: str, vq_output_dir: str,
     return None  # Success
 
 
+def _analyze_codebook_needs(vq_streams: dict, global_codebook, vec_size: int,
+                            bank_cache=None, output_func=None) -> dict:
+    """Codebook bytes each VQ instrument needs (see bank_vq.codebook_need).
+    
+    Results are cached per stream in bank_cache. Instruments whose analysis
+    fails keep a full 256-entry codebook.
+    
+    Returns {inst_idx: codebook_bytes}.
+    """
+    _out = output_func or _output
+    min_snr = BANK_CODEBOOK_MIN_SNR_DB
+    full = 256 * vec_size
+    
+    needs = {}
+    cache_keys = {}
+    to_analyze = {}
+    for inst_idx in sorted(vq_streams.keys()):
+        stream = bytes(vq_streams[inst_idx])
+        if bank_cache is not None:
+            cache_keys[inst_idx] = bank_cache.key(stream, global_codebook,
+                                                  vec_size, analysis=min_snr)
+            cached = bank_cache.get_json(cache_keys[inst_idx])
+            if isinstance(cached, list) and len(cached) == 2:
+                needs[inst_idx] = tuple(cached)
+                continue
+        to_analyze[inst_idx] = stream
+    
+    if to_analyze:
+        _out(f"  Sizing codebooks for {len(to_analyze)} VQ instrument(s) "
+             f"(min SNR {min_snr} dB)...\n")
+        results = codebook_needs(to_analyze, global_codebook, vec_size,
+                                 min_snr, workers=BANK_TRAIN_WORKERS)
+        for inst_idx, res in results.items():
+            if isinstance(res, Exception):
+                logger.error(f"Codebook sizing failed for inst {inst_idx}: {res}")
+                res = (256, float("inf"))
+            elif inst_idx in cache_keys:
+                bank_cache.put_json(cache_keys[inst_idx], list(res))
+            needs[inst_idx] = res
+    
+    result = {}
+    for inst_idx in sorted(needs):
+        n_codes, snr = needs[inst_idx]
+        result[inst_idx] = n_codes * vec_size
+        if n_codes < 256:
+            _out(f"    Inst {inst_idx}: {n_codes} codebook entries "
+                 f"(-{full - n_codes * vec_size}B, {snr:.1f} dB SNR)\n")
+    return result
+
+
+def _report_bank_codebooks(bank_raw_indices: dict, bank_codebooks: dict,
+                           bank_reencoded: dict, bank_chunk_order: dict,
+                           global_codebook, vec_size: int, output_func=None):
+    """Print codebook size, bytes saved and SNR for each VQ bank."""
+    import numpy as np
+    _out = output_func or _output
+    full = 256 * vec_size
+    total_saved = 0
+    _out("  Per-bank codebooks:\n")
+    for bank_idx in sorted(bank_codebooks):
+        cb = bank_codebooks[bank_idx]
+        n_codes = len(cb) // vec_size
+        saved = full - len(cb)
+        total_saved += saved
+        
+        reencoded = b"".join(bytes(bank_reencoded[(inst_idx, bank_idx)])
+                             for inst_idx, _ in bank_chunk_order[bank_idx])
+        used = len(set(reencoded))
+        volumes = bank_volumes(bytes(bank_raw_indices[bank_idx]),
+                               global_codebook, vec_size)
+        snr = ""
+        if volumes is not None and len(volumes):
+            cb_int = np.frombuffer(bytes(cb), dtype=np.uint8).reshape(-1, vec_size) & 0x0F
+            assign = np.frombuffer(reencoded, dtype=np.uint8).astype(np.int64)
+            snr = f", {snr_db(volumes, cb_int, assign):.1f} dB SNR"
+        _out(f"    Bank {bank_idx}: {n_codes} entries ({used} used), "
+             f"{saved}B saved{snr}\n")
+    _out(f"    Total: {total_saved}B of codebook space freed for sample data\n")
+
+
 def _generate_bank_sample_dir(build_dir: str, n_inst: int,
                                 pack_result, vq_streams: dict, 
                                 raw_blocks: dict, song: Song):
@@ -1626,14 +1731,21 @@ def _generate_bank_data_files(build_dir: str, pack_result,
                                 vq_streams: dict, raw_blocks: dict,
                                 bank_codebooks: dict = None,
                                 bank_reencoded: dict = None,
-                                codebook_size: int = 0):
+                                codebook_size: int = 0,
+                                binary: bool = None):
     """Generate BANK_DATA_N.asm files with per-bank codebooks.
     
+    With binary (default BINARY_DATA_INCLUDES) each bank image goes to
+    BANK_DATA_N.bin and the .asm file only holds an `ins` directive.
+    
     VQ bank layout (when codebook_size > 0 and bank has VQ data):
-      $4000 + 0                    : codebook (256 * vec_size bytes)
+      $4000 + 0                    : codebook (up to 256 * vec_size bytes)
       $4000 + codebook_size        : VQ index data
       ...up to $7FFF
     
+    The codebook size of each bank is pack_result.bank_codebook_bytes when
+    the packer sized it per bank, codebook_size otherwise.
+    
     RAW bank layout (no codebook overhead):
       $4000 + 0                    : RAW sample data
       ...up to $7FFF
@@ -1654,19 +1766,21 @@ def _generate_bank_data_files(build_dir: str, pack_result,
     
     # Determine which banks have codebook from pack result
     has_cb = pack_result.bank_has_codebook if pack_result.bank_has_codebook else []
+    bank_cb = pack_result.bank_codebook_bytes or [codebook_size] * n_banks
     
     # Step 1: Prepend codebook ONLY to VQ banks (bank_has_codebook=True)
     for bank_idx in range(n_banks):
         is_vq_bank = bank_idx < len(has_cb) and has_cb[bank_idx]
+        cb_len = bank_cb[bank_idx]
         if codebook_size > 0 and is_vq_bank:
             if bank_idx in bank_codebooks:
                 cb = bank_codebooks[bank_idx]
-                if len(cb) < codebook_size:
-                    cb = cb + bytes(codebook_size - len(cb))  # pad
-                bank_data[bank_idx] = bytearray(cb[:codebook_size])
+                if len(cb) < cb_len:
+                    cb = cb + bytes(cb_len - len(cb))  # pad
+                bank_data[bank_idx] = bytearray(cb[:cb_len])
             else:
                 # VQ bank but no codebook trained — fill with silence
-                bank_data[bank_idx] = bytearray([0x10] * codebook_size)
+                bank_data[bank_idx] = bytearray([0x10] * cb_len)
         # RAW-only banks: no codebook prefix, data starts at $4000
     
     # Sort placements by (first_bank, offset) for correct write ordering
@@ -1703,7 +1817,7 @@ def _generate_bank_data_files(build_dir: str, pack_result,
                 logger.error(f"Bank {bank_idx} overflow: {len(bank_data[bank_idx])} > {BANK_SIZE}")
         else:
             # Multi-bank: per-instrument effective size depends on VQ vs RAW
-            inst_cb = codebook_size if is_vq else 0
+            inst_cb = bank_cb[p.start_bank] if is_vq else 0
             effective_bank_size = BANK_SIZE - inst_cb
             
             if is_vq:
@@ -1733,29 +1847,33 @@ def _generate_bank_data_files(build_dir: str, pack_result,
                 logger.warning(f"Bank data: inst {inst_idx} placed but no data found")
     
     # Write .asm files
+    from pokey_vq.utils.asm_emit import byte_lines, write_asm, ins_line, write_binary
+    if binary is None:
+        binary = BINARY_DATA_INCLUDES
     for bank_idx in range(n_banks):
         data = bank_data[bank_idx]
         is_vq_bank = bank_idx < len(has_cb) and has_cb[bank_idx]
         lines = []
         if is_vq_bank and codebook_size > 0:
-            data_bytes = len(data) - codebook_size
+            data_bytes = len(data) - bank_cb[bank_idx]
             lines.append(f"; BANK_DATA_{bank_idx}.asm - Bank {bank_idx} VQ "
-                        f"(codebook: {codebook_size}B + data: {data_bytes}B)")
+                        f"(codebook: {bank_cb[bank_idx]}B + data: {data_bytes}B)")
         else:
             lines.append(f"; BANK_DATA_{bank_idx}.asm - Bank {bank_idx} RAW "
                         f"({len(data)}B data)")
         lines.append(f"; {len(data)} bytes total")
         lines.append("")
         
-        # Write .byte lines (16 bytes per line)
-        for i in range(0, len(data), 16):
-            chunk = data[i:i+16]
-            hex_vals = ','.join(f'${b:02X}' for b in chunk)
-            lines.append(f" .byte {hex_vals}")
+        if binary:
+            bin_name = f"BANK_DATA_{bank_idx}.bin"
+            write_binary(os.path.join(build_dir, bin_name), data)
+            if data:
+                lines.append(ins_line(bin_name))
+        elif data:
+            # Write .byte lines (16 bytes per line)
+            lines.append(byte_lines(data))
         
-        path = os.path.join(build_dir, f"BANK_DATA_{bank_idx}.asm")
-        with open(path, 'w') as f:
-            f.write('\n'.join(lines))
+        write_asm(os.path.join(build_dir, f"BANK_DATA_{bank_idx}.asm"), lines)
 
 
 def _generate_song_info(build_dir: str, song_title: str, song_author: str):
@@ -2052,14 +2170,18 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
     # Use runtime.get_app_dir() to work correctly in both dev and bundled modes
     tracker_dir = runtime.get_app_dir()
     build_dir = os.path.join(tracker_dir, ".tmp", "build")
+    # Files are generated into a fresh stage directory, then synced into
+    # build_dir by content hash (see build_cache): unchanged files are not
+    # rewritten and MADS is skipped when nothing it reads has changed.
+    stage_dir = os.path.join(tracker_dir, ".tmp", "build_stage")
     
-    # Clean and create build directory
-    if os.path.exists(build_dir):
+    # Clean and create stage directory
+    if os.path.exists(stage_dir):
         try:
-            shutil.rmtree(build_dir)
+            shutil.rmtree(stage_dir)
         except Exception as e:
-            logger.warning(f"Could not clean build dir: {e}")
-    os.makedirs(build_dir, exist_ok=True)
+            logger.warning(f"Could not clean stage dir: {e}")
+    os.makedirs(stage_dir, exist_ok=True)
     
     result.build_dir = build_dir
     _output(f"  Build directory: {build_dir}\n")
@@ -2078,16 +2200,21 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
             "RAW_SAMPLES.asm"
         ]
         
+        binary_files = (_emit_binary_vq_data(stage_dir, vq_output_dir)
+                        if BINARY_DATA_INCLUDES else [])
+        
         missing_files = []
         for vq_file in vq_files:
             src = os.path.join(vq_output_dir, vq_file)
-            if os.path.exists(src):
-                shutil.copy2(src, build_dir)
+            if vq_file in binary_files:
+                _output(f"    + {vq_file} (binary include)\n")
+            elif os.path.exists(src):
+                shutil.copy2(src, stage_dir)
                 _output(f"    + {vq_file}\n")
                 logger.debug(f"Copied: {vq_file}")
             elif vq_file == "RAW_SAMPLES.asm":
                 # Fallback stub if converter didn't generate one
-                stub_path = os.path.join(build_dir, vq_file)
+                stub_path = os.path.join(stage_dir, vq_file)
                 with open(stub_path, 'w') as f:
                     f.write("; RAW_SAMPLES.asm - empty (all instruments use VQ)\n")
                 _output(f"    + {vq_file} (generated stub)\n")
@@ -2107,7 +2234,7 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
         for subdir in support_dirs:
             src_dir = os.path.join(vq_output_dir, subdir)
             if os.path.isdir(src_dir):
-                dst_dir = os.path.join(build_dir, subdir)
+                dst_dir = os.path.join(stage_dir, subdir)
                 shutil.copytree(src_dir, dst_dir)
                 _output(f"    + {subdir}/\n")
                 logger.debug(f"Copied directory: {subdir}/")
@@ -2127,7 +2254,7 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
             for subdir in support_dirs:
                 our_subdir = os.path.join(our_asm_dir, subdir)
                 if os.path.isdir(our_subdir):
-                    dst_subdir = os.path.join(build_dir, subdir)
+                    dst_subdir = os.path.join(stage_dir, subdir)
                     os.makedirs(dst_subdir, exist_ok=True)
                     for filename in os.listdir(our_subdir):
                         src_file = os.path.join(our_subdir, filename)
@@ -2153,12 +2280,12 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
         ]
         
         # Check for IRQ handler
-        if not os.path.exists(os.path.join(build_dir, "tracker/tracker_irq_speed.asm")):
+        if not os.path.exists(os.path.join(stage_dir, "tracker/tracker_irq_speed.asm")):
             critical_files.append("tracker/tracker_irq_speed.asm")
         
         missing_critical = []
         for cf in critical_files:
-            if not os.path.exists(os.path.join(build_dir, cf)):
+            if not os.path.exists(os.path.join(stage_dir, cf)):
                 missing_critical.append(cf)
         
         if missing_critical:
@@ -2172,7 +2299,7 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
         
         # Export song data
         _output("\n  Exporting song data...\n")
-        song_data_path = os.path.join(build_dir, "SONG_DATA.asm")
+        song_data_path = os.path.join(stage_dir, "SONG_DATA.asm")
         # Banking mode: split song data across two regions (I/O gap at $D000)
         # Region A: $8000-$CFFF = 20,480 bytes
         # Region B: $D800-$FBFF =  9,216 bytes  (charset at $FC00)
@@ -2195,7 +2322,7 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
                     f"{len(song.songlines)} songlines, ~{song_bytes//1024}KB)\n")
             # Check for region B overflow
             if use_banking:
-                path2 = os.path.join(build_dir, "SONG_DATA_2.asm")
+                path2 = os.path.join(stage_dir, "SONG_DATA_2.asm")
                 if os.path.exists(path2):
                     song2_bytes = _count_asm_bytes(path2)
                     if song2_bytes > 0:
@@ -2210,7 +2337,7 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
         # Use runtime.get_asm_dir() which handles both dev and bundled modes
         player_src = os.path.join(runtime.get_asm_dir(), "song_player.asm")
         if os.path.exists(player_src):
-            shutil.copy2(player_src, build_dir)
+            shutil.copy2(player_src, stage_dir)
             _output(f"    + song_player.asm\n")
             logger.debug("Copied: song_player.asm")
         else:
@@ -2219,14 +2346,14 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
             return result
         
         # Generate SONG_INFO.asm (song name + author for splash screen)
-        _generate_song_info(build_dir, song.title, song.author)
+        _generate_song_info(stage_dir, song.title, song.author)
         _output(f"    + SONG_INFO.asm\n")
         
         # Also check for copy_os_ram.asm (may be needed)
         copy_os_src = os.path.join(vq_output_dir, "common", "copy_os_ram.asm")
-        if not os.path.exists(os.path.join(build_dir, "common", "copy_os_ram.asm")):
+        if not os.path.exists(os.path.join(stage_dir, "common", "copy_os_ram.asm")):
             # Try to create a minimal one if missing
-            copy_os_path = os.path.join(build_dir, "common", "copy_os_ram.asm")
+            copy_os_path = os.path.join(stage_dir, "common", "copy_os_ram.asm")
             os.makedirs(os.path.dirname(copy_os_path), exist_ok=True)
             if not os.path.exists(copy_os_path):
                 with open(copy_os_path, 'w') as f:
@@ -2236,7 +2363,9 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
         # Banking mode: generate bank data, loader, config
         if use_banking:
             _output("\n  Generating banking build files...\n")
-            bank_err = _generate_banking_build(build_dir, vq_output_dir, song, _output)
+            bank_cache = BankVQCache(os.path.join(tracker_dir, ".tmp", "build_cache"))
+            bank_err = _generate_banking_build(stage_dir, vq_output_dir, song, _output,
+                                               bank_cache=bank_cache)
             if bank_err:
                 # Check for upgrade suggestion (structured signal from packer)
                 if bank_err.startswith("UPGRADE:"):
@@ -2258,7 +2387,7 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
                 return result
         
         # Pre-compute data sizes for better error reporting
-        data_sizes = _estimate_data_sizes(build_dir, use_banking)
+        data_sizes = _estimate_data_sizes(stage_dir, use_banking)
         total_data = sum(data_sizes.values())
         _output(f"\n  Estimated data: ~{total_data//1024}KB\n")
         for name, sz in sorted(data_sizes.items(), key=lambda x: -x[1]):
@@ -2311,9 +2440,17 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
                 _output(f"  on large instruments, or lower the sample rate.\n")
             return result
         
+        # Move changed files into the build directory
+        manifest = load_manifest(build_dir)
+        changed, removed = sync_build_dir(stage_dir, build_dir, manifest)
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        _output(f"\n  Build directory: {len(changed)} file(s) updated, "
+                f"{len(manifest['files']) - len(changed)} unchanged"
+                + (f", {len(removed)} removed" if removed else "") + "\n")
+        
         # Run MADS
         _output("\n  Assembling with MADS...\n")
-        output_xex = os.path.join(build_dir, "song.xex")
+        output_xex = os.path.join(build_dir, XEX_FILE)
         
         if use_banking:
             # Banking: assemble bank_loader.asm (includes song_player.asm)
@@ -2323,17 +2460,25 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
             # 64KB: assemble song_player.asm directly
             main_asm = os.path.join(build_dir, "song_player.asm")
         
-        cmd = [mads_path, main_asm, "-o:" + output_xex]
-        logger.info(f"Running: {' '.join(cmd)}")
-        
-        proc = subprocess.run(
-            cmd,
-            cwd=build_dir,
-            capture_output=True,
-            text=True
-        )
+        digest = input_digest(manifest, os.path.basename(main_asm), mads_path)
+        if cached_xex(build_dir, manifest, digest):
+            _output("    Sources unchanged - reusing previous XEX\n")
+            logger.info("MADS skipped: input set identical to last build")
+            proc = None
+        else:
+            # Invalidate first: an interrupted run must not leave a stale match
+            record_xex(build_dir, manifest, None)
+            cmd = [mads_path, main_asm, "-o:" + output_xex]
+            logger.info(f"Running: {' '.join(cmd)}")
+            
+            proc = subprocess.run(
+                cmd,
+                cwd=build_dir,
+                capture_output=True,
+                text=True
+            )
         
-        if proc.returncode != 0:
+        if proc is not None and proc.returncode != 0:
             # Extract useful error info
             error_output = proc.stdout + "\n" + proc.stderr
             error_lines = [l for l in error_output.split('\n') if 'error' in l.lower()]
@@ -2400,14 +2545,16 @@ def build_xex_sync(song: Song, output_xex_path: str) -> BuildResult:
             logger.error(f"MADS failed: {error_output}")
             return result
         
-        _output("    Assembly successful!\n")
-        
         # Check output exists
         if not os.path.exists(output_xex):
             result.error_message = "MADS succeeded but XEX file not created"
             _output(f"ERROR: {result.error_message}\n")
             return result
         
+        if proc is not None:
+            _output("    Assembly successful!\n")
+            record_xex(build_dir, manifest, digest)
+        
         # Get file size
         xex_size = os.path.getsize(output_xex)
         
@@ -0,0 +1,265 @@
+"""POKEY VQ Tracker - Incremental Build Directory
+
+build_xex_sync() generates every artifact (VQ tables, SONG_DATA, SONG_INFO,
+bank files, loader, support sources) into a scratch stage directory. This
+module then makes .tmp/build follow the stage with as little work as
+possible:
+
+  - a file is moved into the build directory only when its content hash
+    differs from the recorded one (unchanged files keep their mtime)
+  - files the current build no longer produces are removed
+  - the hash of the whole input set is compared with the one recorded
+    after the last successful MADS run; when equal and the XEX is still
+    there, assembly is skipped and the cached XEX reused
+
+The state lives in .tmp/build/.build_manifest.json:
+
+  {"version": 1,
+   "files":  {relpath: [sha256, size, mtime_ns]},   # build dir contents
+   "inputs": "<digest of the last assembled input set>" | null,
+   "xex":    [size, mtime_ns]}                      # XEX from that run
+
+BankVQCache memoizes the per-bank codebook training of banking builds
+(.tmp/build_cache/), the expensive step that is otherwise repeated for
+unchanged sample data on every build.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("tracker.build_cache")
+
+BUILD_MANIFEST = ".build_manifest.json"
+MANIFEST_VERSION = 1
+XEX_FILE = "song.xex"
+
+# Build directory entries that are not generated inputs
+_BUILD_OUTPUTS = (BUILD_MANIFEST, XEX_FILE)
+
+_HASH_CHUNK = 1 << 20
+
+
+def file_digest(path: str) -> str:
+    """sha256 hex digest of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _walk_files(root: str) -> List[str]:
+    """Relative paths (with '/') of all files below root, sorted."""
+    found = []
+    for dirpath, _dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        for fn in filenames:
+            rel = fn if rel_dir == "." else os.path.join(rel_dir, fn)
+            found.append(rel.replace(os.sep, "/"))
+    return sorted(found)
+
+
+def load_manifest(build_dir: str) -> Dict:
+    """Read the build manifest (empty manifest if missing or unreadable)."""
+    try:
+        with open(os.path.join(build_dir, BUILD_MANIFEST), "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": MANIFEST_VERSION, "files": {}, "inputs": None, "xex": None}
+
+
+def save_manifest(build_dir: str, manifest: Dict):
+    """Write the build manifest (best effort: a lost manifest only costs a rebuild)."""
+    path = os.path.join(build_dir, BUILD_MANIFEST)
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.warning(f"Build manifest write failed: {e}")
+
+
+def _matches(entry, path: str) -> bool:
+    """True if path still has the size/mtime recorded in a manifest entry."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return entry is not None and [st.st_size, st.st_mtime_ns] == list(entry[-2:])
+
+
+def sync_build_dir(stage_dir: str, build_dir: str,
+                   manifest: Dict) -> Tuple[List[str], List[str]]:
+    """Make build_dir hold exactly the files of stage_dir.
+
+    Staged files whose hash equals the recorded one are left untouched in
+    build_dir; others are moved over. Files not in the stage are deleted.
+    Updates manifest["files"] in place.
+
+    Returns:
+        (changed, removed) relative paths
+    """
+    os.makedirs(build_dir, exist_ok=True)
+    old = manifest.get("files", {})
+    files = {}
+    changed = []
+
+    for rel in _walk_files(stage_dir):
+        src = os.path.join(stage_dir, rel)
+        dst = os.path.join(build_dir, rel)
+        sha = file_digest(src)
+        entry = old.get(rel)
+        if entry is None or entry[0] != sha or not _matches(entry, dst):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.replace(src, dst)
+            changed.append(rel)
+        st = os.stat(dst)
+        files[rel] = [sha, st.st_size, st.st_mtime_ns]
+
+    removed = []
+    for rel in _walk_files(build_dir):
+        if rel in files or rel in _BUILD_OUTPUTS or rel.endswith(".tmp"):
+            continue
+        try:
+            os.remove(os.path.join(build_dir, rel))
+            removed.append(rel)
+        except OSError as e:
+            logger.warning(f"Could not remove stale build file {rel}: {e}")
+    # Drop directories emptied by the removals
+    for dirpath, _dirnames, _filenames in os.walk(build_dir, topdown=False):
+        if dirpath != build_dir and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+    manifest["files"] = files
+    return changed, removed
+
+
+def input_digest(manifest: Dict, main_asm: str, tool_path: str) -> str:
+    """Digest of everything MADS sees: build files, entry source, assembler."""
+    h = hashlib.sha256()
+    try:
+        st = os.stat(tool_path)
+        tool = [os.path.abspath(tool_path), st.st_size, st.st_mtime_ns]
+    except OSError:
+        tool = [tool_path]
+    h.update(json.dumps({"main": main_asm, "tool": tool}).encode("utf-8"))
+    for rel, entry in sorted(manifest.get("files", {}).items()):
+        h.update(f"\0{rel}\0{entry[0]}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def cached_xex(build_dir: str, manifest: Dict, digest: str) -> Optional[str]:
+    """Path of the XEX assembled from this exact input set, if still present."""
+    path = os.path.join(build_dir, XEX_FILE)
+    if manifest.get("inputs") == digest and _matches(manifest.get("xex"), path):
+        return path
+    return None
+
+
+def record_xex(build_dir: str, manifest: Dict, digest: Optional[str]):
+    """Record the assembled input set (None after a failed run) and save."""
+    path = os.path.join(build_dir, XEX_FILE)
+    manifest["inputs"] = digest
+    manifest["xex"] = None
+    if digest is not None and os.path.exists(path):
+        st = os.stat(path)
+        manifest["xex"] = [st.st_size, st.st_mtime_ns]
+    save_manifest(build_dir, manifest)
+
+
+class BankVQCache:
+    """Content-addressed store of per-bank VQ re-encoding results.
+
+    Entries are keyed by everything the training reads (global codebook,
+    the bank's indices, vector size, parameters). Trained banks are
+    <key>.bin (codebook then indices); analysis results such as codebook
+    sizing are <key>.json (get_json/put_json). prune() removes entries
+    that the current build did not use, so the store holds one build's
+    worth of banks.
+    """
+
+    VERSION = 1
+
+    def __init__(self, root: str):
+        self.root = root
+        self._used = set()
+
+    def key(self, bank_indices: bytes, global_codebook, vec_size: int,
+            **params) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps({"v": self.VERSION, "vec_size": vec_size,
+                             "params": params}, sort_keys=True).encode("utf-8"))
+        h.update(bytes(global_codebook))
+        h.update(b"\0")
+        h.update(bytes(bank_indices))
+        return h.hexdigest()
+
+    def _path(self, key: str, ext: str = ".bin") -> str:
+        return os.path.join(self.root, key + ext)
+
+    def get(self, key: str, n_indices: int) -> Optional[Tuple[bytes, bytes]]:
+        """(codebook_bytes, reencoded) for key, or None."""
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < n_indices:
+            return None
+        self._used.add(key + ".bin")
+        split = len(data) - n_indices
+        return data[:split], data[split:]
+
+    def put(self, key: str, codebook_bytes: bytes, reencoded: bytes):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(key)
+            with open(path + ".tmp", "wb") as f:
+                f.write(bytes(codebook_bytes))
+                f.write(bytes(reencoded))
+            os.replace(path + ".tmp", path)
+            self._used.add(key + ".bin")
+        except OSError as e:
+            logger.warning(f"Bank VQ cache write failed: {e}")
+
+    def get_json(self, key: str):
+        """Analysis result stored with put_json() for key, or None."""
+        try:
+            with open(self._path(key, ".json"), "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._used.add(key + ".json")
+        return value
+
+    def put_json(self, key: str, value):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(key, ".json")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(path + ".tmp", path)
+            self._used.add(key + ".json")
+        except OSError as e:
+            logger.warning(f"Bank VQ cache write failed: {e}")
+
+    def prune(self):
+        """Delete entries not used since this cache object was created."""
+        if not os.path.isdir(self.root):
+            return
+        for fn in os.listdir(self.root):
+            if fn not in self._used:
+                try:
+                    os.remove(os.path.join(self.root, fn))
+                except OSError:
+                    pass
+
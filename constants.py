@@ -34,6 +34,7 @@ VQ_VECTOR_SIZES = [2, 4, 8, 16]  # Must be powers of 2 for ASM optimization
 VQ_VECTOR_DEFAULT = 8
 VQ_SMOOTHNESS_VALUES = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
 VQ_SMOOTHNESS_DEFAULT = 0
+VQ_SEED_DEFAULT = 0  # Fixed codebook training seed -> reproducible conversions
 
 # Memory budget for sample data (bytes)
 # Atari memory map with ROM-under-RAM:
@@ -1,5 +1,5 @@
 # Cycle-accurate timing analyzer for Atari POKEY VQ player.
-# Uses py65 (6502 emulator) to run the actual .xex and measure IRQ timing.
+# Runs the actual .xex on a built-in 6502 core and measures IRQ timing.
 
 from .analyzer import (
     CycleAnalysisResult,
@@ -8,10 +8,10 @@ from .analyzer import (
     run_cycle_analysis,
     start_analysis_async,
 )
-from .atari_system import RowResult, TickMeasurement
+from .atari_system import RowResult, TickMeasurement, TickStats, read_tick_trace
 
 __all__ = [
     'CycleAnalysisResult', 'CycleAnalysisState',
     'analysis_state', 'run_cycle_analysis', 'start_analysis_async',
-    'RowResult', 'TickMeasurement',
+    'RowResult', 'TickMeasurement', 'TickStats', 'read_tick_trace',
 ]
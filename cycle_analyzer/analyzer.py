@@ -3,21 +3,27 @@
 Provides the API that the UI uses for row coloring after BUILD.
 """
 
+import bisect
+import hashlib
+import json
 import logging
 import os
 import threading
 import time
-from collections import defaultdict
+import zlib
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple, Callable
 
 from .atari_system import (
-    AtariSystem, TickMeasurement, RowResult,
-    compute_dma_table, compute_dma_budgets,
+    AtariSystem, TickStats, RowResult, SystemSnapshot, TRACE_MAGIC,
+    ZP_SEQ_SONGLINE, dma_profile,
 )
 
 logger = logging.getLogger(__name__)
 
+MAX_FRAMES = 12000
+SPACE_DELAY_FRAMES = 5
+
 
 @dataclass
 class CycleAnalysisResult:
@@ -38,6 +44,10 @@ class CycleAnalysisResult:
     analysis_time: float = 0.0
     n_ticks: int = 0
 
+    # Handler cycle histogram (empty unless requested)
+    histogram_bin: int = 0
+    handler_histogram: List[int] = field(default_factory=list)
+
     def get_row_status(self, songline: int, row: int) -> Optional[str]:
         """Get status: 'ok', 'tight', 'overrun', or None if not analyzed."""
         key = (songline, row)
@@ -56,7 +66,8 @@ class CycleAnalysisResult:
         margin_b = r.margin_best(self.best_dma)
         budget_lo = self.timer_period - self.worst_dma
         budget_hi = self.timer_period - self.best_dma
-        return (f"IRQ handler: {r.worst_handler_cycles} cyc | "
+        return (f"IRQ handler: {r.worst_handler_cycles} cyc "
+                f"(mean {r.mean_handler_cycles:.0f}) | "
                 f"Budget: {budget_lo}-{budget_hi} cyc | "
                 f"Margin: {margin_w:+d} to {margin_b:+d} | "
                 f"{st.upper()}")
@@ -129,11 +140,197 @@ class CycleAnalysisState:
 analysis_state = CycleAnalysisState()
 
 
+class SnapshotCache:
+    """Songline snapshots of earlier runs, keyed by the XEX they ran.
+
+    An entry is <key>.json (end frame and the snapshots' registers, timer,
+    keyboard and song state) plus <key>.bin (their memory images, each
+    zlib-compressed). The key covers the XEX bytes and the run settings,
+    so a rebuilt song gets a new entry; put() keeps the newest KEEP.
+    """
+
+    VERSION = 1
+    KEEP = 8
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def key(self, xex_data: bytes, is_pal: bool) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps({"v": self.VERSION, "pal": is_pal,
+                             "max_frames": MAX_FRAMES,
+                             "space_delay": SPACE_DELAY_FRAMES},
+                            sort_keys=True).encode("utf-8"))
+        h.update(xex_data)
+        return h.hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key + ext)
+
+    def get(self, key: str) -> Optional[Tuple[List[SystemSnapshot], int]]:
+        """(snapshots, end frame) of the run stored under key, or None."""
+        try:
+            with open(self._path(key, ".json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self._path(key, ".bin"), "rb") as f:
+                data = f.read()
+            snapshots = []
+            pos = 0
+            for entry in meta["snapshots"]:
+                size = entry["size"]
+                memory = zlib.decompress(data[pos:pos + size])
+                pos += size
+                snapshots.append(SystemSnapshot(
+                    frame=entry["frame"], memory=memory,
+                    registers=tuple(entry["registers"]),
+                    timer=tuple(entry["timer"]),
+                    keyboard=tuple(entry["keyboard"]),
+                    song=tuple(entry["song"])))
+            return snapshots, meta["end_frame"]
+        except (OSError, ValueError, KeyError, TypeError, zlib.error):
+            return None
+
+    def put(self, key: str, snapshots: List[SystemSnapshot], end_frame: int):
+        entries = []
+        blobs = []
+        for snap in snapshots:
+            blob = zlib.compress(snap.memory, 1)
+            blobs.append(blob)
+            entries.append({"frame": snap.frame, "size": len(blob),
+                            "registers": snap.registers, "timer": snap.timer,
+                            "keyboard": snap.keyboard, "song": snap.song})
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(key, ".bin")
+            with open(path + ".tmp", "wb") as f:
+                for blob in blobs:
+                    f.write(blob)
+            os.replace(path + ".tmp", path)
+            # The .json goes last: get() only finds complete entries
+            path = self._path(key, ".json")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"end_frame": end_frame, "snapshots": entries}, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"Cycle snapshot cache write failed: {e}")
+            return
+        self._prune()
+
+    def _prune(self):
+        """Delete all but the KEEP most recently written entries."""
+        try:
+            names = [fn[:-5] for fn in os.listdir(self.root)
+                     if fn.endswith(".json")]
+            names.sort(key=lambda k: os.path.getmtime(self._path(k, ".json")),
+                       reverse=True)
+            for k in names[self.KEEP:]:
+                for ext in (".json", ".bin"):
+                    os.remove(self._path(k, ext))
+        except OSError:
+            pass
+
+
+def _segment_starts(frames: List[int], end_frame: int, n: int) -> List[int]:
+    """Indices into the snapshot frames that begin each of at most n
+    contiguous segments of about equal frame count."""
+    starts = [0]
+    for k in range(1, n):
+        target = frames[0] + (end_frame - frames[0]) * k // n
+        i = bisect.bisect_left(frames, target)
+        if i == len(frames) or (i > 0 and target - frames[i - 1] < frames[i] - target):
+            i -= 1
+        if i > starts[-1]:
+            starts.append(i)
+    return starts
+
+
+def _measure_segment(is_pal: bool, snapshot: SystemSnapshot, end_frame: int,
+                     histogram_bin: int, trace_path: Optional[str]
+                     ) -> Tuple[TickStats, bytes]:
+    """Pool worker: the stats of frames snapshot.frame .. end_frame - 1, and
+    the memory they end with."""
+    system = AtariSystem(is_pal=is_pal)
+    stats = system.resume(snapshot, end_frame, SPACE_DELAY_FRAMES,
+                          TickStats(histogram_bin, trace_path))
+    return stats, bytes(system.memory)
+
+
+def _concat_traces(parts: List[str], path: str):
+    with open(path, "wb") as out:
+        out.write(TRACE_MAGIC)
+        for part in parts:
+            with open(part, "rb") as f:
+                f.seek(len(TRACE_MAGIC))
+                while True:
+                    chunk = f.read(1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.remove(part)
+
+
+def _measure_parallel(is_pal: bool, snapshots: List[SystemSnapshot],
+                      end_frame: int, workers: int,
+                      progress_cb: Optional[Callable], histogram_bin: int,
+                      trace_path: Optional[str]) -> Tuple[TickStats, bytes]:
+    """Measure a cached run as contiguous songline ranges on a process pool.
+
+    Each worker resumes from the snapshot at the start of its range and
+    stops at the next range's first frame; the stats are merged in order.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    frames = [snap.frame for snap in snapshots]
+    starts = _segment_starts(frames, end_frame, workers)
+    bounds = [frames[i] for i in starts[1:]] + [MAX_FRAMES]
+    parts: List[Optional[str]] = [
+        f"{trace_path}.{n}" if trace_path else None for n in range(len(starts))]
+    # spawn: the analysis runs on a worker thread of the GUI process,
+    # where fork is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=len(starts), mp_context=ctx) as pool:
+            futures = [pool.submit(_measure_segment, is_pal, snapshots[i], end,
+                                   histogram_bin, part)
+                       for i, end, part in zip(starts, bounds, parts)]
+            stats = TickStats(histogram_bin)
+            memory = b""
+            for i, fut in zip(starts, futures):
+                part_stats, memory = fut.result()
+                stats.merge(part_stats)
+                if progress_cb:
+                    progress_cb(snapshots[i].frame, MAX_FRAMES,
+                                snapshots[i].memory[ZP_SEQ_SONGLINE], 0)
+    except BaseException:
+        for part in parts:
+            if part and os.path.exists(part):
+                os.remove(part)
+        raise
+
+    if trace_path:
+        _concat_traces(parts, trace_path)
+    return stats, memory
+
+
 def run_cycle_analysis(xex_path: str, is_pal: bool = True,
-                       progress_cb: Optional[Callable] = None
+                       progress_cb: Optional[Callable] = None,
+                       histogram_bin: int = 0,
+                       trace_path: Optional[str] = None,
+                       workers: Optional[int] = None,
+                       cache_dir: Optional[str] = None
                        ) -> CycleAnalysisResult:
     """Run cycle analysis on a built .xex file.
     
+    Ticks are aggregated per row as they happen. histogram_bin > 0 adds a
+    histogram of handler cycles; trace_path writes every tick to a raw
+    binary trace (see read_tick_trace).
+
+    With cache_dir, a serial run stores a snapshot at every songline start
+    (see SnapshotCache). Later runs of the same XEX split the song into
+    one songline range per worker (workers=None: CPU count) and measure
+    the ranges on a process pool; the result is the same as a serial run.
+
     Returns CycleAnalysisResult with per-row status.
     """
     t0 = time.time()
@@ -141,43 +338,65 @@ def run_cycle_analysis(xex_path: str, is_pal: bool = True,
     if not os.path.exists(xex_path):
         raise FileNotFoundError(f"XEX not found: {xex_path}")
 
-    system = AtariSystem(is_pal=is_pal)
-    ticks = system.run_analysis(
-        xex_path,
-        max_frames=12000,
-        space_delay_frames=5,
-        progress_cb=progress_cb,
-    )
+    if workers is None:
+        workers = os.cpu_count() or 1
+    cache = key = None
+    cached = None
+    if cache_dir:
+        with open(xex_path, "rb") as f:
+            xex_data = f.read()
+        cache = SnapshotCache(cache_dir)
+        key = cache.key(xex_data, is_pal)
+        cached = cache.get(key)
+
+    stats = None
+    if cached is not None and workers > 1 and len(cached[0]) > 1:
+        try:
+            stats, memory = _measure_parallel(is_pal, *cached, workers,
+                                              progress_cb, histogram_bin,
+                                              trace_path)
+        except Exception as e:
+            # No usable pool (restricted environment, broken worker)
+            logger.warning(f"Parallel cycle analysis unavailable ({e}), "
+                           f"running serially")
+    if stats is None:
+        snapshots: List[SystemSnapshot] = []
+        system = AtariSystem(is_pal=is_pal)
+        stats = system.run_analysis(
+            xex_path,
+            max_frames=MAX_FRAMES,
+            space_delay_frames=SPACE_DELAY_FRAMES,
+            progress_cb=progress_cb,
+            stats=TickStats(histogram_bin, trace_path),
+            on_songline=snapshots.append if cache and cached is None else None,
+        )
+        memory = system.memory
+        if cache and cached is None:
+            cache.put(key, snapshots, system.frame_count + 1)
 
-    if not ticks:
+    if not stats.n_ticks:
         result = CycleAnalysisResult(is_pal=is_pal)
         result.analysis_time = time.time() - t0
         return result
 
     # DMA budgets
-    dma_table = compute_dma_table(system.memory, is_pal)
-    timer_period = ticks[0].timer_period
-    worst_dma, best_dma, avg_dma = compute_dma_budgets(
-        dma_table, timer_period)
+    timer_period = stats.timer_period
+    worst_dma, best_dma, avg_dma = dma_profile(memory, is_pal).budgets(
+        timer_period)
 
     # Sample rate
     clock = 1773447 if is_pal else 1789773
     sample_rate = int(clock / timer_period) if timer_period > 0 else 0
 
-    # Aggregate per row
-    row_ticks: Dict[Tuple[int, int], List[TickMeasurement]] = defaultdict(list)
-    for tick in ticks:
-        row_ticks[(tick.songline, tick.row)].append(tick)
-
     rows: Dict[Tuple[int, int], RowResult] = {}
-    for key, tlist in row_ticks.items():
-        songline, row = key
-        rows[key] = RowResult(
+    for songline, row, worst, mean, count in stats.rows():
+        rows[(songline, row)] = RowResult(
             songline=songline,
             row=row,
-            worst_handler_cycles=max(t.handler_cycles for t in tlist),
-            n_ticks=len(tlist),
+            worst_handler_cycles=worst,
+            n_ticks=count,
             timer_period=timer_period,
+            mean_handler_cycles=mean,
         )
 
     # Build result
@@ -188,7 +407,9 @@ def run_cycle_analysis(xex_path: str, is_pal: bool = True,
         timer_period=timer_period,
         sample_rate=sample_rate,
         is_pal=is_pal,
-        n_ticks=len(ticks),
+        n_ticks=stats.n_ticks,
+        histogram_bin=histogram_bin,
+        handler_histogram=list(stats.histogram),
     )
 
     for key, r in rows.items():
@@ -204,17 +425,18 @@ def run_cycle_analysis(xex_path: str, is_pal: bool = True,
     result.tight_locations.sort()
     result.analysis_time = time.time() - t0
 
-    logger.info(f"Cycle analysis: {len(rows)} rows, {len(ticks)} ticks, "
+    logger.info(f"Cycle analysis: {len(rows)} rows, {stats.n_ticks} ticks, "
                 f"{result.n_overrun_rows} overruns, {result.n_tight_rows} tight, "
                 f"{result.analysis_time:.1f}s")
 
     return result
 
 
-def start_analysis_async(xex_path: str, is_pal: bool = True):
+def start_analysis_async(xex_path: str, is_pal: bool = True,
+                         cache_dir: Optional[str] = None):
     """Start cycle analysis in background thread.
     
-    Results available via analysis_state.
+    Results available via analysis_state. cache_dir: see run_cycle_analysis.
     """
     analysis_state.invalidate()
     analysis_state.running = True
@@ -226,7 +448,8 @@ def start_analysis_async(xex_path: str, is_pal: bool = True):
                 analysis_state.progress_text = (
                     f"Analyzing... frame {frame}, songline {sl}")
 
-            result = run_cycle_analysis(xex_path, is_pal, progress)
+            result = run_cycle_analysis(xex_path, is_pal, progress,
+                                        cache_dir=cache_dir)
             analysis_state.set_result(result)
             analysis_state.progress_text = result.summary()
 
@@ -1,6 +1,6 @@
 """Atari 800 system emulator for cycle-accurate timing analysis.
 
-Ties together py65 CPU, ANTIC DMA model, and POKEY timer to measure
+Ties together the 6502 core, ANTIC DMA model, and POKEY timer to measure
 exactly how many cycles each IRQ handler invocation takes and whether
 it fits within the timer period.
 
@@ -9,12 +9,16 @@ needed for timing analysis: CPU execution, timer IRQs, DMA cycle
 stealing, and VCOUNT for the player's frame detection loop.
 """
 
+import functools
 import logging
+import struct
+from array import array
 from dataclasses import dataclass, field
-from typing import List, Optional, Callable
+from typing import Dict, Iterator, List, Optional, Callable, Tuple
 
-from py65.devices.mpu6502 import MPU
-from py65.memory import ObservableMemory
+import numpy as np
+
+from .cpu6502 import Cpu6502, BREAK, UNUSED, INTERRUPT
 
 logger = logging.getLogger(__name__)
 
@@ -73,29 +77,37 @@ ZP_SEQ_SPEED    = 0xAD
 # DMA model
 # =========================================================================
 
-def compute_dma_table(memory, is_pal: bool = True) -> List[int]:
-    """Build per-scanline DMA cycle cost from the display list in memory.
+# Scanlines and DMA cycles per scanline of each ANTIC mode line
+_MODE_SCANLINES = {
+    2: 8, 3: 10, 4: 8, 5: 16, 6: 8, 7: 16,
+    8: 8, 9: 4, 10: 4, 11: 2, 12: 1, 13: 2, 14: 1, 15: 1,
+}
+_MODE_WIDTH_DIVISOR = {
+    2: 1, 3: 1, 4: 1, 5: 1, 6: 2, 7: 2, 8: 4, 9: 4,
+    10: 2, 11: 2, 12: 2, 13: 2, 14: 1, 15: 1,
+}
 
-    Returns list of DMA cycles stolen per scanline.
-    """
-    n_lines = PAL_SCANLINES if is_pal else NTSC_SCANLINES
-    dma = [9] * n_lines  # Memory refresh: 9 cycles every line
 
+def display_list_ops(memory, is_pal: bool = True) -> bytes:
+    """The display list instructions ANTIC shows in one frame.
+
+    Follows jumps and drops operand bytes, so the result only depends
+    on what is displayed, not on where the list and screen memory are.
+    Empty when display list DMA is off.
+    """
     try:
         dmactl_val = memory[DMACTL]
     except (IndexError, TypeError):
-        return dma
-
+        return b""
     if not (dmactl_val & 0x20):  # Bit 5 = DL DMA enable
-        return dma
+        return b""
 
+    n_lines = PAL_SCANLINES if is_pal else NTSC_SCANLINES
     dl_addr = memory[DLISTL] | (memory[DLISTH] << 8)
-    pf_width = dmactl_val & 0x03
-    width_chars = {0: 0, 1: 32, 2: 40, 3: 48}.get(pf_width, 0)
-
+    ops = bytearray()
     scanline = 0
     for _ in range(256):
-        if scanline >= n_lines or dl_addr > 0xFFFF:
+        if scanline >= n_lines:
             break
 
         opcode = memory[dl_addr]
@@ -103,8 +115,8 @@ def compute_dma_table(memory, is_pal: bool = True) -> List[int]:
         mode = opcode & 0x0F
 
         if mode == 0:
-            n_blank = ((opcode >> 4) & 0x07) + 1
-            scanline += n_blank
+            ops.append(opcode)
+            scanline += ((opcode >> 4) & 0x07) + 1
             continue
 
         if mode == 1:
@@ -115,65 +127,96 @@ def compute_dma_table(memory, is_pal: bool = True) -> List[int]:
             dl_addr = target
             continue
 
-        mode_scanlines = {
-            2: 8, 3: 10, 4: 8, 5: 16, 6: 8, 7: 16,
-            8: 8, 9: 4, 10: 4, 11: 2, 12: 1, 13: 2, 14: 1, 15: 1,
-        }
-        mode_dma = {
-            2: width_chars, 3: width_chars, 4: width_chars, 5: width_chars,
-            6: width_chars // 2, 7: width_chars // 2,
-            8: width_chars // 4, 9: width_chars // 4,
-            10: width_chars // 2, 11: width_chars // 2,
-            12: width_chars // 2, 13: width_chars // 2,
-            14: width_chars, 15: width_chars,
-        }
-
-        n_sl = mode_scanlines.get(mode, 8)
-        dma_cost = mode_dma.get(mode, 0)
-
+        ops.append(opcode)
         if opcode & 0x40:  # LMS
             dl_addr = (dl_addr + 2) & 0xFFFF
+        scanline += _MODE_SCANLINES[mode]
+
+    return bytes(ops)
+
 
-        for sl in range(n_sl):
-            line = scanline + sl
-            if line < n_lines:
-                dma[line] += dma_cost
-                if sl == 0:
-                    dma[line] += 1  # DL fetch
-                if mode <= 7 and sl == 0:
-                    dma[line] += width_chars  # Char name table
+class DmaProfile:
+    """Per-scanline DMA of one display setup, with its budgets cached.
 
+    budgets() sums the table over every window of scanlines an IRQ
+    period can cover (wrapping around the frame) with a prefix sum, and
+    keeps the result per window length, so sweeping timer periods only
+    computes each distinct window once.
+    """
+
+    def __init__(self, table: np.ndarray):
+        self.table = table
+        self._prefix = np.concatenate(([0], np.cumsum(np.tile(table, 2))))
+        self._budgets: Dict[int, Tuple[int, int, int]] = {}
+
+    def budgets(self, timer_period: int) -> Tuple[int, int, int]:
+        """(worst, best, avg) DMA cycles in one timer period."""
+        n_lines = len(self.table)
+        if timer_period <= 0 or n_lines == 0:
+            return 0, 0, 0
+        span = max(1, (timer_period + CYCLES_PER_SCANLINE - 1) // CYCLES_PER_SCANLINE)
+        result = self._budgets.get(span)
+        if result is None:
+            frames, rest = divmod(span, n_lines)
+            window = (self._prefix[rest:rest + n_lines] - self._prefix[:n_lines]
+                      + frames * self._prefix[n_lines])
+            result = (int(window.max()), int(window.min()),
+                      int(window.sum()) // n_lines)
+            self._budgets[span] = result
+        return result
+
+
+@functools.lru_cache(maxsize=64)
+def dma_profile_for(ops: bytes, dmactl: int, is_pal: bool = True) -> DmaProfile:
+    """DMA profile of a display (see display_list_ops()), built once per
+    (instructions, DMACTL, PAL/NTSC)."""
+    n_lines = PAL_SCANLINES if is_pal else NTSC_SCANLINES
+    dma = np.full(n_lines, 9, dtype=np.int64)  # Memory refresh: 9 cycles every line
+    width_chars = {0: 0, 1: 32, 2: 40, 3: 48}[dmactl & 0x03]
+
+    scanline = 0
+    for opcode in ops:
+        if scanline >= n_lines:
+            break
+        mode = opcode & 0x0F
+        if mode == 0:
+            scanline += ((opcode >> 4) & 0x07) + 1
+            continue
+        n_sl = _MODE_SCANLINES[mode]
+        lines = dma[scanline:scanline + n_sl]
+        lines += width_chars // _MODE_WIDTH_DIVISOR[mode]
+        lines[0] += 1  # DL fetch
+        if mode <= 7:
+            lines[0] += width_chars  # Char name table
         scanline += n_sl
 
-    return dma
+    dma.flags.writeable = False
+    return DmaProfile(dma)
 
 
-def compute_dma_budgets(dma_table: List[int], timer_period: int) -> tuple:
-    """Compute worst/best/avg DMA cost per timer period.
+def dma_profile(memory, is_pal: bool = True) -> DmaProfile:
+    """DMA profile of the display set up in memory (cached per display)."""
+    try:
+        dmactl_val = memory[DMACTL]
+    except (IndexError, TypeError):
+        dmactl_val = 0
+    return dma_profile_for(display_list_ops(memory, is_pal), dmactl_val, is_pal)
 
-    Returns (worst_dma, best_dma, avg_dma).
-    """
-    n_lines = len(dma_table)
-    if timer_period <= 0 or n_lines == 0:
-        return 0, 0, 0
 
-    span_lines = max(1, (timer_period + CYCLES_PER_SCANLINE - 1) //
-                     CYCLES_PER_SCANLINE)
+def compute_dma_table(memory, is_pal: bool = True) -> List[int]:
+    """Build per-scanline DMA cycle cost from the display list in memory.
 
-    worst = 0
-    best = 999999
-    total = 0
+    Returns list of DMA cycles stolen per scanline.
+    """
+    return dma_profile(memory, is_pal).table.tolist()
 
-    for start_line in range(n_lines):
-        dma_sum = 0
-        for d in range(span_lines):
-            dma_sum += dma_table[(start_line + d) % n_lines]
-        worst = max(worst, dma_sum)
-        best = min(best, dma_sum)
-        total += dma_sum
 
-    avg = total // n_lines
-    return worst, best, avg
+def compute_dma_budgets(dma_table: List[int], timer_period: int) -> tuple:
+    """Compute worst/best/avg DMA cost per timer period.
+
+    Returns (worst_dma, best_dma, avg_dma).
+    """
+    return DmaProfile(np.asarray(dma_table, dtype=np.int64)).budgets(timer_period)
 
 
 # =========================================================================
@@ -198,6 +241,129 @@ class TickMeasurement:
         return self.timer_period - self.handler_cycles - dma_cycles
 
 
+# Raw tick trace: magic, then one record per tick
+# (frame, tick_in_frame, songline, row, handler_cycles, timer_period)
+TRACE_MAGIC = b"TICKS\x01"
+_TRACE_RECORD = struct.Struct("<HHBBHH")
+_TRACE_FLUSH = 1 << 16
+
+
+class TickTraceWriter:
+    """Appends ticks to a compact binary trace file (10 bytes per tick)."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "wb")
+        self._file.write(TRACE_MAGIC)
+        self._buf = bytearray()
+
+    def write(self, frame: int, tick_in_frame: int, songline: int, row: int,
+              handler_cycles: int, timer_period: int):
+        self._buf += _TRACE_RECORD.pack(
+            frame & 0xFFFF, tick_in_frame & 0xFFFF, songline, row,
+            min(handler_cycles, 0xFFFF), timer_period)
+        if len(self._buf) >= _TRACE_FLUSH:
+            self._file.write(self._buf)
+            self._buf.clear()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.write(self._buf)
+        self._buf.clear()
+        self._file.close()
+
+
+def read_tick_trace(path: str) -> Iterator[TickMeasurement]:
+    """Iterate over the ticks of a trace written by TickTraceWriter."""
+    with open(path, "rb") as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"Not a tick trace: {path}")
+        while True:
+            chunk = f.read(_TRACE_RECORD.size * 4096)
+            if not chunk:
+                break
+            for rec in _TRACE_RECORD.iter_unpack(chunk):
+                yield TickMeasurement(*rec)
+
+
+class TickStats:
+    """Per-row IRQ handler statistics, aggregated as the ticks come in.
+
+    Worst, total and count per (songline, row) live in flat arrays indexed
+    songline * 256 + row, so memory stays the same however long the song
+    runs. With histogram_bin > 0 a histogram of handler cycles is kept
+    (bin i counts handlers of i*bin .. (i+1)*bin-1 cycles); with
+    trace_path every tick is also written to a raw trace file.
+    """
+
+    def __init__(self, histogram_bin: int = 0, trace_path: Optional[str] = None):
+        self.worst = array('L', [0]) * 0x10000
+        self.total = array('Q', [0]) * 0x10000
+        self.count = array('L', [0]) * 0x10000
+        self.n_ticks = 0
+        self.timer_period = 0       # period of the first tick
+        self.histogram_bin = histogram_bin
+        self.histogram = array('L')
+        self._trace = TickTraceWriter(trace_path) if trace_path else None
+
+    def add_frame(self, frame: int, ticks: List[Tuple[int, int, int]]):
+        """Add one frame's ticks as Cpu6502.irq_log holds them:
+        (songline << 8 | row, handler_cycles, timer_period)."""
+        if not ticks:
+            return
+        count, total, worst = self.count, self.total, self.worst
+        for key, cycles, _ in ticks:
+            count[key] += 1
+            total[key] += cycles
+            if cycles > worst[key]:
+                worst[key] = cycles
+        if not self.n_ticks:
+            self.timer_period = ticks[0][2]
+        self.n_ticks += len(ticks)
+        if self.histogram_bin:
+            hist = self.histogram
+            for _, cycles, _ in ticks:
+                b = cycles // self.histogram_bin
+                if b >= len(hist):
+                    hist.extend([0] * (b + 1 - len(hist)))
+                hist[b] += 1
+        if self._trace is not None:
+            for i, (key, cycles, period) in enumerate(ticks):
+                self._trace.write(frame, i, key >> 8, key & 0xFF, cycles, period)
+
+    def close(self):
+        """Finish the raw trace, if any."""
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    def merge(self, other: "TickStats"):
+        """Add the ticks of `other`, measured after those of self."""
+        for key in range(0x10000):
+            n = other.count[key]
+            if n:
+                self.count[key] += n
+                self.total[key] += other.total[key]
+                if other.worst[key] > self.worst[key]:
+                    self.worst[key] = other.worst[key]
+        if not self.n_ticks:
+            self.timer_period = other.timer_period
+        self.n_ticks += other.n_ticks
+        hist = self.histogram
+        if len(other.histogram) > len(hist):
+            hist.extend([0] * (len(other.histogram) - len(hist)))
+        for b, n in enumerate(other.histogram):
+            hist[b] += n
+
+    def rows(self) -> Iterator[Tuple[int, int, int, float, int]]:
+        """(songline, row, worst, mean, count) for every row that ticked."""
+        count, worst, total = self.count, self.worst, self.total
+        for key in range(0x10000):
+            n = count[key]
+            if n:
+                yield key >> 8, key & 0xFF, worst[key], total[key] / n, n
+
+
 @dataclass
 class RowResult:
     """Aggregated result for one song row."""
@@ -207,6 +373,7 @@ class RowResult:
     n_ticks: int
     timer_period: int
     n_active: int = 0
+    mean_handler_cycles: float = 0.0
 
     def status(self, worst_dma: int, best_dma: int) -> str:
         budget_worst = self.timer_period - worst_dma
@@ -224,109 +391,139 @@ class RowResult:
         return self.timer_period - self.worst_handler_cycles - best_dma
 
 
+@dataclass
+class SystemSnapshot:
+    """Machine state at the start of a frame; a run can resume from it."""
+    frame: int
+    memory: bytes
+    registers: Tuple[int, ...]      # pc, a, x, y, p, sp, cycles
+    timer: Tuple[int, ...]          # period, counter, irq enabled, audctl, audf1
+    keyboard: Tuple[bool, int]
+    song: Tuple[bool, int, int]     # started, previous songline, max songline
+
+
 # =========================================================================
 # Atari System Emulator
 # =========================================================================
 
 class AtariSystem:
-    """Minimal Atari 800 emulation for timing analysis."""
+    """Minimal Atari 800 emulation for timing analysis.
+
+    The CPU runs a frame per Cpu6502.run() call: the core counts POKEY
+    timer 1 down, takes the IRQs and logs each handler's cycles itself.
+    The write hooks on the timer registers bring the timer up to date
+    before changing it, so every IRQ fires after the same instruction a
+    one-instruction-at-a-time loop would fire it.
+    """
+
+    # Instructions per frame before the main loop is considered stuck
+    SAFETY_INSTRUCTIONS = 500000
 
     def __init__(self, is_pal: bool = True):
         self.is_pal = is_pal
         self.frame_cycles = PAL_FRAME_CYCLES if is_pal else NTSC_FRAME_CYCLES
         self.n_scanlines = PAL_SCANLINES if is_pal else NTSC_SCANLINES
 
-        self.memory = ObservableMemory()
-        self.cpu = MPU(memory=self.memory, pc=0)
+        self.memory = bytearray(0x10000)
+        self.cpu = Cpu6502(self.memory)
+        # Ticks are logged under the song position at handler entry
+        self.cpu.irq_tag = (ZP_SEQ_SONGLINE, ZP_SEQ_ROW)
 
-        # POKEY timer state
-        self.timer_period = 0
-        self.timer_counter = 0
-        self.timer_irq_enabled = False
+        # POKEY timer registers (the timer itself runs in the CPU core)
         self.audctl = 0
         self.audf1 = 0
 
         # Frame tracking
-        self.frame_cycle = 0
         self.frame_count = 0
-
-        # IRQ state
-        self._in_irq = False
-        self._tick_in_frame = 0
+        self._frame_start = 0   # CPU cycle count at the start of the frame
 
         # Keyboard simulation
         self._key_pressed = False
         self._key_code = 0xFF
 
+        # Song progress, as seen at the end of each frame
+        self._song_started = False
+        self._prev_songline = -1
+        self._max_songline = -1
+
         # Results
-        self.ticks: List[TickMeasurement] = []
+        self.stats = TickStats()
 
         self._setup_observers()
 
     def _setup_observers(self):
-        mem = self.memory
-
-        # POKEY writes
-        mem.subscribe_to_write([AUDF1], self._on_audf1_write)
-        mem.subscribe_to_write([AUDCTL], self._on_audctl_write)
-        mem.subscribe_to_write([STIMER_W], self._on_stimer_write)
-        mem.subscribe_to_write([IRQEN_W], self._on_irqen_write)
-
-        # Absorb writes to audio regs, GTIA, PIA, etc.
-        for addr in [AUDC1, 0xD203, 0xD205, 0xD207,
-                     AUDF2, 0xD204, 0xD206,
-                     PORTB, DMACTL, 0xD400,
-                     COLBK, 0xD016, 0xD017, 0xD018, 0xD01A,
-                     NMIEN, SKCTL_W,
-                     DLISTL, DLISTH]:
-            mem.subscribe_to_write([addr], lambda a, v: None)
+        cpu = self.cpu
+
+        # POKEY writes (everything else is plain memory)
+        cpu.hook_write(AUDF1, self._on_audf1_write)
+        cpu.hook_write(AUDCTL, self._on_audctl_write)
+        cpu.hook_write(STIMER_W, self._on_stimer_write)
+        cpu.hook_write(IRQEN_W, self._on_irqen_write)
 
         # POKEY reads
-        mem.subscribe_to_read([IRQST_R], self._on_irqst_read)
-        mem.subscribe_to_read([KBCODE_R], self._on_kbcode_read)
-        mem.subscribe_to_read([SKSTAT_R], self._on_skstat_read)
-        mem.subscribe_to_read([RANDOM_R], self._on_random_read)
+        cpu.hook_read(IRQST_R, self._on_irqst_read)
+        cpu.hook_read(KBCODE_R, self._on_kbcode_read)
+        cpu.hook_read(SKSTAT_R, self._on_skstat_read)
+        cpu.hook_read(RANDOM_R, self._on_random_read)
 
         # ANTIC reads
-        mem.subscribe_to_read([VCOUNT], self._on_vcount_read)
+        cpu.hook_read(VCOUNT, self._on_vcount_read)
 
         # GTIA reads
-        mem.subscribe_to_read([CONSOL], lambda a: 0x07)
+        cpu.hook_read(CONSOL, lambda a, cyc: 0x07)
 
-    def _on_audf1_write(self, addr, val):
+    def _on_audf1_write(self, addr, val, cycles):
+        stop = self.cpu.sync_timer(cycles)
         self.audf1 = val
         self._recalc_timer_period()
+        return stop
 
-    def _on_audctl_write(self, addr, val):
+    def _on_audctl_write(self, addr, val, cycles):
+        stop = self.cpu.sync_timer(cycles)
         self.audctl = val
         self._recalc_timer_period()
-
-    def _on_stimer_write(self, addr, val):
-        if self.timer_period > 0:
-            self.timer_counter = self.timer_period
-
-    def _on_irqen_write(self, addr, val):
-        self.timer_irq_enabled = bool(val & 0x01)
-
-    def _on_irqst_read(self, addr):
-        return 0xFE if self._in_irq else 0xFF
-
-    def _on_kbcode_read(self, addr):
+        return stop
+
+    def _on_stimer_write(self, addr, val, cycles):
+        cpu = self.cpu
+        stop = cpu.sync_timer(cycles)
+        if cpu.timer_period > 0:
+            cpu.timer_counter = cpu.timer_period
+        return stop
+
+    def _on_irqen_write(self, addr, val, cycles):
+        # The handler acknowledges every IRQ here: skip the sync there
+        cpu = self.cpu
+        stop = cpu.irq_entry < 0 and cpu.sync_timer(cycles)
+        cpu.timer_enabled = bool(val & 0x01)
+        return stop
+
+    def _on_irqst_read(self, addr, cycles):
+        return 0xFE if self.cpu.irq_entry >= 0 else 0xFF
+
+    def _on_kbcode_read(self, addr, cycles):
         return self._key_code
 
-    def _on_skstat_read(self, addr):
+    def _on_skstat_read(self, addr, cycles):
         return 0xFB if self._key_pressed else 0xFF
 
-    def _on_random_read(self, addr):
-        return (self.frame_cycle * 7 + 13) & 0xFF
+    # The frame position stands still while a handler runs (its cost is
+    # added when it returns)
 
-    def _on_vcount_read(self, addr):
-        scanline = self.frame_cycle // CYCLES_PER_SCANLINE
-        return min((scanline >> 1) & 0xFF, 155)
+    def _on_random_read(self, addr, cycles):
+        entry = self.cpu.irq_entry
+        frame_cycle = (entry if entry >= 0 else cycles) - self._frame_start
+        return (frame_cycle * 7 + 13) & 0xFF
+
+    def _on_vcount_read(self, addr, cycles):
+        entry = self.cpu.irq_entry
+        frame_cycle = (entry if entry >= 0 else cycles) - self._frame_start
+        vcount = (frame_cycle // CYCLES_PER_SCANLINE >> 1) & 0xFF
+        return vcount if vcount < 155 else 155
 
     def _recalc_timer_period(self):
         divisor = 114 if (self.audctl & 0x40) else 28
-        self.timer_period = divisor * (self.audf1 + 1)
+        self.cpu.timer_period = divisor * (self.audf1 + 1)
 
     def load_xex(self, xex_data: bytes) -> Optional[int]:
         from .xex_loader import parse_xex, load_into_memory
@@ -335,9 +532,16 @@ class AtariSystem:
 
     def run_analysis(self, xex_path: str, max_frames: int = 20000,
                      space_delay_frames: int = 5,
-                     progress_cb: Optional[Callable] = None
-                     ) -> List[TickMeasurement]:
-        """Run the .xex player and collect IRQ timing measurements."""
+                     progress_cb: Optional[Callable] = None,
+                     stats: Optional[TickStats] = None,
+                     on_songline: Optional[Callable] = None) -> TickStats:
+        """Run the .xex player and aggregate IRQ timing measurements.
+
+        Ticks go into `stats` (a fresh TickStats if None), which is closed
+        and returned when the run ends. on_songline(snapshot) is called
+        at the start of the run and of the first frame of every new
+        songline; resume() continues from those snapshots.
+        """
 
         with open(xex_path, 'rb') as f:
             xex_data = f.read()
@@ -347,33 +551,91 @@ class AtariSystem:
             raise ValueError("XEX has no RUN address")
 
         # Init CPU
-        self.cpu.pc = run_addr
-        self.cpu.sp = 0xFF
-        self.cpu.a = 0
-        self.cpu.x = 0
-        self.cpu.y = 0
-        self.cpu.p = MPU.BREAK | MPU.UNUSED | MPU.INTERRUPT
-        self.cpu.processorCycles = 0
+        cpu = self.cpu
+        cpu.pc = run_addr
+        cpu.sp = 0xFF
+        cpu.a = 0
+        cpu.x = 0
+        cpu.y = 0
+        cpu.p = BREAK | UNUSED | INTERRUPT
+        cpu.cycles = 0
+        cpu.timer_period = 0
+        cpu.timer_counter = 0
+        cpu.timer_enabled = False
+        cpu.timer_synced = 0
 
         # Reset state
         self._key_pressed = False
         self._key_code = 0xFF
-        self.frame_cycle = 0
         self.frame_count = 0
-        self.ticks = []
-        self._in_irq = False
-        self.timer_counter = 0
-        self.timer_period = 0
-        self.timer_irq_enabled = False
-
-        was_playing = False
-        song_started = False
-        prev_songline = -1
-        max_songline_seen = -1
+        self._song_started = False
+        self._prev_songline = -1
+        self._max_songline = -1
 
         logger.info(f"Analysis: RUN=${run_addr:04X}, max_frames={max_frames}")
+        return self._measure_frames(0, max_frames, space_delay_frames,
+                                    progress_cb, stats, on_songline)
+
+    def resume(self, snapshot: SystemSnapshot, end_frame: int,
+               space_delay_frames: int = 5,
+               stats: Optional[TickStats] = None) -> TickStats:
+        """Measure frames snapshot.frame .. end_frame - 1 of a run.
+
+        Stops early where the full run would (song end or wrap), so the
+        ticks are exactly those run_analysis measures for these frames.
+        """
+        cpu = self.cpu
+        cpu.load_memory(snapshot.memory)
+        cpu.pc, cpu.a, cpu.x, cpu.y, cpu.p, cpu.sp, cpu.cycles = snapshot.registers
+        (cpu.timer_period, cpu.timer_counter, cpu.timer_enabled,
+         self.audctl, self.audf1) = snapshot.timer
+        # Frames end between instructions with the timer brought up to date
+        cpu.timer_synced = cpu.cycles
+        cpu.irq_entry = -1
+        cpu.irq_log.clear()
+        self._key_pressed, self._key_code = snapshot.keyboard
+        self._song_started, self._prev_songline, self._max_songline = snapshot.song
+        self.frame_count = snapshot.frame
+        return self._measure_frames(snapshot.frame, end_frame, space_delay_frames,
+                                    None, stats, None)
+
+    def snapshot(self, frame: int) -> SystemSnapshot:
+        """State between frames, as the start of frame `frame`."""
+        cpu = self.cpu
+        return SystemSnapshot(
+            frame=frame,
+            memory=bytes(self.memory),
+            registers=(cpu.pc, cpu.a, cpu.x, cpu.y, cpu.p, cpu.sp, cpu.cycles),
+            timer=(cpu.timer_period, cpu.timer_counter, cpu.timer_enabled,
+                   self.audctl, self.audf1),
+            keyboard=(self._key_pressed, self._key_code),
+            song=(self._song_started, self._prev_songline, self._max_songline),
+        )
 
-        for frame in range(max_frames):
+    def _measure_frames(self, first_frame: int, end_frame: int,
+                        space_delay_frames: int, progress_cb: Optional[Callable],
+                        stats: Optional[TickStats],
+                        on_songline: Optional[Callable]) -> TickStats:
+        self.stats = stats if stats is not None else TickStats()
+        try:
+            self._run_frames(first_frame, end_frame, space_delay_frames,
+                             progress_cb, on_songline)
+        finally:
+            self.stats.close()
+
+        logger.info(f"Done: {self.stats.n_ticks} ticks across "
+                    f"{self.frame_count + 1 - first_frame} frames, "
+                    f"timer_period={self.cpu.timer_period}")
+        return self.stats
+
+    def _run_frames(self, first_frame: int, end_frame: int,
+                    space_delay_frames: int, progress_cb: Optional[Callable],
+                    on_songline: Optional[Callable]):
+        cpu = self.cpu
+        if on_songline:
+            on_songline(self.snapshot(first_frame))
+
+        for frame in range(first_frame, end_frame):
             self.frame_count = frame
 
             # Keyboard: press SPACE, then release
@@ -384,105 +646,39 @@ class AtariSystem:
                 self._key_pressed = False
                 self._key_code = 0xFF
 
-            self.frame_cycle = 0
-            self._tick_in_frame = 0
-
-            safety = 0
-            while self.frame_cycle < self.frame_cycles:
-                # Step one instruction
-                before = self.cpu.processorCycles
-                self.cpu.step()
-                elapsed = self.cpu.processorCycles - before
-                self.frame_cycle += elapsed
-
-                # Timer countdown
-                if self.timer_period > 0 and self.timer_irq_enabled:
-                    self.timer_counter -= elapsed
-                    while self.timer_counter <= 0:
-                        self.timer_counter += self.timer_period
-                        # Try to fire IRQ
-                        self._try_fire_irq()
-
-                safety += 1
-                if safety > 500000:
-                    logger.warning(f"Frame {frame}: safety limit")
-                    break
+            self._frame_start = cpu.cycles
+            executed = cpu.run(cpu.cycles + self.frame_cycles,
+                               self.SAFETY_INSTRUCTIONS + 1)
+            self.stats.add_frame(frame, cpu.irq_log)
+            cpu.irq_log.clear()
+            if executed > self.SAFETY_INSTRUCTIONS:
+                logger.warning(f"Frame {frame}: safety limit")
 
             # Check song state
             playing = self.memory[ZP_SEQ_PLAYING]
-            if playing != 0 and not song_started:
-                song_started = True
+            if playing != 0 and not self._song_started:
+                self._song_started = True
                 logger.info(f"Song started at frame {frame}")
-            if song_started and playing == 0:
+            if self._song_started and playing == 0:
                 logger.info(f"Song ended at frame {frame}")
                 break
 
             # Detect songline wrap (song played through once)
-            if song_started:
+            if self._song_started:
                 cur_songline = self.memory[ZP_SEQ_SONGLINE]
-                if cur_songline > max_songline_seen:
-                    max_songline_seen = cur_songline
-                elif (prev_songline > 0 and cur_songline == 0
-                      and max_songline_seen > 0):
+                if cur_songline > self._max_songline:
+                    self._max_songline = cur_songline
+                elif (self._prev_songline > 0 and cur_songline == 0
+                      and self._max_songline > 0):
                     logger.info(f"Song wrapped at frame {frame} "
-                                f"(max songline={max_songline_seen})")
+                                f"(max songline={self._max_songline})")
                     break
-                prev_songline = cur_songline
+                new_songline = cur_songline != self._prev_songline
+                self._prev_songline = cur_songline
+                if on_songline and new_songline and frame + 1 < end_frame:
+                    on_songline(self.snapshot(frame + 1))
 
             if progress_cb and frame % 100 == 0:
                 sl = self.memory[ZP_SEQ_SONGLINE]
                 rw = self.memory[ZP_SEQ_ROW]
                 progress_cb(frame, max_frames, sl, rw)
-
-        logger.info(f"Done: {len(self.ticks)} ticks across "
-                    f"{self.frame_count + 1} frames, "
-                    f"timer_period={self.timer_period}")
-        return self.ticks
-
-    def _try_fire_irq(self):
-        """Attempt to fire timer IRQ and measure handler."""
-        # If I flag set, IRQ is pending but can't fire yet
-        if self.cpu.p & MPU.INTERRUPT:
-            return
-
-        self._in_irq = True
-
-        # Snapshot song position before handler runs
-        songline = self.memory[ZP_SEQ_SONGLINE]
-        row = self.memory[ZP_SEQ_ROW]
-
-        # Fire IRQ — py65 pushes PC+P, sets I, loads $FFFE vector
-        entry_cycles = self.cpu.processorCycles
-        old_pc = self.cpu.pc
-        self.cpu.irq()
-
-        if self.cpu.pc == old_pc:
-            # irq() did nothing (shouldn't happen since we checked I flag)
-            self._in_irq = False
-            return
-
-        # Execute handler until RTI (opcode $40)
-        for _ in range(5000):
-            opcode = self.memory[self.cpu.pc]
-            self.cpu.step()
-            if opcode == 0x40:  # RTI
-                break
-
-        handler_cost = self.cpu.processorCycles - entry_cycles
-        self._in_irq = False
-
-        # Record tick
-        tick = TickMeasurement(
-            frame=self.frame_count,
-            tick_in_frame=self._tick_in_frame,
-            songline=songline,
-            row=row,
-            handler_cycles=handler_cost,
-            timer_period=self.timer_period,
-        )
-        self.ticks.append(tick)
-        self._tick_in_frame += 1
-
-        # Account for handler time in frame and timer
-        self.frame_cycle += handler_cost
-        self.timer_counter -= handler_cost
@@ -0,0 +1,1020 @@
+"""Table-driven 6502 core for the timing analyzer.
+
+Built for one job: run the player as fast as possible while keeping the
+cycle count of every instruction exact. Hot code is translated into
+Python functions (one per entry address) from the opcode table below, so
+the interpreter pays its dispatch cost once per trace instead of once per
+instruction:
+
+  - registers are locals of the generated code, and so are the cycle
+    count and the N/Z flags until something needs them
+  - memory is a bytearray; only the addresses registered as read or
+    write hooks (POKEY/ANTIC/GTIA registers) go through a callback
+  - a trace follows fixed jumps and subroutine calls and the usual
+    direction of each branch; a trace that jumps back to its start loops
+    internally
+  - the cycle limit is checked once per few instructions; when it is
+    close, checked blocks finish the run one instruction at a time, so
+    the caller sees exactly the instruction boundaries a single-step loop
+    would
+  - cold code runs one instruction per call and is never traced
+
+Self-modifying code: writes to bytes of translated code invalidate the
+blocks covering them. An operand byte that is written this way becomes
+"volatile" -- later translations fetch it from memory at run time, so
+the player's patched pointers and counters cost nothing after the first
+write. A patched opcode byte simply causes re-translation.
+
+Cycle counts follow the NMOS 6502 tables, including the extra cycle for
+page-crossing indexed reads and taken/page-crossing branches.
+Undocumented opcodes behave as two-byte no-ops taking no cycles.
+"""
+
+import functools
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# Status flags
+CARRY = 0x01
+ZERO = 0x02
+INTERRUPT = 0x04
+DECIMAL = 0x08
+BREAK = 0x10
+UNUSED = 0x20
+OVERFLOW = 0x40
+NEGATIVE = 0x80
+
+IRQ_VECTOR = 0xFFFE
+
+# Flag bits returned by a write hook / carried in a block's returned pc
+STOP = 0x20000      # end the stretch after this instruction (hooked write)
+_RTI = 0x10000      # the block ended with RTI
+_STEP = 0x40000     # the limit is close: continue in checked blocks
+_JUMPED = 0x80000   # the block left through a jump, branch or return
+
+_MAX_BLOCK = 48     # instructions per translated block
+_MAX_CHECKED = 16   # instructions per checked block
+_HOT_ENTRY = 16     # jumps to an address before a block is translated there
+_HOT_EXIT = 512     # taken exits before their target joins the block
+_BUSY_EXIT = 256    # ... and those of other exits joining with it
+_MAX_SEGMENTS = 8   # traces per translated block
+_CHUNK = 8          # instructions per cycle-limit check
+
+# Kinds of translation (the kind is bits 16+ of a block key)
+_TRACE = 0
+_CHECKED = 1
+_SINGLE = 2
+
+# opcode mnemonic mode cycles page-cross-extra
+_OPCODE_TABLE = """
+00 BRK imp 7 0  01 ORA inx 6 0  05 ORA zpg 3 0  06 ASL zpg 5 0  08 PHP imp 3 0
+09 ORA imm 2 0  0A ASL acc 2 0  0D ORA abs 4 0  0E ASL abs 6 0  10 BPL rel 2 0
+11 ORA iny 5 1  15 ORA zpx 4 0  16 ASL zpx 6 0  18 CLC imp 2 0  19 ORA aby 4 1
+1D ORA abx 4 1  1E ASL abx 7 0  20 JSR abs 6 0  21 AND inx 6 0  24 BIT zpg 3 0
+25 AND zpg 3 0  26 ROL zpg 5 0  28 PLP imp 4 0  29 AND imm 2 0  2A ROL acc 2 0
+2C BIT abs 4 0  2D AND abs 4 0  2E ROL abs 6 0  30 BMI rel 2 0  31 AND iny 5 1
+35 AND zpx 4 0  36 ROL zpx 6 0  38 SEC imp 2 0  39 AND aby 4 1  3D AND abx 4 1
+3E ROL abx 7 0  40 RTI imp 6 0  41 EOR inx 6 0  45 EOR zpg 3 0  46 LSR zpg 5 0
+48 PHA imp 3 0  49 EOR imm 2 0  4A LSR acc 2 0  4C JMP abs 3 0  4D EOR abs 4 0
+4E LSR abs 6 0  50 BVC rel 2 0  51 EOR iny 5 1  55 EOR zpx 4 0  56 LSR zpx 6 0
+58 CLI imp 2 0  59 EOR aby 4 1  5D EOR abx 4 1  5E LSR abx 7 0  60 RTS imp 6 0
+61 ADC inx 6 0  65 ADC zpg 3 0  66 ROR zpg 5 0  68 PLA imp 4 0  69 ADC imm 2 0
+6A ROR acc 2 0  6C JMP ind 5 0  6D ADC abs 4 0  6E ROR abs 6 0  70 BVS rel 2 0
+71 ADC iny 5 1  75 ADC zpx 4 0  76 ROR zpx 6 0  78 SEI imp 2 0  79 ADC aby 4 1
+7D ADC abx 4 1  7E ROR abx 7 0  81 STA inx 6 0  84 STY zpg 3 0  85 STA zpg 3 0
+86 STX zpg 3 0  88 DEY imp 2 0  8A TXA imp 2 0  8C STY abs 4 0  8D STA abs 4 0
+8E STX abs 4 0  90 BCC rel 2 0  91 STA iny 6 0  94 STY zpx 4 0  95 STA zpx 4 0
+96 STX zpy 4 0  98 TYA imp 2 0  99 STA aby 5 0  9A TXS imp 2 0  9D STA abx 5 0
+A0 LDY imm 2 0  A1 LDA inx 6 0  A2 LDX imm 2 0  A4 LDY zpg 3 0  A5 LDA zpg 3 0
+A6 LDX zpg 3 0  A8 TAY imp 2 0  A9 LDA imm 2 0  AA TAX imp 2 0  AC LDY abs 4 0
+AD LDA abs 4 0  AE LDX abs 4 0  B0 BCS rel 2 0  B1 LDA iny 5 1  B4 LDY zpx 4 0
+B5 LDA zpx 4 0  B6 LDX zpy 4 0  B8 CLV imp 2 0  B9 LDA aby 4 1  BA TSX imp 2 0
+BC LDY abx 4 1  BD LDA abx 4 1  BE LDX aby 4 1  C0 CPY imm 2 0  C1 CMP inx 6 0
+C4 CPY zpg 3 0  C5 CMP zpg 3 0  C6 DEC zpg 5 0  C8 INY imp 2 0  C9 CMP imm 2 0
+CA DEX imp 2 0  CC CPY abs 4 0  CD CMP abs 4 0  CE DEC abs 6 0  D0 BNE rel 2 0
+D1 CMP iny 5 1  D5 CMP zpx 4 0  D6 DEC zpx 6 0  D8 CLD imp 2 0  D9 CMP aby 4 1
+DD CMP abx 4 1  DE DEC abx 7 0  E0 CPX imm 2 0  E1 SBC inx 6 0  E4 CPX zpg 3 0
+E5 SBC zpg 3 0  E6 INC zpg 5 0  E8 INX imp 2 0  E9 SBC imm 2 0  EA NOP imp 2 0
+EC CPX abs 4 0  ED SBC abs 4 0  EE INC abs 6 0  F0 BEQ rel 2 0  F1 SBC iny 5 1
+F5 SBC zpx 4 0  F6 INC zpx 6 0  F8 SED imp 2 0  F9 SBC aby 4 1  FD SBC abx 4 1
+FE INC abx 7 0
+"""
+
+
+def _parse_table(text: str) -> Dict[int, tuple]:
+    fields = text.split()
+    table = {}
+    for i in range(0, len(fields), 5):
+        op, name, mode, cycles, extra = fields[i:i + 5]
+        table[int(op, 16)] = (name, mode, int(cycles), int(extra))
+    return table
+
+
+OPCODES = _parse_table(_OPCODE_TABLE)
+
+_OPERAND_BYTES = {"imp": 0, "acc": 0, "imm": 1, "zpg": 1, "zpx": 1, "zpy": 1,
+                  "inx": 1, "iny": 1, "rel": 1, "abs": 2, "abx": 2, "aby": 2,
+                  "ind": 2}
+
+# N and Z flags of a result byte
+_NZ = bytes((v & NEGATIVE) | (ZERO if v == 0 else 0) for v in range(256))
+# C, Z and N of a compare: indexed by register - operand + 256
+_CMP = bytes(((CARRY if d >= 0 else 0) | (ZERO if d == 0 else 0) | (d & NEGATIVE))
+             for d in range(-256, 256))
+
+_BRANCHES = {"BPL": "not p & 0x80", "BMI": "p & 0x80",
+             "BVC": "not p & 0x40", "BVS": "p & 0x40",
+             "BCC": "not p & 0x01", "BCS": "p & 0x01",
+             "BNE": "not p & 0x02", "BEQ": "p & 0x02"}
+# The same conditions with N and Z still pending from register {0}
+_NZ_BRANCHES = {"BPL": "not {0} & 0x80", "BMI": "{0} & 0x80",
+                "BNE": "{0}", "BEQ": "not {0}"}
+_LOGIC = {"ORA": "|", "AND": "&", "EOR": "^"}
+_FLAG_OPS = {"CLC": "p &= 0xFE", "SEC": "p |= 0x01", "CLI": "p &= 0xFB",
+             "SEI": "p |= 0x04", "CLD": "p &= 0xF7", "SED": "p |= 0x08",
+             "CLV": "p &= 0xBF", "NOP": None}
+_TRANSFERS = {"TAX": ("x", "a"), "TAY": ("y", "a"), "TXA": ("a", "x"),
+              "TYA": ("a", "y"), "TSX": ("x", "sp")}
+_INC_REG = {"INX": ("x", "+"), "INY": ("y", "+"), "DEX": ("x", "-"), "DEY": ("y", "-")}
+_READS = {"LDA", "LDX", "LDY", "ORA", "AND", "EOR", "ADC", "SBC",
+          "CMP", "CPX", "CPY", "BIT"}
+_STORES = {"STA": "a", "STX": "x", "STY": "y"}
+_RMW = {"ASL", "LSR", "ROL", "ROR", "INC", "DEC"}
+
+
+def _adc_decimal(a: int, data: int, p: int):
+    """Decimal-mode ADC (NMOS: N/V/Z from the binary ALU result)."""
+    halfcarry = decimalcarry = adjust0 = adjust1 = 0
+    nibble0 = (data & 0xF) + (a & 0xF) + (p & CARRY)
+    if nibble0 > 9:
+        adjust0 = 6
+        halfcarry = 1
+    nibble1 = ((data >> 4) & 0xF) + ((a >> 4) & 0xF) + halfcarry
+    if nibble1 > 9:
+        adjust1 = 6
+        decimalcarry = 1
+    nibble0 &= 0xF
+    nibble1 &= 0xF
+    aluresult = (nibble1 << 4) + nibble0
+    nibble0 = (nibble0 + adjust0) & 0xF
+    nibble1 = (nibble1 + adjust1) & 0xF
+    p &= ~(CARRY | OVERFLOW | NEGATIVE | ZERO)
+    p |= (aluresult & NEGATIVE) if aluresult else ZERO
+    if decimalcarry:
+        p |= CARRY
+    if (~(a ^ data) & (a ^ aluresult)) & NEGATIVE:
+        p |= OVERFLOW
+    return (nibble1 << 4) + nibble0, p
+
+
+def _sbc_decimal(a: int, data: int, p: int):
+    """Decimal-mode SBC (NMOS: flags from the binary result)."""
+    halfcarry = 1
+    decimalcarry = adjust0 = adjust1 = 0
+    nibble0 = (a & 0xF) + (~data & 0xF) + (p & CARRY)
+    if nibble0 <= 0xF:
+        halfcarry = 0
+        adjust0 = 10
+    nibble1 = ((a >> 4) & 0xF) + ((~data >> 4) & 0xF) + halfcarry
+    if nibble1 <= 0xF:
+        adjust1 = 10 << 4
+    aluresult = a + (~data & 0xFF) + (p & CARRY)
+    if aluresult > 0xFF:
+        decimalcarry = 1
+    aluresult &= 0xFF
+    nibble0 = (aluresult + adjust0) & 0xF
+    nibble1 = ((aluresult + adjust1) >> 4) & 0xF
+    p &= ~(CARRY | ZERO | NEGATIVE | OVERFLOW)
+    p |= (aluresult & NEGATIVE) if aluresult else ZERO
+    if decimalcarry:
+        p |= CARRY
+    if ((a ^ data) & (a ^ aluresult)) & NEGATIVE:
+        p |= OVERFLOW
+    return (nibble1 << 4) + nibble0, p
+
+
+class _Insn:
+    """One decoded instruction of a trace."""
+    __slots__ = ("pc", "name", "mode", "cycles", "extra", "operands",
+                 "volatile", "nxt", "target", "follow", "ret", "guard")
+
+    def __init__(self, pc, name, mode, cycles, extra, operands, volatile, nxt):
+        self.pc = pc
+        self.name = name
+        self.mode = mode
+        self.cycles = cycles
+        self.extra = extra
+        self.operands = operands
+        self.volatile = volatile
+        self.nxt = nxt
+        self.target = None      # static branch/jump target
+        self.follow = False     # trace continues at target
+        self.ret = None         # JSR return / expected RTS return address
+        self.guard = False      # computed jump followed to its current target
+
+    def max_cycles(self) -> int:
+        if self.name is None:
+            return 0
+        return self.cycles + self.extra + (2 if self.name in _BRANCHES else 0)
+
+
+class Cpu6502:
+    """6502 with flat bytearray memory and hooks on selected addresses.
+
+    read_hooks[addr](addr, cycles) -> byte replaces the memory value;
+    write_hooks[addr](addr, value, cycles) runs after the value is stored,
+    and makes run() look at the timer again after the instruction if it
+    returns true. `cycles` is the cycle counter at the start of the
+    accessing instruction.
+
+    The interval timer (POKEY timer 1 on the Atari) counts down while
+    timer_period and timer_enabled are set; timer_counter is its value at
+    cycle count timer_synced. When it underflows it is reloaded and, if
+    the I flag allows, run() takes the IRQ and runs the handler to its
+    RTI. The timer stands still while a handler runs and is charged the
+    handler's cycles when it returns; an underflow while I is set is
+    lost. Every handler run is logged to irq_log as (tag, handler cycles,
+    timer period), tag being the bytes at irq_tag (high, low) at entry.
+    Write hooks that change the timer call sync_timer() first.
+    """
+
+    # Instructions per handler before giving up on its RTI
+    HANDLER_INSTRUCTIONS = 5000
+
+    def __init__(self, memory: Optional[bytearray] = None):
+        self.memory = memory if memory is not None else bytearray(0x10000)
+        self.pc = 0
+        self.a = self.x = self.y = 0
+        self.sp = 0xFF
+        self.p = BREAK | UNUSED
+        self.cycles = 0
+
+        self.timer_period = 0
+        self.timer_counter = 0
+        self.timer_enabled = False
+        self.timer_synced = 0
+        self.irq_entry = -1         # cycle count at entry of the running handler
+        self.irq_tag = (0, 0)
+        self.irq_log: List[Tuple[int, int, int]] = []
+
+        self.read_hooks: Dict[int, Callable] = {}
+        self.write_hooks: Dict[int, Callable] = {}
+        self._rhook = bytearray(0x10000)
+        self._wtrap = bytearray(0x10000)   # 1 = write hook, 2 = translated code
+
+        self._blocks: List[Optional[Callable]] = [None] * 0x10000
+        self._checked: List[Optional[Callable]] = [None] * 0x10000
+        self._singles: List[Optional[Callable]] = [None] * 0x10000
+        self._heat = bytearray(0x10000)          # jumps to an untranslated pc
+        self._checked_heat = bytearray(0x10000)
+        self._block_bytes: Dict[int, List[int]] = {}    # block key -> code bytes
+        self._covering: Dict[int, Set[int]] = {}        # code byte -> block keys
+        self._opcode_at: Set[int] = set()               # opcode bytes in use
+        self._volatile: Set[int] = set()
+        self._links: Dict[int, List[int]] = {}  # block key -> hot exit targets
+        self.translations = 0
+
+    # --- hooks ---------------------------------------------------------
+
+    def hook_read(self, addr: int, fn: Callable):
+        self.read_hooks[addr] = fn
+        self._rhook[addr] = 1
+
+    def hook_write(self, addr: int, fn: Callable):
+        self.write_hooks[addr] = fn
+        self._wtrap[addr] |= 1
+
+    def read(self, addr: int) -> int:
+        addr &= 0xFFFF
+        if self._rhook[addr]:
+            return self.read_hooks[addr](addr, self.cycles)
+        return self.memory[addr]
+
+    # --- execution -----------------------------------------------------
+
+    def irq(self) -> bool:
+        """Take an IRQ if the I flag allows it (7 cycles). Returns taken."""
+        if self.p & INTERRUPT:
+            return False
+        mem = self.memory
+        pc = self.pc
+        mem[0x100 + self.sp] = pc >> 8
+        self.sp = (self.sp - 1) & 0xFF
+        mem[0x100 + self.sp] = pc & 0xFF
+        self.sp = (self.sp - 1) & 0xFF
+        self.p &= ~BREAK
+        mem[0x100 + self.sp] = self.p | UNUSED
+        self.sp = (self.sp - 1) & 0xFF
+        self.p |= INTERRUPT
+        self.pc = mem[IRQ_VECTOR] | (mem[IRQ_VECTOR + 1] << 8)
+        self.cycles += 7
+        return True
+
+    def step(self) -> int:
+        """Execute one instruction; returns its cycles."""
+        before = self.cycles
+        self.run(before + 1, 1)
+        return self.cycles - before
+
+    def sync_timer(self, cycles: int) -> bool:
+        """Count the timer down to cycle count `cycles`.
+
+        For write hooks about to change the timer: the cycles before the
+        writing instruction count under the old timer state, the
+        instruction's own cycles under the new one. Returns whether run()
+        has to look at the timer again -- not inside a handler, where the
+        timer stands still.
+        """
+        if self.irq_entry >= 0:
+            return False
+        if self.timer_period and self.timer_enabled:
+            self.timer_counter -= cycles - self.timer_synced
+        self.timer_synced = cycles
+        return True
+
+    def run(self, limit: int, max_instructions: int = 1 << 62) -> int:
+        """Execute until the cycle counter reaches limit, taking timer IRQs.
+
+        Also stops after max_instructions (checked between blocks). Handler
+        instructions do not count against it, and a handler that has not
+        returned after HANDLER_INSTRUCTIONS instructions is left where it
+        stands. Returns the number of instructions executed outside
+        handlers.
+
+        Code runs one instruction per call until an address has been
+        jumped to _HOT_ENTRY times; only then is a trace translated there,
+        so code that runs once (initialisation, rare paths) is not worth
+        compiling. The entry address of run() counts as jumped to.
+        """
+        blocks, heat_blocks = self._blocks, self._heat
+        singles = self._singles
+        mem = self.memory
+        log = self.irq_log
+        pc, a, x, y, p, sp, cyc = (self.pc, self.a, self.x, self.y,
+                                   self.p, self.sp, self.cycles)
+        n = 0
+        in_handlers = 0     # of the n instructions
+        entry = -1
+        draining = False    # reloading the timer after underflows
+        flags = _JUMPED
+        while True:
+            # Run up to the next underflow, or the handler to its RTI
+            table, heat = blocks, heat_blocks
+            if entry < 0:
+                stop, room = limit, max_instructions + in_handlers
+                if self.timer_period and self.timer_enabled:
+                    t = self.timer_synced + self.timer_counter
+                    if t < stop:
+                        stop = t if t > cyc else cyc + 1
+            while cyc < stop and n < room:
+                if flags & (_JUMPED | _STEP) and table[pc] is None:
+                    h = heat[pc] + 1
+                    if h >= _HOT_ENTRY:
+                        self._translate(pc, _CHECKED if table is self._checked else _TRACE)
+                    else:
+                        heat[pc] = h
+                fn = table[pc]
+                if fn is None:
+                    fn = singles[pc]
+                    if fn is None:
+                        fn = self._translate(pc, _SINGLE)
+                pc, a, x, y, p, sp, cyc, k = fn(a, x, y, p, sp, cyc, stop)
+                n += k
+                flags = pc
+                if pc > 0xFFFF:
+                    pc &= 0xFFFF
+                    if flags & _STEP:
+                        # The limit may fall inside the next few instructions
+                        table, heat = self._checked, self._checked_heat
+                        continue
+                    if flags & (_RTI | STOP):
+                        break
+
+            if entry >= 0:
+                if not (flags & _RTI or cyc >= stop or n >= room):
+                    continue
+                cost = cyc - entry
+                log.append((tag, cost, self.timer_period))
+                in_handlers += n - handler_start
+                entry = self.irq_entry = -1
+                flags = _JUMPED
+                self.timer_synced = cyc
+                self.timer_counter -= cost
+            elif self.timer_period and self.timer_enabled:
+                self.timer_counter -= cyc - self.timer_synced
+                self.timer_synced = cyc
+                draining = True
+            else:
+                self.timer_synced = cyc
+
+            while draining:
+                if self.timer_counter > 0 or not self.timer_period:
+                    draining = False
+                    break
+                self.timer_counter += self.timer_period
+                if p & INTERRUPT:
+                    continue
+                # Take the IRQ: push PC and P, set I, load the vector
+                tag = (mem[self.irq_tag[0]] << 8) | mem[self.irq_tag[1]]
+                mem[0x100 + sp] = pc >> 8
+                sp = (sp - 1) & 0xFF
+                mem[0x100 + sp] = pc & 0xFF
+                sp = (sp - 1) & 0xFF
+                p &= ~BREAK
+                mem[0x100 + sp] = p | UNUSED
+                sp = (sp - 1) & 0xFF
+                p |= INTERRUPT
+                pc = mem[IRQ_VECTOR] | (mem[IRQ_VECTOR + 1] << 8)
+                entry = self.irq_entry = cyc
+                cyc += 7
+                # Every instruction takes at most 7 cycles, so the cycle
+                # limit only guards a handler that never returns
+                stop = entry + 7 * (self.HANDLER_INSTRUCTIONS + 1)
+                handler_start = n
+                room = n + self.HANDLER_INSTRUCTIONS
+                flags = _JUMPED
+                break
+            if entry < 0 and (cyc >= limit or n - in_handlers >= max_instructions):
+                break
+        self.pc, self.a, self.x, self.y, self.p, self.sp, self.cycles = (
+            pc, a, x, y, p, sp, cyc)
+        return n - in_handlers
+
+    def load_memory(self, data: bytes):
+        """Replace the memory image, dropping translations it changes."""
+        mem = self.memory
+        for addr in [b for b in self._covering if mem[b] != data[b]]:
+            self._invalidate(addr)
+        mem[:] = data
+
+    # --- self-modifying code -------------------------------------------
+
+    def _trap(self, addr: int, value: int, cyc: int) -> int:
+        """Slow path of a store to a hooked or translated address."""
+        flags = self._wtrap[addr]
+        if flags & 2:
+            self._invalidate(addr)
+        if flags & 1:
+            if self.write_hooks[addr](addr, value, cyc):
+                return STOP
+        return 0
+
+    def _invalidate(self, addr: int):
+        if addr not in self._opcode_at:
+            self._volatile.add(addr)
+        for key in list(self._covering.get(addr, ())):
+            self._drop(key)
+
+    def _drop(self, key: int):
+        tables = (self._blocks, self._checked, self._singles)
+        tables[key >> 16][key & 0xFFFF] = None
+        for b in self._block_bytes.pop(key, ()):
+            users = self._covering.get(b)
+            if users is not None:
+                users.discard(key)
+                if not users:
+                    del self._covering[b]
+                    self._wtrap[b] &= ~2
+                    self._opcode_at.discard(b)
+
+    def _link(self, key: int, hits: List[int], targets: List[int]):
+        """An exit of block `key` is hot: retranslate the block with the
+        traces from the targets of its busy exits in it."""
+        links = self._links.setdefault(key, [])
+        n_links = len(links)
+        for n, target in sorted(zip(hits, targets), reverse=True):
+            if (n >= _BUSY_EXIT and len(links) < _MAX_SEGMENTS - 1
+                    and target not in links and target != key & 0xFFFF):
+                links.append(target)
+        if len(links) > n_links:
+            self._drop(key)
+
+    # --- translation ---------------------------------------------------
+
+    def _translate(self, start: int, kind: int = _TRACE) -> Callable:
+        """Compile the code starting at `start` as a block of `kind`.
+
+        Checked blocks test the cycle limit after every instruction; they
+        run only when a normal block found the limit close. Singles hold
+        one instruction and follow nothing.
+        """
+        key = start | (kind << 16)
+        if kind == _SINGLE:
+            segments = [(start, *self._decode(start, 1, False))]
+        else:
+            length = _MAX_CHECKED if kind == _CHECKED else _MAX_BLOCK
+            segments = [(seg, *self._decode(seg, length))
+                        for seg in [start] + self._links.get(key, [])]
+        src, targets = _Emitter(self, segments, kind).source()
+        hits = [0] * len(targets)
+        namespace = {"mem": self.memory, "rhook": self._rhook, "wtrap": self._wtrap,
+                     "io_read": self._io_read, "trap": self._trap, "NZ": _NZ,
+                     "CMP": _CMP, "adc_dec": _adc_decimal, "sbc_dec": _sbc_decimal,
+                     "hits": hits, "link": functools.partial(self._link, key, hits, targets)}
+        for addr, fn in self.read_hooks.items():
+            namespace[f"read_{addr:04X}"] = fn
+        for addr, fn in self.write_hooks.items():
+            namespace[f"write_{addr:04X}"] = fn
+        exec(compile(src, f"<6502 block ${start:04X}>", "exec"), namespace)
+        fn = namespace["block"]
+
+        (self._blocks, self._checked, self._singles)[kind][start] = fn
+        code_bytes = []
+        for insn in (insn for _, trace, _ in segments for insn in trace):
+            code_bytes.append(insn.pc)
+            self._opcode_at.add(insn.pc)
+            if not insn.volatile:
+                code_bytes.extend(insn.operands)
+        self._block_bytes[key] = code_bytes
+        for b in code_bytes:
+            self._covering.setdefault(b, set()).add(key)
+            self._wtrap[b] |= 2
+        self.translations += 1
+        return fn
+
+    def _io_read(self, addr: int, cyc: int) -> int:
+        return self.read_hooks[addr](addr, cyc)
+
+    def _decode(self, start: int, length: int, follow: bool = True):
+        """Decode a trace of up to `length` instructions -> (instructions, end).
+
+        With `follow`, JMP and JSR with a fixed target are followed; an RTS
+        matching a followed JSR continues behind it. A conditional branch
+        continues on the fall-through path, unless it loops back to the
+        start. `end` is None when the last instruction leaves the block
+        itself, "loop" to jump back to the start, else the address to
+        return.
+        """
+        mem = self.memory
+        trace: List[_Insn] = []
+        visited = set()
+        calls: List[int] = []
+        pc = start
+        for _ in range(length):
+            visited.add(pc)
+            info = OPCODES.get(mem[pc])
+            if info is None:
+                trace.append(_Insn(pc, None, "imp", 0, 0, [], False, (pc + 2) & 0xFFFF))
+                return trace, None
+            name, mode, cycles, extra = info
+            operands = [(pc + 1 + i) & 0xFFFF for i in range(_OPERAND_BYTES[mode])]
+            volatile = any(b in self._volatile for b in operands)
+            insn = _Insn(pc, name, mode, cycles, extra, operands, volatile,
+                         (pc + 1 + len(operands)) & 0xFFFF)
+            trace.append(insn)
+            cont = insn.nxt
+            if not volatile and len(operands) == 2:
+                word = mem[operands[0]] | (mem[operands[1]] << 8)
+            if name in _BRANCHES:
+                if not volatile:
+                    d = mem[operands[0]]
+                    insn.target = (insn.nxt + d - 256 if d & 0x80 else insn.nxt + d) & 0xFFFF
+                    if follow and insn.target == start:
+                        insn.follow = True
+                        cont = insn.target
+            elif not follow:
+                if name in ("JMP", "JSR", "RTS", "RTI", "BRK"):
+                    return trace, None
+            elif name in ("JMP", "JSR") and mode == "abs" and not volatile:
+                insn.target = word
+                if name == "JSR":
+                    insn.ret = (pc + 2) & 0xFFFF
+                insn.follow = True
+                if name == "JSR":
+                    calls.append(insn.ret)
+                cont = word
+            elif name == "JMP":
+                # Computed jump (indirect or patched operand): follow the
+                # current target behind a check of the run-time target
+                if mode == "abs":
+                    target = mem[operands[0]] | (mem[operands[1]] << 8)
+                else:
+                    ta = mem[operands[0]] | (mem[operands[1]] << 8)
+                    target = mem[ta] | (mem[(ta & 0xFF00) | ((ta + 1) & 0xFF)] << 8)
+                insn.target = target
+                insn.follow = insn.guard = True
+                cont = target
+            elif name == "RTS" and calls:
+                insn.ret = calls.pop()
+                cont = (insn.ret + 1) & 0xFFFF
+            elif name in ("JMP", "JSR", "RTS", "RTI", "BRK"):
+                return trace, None
+            if cont == start:
+                return trace, "loop"
+            if cont in visited:
+                return trace, cont
+            pc = cont
+        return trace, pc
+
+
+class _Emitter:
+    """Python source for a block: one or more decoded traces.
+
+    Registers are locals. `cyc` is only updated where it has to be (page
+    crossings, loop back-edges); elsewhere the cycles of the instructions
+    emitted so far are carried as the constant `off`. Likewise the N and Z
+    flags of a register load are folded into `p` only where `p` is read
+    (`nz` names the register they are pending from). The limit is checked
+    once per chunk of instructions against the chunk's worst case; a
+    chunk that might reach it returns with the STEP flag and run()
+    continues in checked blocks. Singles leave the check to run().
+
+    Normal and checked blocks hold the trace from their start plus the
+    traces from the targets of their hot exits (segments). Exits to a
+    segment jump there inside the function (segment `s` of a `while`
+    loop), so a handler with data-dependent branches runs in one call;
+    other fixed exits count their hits and add their target once it is
+    hot.
+    """
+
+    def __init__(self, cpu: Cpu6502, segments: List[tuple], kind: int):
+        self.cpu = cpu
+        self.mem = cpu.memory
+        self.segments = segments
+        self.region = kind != _SINGLE
+        self.seg_starts = {seg for seg, _, _ in segments} if self.region else set()
+        self.kind = kind
+        self.checked = kind == _CHECKED
+        self.lines: List[str] = []
+        self.off = 0
+        self.count = 0
+        self.targets: List[int] = []      # target of each counted exit
+        self.nz = None
+
+    # helpers
+    def cyc(self, extra: int = 0) -> str:
+        total = self.off + extra
+        return f"cyc + {total}" if total else "cyc"
+
+    def n(self, count=None) -> str:
+        count = self.count if count is None else count
+        return f"n + {count}" if self.region else str(count)
+
+    def p(self) -> str:
+        return f"(p & 0x7D) | NZ[{self.nz}]" if self.nz else "p"
+
+    def flush(self):
+        if self.nz:
+            self.lines.append(f"p = {self.p()}")
+            self.nz = None
+
+    def add(self, lines: List[str]):
+        """Append lines; '@NZ r' marks the N/Z flags as pending from r."""
+        for ln in lines:
+            if ln.startswith("@NZ "):
+                reg = ln[4:]
+                if reg in ("a", "x", "y"):
+                    self.nz = reg
+                else:
+                    self.lines.append(f"p = (p & 0x7D) | NZ[{reg}]")
+                    self.nz = None
+            else:
+                self.lines.append(ln)
+
+    def exit(self, pc, extra: int = 0, count=None, jumped: bool = False) -> str:
+        if jumped:
+            pc = pc | _JUMPED if isinstance(pc, int) else f"{pc} | {_JUMPED}"
+        return (f"return ({pc}, a, x, y, {self.p()}, sp, {self.cyc(extra)}, "
+                f"{self.n(count)})")
+
+    def leave(self, target: int, extra: int = 0, jumped: bool = True) -> List[str]:
+        """Lines for a jump to the fixed address `target`."""
+        if target in self.seg_starts:
+            stmts = [f"p = {self.p()}"] if self.nz else []
+            if self.off + extra:
+                stmts.append(f"cyc += {self.off + extra}")
+            stmts += [f"n += {self.count}", f"s = {target}", "continue"]
+            return ["; ".join(stmts)]
+        if not self.region:
+            return [self.exit(target, extra, jumped=jumped)]
+        j = len(self.targets)
+        self.targets.append(target)
+        return [f"hits[{j}] += 1",
+                f"if hits[{j}] == {_HOT_EXIT}: link()",
+                self.exit(target, extra, jumped=True)]
+
+    def source(self):
+        body = []
+        for seg, trace, end in self.segments:
+            self.lines, self.off, self.count, self.nz = [], 0, 0, None
+            self.segment(seg, trace, end)
+            if self.region:
+                body += [f"if s == {seg}:"] + ["    " + ln for ln in self.lines]
+            else:
+                body += self.lines
+        if self.region:
+            body = ["n = 0", f"s = {self.segments[0][0]}", "while True:"] + [
+                "    " + ln for ln in body]
+        src = ("def block(a, x, y, p, sp, cyc, limit, mem=mem, rhook=rhook, "
+               "wtrap=wtrap, io_read=io_read, trap=trap, NZ=NZ, CMP=CMP, "
+               "adc_dec=adc_dec, sbc_dec=sbc_dec, hits=hits, link=link):\n"
+               + "\n".join("    " + ln for ln in body) + "\n")
+        return src, self.targets
+
+    def segment(self, start: int, trace: List[_Insn], end):
+        if self.checked:
+            # Entered by a jump from inside the block, too
+            self.lines.append("if cyc >= limit: " + self.exit(start, count=0))
+        for i, insn in enumerate(trace):
+            if self.kind == _TRACE and i % _CHUNK == 0:
+                worst = sum(t.max_cycles() for t in trace[i:i + _CHUNK])
+                self.lines.append(f"if cyc + {self.off + worst} >= limit: "
+                                  + self.exit(insn.pc | _STEP, count=i))
+            self.count = i + 1
+            self.emit(insn)
+            if self.checked:
+                if i + 1 < len(trace):
+                    self.lines.append(f"if {self.cyc()} >= limit: "
+                                      + self.exit(trace[i + 1].pc))
+                elif end is not None:
+                    cont = start if end == "loop" else end
+                    self.lines.append(f"if {self.cyc()} >= limit: " + self.exit(cont))
+        if end == "loop":
+            self.lines += self.leave(start)
+        elif end is not None:
+            # A trace that stops short of a jump still ends at an address
+            # worth a trace of its own; a single just steps on
+            self.lines += self.leave(end, jumped=self.kind != _SINGLE)
+
+    def operand(self, insn: _Insn):
+        """Operand as a constant, or an expression if volatile."""
+        ops = insn.operands
+        if len(ops) == 1:
+            return f"mem[{ops[0]}]" if insn.volatile else self.mem[ops[0]]
+        if insn.volatile:
+            return f"(mem[{ops[0]}] | (mem[{ops[1]}] << 8))"
+        return self.mem[ops[0]] | (self.mem[ops[1]] << 8)
+
+    def emit(self, insn: _Insn):
+        lines = self.lines
+        name, mode, cycles, nxt = insn.name, insn.mode, insn.cycles, insn.nxt
+
+        if name is None:
+            # Undocumented: two-byte no-op, no cycles
+            lines.append(self.exit(nxt))
+            return
+
+        # --- control flow ---
+        if name in _BRANCHES:
+            cond = _BRANCHES[name]
+            if self.nz and name in _NZ_BRANCHES:
+                cond = _NZ_BRANCHES[name].format(self.nz)
+            if insn.target is None:
+                lines += [f"if {cond}:",
+                          f"    d = mem[{insn.operands[0]}]",
+                          f"    t = ({nxt} + d - 256 if d & 0x80 else {nxt} + d) & 0xFFFF",
+                          f"    return (t | {_JUMPED}, a, x, y, {self.p()}, sp, {self.cyc()} + "
+                          f"(4 if (t ^ {nxt}) & 0xFF00 else 3), {self.n()})"]
+                self.off += 2
+                return
+            taken = 4 if (insn.target ^ nxt) & 0xFF00 else 3
+            if insn.follow:
+                lines.append(f"if not ({cond}):")
+                lines += ["    " + ln for ln in self.leave(nxt, 2)]
+                self.off += taken
+                return
+            lines.append(f"if {cond}:")
+            lines += ["    " + ln for ln in self.leave(insn.target, taken)]
+            self.off += 2
+            return
+
+        if name == "JMP":
+            if insn.guard:
+                if mode == "abs":
+                    lines.append(f"t = {self.operand(insn)}")
+                else:
+                    lines += [f"ta = {self.operand(insn)}",
+                              "t = mem[ta] | (mem[(ta & 0xFF00) | ((ta + 1) & 0xFF)] << 8)"]
+                lines.append(f"if t != {insn.target}: " + self.exit("t", cycles, jumped=True))
+                self.off += cycles
+            elif insn.follow:
+                self.off += cycles
+            elif mode == "abs":
+                lines.append(self.exit(self.operand(insn), cycles, jumped=True))
+            else:
+                # JMP (ind) with the NMOS page-wrap of the pointer
+                lines += [f"ta = {self.operand(insn)}",
+                          "t = mem[ta] | (mem[(ta & 0xFF00) | ((ta + 1) & 0xFF)] << 8)",
+                          self.exit("t", cycles, jumped=True)]
+            return
+
+        if name == "JSR":
+            ret = (insn.pc + 2) & 0xFFFF
+            lines += [f"mem[0x100 + sp] = {ret >> 8}",
+                      "sp = (sp - 1) & 0xFF",
+                      f"mem[0x100 + sp] = {ret & 0xFF}",
+                      "sp = (sp - 1) & 0xFF"]
+            if insn.follow:
+                self.off += cycles
+            else:
+                lines.append(self.exit(self.operand(insn), cycles, jumped=True))
+            return
+
+        if name == "RTS":
+            lines += ["sp = (sp + 1) & 0xFF", "t = mem[0x100 + sp]",
+                      "sp = (sp + 1) & 0xFF", "t |= mem[0x100 + sp] << 8"]
+            if insn.ret is not None:
+                lines.append(f"if t != {insn.ret}: "
+                             + self.exit("((t + 1) & 0xFFFF)", cycles, jumped=True))
+                self.off += cycles
+            else:
+                lines.append(self.exit("((t + 1) & 0xFFFF)", cycles, jumped=True))
+            return
+
+        if name == "RTI":
+            self.nz = None
+            lines += ["sp = (sp + 1) & 0xFF", "p = mem[0x100 + sp] | 0x30",
+                      "sp = (sp + 1) & 0xFF", "t = mem[0x100 + sp]",
+                      "sp = (sp + 1) & 0xFF", "t |= mem[0x100 + sp] << 8",
+                      self.exit(f"t | {_RTI}", cycles, jumped=True)]
+            return
+
+        if name == "BRK":
+            self.flush()
+            ret = (insn.pc + 2) & 0xFFFF
+            lines += [f"mem[0x100 + sp] = {ret >> 8}",
+                      "sp = (sp - 1) & 0xFF",
+                      f"mem[0x100 + sp] = {ret & 0xFF}",
+                      "sp = (sp - 1) & 0xFF",
+                      "p |= 0x10",
+                      "mem[0x100 + sp] = p | 0x30",
+                      "sp = (sp - 1) & 0xFF",
+                      "p |= 0x04",
+                      self.exit(f"(mem[{IRQ_VECTOR}] | (mem[{IRQ_VECTOR + 1}] << 8))",
+                                cycles, jumped=True)]
+            return
+
+        # --- implied / accumulator ---
+        if mode == "imp":
+            if name in _FLAG_OPS:
+                if _FLAG_OPS[name]:
+                    lines.append(_FLAG_OPS[name])
+            elif name in _TRANSFERS:
+                dst, src = _TRANSFERS[name]
+                self.add([f"{dst} = {src}", f"@NZ {dst}"])
+            elif name == "TXS":
+                lines.append("sp = x")
+            elif name in _INC_REG:
+                reg, sign = _INC_REG[name]
+                self.add([f"{reg} = ({reg} {sign} 1) & 0xFF", f"@NZ {reg}"])
+            elif name == "PHA":
+                lines += ["mem[0x100 + sp] = a", "sp = (sp - 1) & 0xFF"]
+            elif name == "PHP":
+                self.flush()
+                lines += ["mem[0x100 + sp] = p | 0x30", "sp = (sp - 1) & 0xFF"]
+            elif name == "PLA":
+                self.add(["sp = (sp + 1) & 0xFF", "a = mem[0x100 + sp]", "@NZ a"])
+            elif name == "PLP":
+                self.nz = None
+                lines += ["sp = (sp + 1) & 0xFF", "p = mem[0x100 + sp] | 0x30"]
+            else:
+                raise _unexpected(insn)
+            self.off += cycles
+            return
+
+        if mode == "acc":
+            self.nz = None      # the shift replaces N and Z
+            self.add(_rmw_lines(insn, "a", "a"))
+            self.off += cycles
+            return
+
+        # --- memory operands ---
+        ea, ea_lines, cross, dynamic, zero_page = self.address(insn)
+        lines += ea_lines
+
+        if mode == "imm":
+            value = self.operand(insn)
+        elif zero_page:
+            value = f"mem[{ea}]"
+        elif not dynamic:
+            value = (f"read_{ea:04X}({ea}, {self.cyc()})" if self.cpu._rhook[ea]
+                     else f"mem[{ea}]")
+        else:
+            value = f"(mem[{ea}] if not rhook[{ea}] else io_read({ea}, {self.cyc()}))"
+
+        if name in _READS:
+            if name not in ("LDA", "LDX", "LDY", "ORA", "AND", "EOR"):
+                self.nz = None  # the instruction rewrites N and Z itself
+            self.add(_read_lines(insn, value))
+            if cross:
+                lines.append(cross)
+            self.off += cycles
+            return
+
+        if name in _RMW:
+            self.nz = None
+            lines.append(f"v = {value}")
+            self.add(_rmw_lines(insn, "v", "v"))
+            src = "v"
+        elif name in _STORES:
+            src = _STORES[name]
+        else:
+            raise _unexpected(insn)
+
+        lines.append(f"mem[{ea}] = {src}")
+        if not dynamic and ea in self.cpu.write_hooks:
+            lines.append(f"if write_{ea:04X}({ea}, {src}, {self.cyc()}): "
+                         + self.exit(nxt | STOP, cycles))
+        else:
+            jumped = _JUMPED if self.kind != _SINGLE else 0
+            lines.append(f"if wtrap[{ea}]: return (trap({ea}, {src}, {self.cyc()}) | {nxt | jumped}, "
+                         f"a, x, y, {self.p()}, sp, {self.cyc(cycles)}, {self.n()})")
+        self.off += cycles
+
+    def address(self, insn: _Insn):
+        """(ea expression, setup lines, page-cross line, dynamic, zero page)."""
+        mode = insn.mode
+        op = self.operand(insn)
+        const = isinstance(op, int)
+        if mode == "imm":
+            return None, [], None, False, False
+        if mode in ("zpg", "abs"):
+            if const:
+                return op, [], None, False, mode == "zpg"
+            return "ea", [f"ea = {op}"], None, True, mode == "zpg"
+        if mode in ("zpx", "zpy"):
+            reg = "x" if mode == "zpx" else "y"
+            return "ea", [f"ea = ({op} + {reg}) & 0xFF"], None, True, True
+        if mode in ("abx", "aby"):
+            reg = "x" if mode == "abx" else "y"
+            if const:
+                lines = ([f"ea = ({op} + {reg}) & 0xFFFF"] if op + 0xFF > 0xFFFF
+                         else [f"ea = {op} + {reg}"])
+                cross = (f"if {op & 0xFF} + {reg} > 0xFF: cyc += 1"
+                         if insn.extra else None)
+            else:
+                lines = [f"b = {op}", f"ea = (b + {reg}) & 0xFFFF"]
+                cross = f"if (b & 0xFF) + {reg} > 0xFF: cyc += 1" if insn.extra else None
+            return "ea", lines, cross, True, False
+        if mode == "inx":
+            return "ea", [f"z = ({op} + x) & 0xFF",
+                          "ea = mem[z] | (mem[(z + 1) & 0xFF] << 8)"], None, True, False
+        if mode == "iny":
+            if const:
+                lines = [f"b = mem[{op}] | (mem[{(op + 1) & 0xFF}] << 8)"]
+            else:
+                lines = [f"z = {op}", "b = mem[z] | (mem[(z + 1) & 0xFF] << 8)"]
+            lines.append("ea = (b + y) & 0xFFFF")
+            cross = "if (b & 0xFF) + y > 0xFF: cyc += 1" if insn.extra else None
+            return "ea", lines, cross, True, False
+        raise _unexpected(insn)
+
+
+def _unexpected(insn: _Insn) -> AssertionError:
+    """Error for an instruction the emitter's dispatch should not reach."""
+    return AssertionError(f"no translation for {insn.name} ({insn.mode}) "
+                          f"at ${insn.pc:04X}")
+
+
+def _read_lines(insn: _Insn, value) -> List[str]:
+    name = insn.name
+    if name in ("LDA", "LDX", "LDY"):
+        reg = name[2].lower()
+        return [f"{reg} = {value}", f"@NZ {reg}"]
+    if name in _LOGIC:
+        return [f"a {_LOGIC[name]}= {value}", "@NZ a"]
+    if name in ("CMP", "CPX", "CPY"):
+        reg = {"CMP": "a", "CPX": "x", "CPY": "y"}[name]
+        return [f"p = (p & 0x7C) | CMP[{reg} - {value} + 256]"]
+    if name == "BIT":
+        return [f"v = {value}", "p = (p & 0x3D) | (v & 0xC0) | (0 if a & v else 2)"]
+    if name == "ADC":
+        return [f"v = {value}",
+                "if p & 0x08:",
+                "    a, p = adc_dec(a, v, p)",
+                "else:",
+                "    t = a + v + (p & 1)",
+                "    p = ((p & 0x3C) | (0x40 if ~(a ^ v) & (a ^ t) & 0x80 else 0)"
+                " | (t > 0xFF))",
+                "    a = t & 0xFF",
+                "    p |= NZ[a]"]
+    if name == "SBC":
+        return [f"v = {value}",
+                "if p & 0x08:",
+                "    a, p = sbc_dec(a, v, p)",
+                "else:",
+                "    t = a + (v ^ 0xFF) + (p & 1)",
+                "    p = ((p & 0x3C) | (0x40 if (a ^ v) & (a ^ t) & 0x80 else 0)"
+                " | (t > 0xFF))",
+                "    a = t & 0xFF",
+                "    p |= NZ[a]"]
+    raise _unexpected(insn)
+
+
+def _rmw_lines(insn: _Insn, src: str, dst: str) -> List[str]:
+    name = insn.name
+    if name == "ASL":
+        return [f"p = (p & 0x7C) | ({src} >> 7)", f"{dst} = ({src} << 1) & 0xFF",
+                f"@NZ {dst}"]
+    if name == "LSR":
+        return [f"p = (p & 0x7C) | ({src} & 1)", f"{dst} = {src} >> 1", f"@NZ {dst}"]
+    if name == "ROL":
+        return [f"t = (({src} << 1) | (p & 1)) & 0xFF",
+                f"p = (p & 0x7C) | ({src} >> 7)", f"{dst} = t", f"@NZ {dst}"]
+    if name == "ROR":
+        return [f"t = ({src} >> 1) | ((p & 1) << 7)",
+                f"p = (p & 0x7C) | ({src} & 1)", f"{dst} = t", f"@NZ {dst}"]
+    if name == "INC":
+        return [f"{dst} = ({src} + 1) & 0xFF", f"@NZ {dst}"]
+    if name == "DEC":
+        return [f"{dst} = ({src} - 1) & 0xFF", f"@NZ {dst}"]
+    raise _unexpected(insn)
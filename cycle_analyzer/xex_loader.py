@@ -87,7 +87,7 @@ def parse_xex(data: bytes) -> XexFile:
 
 
 def load_into_memory(memory, xex: XexFile):
-    """Load XEX segments into memory (list or ObservableMemory).
+    """Load XEX segments into memory (bytearray or list).
 
     Returns run_addr or None.
     """
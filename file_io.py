@@ -7,14 +7,20 @@ Project file format (.pvq):
     - project.json: Song data, editor state, VQ settings
     - samples/: WAV audio files (original sources)
     - metadata.json: Format version, timestamps
+    - vq_output/ (optional): Converter output (codebook, index stream,
+      SAMPLE_DIR, conversion_info.json) plus vq_meta.json holding the
+      content hash of the instruments + settings that produced it
     
-    NOTE: VQ output is NOT saved in archives. It is auto-regenerated
-    on load to ensure the latest conversion algorithm is always used.
+    NOTE: Embedded VQ output is only reused when its hash still matches the
+    current instruments, settings and converter version. Otherwise it is
+    regenerated on load, so the latest conversion algorithm is always used.
 
 Working directory:
     .tmp/ folder in application directory with subdirectories:
     - samples/: Imported/extracted sample files
     - vq_output/: VQ conversion results (regenerated on load)
+    - vq_cache/: Content-addressed conversion cache (see vq_cache.py);
+      survives new/load project so reconversion of unchanged input is instant
     - build/: Build artifacts
 
 Instance locking:
@@ -145,7 +151,7 @@ except ImportError:
 from constants import (PROJECT_EXT, BINARY_EXT, DEFAULT_SPEED, DEFAULT_OCTAVE,
                        DEFAULT_STEP, MAX_VOLUME, MAX_CHANNELS, PAL_HZ, FOCUS_EDITOR,
                        NOTE_OFF, APP_VERSION, FORMAT_VERSION, VQ_RATE_DEFAULT,
-                       VQ_VECTOR_DEFAULT, VQ_SMOOTHNESS_DEFAULT)
+                       VQ_VECTOR_DEFAULT, VQ_SMOOTHNESS_DEFAULT, VQ_SEED_DEFAULT)
 from data_model import Song, Instrument, Pattern, Row
 
 # =============================================================================
@@ -200,6 +206,7 @@ class EditorState:
     vq_enhance: bool = True
     vq_memory_limit_kb: int = 35  # DEPRECATED — kept for loading old projects
     vq_used_only: bool = False  # Only convert/optimize instruments used in song
+    vq_seed: int = VQ_SEED_DEFAULT  # Codebook training seed
     
     # Song target settings
     start_address: int = 0x2000
@@ -530,17 +537,21 @@ def get_supported_extensions() -> List[str]:
 # =============================================================================
 
 def save_project(song: Song, editor_state: EditorState, 
-                 path: str, work_dir: WorkingDirectory) -> Tuple[bool, str]:
+                 path: str, work_dir: WorkingDirectory,
+                 vq_output_dir: Optional[str] = None) -> Tuple[bool, str]:
     """Save project as ZIP archive.
     
     Uses Song.to_dict() as single source of truth for serialization.
-    Only adds: editor state, sample WAV embedding, and archive metadata.
+    Only adds: editor state, sample WAV embedding, archive metadata and
+    (optionally) the VQ conversion output.
     
     Args:
         song: Song data
         editor_state: Editor state to persist
         path: Output file path
         work_dir: Working directory instance
+        vq_output_dir: Valid converter output to embed. Only embedded if it
+            carries a vq_meta.json content hash (deterministic conversion).
         
     Returns:
         (success, message)
@@ -567,6 +578,9 @@ def save_project(song: Song, editor_state: EditorState,
                     zf.write(inst.sample_path, archive_name)
                     embedded_count += 1
             
+            # Embed VQ conversion output (reused on load if hash matches)
+            vq_embedded = _embed_vq_output(zf, vq_output_dir)
+            
             # Add project.json
             zf.writestr("project.json", json.dumps(project_data, indent=2))
             
@@ -586,6 +600,8 @@ def save_project(song: Song, editor_state: EditorState,
         msg = f"Saved: {os.path.basename(path)}"
         if embedded_count:
             msg += f" ({embedded_count} samples)"
+        if vq_embedded:
+            msg += " + VQ data"
         
         # Warn about instruments whose sample files are missing on disk
         missing = sum(1 for inst in song.instruments
@@ -687,6 +703,8 @@ def load_project(path: str, work_dir: WorkingDirectory
         # Load editor state
         editor_data = data.get('editor', {})
         editor_state = EditorState.from_dict(editor_data)
+        # Embedded VQ output was extracted into work_dir.vq_output. It is
+        # only reused if its hash matches on the auto-conversion that follows.
         editor_state.vq_converted = False
         
         logger.info(f"Loaded: {os.path.basename(path)} ({loaded_samples} samples)")
@@ -711,6 +729,22 @@ def load_project(path: str, work_dir: WorkingDirectory
         return None, None, f"Load failed: {e}"
 
 
+def _embed_vq_output(zf: zipfile.ZipFile, vq_output_dir: Optional[str]) -> bool:
+    """Write converter output files into the archive under vq_output/.
+    
+    Extracting the archive into work_dir.root restores them straight into
+    work_dir.vq_output. Returns True if anything was embedded.
+    """
+    from vq_cache import read_output_meta
+    if not vq_output_dir or read_output_meta(vq_output_dir) is None:
+        return False
+    for name in sorted(os.listdir(vq_output_dir)):
+        src = os.path.join(vq_output_dir, name)
+        if os.path.isfile(src):
+            zf.write(src, f"{VQ_OUTPUT_DIR}/{name}")
+    return True
+
+
 # =============================================================================
 # SAMPLE LOADING
 # =============================================================================
@@ -587,6 +587,9 @@ def main():
             C.poll_build_progress()  # Poll build progress (thread-safe)
             C.poll_button_blink()   # Update blinking attention buttons
             R.update_visualization()   # Update VU + spectrum bars
+            # Live CPU headroom (~4x per second; only edits are re-simulated)
+            if _stream_check_counter % 15 == 0:
+                R.update_cpu_indicator()
             # Periodically check audio stream health (~every 2s at 60fps)
             _stream_check_counter += 1
             if _stream_check_counter >= 120:
@@ -613,6 +616,10 @@ def main():
 
 
 if __name__ == "__main__":
+    # Bank codebook training uses a process pool; frozen builds must let
+    # the pool's child processes through before the GUI starts
+    import multiprocessing
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
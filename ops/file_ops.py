@@ -168,6 +168,7 @@ def _restore_editor_state(editor_state: EditorState):
     state.vq.settings.enhance = editor_state.vq_enhance
     # memory_limit removed — now auto-computed from start_address + memory_config
     state.vq.settings.used_only = editor_state.vq_used_only
+    state.vq.settings.seed = editor_state.vq_seed
     state.vq.invalidate()
 
 
@@ -235,7 +236,9 @@ def _save_file(path: str):
         return
 
     editor_state = _build_editor_state()
-    ok, msg = save_project(state.song, editor_state, path, file_io.work_dir)
+    vq_output_dir = state.vq.output_dir if state.vq.is_valid else None
+    ok, msg = save_project(state.song, editor_state, path, file_io.work_dir,
+                           vq_output_dir=vq_output_dir)
     if ok:
         ui.update_title()
         ui.show_status(msg)
@@ -269,6 +272,7 @@ def _build_editor_state() -> EditorState:
         vq_smoothness=state.vq.smoothness,
         vq_enhance=state.vq.settings.enhance,
         vq_used_only=state.vq.settings.used_only,
+        vq_seed=state.vq.settings.seed,
     )
 
 
@@ -462,6 +466,7 @@ def _auto_optimize():
         used_indices=used_indices,
         use_banking=use_banking,
         banking_budget=banking_budget,
+        screen_control=state.song.screen_control,
     )
     
     n_changed = 0
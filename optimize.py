@@ -7,6 +7,9 @@ is audio quality (RAW has no VQ artifacts).
 Strategy:
   Phase 1 — Fix overruns: switch instruments to RAW where doing so
             eliminates the most overrun-IRQs per memory byte spent.
+            A greedy pass seeds an exact branch-and-bound search
+            (_exact_overrun_fix) that minimizes the overrun IRQs left,
+            then the memory spent, within MODE_SEARCH_TIME_BUDGET.
   Phase 2 — Quality: promote remaining instruments to RAW if budget allows,
             shortest first (least memory waste from page alignment).
 
@@ -14,12 +17,22 @@ The optimizer simulates the entire song, tracking when instruments actually
 expire (based on sample length and pitch), to get accurate per-row
 active-channel counts. A short hihat (80ms) that dies mid-row doesn't
 count as "active" for the rest of that row.
+
+The simulated timeline is kept run-length compressed (_Timeline): one
+entry per distinct set of active channels with the IRQs the song spends
+in it, so every candidate evaluation is a few NumPy reductions over the
+distinct sets instead of a rescan of every row.
 """
 
+import functools
+import hashlib
+import json
 import logging
 import math
+import os
+import time
 import numpy as np
-from typing import List, Optional, Tuple, Set, Dict
+from typing import List, Optional, Tuple, Dict
 from dataclasses import dataclass, field
 from collections import Counter
 
@@ -33,6 +46,8 @@ logger = logging.getLogger(__name__)
 # =============================================================================
 # 6502 CYCLE CONSTANTS (measured from tracker_irq_speed.asm)
 # =============================================================================
+# Fallback model: _cycle_model() derives the costs from the handler source
+# with tools/asm_cycles.py and only uses these when the asm is unavailable.
 IRQ_OVERHEAD_CYCLES = 48    # Register save/restore, IRQEN, process_row check, RTI
 CH_BASE_NOVOL = 35          # Active channel, no volume scaling
 CH_BASE_VOL = 46            # Active channel, with volume scaling
@@ -51,6 +66,9 @@ CPU_CLOCK_NTSC = 1789773
 PITCH_OFFSET = 24
 PITCH_MULTIPLIERS = [2.0 ** ((n - PITCH_OFFSET) / 12.0) for n in range(60)]
 
+# Time limit (seconds) of the exact Phase 1 search; 0 = greedy only
+MODE_SEARCH_TIME_BUDGET = 1.0
+
 
 # =============================================================================
 # DATA CLASSES
@@ -80,7 +98,9 @@ class InstrumentAnalysis:
 class CpuAnalysis:
     """CPU budget analysis."""
     sample_rate: int = 0
-    irq_period: float = 0.0
+    irq_period: float = 0.0         # Cycles an IRQ may take (see irq_budget)
+    dma_cycles: int = 0             # Display DMA taken off the IRQ period
+    screen_on: bool = True
     total_overrun_irqs: int = 0     # Total overrun-IRQs across entire song
     worst_row_pct: float = 0.0
     worst_active_channels: int = 0
@@ -88,6 +108,36 @@ class CpuAnalysis:
     warning: str = ""
 
 
+@dataclass
+class OverrunPrediction:
+    """Per-row CPU load of the song as currently configured.
+
+    budget is the IRQ period left after banking and the worst display
+    DMA an IRQ period can see; row_cycles[k][r] is the costliest IRQ of
+    row r in songline k.
+    """
+    budget: float
+    dma_cycles: int
+    peak_pct: float
+    overrun_irqs: int
+    row_cycles: List[np.ndarray] = field(default_factory=list)
+    vq_in_overruns: bool = False    # Some overrun IRQ plays a VQ instrument
+
+    def overrun_rows(self, songline: int) -> np.ndarray:
+        """Rows of a songline whose costliest IRQ exceeds the budget."""
+        if not 0 <= songline < len(self.row_cycles):
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.row_cycles[songline] > self.budget)
+
+    def first_overrun(self) -> Optional[Tuple[int, int, float]]:
+        """(songline, row, cycles) of the first overrun row, or None."""
+        for k, cycles in enumerate(self.row_cycles):
+            over = np.flatnonzero(cycles > self.budget)
+            if len(over):
+                return k, int(over[0]), float(cycles[over[0]])
+        return None
+
+
 @dataclass
 class OptimizeResult:
     """Result of the optimize analysis."""
@@ -99,6 +149,48 @@ class OptimizeResult:
     fits_all_raw: bool = False
     summary: str = ""
     cpu: CpuAnalysis = field(default_factory=CpuAnalysis)
+    # Exact Phase 1 search (None = not run): proven optimal, and how many
+    # overrun IRQs the result may be above the lower bound
+    mode_search_optimal: Optional[bool] = None
+    mode_search_gap: int = 0
+
+
+class AnalysisCache:
+    """What one optimizer run can hand to the next.
+
+    songlines: per-songline simulation summaries ({signature: IRQs}, exit
+        channel state, signatures per row), keyed by everything the
+        simulation of a songline reads -- the channel state it starts
+        from, its row length in IRQs, the note/instrument events of its
+        patterns and the sizes and base notes of the instruments they
+        play. After an edit only
+        songlines with a changed key (and those after it whose entry
+        state changed) are simulated again.
+    sizes: per-instrument (raw_size, vq_estimate, duration_ms), valid
+        while the instrument's audio array object and the rate settings
+        are the same (any sample or effect edit replaces the array).
+
+    Songline entries the latest run did not use are dropped at its end.
+    """
+
+    def __init__(self):
+        self.songlines: Dict[tuple, tuple] = {}
+        self.used: Dict[tuple, tuple] = {}
+        self.sizes: Dict[int, tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def end_run(self):
+        self.songlines, self.used = self.used, {}
+
+    def clear(self):
+        self.songlines.clear()
+        self.used.clear()
+        self.sizes.clear()
+
+
+# Shared by analyze_instruments() and predict_overruns()
+_cache = AnalysisCache()
 
 
 # =============================================================================
@@ -128,23 +220,235 @@ def estimate_vq_size(sample_data, sample_rate: int,
     return max((n_samples + vector_size - 1) // vector_size, 1)
 
 
+def _instrument_sizes(inst_idx: int, inst, target_rate: int, vector_size: int,
+                      cache: Optional[AnalysisCache]) -> Tuple[int, int, int]:
+    """(raw_size, estimated vq_size, duration_ms) of a loaded instrument."""
+    # Get effects-processed audio (Sustain, trim, etc.)
+    # processed_data is a lazy cache — may be None after effect edits
+    if inst.effects and inst.processed_data is None:
+        try:
+            from sample_editor.pipeline import run_pipeline
+            inst.processed_data = run_pipeline(
+                inst.sample_data, inst.sample_rate, inst.effects)
+        except Exception:
+            pass  # Fall back to raw sample_data below
+    data = (inst.processed_data if inst.processed_data is not None
+            else inst.sample_data)
+    sr = inst.sample_rate
+    params = (sr, target_rate, vector_size)
+
+    entry = cache.sizes.get(inst_idx) if cache is not None else None
+    if entry is not None and entry[0] is data and entry[1] == params:
+        return entry[2]
+    sizes = (compute_raw_size(data, sr, target_rate),
+             estimate_vq_size(data, sr, target_rate, vector_size),
+             int(len(data) / sr * 1000))
+    if cache is not None:
+        cache.sizes[inst_idx] = (data, params, sizes)
+    return sizes
+
+
 # =============================================================================
 # CPU COST COMPUTATION
 # =============================================================================
 
+@dataclass(frozen=True)
+class CycleModel:
+    """Per-IRQ cycle costs of the player's IRQ handler.
+
+    channel[(is_raw, has_pitch)] is one active channel: its common tick
+    plus the extra cycles of its boundary tick (new VQ vector, next RAW
+    page) spread over the IRQs between boundaries.
+    """
+    overhead: float         # interrupt, register save/restore, IRQEN, RTI
+    inactive: float         # one silent channel
+    channel: Dict[Tuple[bool, bool], float]
+
+
+@functools.lru_cache(maxsize=None)
+def _constant_model(vector_size: int, volume_control: bool) -> CycleModel:
+    base = CH_BASE_VOL if volume_control else CH_BASE_NOVOL
+    return CycleModel(
+        IRQ_OVERHEAD_CYCLES, CH_INACTIVE,
+        {(is_raw, has_pitch): (base + (CH_PITCH_EXTRA if has_pitch else 0)
+                               + (RAW_BOUNDARY_CYCLES / RAW_PAGE_SIZE if is_raw
+                                  else VQ_BOUNDARY_CYCLES / vector_size))
+         for is_raw in (False, True) for has_pitch in (False, True)})
+
+
+def _handler_model(asm_dir: str, vector_size: int,
+                   volume_control: bool) -> Optional[CycleModel]:
+    """Cycle costs from the WCET table of the 64 KB IRQ handler
+    (tools/asm_cycles.handler_wcet), worst channel per mode; None if the
+    player source cannot be analyzed."""
+    try:
+        from tools.asm_cycles import process_config, handler_wcet
+        defines = {'VOLUME_CONTROL': int(volume_control),
+                   'MIN_VECTOR': vector_size}
+        _, _, parsed = process_config(os.path.join(asm_dir, 'song_player.asm'),
+                                      [asm_dir], defines, [])
+        table = handler_wcet(parsed)
+    except Exception as e:
+        logger.debug(f"Handler cycle analysis failed: {e}")
+        return None
+    if table is None:
+        return None
+
+    channel = {}
+    for is_raw in (False, True):
+        for has_pitch in (False, True):
+            mode = ('raw_' if is_raw else 'vq_') + ('pitch' if has_pitch else 'no_pitch')
+            bounds = [row[mode] for row in table['channels'] if mode in row]
+            if not bounds:
+                return None
+            common = max(lo for lo, _ in bounds)
+            boundary = max(hi for _, hi in bounds)
+            interval = RAW_PAGE_SIZE if is_raw else vector_size
+            channel[(is_raw, has_pitch)] = common + (boundary - common) / interval
+    return CycleModel(table['entry'][1] + table['exit'][1],
+                      max(row['inactive'][1] for row in table['channels']),
+                      channel)
+
+
+# =============================================================================
+# CYCLE MODEL CALIBRATION
+# =============================================================================
+# The models of every VOLUME_CONTROL x MIN_VECTOR build are derived once per
+# version of the player sources and kept in .tmp/cycle_model.json:
+#
+#   {"version": 1, "asm": "<sha256 of asm/**/*.asm|inc>",
+#    "models": [{"vector_size": 8, "volume_control": false,
+#                "overhead": 43, "inactive": 8,
+#                "channel": [[is_raw, has_pitch, cycles], ...]}, ...]}
+
+CYCLE_MODEL_FILE = "cycle_model.json"
+CYCLE_MODEL_VERSION = 1
+CALIBRATED_VECTOR_SIZES = (2, 4, 8, 16)
+
+
+@dataclass
+class _Calibration:
+    checked: bool = False               # refresh_cycle_models() has run
+    digest: Optional[str] = None        # player sources the models match
+    models: Dict[Tuple[int, bool], CycleModel] = field(default_factory=dict)
+
+
+_calibration = _Calibration()
+
+
+def asm_digest(asm_dir: str) -> Optional[str]:
+    """sha256 of the player sources (*.asm and *.inc below asm_dir), None
+    if there are none."""
+    h = hashlib.sha256()
+    found = False
+    for dirpath, dirnames, filenames in os.walk(asm_dir):
+        dirnames.sort()
+        for fn in sorted(filenames):
+            if not fn.lower().endswith(('.asm', '.inc')):
+                continue
+            path = os.path.join(dirpath, fn)
+            h.update(os.path.relpath(path, asm_dir).replace(os.sep, '/').encode('utf-8') + b'\0')
+            try:
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+            except OSError:
+                return None
+            found = True
+    return h.hexdigest() if found else None
+
+
+def calibrate_cycle_models(asm_dir: str) -> Dict[Tuple[int, bool], CycleModel]:
+    """Models of every calibrated build, analyzed from the sources."""
+    models = {}
+    for vector_size in CALIBRATED_VECTOR_SIZES:
+        for volume_control in (False, True):
+            model = _handler_model(asm_dir, vector_size, volume_control)
+            if model is not None:
+                models[(vector_size, volume_control)] = model
+    return models
+
+
+def _load_models(path: str, digest: str) -> Optional[Dict[Tuple[int, bool], CycleModel]]:
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != CYCLE_MODEL_VERSION or data.get('asm') != digest:
+            return None
+        return {(m['vector_size'], m['volume_control']): CycleModel(
+                    m['overhead'], m['inactive'],
+                    {(is_raw, has_pitch): cycles
+                     for is_raw, has_pitch, cycles in m['channel']})
+                for m in data['models']}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_models(path: str, digest: str,
+                 models: Dict[Tuple[int, bool], CycleModel]):
+    data = {'version': CYCLE_MODEL_VERSION, 'asm': digest, 'models': [
+        {'vector_size': vs, 'volume_control': vc,
+         'overhead': m.overhead, 'inactive': m.inactive,
+         'channel': [[raw, pitch, c] for (raw, pitch), c in m.channel.items()]}
+        for (vs, vc), m in models.items()]}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1)
+    except OSError as e:
+        logger.debug(f"Cannot save cycle models: {e}")
+
+
+def refresh_cycle_models(asm_dir: Optional[str] = None,
+                         cache_path: Optional[str] = None) -> bool:
+    """Bring the cycle models in line with the player sources.
+
+    Nothing happens while the sources hash the same as last time. Otherwise
+    the models are read from cache_path (default .tmp/cycle_model.json in
+    the app directory) if it was written for these sources, or calibrated
+    and saved there. Without sources the fallback constants apply.
+    Returns True if the models changed.
+    """
+    import runtime
+    if asm_dir is None:
+        asm_dir = runtime.get_asm_dir()
+    if cache_path is None:
+        cache_path = os.path.join(runtime.get_app_dir(), '.tmp', CYCLE_MODEL_FILE)
+    digest = asm_digest(asm_dir)
+    _calibration.checked = True
+    if digest == _calibration.digest:
+        return False
+    models = {}
+    if digest is not None:
+        models = _load_models(cache_path, digest)
+        if models is None:
+            models = calibrate_cycle_models(asm_dir)
+            _save_models(cache_path, digest, models)
+            logger.info(f"Calibrated CPU cycle models from {asm_dir}")
+    _calibration.digest, _calibration.models = digest, models
+    return True
+
+
+def _cycle_model(vector_size: int, volume_control: bool) -> CycleModel:
+    """Cycle costs of the handler build for these settings."""
+    if not _calibration.checked:
+        refresh_cycle_models()
+    model = _calibration.models.get((vector_size, bool(volume_control)))
+    return model or _constant_model(vector_size, bool(volume_control))
+
+
+# =============================================================================
+# PER-IRQ COST
+# =============================================================================
+
 def _channel_cycles_vq(vector_size: int, has_pitch: bool,
                        volume_control: bool) -> float:
-    base = CH_BASE_VOL if volume_control else CH_BASE_NOVOL
-    if has_pitch:
-        base += CH_PITCH_EXTRA
-    return base + VQ_BOUNDARY_CYCLES / vector_size
+    return _cycle_model(vector_size, volume_control).channel[(False, has_pitch)]
 
 
-def _channel_cycles_raw(has_pitch: bool, volume_control: bool) -> float:
-    base = CH_BASE_VOL if volume_control else CH_BASE_NOVOL
-    if has_pitch:
-        base += CH_PITCH_EXTRA
-    return base + RAW_BOUNDARY_CYCLES / RAW_PAGE_SIZE
+def _channel_cycles_raw(has_pitch: bool, volume_control: bool,
+                        vector_size: int = 8) -> float:
+    # vector_size only selects the handler build; RAW paths don't use it
+    return _cycle_model(vector_size, volume_control).channel[(True, has_pitch)]
 
 
 def _irq_cost(active_channels: List[Tuple[int, bool]],
@@ -153,15 +457,16 @@ def _irq_cost(active_channels: List[Tuple[int, bool]],
     """Compute IRQ cycle cost for a set of active (inst_idx, has_pitch) channels.
     mode_map: {inst_idx: True=RAW, False=VQ}
     """
-    total = IRQ_OVERHEAD_CYCLES
+    model = _cycle_model(vector_size, volume_control)
+    total = model.overhead
     n_active = len(active_channels)
     n_inactive = MAX_CHANNELS - n_active
-    total += n_inactive * CH_INACTIVE
+    total += n_inactive * model.inactive
 
     for inst_idx, has_pitch in active_channels:
         is_raw = mode_map.get(inst_idx, False)
         if is_raw:
-            total += _channel_cycles_raw(has_pitch, volume_control)
+            total += _channel_cycles_raw(has_pitch, volume_control, vector_size)
         else:
             total += _channel_cycles_vq(vector_size, has_pitch, volume_control)
 
@@ -179,6 +484,106 @@ class _Segment:
     active: List[Tuple[int, bool]]  # [(inst_idx, has_pitch), ...]
 
 
+class _Timeline:
+    """Song timeline compressed into unique active-channel signatures.
+
+    A signature is the sorted tuple of active (inst_idx, has_pitch)
+    channels; signatures keep the order of their first appearance.
+    add_row()/add_signatures() collect them, finish() builds the arrays:
+      irqs[s]      IRQs the song spends in signature s
+      n_active[s]  active channels, n_pitch[s] of them pitched
+      counts[s, i] channels playing instrument i
+      pitched[s, i] ... of them pitched
+      index[i]     signatures containing instrument i
+    Songlines merged with their rows also get a per-row layout:
+      row_sigs[row_start[r]:row_start[r + 1]]  signatures row r plays
+      songline_rows[k]  rows of the k-th merged songline (in song order)
+    """
+
+    def __init__(self):
+        self._irqs: Dict[tuple, int] = {}
+        self._rows: List[tuple] = []
+        self.finish()
+
+    def add_row(self, segments: List[_Segment]):
+        for seg in segments:
+            key = tuple(sorted(seg.active))
+            self._irqs[key] = self._irqs.get(key, 0) + seg.n_irqs
+
+    def add_signatures(self, sigs: Dict[tuple, int], rows: tuple = ()):
+        """Merge {signature: IRQs} collected elsewhere (in song order),
+        optionally with the signatures each of its rows plays."""
+        for key, n in sigs.items():
+            self._irqs[key] = self._irqs.get(key, 0) + n
+        if rows:
+            self._rows.append(rows)
+
+    def finish(self) -> '_Timeline':
+        sigs = list(self._irqs)
+        n_inst = 1 + max((i for sig in sigs for i, _ in sig), default=-1)
+        self.irqs = np.fromiter(self._irqs.values(), dtype=np.int64, count=len(sigs))
+        self.n_active = np.array([len(sig) for sig in sigs], dtype=np.int64)
+        self.n_pitch = np.array([sum(1 for _, p in sig if p) for sig in sigs],
+                                dtype=np.int64)
+        self.counts = np.zeros((len(sigs), n_inst), dtype=np.int64)
+        self.pitched = np.zeros((len(sigs), n_inst), dtype=np.int64)
+        for s, sig in enumerate(sigs):
+            for inst_idx, has_pitch in sig:
+                self.counts[s, inst_idx] += 1
+                self.pitched[s, inst_idx] += has_pitch
+        self.index = {i: np.flatnonzero(self.counts[:, i]) for i in range(n_inst)}
+
+        position = {sig: s for s, sig in enumerate(sigs)}
+        per_row = [row for rows in self._rows for row in rows]
+        self.songline_rows = np.array([len(rows) for rows in self._rows], dtype=np.int64)
+        self.row_start = np.zeros(len(per_row) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in per_row], out=self.row_start[1:])
+        self.row_sigs = np.fromiter((position[sig] for row in per_row for sig in row),
+                                    dtype=np.int64, count=int(self.row_start[-1]))
+        return self
+
+    def row_costs(self, cost: np.ndarray) -> np.ndarray:
+        """Costliest IRQ of every merged row, given per-signature costs."""
+        if not len(self.row_sigs):
+            return np.zeros(0, dtype=cost.dtype)
+        return np.maximum.reduceat(cost[self.row_sigs], self.row_start[:-1])
+
+    def __len__(self) -> int:
+        return len(self.irqs)
+
+    def channel_cycles(self, mode_map: Dict[int, bool], vector_size: int,
+                       volume_control: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-instrument (unpitched channel cost, extra if pitched) under
+        mode_map."""
+        model = _cycle_model(vector_size, volume_control)
+        raw = np.array([mode_map.get(i, False) for i in range(self.counts.shape[1])],
+                       dtype=bool)
+        plain = np.where(raw, model.channel[(True, False)], model.channel[(False, False)])
+        pitch = np.where(raw, model.channel[(True, True)], model.channel[(False, True)])
+        return plain, pitch - plain
+
+    def raw_saving(self, mode_map: Dict[int, bool], vector_size: int,
+                   volume_control: bool) -> np.ndarray:
+        """saving[s, i]: cycles signature s loses if instrument i turns RAW
+        (0 if it already is)."""
+        vq = {i: False for i in range(self.counts.shape[1])}
+        raw = {i: True for i in range(self.counts.shape[1])}
+        vq_plain, vq_pitch = self.channel_cycles(vq, vector_size, volume_control)
+        raw_plain, raw_pitch = self.channel_cycles(raw, vector_size, volume_control)
+        saving = (self.counts * (vq_plain - raw_plain)
+                  + self.pitched * (vq_pitch - raw_pitch))
+        saving[:, [i for i in range(self.counts.shape[1]) if mode_map.get(i, False)]] = 0
+        return saving
+
+    def costs(self, mode_map: Dict[int, bool], vector_size: int,
+              volume_control: bool) -> np.ndarray:
+        """IRQ cycle cost of every signature (same model as _irq_cost)."""
+        model = _cycle_model(vector_size, volume_control)
+        plain, pitch = self.channel_cycles(mode_map, vector_size, volume_control)
+        return (model.overhead + (MAX_CHANNELS - self.n_active) * model.inactive
+                + self.counts @ plain + self.pitched @ pitch)
+
+
 def _compute_inst_duration_irqs(raw_size: int, pitch_mult: float) -> int:
     """How many IRQs an instrument plays before its sample runs out.
     raw_size = number of samples at target rate (1 byte per IRQ at 1x pitch).
@@ -191,89 +596,133 @@ def _compute_inst_duration_irqs(raw_size: int, pitch_mult: float) -> int:
 
 def _simulate_song(song, inst_raw_sizes: Dict[int, int],
                    target_rate: int, system_hz: int,
-                   inst_notes_map: Optional[Dict] = None,
-                   instruments: Optional[list] = None
-                   ) -> List[List[_Segment]]:
+                   instruments: Optional[list] = None,
+                   cache: Optional['AnalysisCache'] = None) -> _Timeline:
     """Walk every row in the song, tracking instrument expiration.
 
-    Returns a list of rows, each row being a list of _Segments.
+    With a cache, songlines whose inputs are unchanged since the last
+    run reuse their stored summary instead of being re-simulated.
+
+    Returns the compressed timeline (empty without song data).
     """
+    timeline = _Timeline()
     if not song or not song.songlines or not song.patterns:
-        return []
+        return timeline
+
+    # Per-channel state: (inst_idx or None, remaining_irqs, has_pitch)
+    channels = ((None, 0, False),) * MAX_CHANNELS
+    pattern_keys: Dict[int, tuple] = {}
 
-    all_rows: List[List[_Segment]] = []
+    for sl in song.songlines:
+        row_irqs = int(sl.speed * target_rate / system_hz)
+        pat_ids = [sl.patterns[ch] if ch < len(sl.patterns) else 0
+                   for ch in range(MAX_CHANNELS)]
+        patterns = [song.get_pattern(p) for p in pat_ids]
+
+        if cache is None:
+            sigs, channels, rows = _simulate_songline(
+                patterns, channels, row_irqs, inst_raw_sizes, instruments)
+        else:
+            for p, pat in zip(pat_ids, patterns):
+                if p not in pattern_keys:
+                    pattern_keys[p] = _pattern_key(pat)
+            keys = tuple(pattern_keys[p] for p in pat_ids)
+            played = sorted(set().union(*(k[1] for k in keys)))
+            key = (channels, row_irqs, tuple(k[0] for k in keys),
+                   tuple((i, inst_raw_sizes.get(i, 0), _base_note(instruments, i))
+                         for i in played))
+            entry = cache.songlines.get(key)
+            if entry is None:
+                entry = _simulate_songline(
+                    patterns, channels, row_irqs, inst_raw_sizes, instruments)
+                cache.misses += 1
+            else:
+                cache.hits += 1
+            cache.used[key] = entry
+            sigs, channels, rows = entry
 
-    # Per-channel state: (inst_idx, remaining_irqs, has_pitch)
-    ch_inst = [None] * MAX_CHANNELS       # instrument index or None
-    ch_remaining = [0] * MAX_CHANNELS     # IRQs left for this instrument
-    ch_pitch = [False] * MAX_CHANNELS     # whether this note uses pitch
+        timeline.add_signatures(sigs, rows)
 
-    # Track which notes each instrument is played at (for pitch detection)
-    inst_note_set: Dict[int, Set[int]] = inst_notes_map or {}
+    if cache is not None:
+        cache.end_run()
+    return timeline.finish()
 
-    for sl in song.songlines:
-        speed = sl.speed
-        row_irqs = int(speed * target_rate / system_hz)
-
-        patterns = []
-        max_len = 0
-        for ch_idx in range(MAX_CHANNELS):
-            pat_idx = sl.patterns[ch_idx] if ch_idx < len(sl.patterns) else 0
-            pat = song.get_pattern(pat_idx)
-            patterns.append(pat)
-            max_len = max(max_len, pat.length)
-
-        for row_idx in range(max_len):
-            # Process note events for this row
-            for ch in range(MAX_CHANNELS):
-                pat = patterns[ch]
-                if row_idx >= pat.length:
-                    continue
-                row = pat.rows[row_idx]
-
-                if row.note == NOTE_OFF:
+
+def _base_note(instruments: Optional[list], inst_idx: int) -> int:
+    if instruments and 0 <= inst_idx < len(instruments):
+        return getattr(instruments[inst_idx], 'base_note', 1)
+    return 1
+
+
+def _pattern_key(pat) -> Tuple[tuple, frozenset]:
+    """(row events the simulation reads, instruments the pattern plays)."""
+    rows = tuple((row.note, row.instrument) for row in pat.rows[:pat.length])
+    played = frozenset(i for n, i in rows if 1 <= n <= MAX_NOTES)
+    return rows, played
+
+
+def _simulate_songline(patterns, channels: tuple, row_irqs: int,
+                       inst_raw_sizes: Dict[int, int],
+                       instruments: Optional[list]) -> Tuple[Dict[tuple, int], tuple]:
+    """Simulate one songline from the given channel state.
+
+    Returns ({signature: IRQs} in order of appearance, channel state at
+    the end of the songline, the signatures each row plays).
+    """
+    ch_inst = [c[0] for c in channels]       # instrument index or None
+    ch_remaining = [c[1] for c in channels]  # IRQs left for this instrument
+    ch_pitch = [c[2] for c in channels]      # whether this note uses pitch
+    sigs: Dict[tuple, int] = {}
+    rows = []
+
+    max_len = max(pat.length for pat in patterns)
+    for row_idx in range(max_len):
+        # Process note events for this row
+        for ch in range(MAX_CHANNELS):
+            pat = patterns[ch]
+            if row_idx >= pat.length:
+                continue
+            row = pat.rows[row_idx]
+
+            if row.note == NOTE_OFF:
+                ch_inst[ch] = None
+                ch_remaining[ch] = 0
+                ch_pitch[ch] = False
+            elif row.note > 0 and 1 <= row.note <= MAX_NOTES:
+                inst_idx = row.instrument
+                # Apply base_note pitch correction (same as build.py export)
+                base_note = _base_note(instruments, inst_idx)
+                note_idx = row.note + PITCH_OFFSET - (base_note - 1) - 1  # 0-based
+                note_idx = max(0, min(note_idx, len(PITCH_MULTIPLIERS) - 1))
+                pitch_mult = PITCH_MULTIPLIERS[note_idx]
+
+                raw_sz = inst_raw_sizes.get(inst_idx, 0)
+                dur = _compute_inst_duration_irqs(raw_sz, pitch_mult)
+
+                ch_inst[ch] = inst_idx
+                ch_remaining[ch] = dur
+                # has_pitch = pitch_mult != 1.0
+                ch_pitch[ch] = abs(pitch_mult - 1.0) > 0.001
+
+        # Build segments within this row (active set can change as
+        # instruments expire mid-row)
+        row = []
+        for seg in _build_row_segments(ch_inst, ch_remaining, ch_pitch, row_irqs):
+            key = tuple(sorted(seg.active))
+            sigs[key] = sigs.get(key, 0) + seg.n_irqs
+            row.append(key)
+        rows.append(tuple(row))
+
+        # Advance time: subtract row_irqs from remaining
+        for ch in range(MAX_CHANNELS):
+            if ch_inst[ch] is not None:
+                ch_remaining[ch] -= row_irqs
+                if ch_remaining[ch] <= 0:
                     ch_inst[ch] = None
                     ch_remaining[ch] = 0
                     ch_pitch[ch] = False
-                elif row.note > 0 and 1 <= row.note <= MAX_NOTES:
-                    inst_idx = row.instrument
-                    # Apply base_note pitch correction (same as build.py export)
-                    base_note = 1
-                    if instruments and 0 <= inst_idx < len(instruments):
-                        base_note = getattr(instruments[inst_idx], 'base_note', 1)
-                    note_idx = row.note + PITCH_OFFSET - (base_note - 1) - 1  # 0-based
-                    note_idx = max(0, min(note_idx, len(PITCH_MULTIPLIERS) - 1))
-                    pitch_mult = PITCH_MULTIPLIERS[note_idx]
-
-                    raw_sz = inst_raw_sizes.get(inst_idx, 0)
-                    dur = _compute_inst_duration_irqs(raw_sz, pitch_mult)
-
-                    ch_inst[ch] = inst_idx
-                    ch_remaining[ch] = dur
-                    # has_pitch = pitch_mult != 1.0
-                    ch_pitch[ch] = abs(pitch_mult - 1.0) > 0.001
-
-                    # Track note set
-                    if inst_idx not in inst_note_set:
-                        inst_note_set[inst_idx] = set()
-                    inst_note_set[inst_idx].add(row.note)
-
-            # Build segments within this row (active set can change as
-            # instruments expire mid-row)
-            segments = _build_row_segments(
-                ch_inst, ch_remaining, ch_pitch, row_irqs)
-            all_rows.append(segments)
-
-            # Advance time: subtract row_irqs from remaining
-            for ch in range(MAX_CHANNELS):
-                if ch_inst[ch] is not None:
-                    ch_remaining[ch] -= row_irqs
-                    if ch_remaining[ch] <= 0:
-                        ch_inst[ch] = None
-                        ch_remaining[ch] = 0
-                        ch_pitch[ch] = False
-
-    return all_rows
+
+    return sigs, tuple(zip(ch_inst, ch_remaining, ch_pitch)), tuple(rows)
 
 
 def _build_row_segments(ch_inst, ch_remaining, ch_pitch,
@@ -327,59 +776,275 @@ def _build_row_segments(ch_inst, ch_remaining, ch_pitch,
 # OVERRUN ANALYSIS
 # =============================================================================
 
-def _count_overrun_irqs(all_rows: List[List[_Segment]],
+def _count_overrun_irqs(timeline: _Timeline,
                         mode_map: Dict[int, bool],
                         vector_size: int, volume_control: bool,
                         irq_period: float) -> int:
     """Count total IRQs across the song where CPU exceeds the budget."""
-    total = 0
-    for segments in all_rows:
-        for seg in segments:
-            cost = _irq_cost(seg.active, mode_map, vector_size, volume_control)
-            if cost > irq_period:
-                total += seg.n_irqs
-    return total
+    cost = timeline.costs(mode_map, vector_size, volume_control)
+    return int(timeline.irqs[cost > irq_period].sum())
+
+
+def _overrun_candidates(timeline: _Timeline, mode_map: Dict[int, bool],
+                        vector_size: int, volume_control: bool,
+                        irq_period: float) -> Tuple[np.ndarray, np.ndarray]:
+    """For every instrument, count:
+    - overrun IRQs where this instrument is active (participating)
+    - overrun IRQs that would be FIXED by switching this inst to RAW
 
+    Returns (participating, fixed), arrays indexed by instrument.
+    """
+    cost = timeline.costs(mode_map, vector_size, volume_control)
+    over = cost > irq_period
+    present = timeline.counts > 0
+    participating = np.where(over, timeline.irqs, 0) @ present
+
+    # Cost if the instrument were RAW (unchanged if it already is)
+    cost_if_raw = cost[:, None] - timeline.raw_saving(mode_map, vector_size,
+                                                      volume_control)
+    fixes = present & over[:, None] & (cost_if_raw <= irq_period)
+    fixed = timeline.irqs @ fixes
+    return participating, fixed
 
-def _count_overrun_irqs_involving(all_rows: List[List[_Segment]],
+
+def _count_overrun_irqs_involving(timeline: _Timeline,
                                    mode_map: Dict[int, bool],
                                    inst_idx: int,
                                    vector_size: int, volume_control: bool,
                                    irq_period: float) -> Tuple[int, int]:
-    """For a given instrument, count:
-    - overrun IRQs where this instrument is active (participating)
-    - overrun IRQs that would be FIXED by switching this inst to RAW
+    """(participating, fixed) of _overrun_candidates for one instrument,
+    evaluated on the signatures that contain it only."""
+    sigs = timeline.index.get(inst_idx)
+    if sigs is None or len(sigs) == 0:
+        return 0, 0
+    cost = timeline.costs(mode_map, vector_size, volume_control)[sigs]
+    irqs = timeline.irqs[sigs]
+    over = cost > irq_period
+    cost_if_raw = cost - timeline.raw_saving(mode_map, vector_size,
+                                             volume_control)[sigs, inst_idx]
+    return (int(irqs[over].sum()),
+            int(irqs[over & (cost_if_raw <= irq_period)].sum()))
+
+
+def _worst_signature(timeline: _Timeline, mode_map: Dict[int, bool],
+                     vector_size: int, volume_control: bool,
+                     irq_period: float) -> Tuple[float, int]:
+    """(peak % of the IRQ period, active channels) of the costliest
+    signature; the first to appear in the song wins ties."""
+    cost = timeline.costs(mode_map, vector_size, volume_control)
+    if not irq_period or len(cost) == 0:
+        return 0.0, 0
+    pct = (cost / irq_period) * 100
+    s = int(np.argmax(pct))
+    if pct[s] <= 0.0:
+        return 0.0, 0
+    return float(pct[s]), int(timeline.n_active[s])
+
+
+# =============================================================================
+# PHASE 1 SOLVERS
+# =============================================================================
+
+def _greedy_overrun_fix(timeline: _Timeline, active_analyses,
+                        mode_map: Dict[int, bool], remaining: int,
+                        vector_size: int, volume_control: bool,
+                        irq_period: float) -> List[Tuple[int, str]]:
+    """Greedy Phase 1: repeatedly promote the best candidate to RAW.
 
-    Returns (participating, fixed).
+    Returns [(inst_idx, reason)] in promotion order; mode_map is not
+    modified.
     """
-    participating = 0
-    fixed = 0
+    mode_map = dict(mode_map)
+    promotions = []
+
+    # Iteratively promote instruments to eliminate overruns.
+    # Two tiers:
+    #   Tier A: candidate that directly fixes overrun IRQs (crosses threshold)
+    #   Tier B: candidate that reduces severity (lowers cost in overrun segments)
+    #           so that a SUBSEQUENT promotion can cross the threshold
+    max_iterations = len(active_analyses)
+    for iteration in range(max_iterations):
+        current_overruns = _count_overrun_irqs(
+            timeline, mode_map, vector_size, volume_control, irq_period)
+        if current_overruns == 0:
+            break
 
-    # Precompute what the cost would be if this inst were RAW
-    mode_if_raw = dict(mode_map)
-    mode_if_raw[inst_idx] = True
+        # Every candidate at once (array reductions over signatures)
+        participating_all, fixed_all = _overrun_candidates(
+            timeline, mode_map, vector_size, volume_control, irq_period)
 
-    for segments in all_rows:
-        for seg in segments:
-            # Is this instrument active in this segment?
-            inst_active = any(idx == inst_idx for idx, _ in seg.active)
-            if not inst_active:
+        best_idx = -1
+        best_score = -1.0
+        best_fixed = 0
+        best_mem = 0
+
+        # Also track best severity-reduction candidate (Tier B)
+        best_b_idx = -1
+        best_b_score = -1.0
+        best_b_mem = 0
+
+        for a in active_analyses:
+            if mode_map[a.index]:
+                continue
+            extra_mem = max(a.raw_size_aligned - a.vq_size, 0)
+            if extra_mem > remaining:
                 continue
 
-            cost_current = _irq_cost(seg.active, mode_map,
-                                     vector_size, volume_control)
-            if cost_current <= irq_period:
-                continue  # Not an overrun segment
+            if a.index < len(participating_all):
+                participating = int(participating_all[a.index])
+                fixed = int(fixed_all[a.index])
+            else:
+                participating = fixed = 0  # never played
 
-            participating += seg.n_irqs
+            if participating == 0:
+                continue
 
-            # Would switching this inst to RAW fix it?
-            cost_if_raw = _irq_cost(seg.active, mode_if_raw,
-                                    vector_size, volume_control)
-            if cost_if_raw <= irq_period:
-                fixed += seg.n_irqs
+            if fixed > 0:
+                # Tier A: directly fixes overruns
+                score = fixed / max(extra_mem / 1024.0, 0.001)
+                if score > best_score:
+                    best_score = score
+                    best_idx = a.index
+                    best_fixed = fixed
+                    best_mem = extra_mem
+            else:
+                # Tier B: reduces severity (no threshold crossing yet)
+                # Score by how much total cycle-debt it removes.
+                # cycle_saving × participating_irqs / memory_cost
+                severity = a.cpu_saving * participating
+                if extra_mem > 0:
+                    b_score = severity / (extra_mem / 1024.0)
+                else:
+                    b_score = float('inf')
+                if b_score > best_b_score:
+                    best_b_score = b_score
+                    best_b_idx = a.index
+                    best_b_mem = extra_mem
+
+        # Pick winner: prefer Tier A, fall back to Tier B
+        if best_idx >= 0:
+            promotions.append((best_idx, f"fixes {best_fixed} overrun IRQs"))
+            chosen_mem = best_mem
+        elif best_b_idx >= 0:
+            promotions.append((best_b_idx, "reduces overrun severity"))
+            chosen_mem = best_b_mem
+        else:
+            break  # No candidate participates in any overrun
 
-    return participating, fixed
+        mode_map[promotions[-1][0]] = True
+        remaining -= chosen_mem
+
+    return promotions
+
+
+def _exact_overrun_fix(timeline: _Timeline, active_analyses,
+                       mode_map: Dict[int, bool], remaining: int,
+                       incumbent: List[int],
+                       vector_size: int, volume_control: bool,
+                       irq_period: float,
+                       time_budget: float) -> Tuple[List[int], int, int, bool]:
+    """Exact Phase 1: depth-first branch and bound over RAW promotions.
+
+    An overrun signature s fits the IRQ period once its RAW promotions
+    save need[s] cycles -- a covering knapsack over the distinct
+    signatures: promoting instrument i covers the cycles its channels
+    save in s (Timeline.raw_saving) and spends its extra RAW memory.
+    Minimizes the overrun IRQs left, then the memory spent (Phase 2 turns
+    what is left into quality promotions).
+
+    The search starts from the incumbent (the greedy choice) and keeps
+    the best assignment found when the time budget runs out.
+
+    Returns:
+        (promoted inst indices, overrun IRQs left, lower bound on the
+        overrun IRQs any assignment leaves, True if the overrun IRQs
+        left are proven minimal)
+    """
+    deadline = time.monotonic() + time_budget
+    cost = timeline.costs(mode_map, vector_size, volume_control)
+    over = np.flatnonzero(cost > irq_period)
+    irqs = timeline.irqs[over]
+    if len(over) == 0:
+        return list(incumbent), 0, 0, True
+    # Compared as cost - saved > period, exactly like costs() afterwards
+    need = cost[over]
+
+    saving = timeline.raw_saving(mode_map, vector_size, volume_control)[over]
+    cand, extra = [], []
+    for a in active_analyses:
+        mem = max(a.raw_size_aligned - a.vq_size, 0)
+        if (not mode_map[a.index] and mem <= remaining
+                and a.index < saving.shape[1] and (saving[:, a.index] > 0).any()):
+            cand.append(a.index)
+            extra.append(mem)
+    # Most overrun IRQs touched per KB first: good solutions early
+    weight = irqs @ (saving[:, cand] > 0) if cand else np.zeros(0)
+    order = sorted(range(len(cand)),
+                   key=lambda j: -weight[j] / max(extra[j], 1))
+    cand = [cand[j] for j in order]
+    extra = np.array([extra[j] for j in order], dtype=np.int64)
+    cover = saving[:, cand]
+
+    def left(cov):
+        return int(irqs[need - cov > irq_period].sum())
+
+    def bound(k, cov, mem):
+        # Optimistic: every later candidate that still fits on its own
+        fits = np.flatnonzero(extra[k:] <= remaining - mem) + k
+        return left(cov + cover[:, fits].sum(axis=1))
+
+    inc = [i for i in incumbent if i in cand]
+    inc_cols = [cand.index(i) for i in inc]
+    best = [left(cover[:, inc_cols].sum(axis=1)),
+            int(extra[inc_cols].sum()), inc]
+    lower = bound(0, np.zeros(len(over)), 0)
+    timed_out = False
+
+    def search(k, cov, mem, chosen):
+        nonlocal timed_out
+        if timed_out or time.monotonic() > deadline:
+            timed_out = True
+            return
+        now = left(cov)
+        if (now, mem) < (best[0], best[1]):
+            best[:] = [now, mem, [cand[j] for j in chosen]]
+        if k == len(cand):
+            return
+        lb = bound(k, cov, mem)
+        if lb == now or (lb, mem) >= (best[0], best[1]):
+            return
+        # Promote candidate k (only if it helps an unfixed signature)
+        if (extra[k] <= remaining - mem
+                and (cover[:, k] > 0)[need - cov > irq_period].any()):
+            chosen.append(k)
+            search(k + 1, cov + cover[:, k], mem + int(extra[k]), chosen)
+            chosen.pop()
+        search(k + 1, cov, mem, chosen)
+
+    search(0, np.zeros(len(over)), 0, [])
+    if not timed_out:
+        lower = best[0]         # exhausted: the optimum is its own bound
+    # A timeout after reaching the bound leaves only the memory unproven
+    return best[2], best[0], lower, best[0] == lower
+
+
+def _exact_reasons(timeline: _Timeline, mode_map: Dict[int, bool],
+                   chosen: List[int], vector_size: int,
+                   volume_control: bool,
+                   irq_period: float) -> List[Tuple[int, str]]:
+    """Reasons for an exact Phase 1 result: the overrun IRQs each chosen
+    instrument helps fix together with the others."""
+    before = timeline.costs(mode_map, vector_size, volume_control) > irq_period
+    after_map = dict(mode_map)
+    after_map.update({i: True for i in chosen})
+    after = timeline.costs(after_map, vector_size, volume_control) > irq_period
+    fixed = before & ~after
+    promotions = []
+    for i in chosen:
+        n = int(timeline.irqs[fixed & (timeline.counts[:, i] > 0)].sum())
+        promotions.append((i, f"fixes {n} overrun IRQs" if n
+                           else "reduces overrun severity"))
+    return promotions
 
 
 # =============================================================================
@@ -395,7 +1060,9 @@ def analyze_instruments(instruments, target_rate: int, vector_size: int,
                         used_indices: set = None,
                         use_banking: bool = False,
                         banking_budget: int = 0,
-                        max_banks: int = 0) -> OptimizeResult:
+                        max_banks: int = 0,
+                        screen_control: bool = True,
+                        cache: Optional[AnalysisCache] = None) -> OptimizeResult:
     """Analyze instruments and suggest RAW vs VQ for each.
     
     Args:
@@ -408,7 +1075,15 @@ def analyze_instruments(instruments, target_rate: int, vector_size: int,
         max_banks: Number of physical 16KB banks available. Used for trial-pack
                    verification when use_banking=True. If 0, derived from
                    banking_budget.
+        screen_control: Display on during playback; its DMA is taken off
+                        the cycle budget (see irq_budget).
+        cache: Results kept from earlier runs (default: the module's shared
+               cache), so only edited songlines and instruments are
+               re-analyzed.
     """
+    if cache is None:
+        cache = _cache
+    refresh_cycle_models()
     # In banking mode, override memory budget with bank capacity
     if use_banking and banking_budget > 0:
         memory_budget = banking_budget
@@ -421,15 +1096,14 @@ def analyze_instruments(instruments, target_rate: int, vector_size: int,
         result.summary = "No instruments to analyze."
         return result
 
-    cpu_clock = CPU_CLOCK_PAL if system_hz == 50 else CPU_CLOCK_NTSC
-    irq_period = cpu_clock / target_rate
-    
-    # Banking mode: reduce effective IRQ period by bank-switching overhead
-    if use_banking:
-        irq_period -= BANKING_OVERHEAD_CYCLES
+    # Same budget as predict_overruns(), so OPTIMIZE and the live
+    # indicator agree
+    irq_period, dma = irq_budget(system_hz, target_rate, use_banking, screen_control)
     
     result.cpu.sample_rate = target_rate
     result.cpu.irq_period = irq_period
+    result.cpu.dma_cycles = dma
+    result.cpu.screen_on = screen_control
 
     codebook_size = 256 * vector_size
 
@@ -445,33 +1119,19 @@ def analyze_instruments(instruments, target_rate: int, vector_size: int,
             a.reason = "unused in song"
 
         if inst.is_loaded():
-            # Get effects-processed audio (Sustain, trim, etc.)
-            # processed_data is a lazy cache — may be None after effect edits
-            if inst.effects and inst.processed_data is None:
-                try:
-                    from sample_editor.pipeline import run_pipeline
-                    inst.processed_data = run_pipeline(
-                        inst.sample_data, inst.sample_rate, inst.effects)
-                except Exception:
-                    pass  # Fall back to raw sample_data below
-            data = (inst.processed_data if inst.processed_data is not None
-                    else inst.sample_data)
-            sr = inst.sample_rate
-
-            a.raw_size = compute_raw_size(data, sr, target_rate)
+            a.raw_size, vq_estimate, a.duration_ms = _instrument_sizes(
+                i, inst, target_rate, vector_size, cache)
             a.raw_size_aligned = compute_raw_size_aligned(a.raw_size)
             inst_raw_sizes[i] = a.raw_size
 
             if vq_result and i < len(vq_result.inst_vq_sizes):
                 a.vq_size = vq_result.inst_vq_sizes[i]
             else:
-                a.vq_size = estimate_vq_size(data, sr, target_rate, vector_size)
-
-            a.duration_ms = int(len(data) / sr * 1000)
+                a.vq_size = vq_estimate
 
             # CPU cost (pitch=True is worst case for estimation without song)
             a.cpu_cost_vq = _channel_cycles_vq(vector_size, True, volume_control)
-            a.cpu_cost_raw = _channel_cycles_raw(True, volume_control)
+            a.cpu_cost_raw = _channel_cycles_raw(True, volume_control, vector_size)
             a.cpu_saving = a.cpu_cost_vq - a.cpu_cost_raw
 
         result.analyses.append(a)
@@ -484,30 +1144,22 @@ def analyze_instruments(instruments, target_rate: int, vector_size: int,
     result.fits_all_raw = result.total_raw_size <= memory_budget
 
     # --- Simulate song (if available) ---
-    all_rows = _simulate_song(song, inst_raw_sizes, target_rate, system_hz,
-                               instruments=instruments)
+    timeline = _simulate_song(song, inst_raw_sizes, target_rate, system_hz,
+                              instruments=instruments, cache=cache)
 
     # Start with all VQ
     mode_map: Dict[int, bool] = {a.index: False for a in result.analyses}
 
     # --- CPU analysis ---
-    if all_rows:
+    if timeline:
         total_overruns = _count_overrun_irqs(
-            all_rows, mode_map, vector_size, volume_control, irq_period)
+            timeline, mode_map, vector_size, volume_control, irq_period)
         result.cpu.total_overrun_irqs = total_overruns
         result.cpu.overrun = total_overruns > 0
 
         # Find worst segment for reporting
-        worst_pct = 0.0
-        worst_n_ch = 0
-        for segments in all_rows:
-            for seg in segments:
-                cost = _irq_cost(seg.active, mode_map,
-                                 vector_size, volume_control)
-                pct = (cost / irq_period) * 100 if irq_period else 0
-                if pct > worst_pct:
-                    worst_pct = pct
-                    worst_n_ch = len(seg.active)
+        worst_pct, worst_n_ch = _worst_signature(
+            timeline, mode_map, vector_size, volume_control, irq_period)
         result.cpu.worst_row_pct = worst_pct
         result.cpu.worst_active_channels = worst_n_ch
 
@@ -519,8 +1171,8 @@ def analyze_instruments(instruments, target_rate: int, vector_size: int,
     else:
         # No song — estimate worst case assuming all instruments on separate channels
         n_ch = min(len(result.analyses), MAX_CHANNELS)
-        ch_cost = _channel_cycles_vq(vector_size, True, volume_control)
-        worst_cost = IRQ_OVERHEAD_CYCLES + n_ch * ch_cost + (MAX_CHANNELS - n_ch) * CH_INACTIVE
+        worst_cost = _irq_cost([(i, True) for i in range(n_ch)], {},
+                               vector_size, volume_control)
         result.cpu.worst_row_pct = (worst_cost / irq_period) * 100
         result.cpu.worst_active_channels = n_ch
         result.cpu.overrun = worst_cost > irq_period
@@ -530,7 +1182,7 @@ def analyze_instruments(instruments, target_rate: int, vector_size: int,
                 f"(no song data)")
 
     # --- Assign modes ---
-    _assign_modes(result, mode_map, all_rows, codebook_size,
+    _assign_modes(result, mode_map, timeline, codebook_size,
                   vector_size, volume_control, irq_period)
 
     # --- Banking: verify the result actually fits in banks ---
@@ -539,13 +1191,110 @@ def analyze_instruments(instruments, target_rate: int, vector_size: int,
     # codebook overhead.  Run a trial pack to catch overcommit.
     if use_banking and max_banks > 0:
         _verify_banking_fit(result, mode_map, codebook_size, max_banks,
-                            all_rows, vector_size, volume_control, irq_period)
+                            timeline, vector_size, volume_control, irq_period)
 
     return result
 
 
+# Display list of song_player.asm (BLANK_SCREEN=0) as ANTIC shows it
+# (operands dropped, see cycle_analyzer.atari_system.display_list_ops):
+# 24 blank lines, 4 lines of mode 2 text. Playback with the screen off
+# only keeps the memory refresh.
+PLAYER_DISPLAY_LIST = bytes([0x70, 0x70, 0x70, 0x42, 0x02, 0x02, 0x02])
+PLAYER_DMACTL = 0x22
+
+
+def _dma_cycles(is_pal: bool, screen_on: bool, timer_period: int) -> int:
+    """Most cycles ANTIC steals from one timer period during playback."""
+    from cycle_analyzer.atari_system import dma_profile_for
+    if screen_on:
+        profile = dma_profile_for(PLAYER_DISPLAY_LIST, PLAYER_DMACTL, is_pal)
+    else:
+        profile = dma_profile_for(b"", 0, is_pal)
+    return profile.budgets(timer_period)[0]
+
+
+def irq_budget(system_hz: int, target_rate: int, use_banking: bool = False,
+               screen_on: bool = True) -> Tuple[float, int]:
+    """Cycles one IRQ may take: the IRQ period less the banking overhead
+    and the most display DMA one period can see.
+
+    Returns (budget, DMA cycles).
+    """
+    is_pal = system_hz == 50
+    irq_period = (CPU_CLOCK_PAL if is_pal else CPU_CLOCK_NTSC) / target_rate
+    dma = _dma_cycles(is_pal, screen_on, int(round(irq_period)))
+    budget = irq_period - dma
+    if use_banking:
+        budget -= BANKING_OVERHEAD_CYCLES
+    return budget, dma
+
+
+def _vq_in_overruns(timeline: _Timeline, mode_map: Dict[int, bool],
+                    vector_size: int, volume_control: bool,
+                    irq_period: float) -> bool:
+    """Whether some overrun IRQ plays a VQ instrument (so switching
+    instruments to RAW can still help)."""
+    over = timeline.costs(mode_map, vector_size, volume_control) > irq_period
+    vq = np.array([not mode_map.get(i, False) for i in range(timeline.counts.shape[1])],
+                  dtype=bool)
+    return bool((timeline.counts[over][:, vq] > 0).any())
+
+
+def overrun_advice(vq_in_overruns: bool, screen_on: bool) -> str:
+    """What the user can do about overruns that remain."""
+    if vq_in_overruns:
+        return "Run OPTIMIZE or switch instruments to RAW."
+    if screen_on:
+        return ("Overrunning IRQs already play RAW only: turn the screen off "
+                "or lower the sample rate.")
+    return "Overrunning IRQs already play RAW only: lower the sample rate."
+
+
+def predict_overruns(song, target_rate: int, vector_size: int,
+                     use_banking: bool = False,
+                     cache: Optional[AnalysisCache] = None
+                     ) -> Optional[OverrunPrediction]:
+    """Predict which rows overrun the IRQ period, without building.
+
+    Costs every row's active channel sets with the calibrated handler
+    model and compares them with the same budget OPTIMIZE uses
+    (irq_budget: the IRQ period less banking and the display DMA of
+    the player's screen setting). Uses each instrument's current mode
+    (use_vq). Cheap enough to call after every edit: with the shared
+    cache only edited songlines are simulated again.
+
+    Returns None without song data.
+    """
+    if cache is None:
+        cache = _cache
+    refresh_cycle_models()
+    instruments = song.instruments
+    inst_raw_sizes = {
+        i: _instrument_sizes(i, inst, target_rate, vector_size, cache)[0]
+        for i, inst in enumerate(instruments) if inst.is_loaded()}
+    timeline = _simulate_song(song, inst_raw_sizes, target_rate, song.system,
+                              instruments=instruments, cache=cache)
+    if not timeline:
+        return None
+
+    budget, dma = irq_budget(song.system, target_rate, use_banking,
+                             song.screen_control)
+    mode_map = {i: not inst.use_vq for i, inst in enumerate(instruments)}
+    cost = timeline.costs(mode_map, vector_size, song.volume_control)
+    peak, _ = _worst_signature(timeline, mode_map, vector_size,
+                               song.volume_control, budget)
+    bounds = np.cumsum(timeline.songline_rows)[:-1]
+    return OverrunPrediction(
+        budget=budget, dma_cycles=dma, peak_pct=peak,
+        overrun_irqs=int(timeline.irqs[cost > budget].sum()),
+        row_cycles=np.split(timeline.row_costs(cost), bounds),
+        vq_in_overruns=_vq_in_overruns(timeline, mode_map, vector_size,
+                                       song.volume_control, budget))
+
+
 def _assign_modes(result: OptimizeResult, mode_map: Dict[int, bool],
-                  all_rows: List[List[_Segment]], codebook_size: int,
+                  timeline: _Timeline, codebook_size: int,
                   vector_size: int, volume_control: bool,
                   irq_period: float):
     """Assign RAW/VQ modes. Priority: fix overruns first, then quality."""
@@ -562,7 +1311,7 @@ def _assign_modes(result: OptimizeResult, mode_map: Dict[int, bool],
             a.reason = "Fits in memory"
             mode_map[a.index] = True
         result.total_mixed_size = result.total_raw_size
-        _build_summary(result, mode_map, all_rows, vector_size,
+        _build_summary(result, mode_map, timeline, vector_size,
                        volume_control, irq_period)
         return
 
@@ -582,87 +1331,30 @@ def _assign_modes(result: OptimizeResult, mode_map: Dict[int, bool],
     remaining = budget - result.total_vq_size  # memory headroom for RAW promotions
     n_raw = 0
 
-    if all_rows and result.cpu.overrun:
-        # Iteratively promote instruments to eliminate overruns.
-        # Two tiers:
-        #   Tier A: candidate that directly fixes overrun IRQs (crosses threshold)
-        #   Tier B: candidate that reduces severity (lowers cost in overrun segments)
-        #           so that a SUBSEQUENT promotion can cross the threshold
-        max_iterations = len(analyses)
-        for iteration in range(max_iterations):
-            current_overruns = _count_overrun_irqs(
-                all_rows, mode_map, vector_size, volume_control, irq_period)
-            if current_overruns == 0:
-                break
-
-            best_idx = -1
-            best_score = -1.0
-            best_fixed = 0
-            best_mem = 0
-            best_tier = 'none'
-
-            # Also track best severity-reduction candidate (Tier B)
-            best_b_idx = -1
-            best_b_score = -1.0
-            best_b_severity = 0.0
-            best_b_mem = 0
-
-            for a in active_analyses:
-                if mode_map[a.index]:
-                    continue
-                extra_mem = max(a.raw_size_aligned - a.vq_size, 0)
-                if extra_mem > remaining:
-                    continue
-
-                participating, fixed = _count_overrun_irqs_involving(
-                    all_rows, mode_map, a.index,
+    if timeline and result.cpu.overrun:
+        promotions = _greedy_overrun_fix(
+            timeline, active_analyses, mode_map, remaining,
+            vector_size, volume_control, irq_period)
+
+        if MODE_SEARCH_TIME_BUDGET > 0:
+            chosen, overruns, lower, optimal = _exact_overrun_fix(
+                timeline, active_analyses, mode_map, remaining,
+                [idx for idx, _ in promotions],
+                vector_size, volume_control, irq_period,
+                MODE_SEARCH_TIME_BUDGET)
+            result.mode_search_optimal = optimal
+            result.mode_search_gap = overruns - lower
+            if set(chosen) != {idx for idx, _ in promotions}:
+                promotions = _exact_reasons(
+                    timeline, mode_map, chosen,
                     vector_size, volume_control, irq_period)
 
-                if participating == 0:
-                    continue
-
-                if fixed > 0:
-                    # Tier A: directly fixes overruns
-                    score = fixed / max(extra_mem / 1024.0, 0.001)
-                    if score > best_score:
-                        best_score = score
-                        best_idx = a.index
-                        best_fixed = fixed
-                        best_mem = extra_mem
-                        best_tier = 'A'
-                else:
-                    # Tier B: reduces severity (no threshold crossing yet)
-                    # Score by how much total cycle-debt it removes.
-                    # cycle_saving × participating_irqs / memory_cost
-                    severity = a.cpu_saving * participating
-                    if extra_mem > 0:
-                        b_score = severity / (extra_mem / 1024.0)
-                    else:
-                        b_score = float('inf')
-                    if b_score > best_b_score:
-                        best_b_score = b_score
-                        best_b_idx = a.index
-                        best_b_severity = severity
-                        best_b_mem = extra_mem
-
-            # Pick winner: prefer Tier A, fall back to Tier B
-            if best_idx >= 0:
-                chosen = best_idx
-                chosen_mem = best_mem
-                a = analyses[chosen]
-                a.suggest_raw = True
-                a.reason = f"fixes {best_fixed} overrun IRQs"
-            elif best_b_idx >= 0:
-                chosen = best_b_idx
-                chosen_mem = best_b_mem
-                a = analyses[chosen]
-                a.suggest_raw = True
-                a.reason = f"reduces overrun severity"
-            else:
-                break  # No candidate participates in any overrun
-
-            mode_map[chosen] = True
-            remaining -= chosen_mem
+        for idx, reason in promotions:
+            a = analyses[idx]
+            a.suggest_raw = True
+            a.reason = reason
+            mode_map[idx] = True
+            remaining -= max(a.raw_size_aligned - a.vq_size, 0)
             n_raw += 1
 
     # === PHASE 2: Quality promotion (remaining budget) ===
@@ -698,12 +1390,12 @@ def _assign_modes(result: OptimizeResult, mode_map: Dict[int, bool],
     if any(not a.suggest_raw for a in active_analyses):
         result.total_mixed_size += codebook_size
 
-    _build_summary(result, mode_map, all_rows, vector_size,
+    _build_summary(result, mode_map, timeline, vector_size,
                    volume_control, irq_period)
 
 
 def _build_summary(result: OptimizeResult, mode_map: Dict[int, bool],
-                   all_rows: List[List[_Segment]],
+                   timeline: _Timeline,
                    vector_size: int, volume_control: bool,
                    irq_period: float):
     """Build human-readable summary string."""
@@ -727,18 +1419,13 @@ def _build_summary(result: OptimizeResult, mode_map: Dict[int, bool],
         parts.append(f"{n_skipped} unused skipped")
 
     # Post-optimization CPU
-    if all_rows:
+    if timeline:
         post_overruns = _count_overrun_irqs(
-            all_rows, mode_map, vector_size, volume_control, irq_period)
+            timeline, mode_map, vector_size, volume_control, irq_period)
 
         # Find worst segment after optimization
-        worst_pct = 0.0
-        for segments in all_rows:
-            for seg in segments:
-                cost = _irq_cost(seg.active, mode_map,
-                                 vector_size, volume_control)
-                pct = (cost / irq_period) * 100 if irq_period else 0
-                worst_pct = max(worst_pct, pct)
+        worst_pct, _ = _worst_signature(
+            timeline, mode_map, vector_size, volume_control, irq_period)
 
         parts.append(f"CPU peak: {worst_pct:.0f}%")
 
@@ -749,6 +1436,14 @@ def _build_summary(result: OptimizeResult, mode_map: Dict[int, bool],
                 post_ms = post_overruns / result.cpu.sample_rate * 1000
                 parts.append(f"{post_overruns} overrun IRQs remain "
                              f"({post_ms:.0f}ms)")
+                if not _vq_in_overruns(timeline, mode_map, vector_size,
+                                       volume_control, irq_period):
+                    parts.append(overrun_advice(False, result.cpu.screen_on))
+            if result.mode_search_optimal:
+                parts.append("mode assignment optimal")
+            elif result.mode_search_optimal is not None:
+                parts.append(f"optimality gap {result.mode_search_gap} IRQs "
+                             f"(search timed out)")
     elif result.cpu.worst_row_pct > 0:
         parts.append(f"CPU est: {result.cpu.worst_row_pct:.0f}%")
 
@@ -766,7 +1461,7 @@ def _fmt_size(n: int) -> str:
 
 def _verify_banking_fit(result: OptimizeResult, mode_map: Dict[int, bool],
                         codebook_size: int, max_banks: int,
-                        all_rows: List[List[_Segment]],
+                        timeline: _Timeline,
                         vector_size: int, volume_control: bool,
                         irq_period: float):
     """Verify optimized modes actually fit in banks; demote RAW→VQ if not.
@@ -778,7 +1473,10 @@ def _verify_banking_fit(result: OptimizeResult, mode_map: Dict[int, bool],
     
     This function runs a trial bin-pack.  If it fails, it iteratively
     demotes the largest RAW instruments to VQ (biggest fragmentation
-    savings) until the pack succeeds.
+    savings) until the pack succeeds.  The trial packs search like the
+    build does (build.BANK_PACK_OPTIMAL), so nothing is demoted for a
+    song the build would fit.  They still reserve a full codebook per VQ
+    bank: the per-bank sizes are only known after conversion.
     """
     logger = logging.getLogger("optimize")
     
@@ -787,6 +1485,7 @@ def _verify_banking_fit(result: OptimizeResult, mode_map: Dict[int, bool],
     except ImportError:
         logger.warning("bank_packer not available — skipping trial pack")
         return
+    from build import BANK_PACK_OPTIMAL, BANK_PACK_TIME_BUDGET
     
     active = [a for a in result.analyses if not a.skipped]
     if not active:
@@ -805,11 +1504,21 @@ def _verify_banking_fit(result: OptimizeResult, mode_map: Dict[int, bool],
         """Set of instrument indices currently in VQ mode."""
         return {a.index for a in active if not mode_map[a.index]}
     
+    def _trial_pack():
+        """Pack the current modes; the optimal search only if first-fit fails."""
+        inst_sizes, vq_set = _build_inst_sizes(), _vq_set()
+        pack = pack_into_banks(inst_sizes, max_banks,
+                               codebook_size=codebook_size,
+                               vq_instruments=vq_set)
+        if not pack.success and BANK_PACK_OPTIMAL:
+            pack = pack_into_banks(inst_sizes, max_banks,
+                                   codebook_size=codebook_size,
+                                   vq_instruments=vq_set, optimal=True,
+                                   time_budget=BANK_PACK_TIME_BUDGET)
+        return pack
+    
     # Trial pack with current modes
-    inst_sizes = _build_inst_sizes()
-    pack = pack_into_banks(inst_sizes, max_banks,
-                           codebook_size=codebook_size,
-                           vq_instruments=_vq_set())
+    pack = _trial_pack()
     
     if pack.success:
         return  # Fits — nothing to do
@@ -850,10 +1559,7 @@ def _verify_banking_fit(result: OptimizeResult, mode_map: Dict[int, bool],
                      f"(saves {best_saving})")
         
         # Retry trial pack
-        inst_sizes = _build_inst_sizes()
-        pack = pack_into_banks(inst_sizes, max_banks,
-                               codebook_size=codebook_size,
-                               vq_instruments=_vq_set())
+        pack = _trial_pack()
         
         if pack.success:
             logger.info(f"  Trial pack succeeded after {iteration + 1} demotion(s): "
@@ -873,5 +1579,5 @@ def _verify_banking_fit(result: OptimizeResult, mode_map: Dict[int, bool],
     
     result.fits_all_raw = False  # We had to demote — not all-RAW anymore
     
-    _build_summary(result, mode_map, all_rows, vector_size,
+    _build_summary(result, mode_map, timeline, vector_size,
                    volume_control, irq_period)
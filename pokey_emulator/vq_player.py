@@ -72,6 +72,9 @@ class InstrumentData:
     For RAW instruments:
         - stream_data contains the raw sample bytes (AUDC values)
         - start_offset = 0, end_offset = len(stream_data)
+
+    stream_data may be any byte buffer: bytes, or a memoryview slice of
+    the conversion output (see SongData.close).
     """
 
     __slots__ = ('index', 'is_vq', 'stream_data', 'start_offset', 'end_offset')
@@ -93,11 +96,18 @@ class SongData:
     """Complete song data for the player.
 
     Built from the tracker's Song model + VQ conversion results.
+
+    When loaded from VQ_DATA.bin, codebook and instrument stream_data are
+    read-only memoryview slices of one buffer (an mmap on POSIX) that is
+    kept alive by self.backing; no per-byte Python objects are created.
     """
 
     def __init__(self):
         self.instruments: List[InstrumentData] = []
 
+        # Container the codebook / stream views point into (or None)
+        self.backing = None
+
         # VQ codebook: packed sample vectors.
         # Indexed by simple offset (NOT Atari addresses).
         self.codebook: bytes = b''
@@ -126,6 +136,19 @@ class SongData:
         self.volume_control: bool = False
         self.volume_scale: bytes = b''    # 256-byte lookup table
 
+    def close(self):
+        """Drop the data views and release the backing container.
+
+        If a channel still references an instrument, the mapping is
+        released when that reference goes away instead.
+        """
+        if self.backing is None:
+            return
+        self.codebook = b''
+        self.instruments = []
+        self.backing.close()
+        self.backing = None
+
     def build_codebook_offsets(self):
         """(Re)compute cb_offset_lo/hi from codebook length and vector_size.
 
@@ -263,6 +286,8 @@ class VQPlayer:
 
     def load_song(self, song: SongData):
         """Load song data and initialize the emulator."""
+        if self.song is not None and self.song is not song:
+            self.song.close()
         self.song = song
         self.ntsc = song.ntsc
         self.cycles_per_frame = (NTSC_CYCLES_PER_FRAME if song.ntsc
@@ -775,11 +800,16 @@ class VQPlayer:
         self.load_song(song_data)
 
     def _load_vq_files(self, song_data: SongData, output_dir: str, song_obj):
-        """Load VQ binary data from the converter's ASM output directory.
+        """Load VQ binary data from the converter's output directory.
 
-        We parse the ASM files for raw byte data, but IGNORE the addresses
-        in VQ_LO/VQ_HI -- we recompute offset tables from vector_size.
+        Reads VQ_DATA.bin when present (no parsing, slices of one buffer);
+        older outputs fall back to parsing the ASM files. Either way the
+        addresses in VQ_LO/VQ_HI are IGNORED -- we recompute offset tables
+        from vector_size.
         """
+        if self._load_vq_container(song_data, output_dir):
+            return
+
         vq_blob = self._parse_asm_bytes(
             os.path.join(output_dir, 'VQ_BLOB.asm'))
         vq_indices = self._parse_asm_bytes(
@@ -792,6 +822,7 @@ class VQPlayer:
         # Load conversion_info.json for per-instrument boundaries
         info_path = os.path.join(output_dir, 'conversion_info.json')
         indices_bytes = bytes(vq_indices)
+        indices_view = memoryview(indices_bytes)
 
         if os.path.exists(info_path):
             with open(info_path, 'r') as f:
@@ -813,10 +844,11 @@ class VQPlayer:
                 is_vq = (mode.lower() != 'raw')
 
                 if is_vq:
+                    stream = indices_view[start:end]
                     inst = InstrumentData(
                         index=i, is_vq=True,
-                        stream_data=indices_bytes,
-                        start_offset=start, end_offset=end,
+                        stream_data=stream,
+                        start_offset=0, end_offset=len(stream),
                     )
                 else:
                     # RAW: load from pre-parsed RAW_SAMPLES.asm
@@ -847,13 +879,41 @@ class VQPlayer:
                 )
                 song_data.instruments.append(inst)
 
-    def _parse_asm_bytes(self, path: str) -> list:
+    def _load_vq_container(self, song_data: SongData, output_dir: str) -> bool:
+        """Fill song_data from VQ_DATA.bin. Returns False if unavailable."""
+        try:
+            from pokey_vq.utils.vq_container import open_container
+        except ImportError:  # converter package not on sys.path
+            return False
+        # mmap only where a mapped file can still be deleted/replaced by
+        # the next conversion (Windows locks it)
+        container = open_container(output_dir, use_mmap=(os.name == 'posix'))
+        if container is None:
+            return False
+
+        song_data.backing = container
+        song_data.codebook = container.codebook
+        for i in range(len(container.samples)):
+            if container.is_raw(i):
+                data = container.raw_block(i)
+                if not len(data):
+                    data = b'\x10'  # silence byte
+            else:
+                data = container.vq_stream(i)
+            inst = InstrumentData(
+                index=i, is_vq=not container.is_raw(i), stream_data=data,
+                start_offset=0, end_offset=len(data),
+            )
+            song_data.instruments.append(inst)
+        return True
+
+    def _parse_asm_bytes(self, path: str) -> bytearray:
         """Parse MADS .asm file containing data directives into byte list.
 
         Handles: .byte, dta b(), dta, .db directives with hex ($xx) and
         decimal values. Strips comments.
         """
-        result = []
+        result = bytearray()
         if not os.path.exists(path):
             return result
         with open(path, 'r') as f:
@@ -934,7 +994,7 @@ class VQPlayer:
         end_re = re.compile(r'^RAW_INST_(\d+)_END\s*$')
 
         current_idx = None
-        current_bytes = []
+        current_bytes = bytearray()
 
         for line in lines:
             stripped = line.strip()
@@ -948,7 +1008,7 @@ class VQPlayer:
                 if current_idx is not None and current_bytes:
                     result[current_idx] = bytes(current_bytes)
                 current_idx = int(m.group(1))
-                current_bytes = []
+                current_bytes = bytearray()
                 continue
 
             # Check for end label
@@ -958,7 +1018,7 @@ class VQPlayer:
                 if current_idx == idx and current_bytes:
                     result[current_idx] = bytes(current_bytes)
                 current_idx = None
-                current_bytes = []
+                current_bytes = bytearray()
                 continue
 
             # If we're inside a label block, parse byte data
@@ -0,0 +1,134 @@
+"""Tests for the 6502 cycle analyzer's basic-block path bounds."""
+import unittest
+import sys
+import os
+import random
+import itertools
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.asm_cycles import (InstructionParser, PathAnalyzer, process_config,
+                              handler_wcet, handler_bounds, HANDLER_MODES)
+
+ASM_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'asm')
+
+
+def _parse(source, symbols=None):
+    ip = InstructionParser(symbols or {'zp': 0x80})
+    return [ip.parse_line(line) for line in source.strip('\n').split('\n')]
+
+
+def _random_listing(seed, n_blocks=9):
+    """Forward branches only, each to its own target label."""
+    rng = random.Random(seed)
+    body = ['lda zp', 'sta zp', 'inc zp', 'nop', 'lda #1', 'ldx zp,y', 'asl']
+    free = list(range(1, n_blocks + 1))
+    lines = []
+    for k in range(n_blocks):
+        lines.append(f'L{k}:')
+        lines += [f'    {rng.choice(body)}' for _ in range(rng.randint(1, 3))]
+        later = [j for j in free if j > k]
+        if later and rng.random() < 0.85:
+            j = rng.choice(later)
+            free.remove(j)
+            lines.append(f'    {rng.choice(["bne", "bcc", "bmi"])} L{j}')
+        elif rng.random() < 0.3:
+            lines.append(f'    jmp L{rng.randint(k + 1, n_blocks)}')
+    lines += [f'L{n_blocks}:', '    rts']
+    return '\n'.join(lines), n_blocks
+
+
+class TestPathBounds(unittest.TestCase):
+
+    def test_matches_branch_enumeration(self):
+        for seed in range(30):
+            source, end = _random_listing(seed)
+            analyzer = PathAnalyzer(_parse(source))
+            targets = [info['branch_target'] for info in analyzer.lines
+                       if info and info['is_branch']]
+            totals = {analyzer.trace_path('L0', f'L{end}',
+                                          dict(zip(targets, bits)))[0]
+                      for bits in itertools.product((False, True), repeat=len(targets))}
+            lo, hi = analyzer.path_bounds('L0', f'L{end}')
+            self.assertEqual((lo['cycles'], hi['cycles']), (min(totals), max(totals)))
+            self.assertEqual(sum(c for _, c in hi['trace']), hi['cycles'])
+            self.assertEqual(analyzer.trace_path('L0', f'L{end}', hi['choices'])[0],
+                             hi['cycles'])
+
+    def test_self_modified_jump(self):
+        analyzer = PathAnalyzer(_parse('''
+start:
+    lda zp
+dispatch = *+1
+    jmp slow
+fast:
+    nop
+    jmp done
+slow:
+    inc zp
+    inc zp
+test:
+    bcs done
+    nop
+done:
+    rts
+'''))
+        bounds = lambda smc: tuple(p['cycles'] for p in
+                                   analyzer.path_bounds('start', 'done', smc))
+        self.assertTrue(analyzer.lines[2]['is_smc'])
+        self.assertEqual(bounds(None), (3 + 3 + 10 + 3, 3 + 3 + 10 + 2 + 2))
+        self.assertEqual(bounds({'dispatch': 'fast'}), (11, 11))
+        self.assertEqual(bounds({'dispatch': ['fast', 'slow']}), (11, 20))
+        # Patched branch opcode: never taken
+        self.assertEqual(bounds({'test': False}), (20, 20))
+        self.assertIsNone(analyzer.path_bounds('start', 'done', {'dispatch': 'fast'},
+                                               avoid=['fast']))
+
+    def test_loop_followed_once(self):
+        analyzer = PathAnalyzer(_parse('''
+top:
+    dex
+    bne top
+    rts
+'''))
+        lo, hi = analyzer.path_bounds('top')
+        self.assertEqual((lo['cycles'], hi['cycles']), (2 + 2 + 6, 2 + 2 + 6))
+
+
+class TestHandlerWcet(unittest.TestCase):
+
+    def _table(self, **defines):
+        _, _, parsed = process_config(os.path.join(ASM_DIR, 'song_player.asm'),
+                                      [ASM_DIR], defines, [])
+        return parsed, handler_wcet(parsed)
+
+    def test_speed_handler(self):
+        parsed, table = self._table(VOLUME_CONTROL=0, MIN_VECTOR=8)
+        self.assertEqual(len(table['channels']), 4)
+        # 7 interrupt + 3 x STx zp + LDA #/STA IRQEN twice; LDx zp x 3 + RTI
+        self.assertEqual(table['entry'], (28, 28))
+        self.assertEqual(table['exit'], (15, 15))
+        for row in table['channels']:
+            self.assertEqual(set(row), {'inactive', *HANDLER_MODES})
+            self.assertEqual(row['inactive'], (8, 8))
+            # Active check, output sample, dispatch JMP, pitch add, BCS
+            self.assertEqual(row['raw_pitch'][0], 6 + 12 + 3 + 22)
+            for lo, hi in row.values():
+                self.assertLessEqual(lo, hi)
+        self.assertEqual(handler_bounds(parsed), (
+            28 + 4 * 8 + 15,
+            28 + sum(max(hi for _, hi in row.values())
+                     for row in table['channels']) + 15))
+
+    def test_banked_handler_switches_banks(self):
+        _, speed = self._table(VOLUME_CONTROL=1, MIN_VECTOR=4)
+        _, banked = self._table(VOLUME_CONTROL=1, MIN_VECTOR=4, USE_BANKING=1)
+        self.assertEqual(banked['exit'][0], speed['exit'][0] + 6)
+        for fast, slow in zip(speed['channels'], banked['channels']):
+            self.assertEqual(slow['inactive'], fast['inactive'])
+            for mode in HANDLER_MODES:
+                self.assertEqual(slow[mode][0], fast[mode][0] + 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Tests for the vectorized MADS data emitter and exporter quantization."""
+import unittest
+import sys
+import os
+import tempfile
+import shutil
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "vq_converter"))
+
+import numpy as np
+
+from pokey_vq.utils.asm_emit import byte_lines
+from pokey_vq.utils.mads_exporter import MADSExporter, quantize_nearest
+from pokey_vq.core.pokey_table import POKEY_VOLTAGE_TABLE
+
+
+def _reference_lines(data, per_line=16, prefix=" .byte "):
+    return "\n".join(prefix + ",".join(f"${b:02X}" for b in data[i:i + per_line])
+                     for i in range(0, len(data), per_line))
+
+
+class TestByteLines(unittest.TestCase):
+
+    def test_matches_per_byte_formatting(self):
+        rng = np.random.default_rng(0)
+        for n in (0, 1, 15, 16, 17, 255, 1000):
+            data = rng.integers(0, 256, n).astype(np.uint8)
+            self.assertEqual(byte_lines(data), _reference_lines(list(data)), n)
+            self.assertEqual(byte_lines(bytes(data), 8, "    .byte "),
+                             _reference_lines(list(data), 8, "    .byte "), n)
+
+    def test_input_types(self):
+        expected = " .byte $00,$7F,$FF"
+        self.assertEqual(byte_lines(b"\x00\x7f\xff"), expected)
+        self.assertEqual(byte_lines(bytearray(b"\x00\x7f\xff")), expected)
+        self.assertEqual(byte_lines(memoryview(b"\x00\x7f\xff")), expected)
+        self.assertEqual(byte_lines([0, 127, 255]), expected)
+
+    def test_parsed_back_by_build(self):
+        import build
+        data = bytes(range(256)) * 3
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "X.asm")
+            with open(path, "w") as f:
+                f.write("X\n" + byte_lines(data))
+            self.assertEqual(build._parse_asm_bytes(path), data)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+class TestExporterQuantize(unittest.TestCase):
+
+    def test_matches_scalar_search(self):
+        table = POKEY_VOLTAGE_TABLE / POKEY_VOLTAGE_TABLE[-1]
+        values = np.concatenate([np.random.default_rng(1).uniform(-0.1, 1.1, 2000),
+                                 table, (table[1:] + table[:-1]) / 2])
+        expected = []
+        for val in values:
+            idx = np.searchsorted(table, val)
+            if idx == len(table):
+                idx = len(table) - 1
+            elif idx > 0 and abs(val - table[idx - 1]) < abs(val - table[idx]):
+                idx -= 1
+            expected.append(idx)
+        np.testing.assert_array_equal(quantize_nearest(values, table), expected)
+
+    def test_odd_length_nibble_packing(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            exporter = MADSExporter()
+            exporter.export(os.path.join(tmp, "VQ.asm"),
+                            [np.array([0.0, 1.0, 1.0]), np.array([1.0, 0.0])],
+                            np.array([0, 1]), POKEY_VOLTAGE_TABLE, channels=1)
+            # [lo=0, hi=15], [lo=15, hi=pad 0], [lo=15, hi=0]
+            self.assertEqual(exporter.last_export["codebook"], b"\xF0\x0F\x0F")
+            self.assertEqual(exporter.last_export["vq_offsets"][:4], b"\x00\x00\x02\x00")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
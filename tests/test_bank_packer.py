@@ -4,7 +4,8 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from bank_packer import (pack_into_banks, generate_bank_asm, 
+from bank_packer import (pack_into_banks, generate_bank_asm, instrument_cooccurrence,
+                         bank_switch_cost, 
                           BANK_SIZE, BANK_BASE, DBANK_TABLE, PORTB_MAIN_RAM)
 
 
@@ -492,6 +493,134 @@ class TestPerBankCodebook(unittest.TestCase):
         self.assertFalse(r.bank_has_codebook[raw_bank])
 
 
+class TestSizedCodebooks(unittest.TestCase):
+    """Per-instrument codebook needs (inst_codebook_bytes)."""
+    
+    def test_full_needs_match_legacy(self):
+        sizes = [(0, 20000), (1, 6000), (2, 5000), (3, 9000)]
+        legacy = pack_into_banks(sizes, 8, codebook_size=2048,
+                                 vq_instruments={0, 1, 2})
+        sized = pack_into_banks(sizes, 8, codebook_size=2048,
+                                vq_instruments={0, 1, 2},
+                                inst_codebook_bytes={0: 2048, 1: 4096})
+        self.assertEqual(legacy.placements, sized.placements)
+        self.assertEqual(legacy.bank_codebook_bytes, [2048, 2048, 2048, 0])
+    
+    def test_small_need_shrinks_reserve(self):
+        r = pack_into_banks([(0, 5000)], codebook_size=2048,
+                            vq_instruments={0}, inst_codebook_bytes={0: 200})
+        self.assertEqual(r.bank_codebook_bytes, [256])
+        p = r.placements[0]
+        self.assertEqual(p.offset, BANK_BASE + 256)
+        self.assertEqual((p.end_addr_hi << 8) | p.end_addr_lo, BANK_BASE + 256 + 5000)
+        asm = generate_bank_asm(r, 1, codebook_bytes=2048, vq_instruments={0})
+        self.assertIn("SAMPLE_DATA_HI:\n    .byte $41", asm)
+    
+    def test_bank_reserve_is_sum_of_needs(self):
+        r = pack_into_banks([(0, 6000), (1, 6000)], codebook_size=2048,
+                            vq_instruments={0, 1},
+                            inst_codebook_bytes={0: 512, 1: 768})
+        self.assertEqual(r.n_banks_used, 1)
+        self.assertEqual(r.bank_codebook_bytes, [1280])
+        # Reserve grew after inst 0 was placed: addresses follow the final one
+        self.assertEqual(sorted(p.offset for p in r.placements.values()),
+                         [BANK_BASE + 1280, BANK_BASE + 1280 + 6144])
+    
+    def test_more_data_fits(self):
+        # 4 x 15000 bytes: needs 8 banks with 2KB codebooks, 4 with 256B ones
+        sizes = [(i, 15000) for i in range(4)]
+        full = pack_into_banks(sizes, 4, codebook_size=2048,
+                               vq_instruments={0, 1, 2, 3})
+        self.assertFalse(full.success)
+        sized = pack_into_banks(sizes, 4, codebook_size=2048,
+                                vq_instruments={0, 1, 2, 3},
+                                inst_codebook_bytes={i: 256 for i in range(4)})
+        self.assertTrue(sized.success, sized.error)
+        self.assertEqual(sized.bank_codebook_bytes, [256] * 4)
+    
+    def test_multi_bank_reserve_frozen(self):
+        r = pack_into_banks([(0, 20000), (1, 3000)], codebook_size=2048,
+                            vq_instruments={0, 1},
+                            inst_codebook_bytes={0: 256, 1: 2048})
+        self.assertEqual(r.placements[0].bank_indices, [0, 1])
+        self.assertEqual(r.bank_codebook_bytes[:2], [256, 256])
+        # Inst 1 needs more than the frozen reserve: not in the chunk's bank
+        self.assertEqual(r.placements[1].bank_indices, [2])
+        self.assertEqual(r.bank_codebook_bytes[2], 2048)
+
+
+class TestOptimalPacking(unittest.TestCase):
+    """optimal=True: branch-and-bound on top of first-fit-decreasing."""
+    
+    # First-fit-decreasing needs 3 banks; {33,20,9} + {32,24,8} pages fit in 2
+    PAGES = [24, 8, 32, 33, 20, 9]
+    
+    def _sizes(self):
+        return [(i, n * 256) for i, n in enumerate(self.PAGES)]
+    
+    def test_fewer_banks_than_ffd(self):
+        ffd = pack_into_banks(self._sizes(), 8)
+        opt = pack_into_banks(self._sizes(), 8, optimal=True)
+        self.assertEqual((ffd.n_banks_used, opt.n_banks_used), (3, 2))
+        self.assertEqual(opt.lower_bound, 2)
+        self.assertTrue(opt.proven_optimal)
+        for b in range(2):
+            spans = sorted((p.offset, p.offset + p.encoded_size)
+                           for p in opt.placements.values() if p.start_bank == b)
+            for (_, end), (start, _) in zip(spans, spans[1:]):
+                self.assertLessEqual(end, start)
+            self.assertLessEqual(spans[-1][1], BANK_BASE + BANK_SIZE)
+    
+    def test_fits_where_ffd_fails(self):
+        self.assertFalse(pack_into_banks(self._sizes(), 2).success)
+        r = pack_into_banks(self._sizes(), 2, optimal=True)
+        self.assertTrue(r.success, r.error)
+        self.assertEqual(len(r.bank_seq), 6)
+    
+    def test_multi_bank_tail_shared(self):
+        r = pack_into_banks([(0, 20000), (1, 6000), (2, 8000)], 8,
+                            codebook_size=2048, vq_instruments={0, 1, 2},
+                            optimal=True)
+        self.assertEqual(r.placements[0].bank_indices, [0, 1])
+        # Inst 2 follows the 5664-byte tail chunk in bank 1
+        self.assertEqual(r.placements[2].start_bank, 1)
+        self.assertEqual(r.placements[2].offset, BANK_BASE + 2048 + 5888)
+        self.assertEqual(r.placements[1].start_bank, 2)
+        self.assertEqual(r.bank_codebook_bytes, [2048] * 3)
+    
+    def test_reduced_reserve_tail_stays_frozen(self):
+        r = pack_into_banks([(0, 20000), (1, 3000)], 8,
+                            codebook_size=2048, vq_instruments={0, 1},
+                            inst_codebook_bytes={0: 256, 1: 256},
+                            optimal=True)
+        # Both needs together would grow the chain's reservation
+        self.assertEqual(r.placements[1].start_bank, 2)
+        self.assertEqual(r.bank_codebook_bytes, [256, 256, 256])
+    
+    def test_cooccurrence_groups_banks(self):
+        sizes = [(i, 8192) for i in range(4)]
+        co = {(0, 3): 10, (1, 2): 4}
+        ffd = pack_into_banks(sizes, 4, cooccurrence=co)
+        self.assertEqual(ffd.switch_cost, 14)
+        r = pack_into_banks(sizes, 4, optimal=True, cooccurrence=co)
+        self.assertEqual(r.n_banks_used, 2)
+        self.assertEqual(r.switch_cost, 0)
+        self.assertEqual(r.placements[0].start_bank, r.placements[3].start_bank)
+        self.assertEqual(bank_switch_cost(r, {(0, 1): 2}), 2)
+    
+    def test_instrument_cooccurrence(self):
+        from data_model import Song
+        from constants import NOTE_OFF
+        song = Song()
+        p1 = song.add_pattern()
+        song.songlines[0].patterns[:2] = [0, p1]
+        pat0, pat1 = song.get_pattern(0), song.get_pattern(p1)
+        pat0.rows[0].note, pat0.rows[0].instrument = 1, 2
+        pat1.rows[1].note, pat1.rows[1].instrument = 1, 5
+        pat0.rows[3].note = NOTE_OFF
+        self.assertEqual(instrument_cooccurrence(song), {(2, 5): 2})
+
+
 class TestRawLabelExtraction(unittest.TestCase):
     """Test _extract_raw_blocks with both label conventions."""
     
@@ -587,7 +716,7 @@ class TestPerBankVQReEncoding(unittest.TestCase):
     def test_reencode_bank_vq_basic(self):
         """Re-encode preserves approximate volume levels."""
         import numpy as np
-        from build import _reencode_bank_vq
+        from bank_vq import reencode_bank_vq
         
         vec_size = 4
         # Build a simple 4-entry global codebook (AUDC format: $10|vol)
@@ -601,7 +730,7 @@ class TestPerBankVQReEncoding(unittest.TestCase):
         # Create some indices referencing entries 0-3
         bank_indices = bytes([0, 1, 2, 3, 0, 0, 1, 1])
         
-        cb_bytes, reenc = _reencode_bank_vq(bank_indices, global_cb, vec_size)
+        cb_bytes, reenc = reencode_bank_vq(bank_indices, global_cb, vec_size)
         
         self.assertEqual(len(cb_bytes), 256 * vec_size)
         self.assertEqual(len(reenc), len(bank_indices))
@@ -613,7 +742,7 @@ class TestPerBankVQReEncoding(unittest.TestCase):
     def test_reencode_silence_reserved(self):
         """Silence codebook[0] reserved when near-silent vectors exist."""
         import numpy as np
-        from build import _reencode_bank_vq
+        from bank_vq import reencode_bank_vq
         
         vec_size = 4
         # Global codebook: entry 0 = silence, entry 5 = loud
@@ -624,7 +753,7 @@ class TestPerBankVQReEncoding(unittest.TestCase):
         # Mix of silence (idx 0) and loud (idx 5)
         bank_indices = bytes([0, 0, 0, 5, 0, 5])
         
-        cb_bytes, reenc = _reencode_bank_vq(bank_indices, global_cb, vec_size)
+        cb_bytes, reenc = reencode_bank_vq(bank_indices, global_cb, vec_size)
         
         # Codebook entry 0 should be silence ($10 for all samples)
         for j in range(vec_size):
@@ -669,7 +798,7 @@ class TestPerBankVQReEncoding(unittest.TestCase):
         its own re-encoded data (not the other's).
         """
         import numpy as np
-        from build import _reencode_bank_vq
+        from bank_vq import reencode_bank_vq
         
         vec_size = 4
         # Build global codebook: entry 0 = silence, entry 10 = loud
@@ -685,7 +814,7 @@ class TestPerBankVQReEncoding(unittest.TestCase):
         # Concatenate in order A, B (as the build pipeline would)
         combined = inst_a_indices + inst_b_indices
         
-        cb_bytes, reencoded = _reencode_bank_vq(combined, global_cb, vec_size)
+        cb_bytes, reencoded = reencode_bank_vq(combined, global_cb, vec_size)
         
         # Split back: A gets first 50, B gets next 30
         reenc_a = reencoded[:50]
@@ -798,6 +927,25 @@ class TestVerifyBankingFit(unittest.TestCase):
         # All should remain RAW
         self.assertTrue(all(a.suggest_raw for a in result.analyses))
 
+    def test_no_demotion_when_optimal_pack_fits(self):
+        """The trial pack searches like the build: first-fit failing is not enough."""
+        from optimize import _verify_banking_fit, OptimizeResult, InstrumentAnalysis
+
+        result = OptimizeResult(memory_budget=2 * BANK_SIZE)
+        mode_map = {}
+        # First-fit-decreasing needs 3 banks; {33,20,9} + {32,24,8} pages fit in 2
+        for i, pages in enumerate(TestOptimalPacking.PAGES):
+            a = InstrumentAnalysis(index=i, name=f"inst_{i}")
+            a.raw_size_aligned = pages * 256
+            a.vq_size = 512
+            a.suggest_raw = True
+            mode_map[i] = True
+            result.analyses.append(a)
+
+        _verify_banking_fit(result, mode_map, 2048, 2, [], 8, False, 30000)
+
+        self.assertTrue(all(a.suggest_raw for a in result.analyses))
+
 
 if __name__ == '__main__':
     unittest.main()
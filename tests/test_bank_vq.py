@@ -0,0 +1,118 @@
+"""Tests for per-bank VQ codebook training (bank_vq)."""
+import unittest
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from bank_vq import (reencode_bank_vq, bank_kmeans, train_banks, codebook_need,
+                     codebook_needs)
+
+
+def _reference_kmeans(vf, n_codes, n_iter):
+    """Direct k-means++ / per-cluster mean formulation (same RandomState)."""
+    n_vecs = len(vf)
+    rng = np.random.RandomState(42)
+    indices = [rng.randint(n_vecs)]
+    for _ in range(1, n_codes):
+        cb = vf[indices]
+        dists = np.min(np.sum((vf[:, None, :] - cb[None, :, :]) ** 2, axis=2), axis=1)
+        probs = dists / dists.sum()
+        indices.append(rng.choice(n_vecs, p=probs / probs.sum()))
+    codebook = vf[indices].copy()
+    for _ in range(n_iter):
+        d = np.sum((vf[:, None, :] - codebook[None, :, :]) ** 2, axis=2)
+        assignments = np.argmin(d, axis=1)
+        new_cb = codebook.copy()
+        for c in range(n_codes):
+            members = vf[assignments == c]
+            if len(members) > 0:
+                new_cb[c] = np.mean(members, axis=0)
+        done = np.allclose(new_cb, codebook, atol=0.01)
+        codebook = new_cb
+        if done:
+            break
+    return codebook
+
+
+def _global_codebook(vec_size, seed=0):
+    rng = np.random.default_rng(seed)
+    return bytes(0x10 | rng.integers(0, 16, 256 * vec_size).astype(np.uint8))
+
+
+def _banks(n_banks, n_indices, seed=1):
+    rng = np.random.default_rng(seed)
+    return {b: bytes(rng.integers(0, 256, n_indices).astype(np.uint8))
+            for b in range(n_banks)}
+
+
+class TestTrainBanks(unittest.TestCase):
+
+    def test_parallel_matches_serial(self):
+        cb = _global_codebook(4)
+        banks = _banks(3, 600)
+        progress = []
+        serial = train_banks(banks, cb, 4, workers=1,
+                             progress=lambda b, n, t: progress.append((n, t)))
+        parallel = train_banks(banks, memoryview(cb), 4, workers=2)
+        self.assertEqual(list(parallel), [0, 1, 2])
+        self.assertEqual(serial, parallel)
+        self.assertEqual(progress, [(1, 3), (2, 3), (3, 3)])
+        for b, data in banks.items():
+            self.assertEqual(serial[b], reencode_bank_vq(data, memoryview(cb), 4))
+
+
+class TestBankKMeans(unittest.TestCase):
+
+    def test_matches_reference(self):
+        rng = np.random.default_rng(2)
+        for vec_size in (4, 8):
+            vf = rng.integers(0, 16, (700, vec_size)).astype(np.float32)
+            np.testing.assert_array_equal(bank_kmeans(vf, 64, 5, 15),
+                                          _reference_kmeans(vf, 64, 5))
+
+    def test_reconstruction(self):
+        cb = _global_codebook(4)
+        # Entries past a short codebook's end reconstruct as zero volume
+        short = memoryview(cb)[:10 * 4]
+        idx = bytes([0, 1, 9, 10, 200])
+        _cb, enc = reencode_bank_vq(idx, short, 4)
+        _cb2, enc2 = reencode_bank_vq(idx, list(cb[:10 * 4]), 4)
+        self.assertEqual((_cb, enc), (_cb2, enc2))
+        self.assertEqual(enc[3], enc[4])
+
+
+
+class TestCodebookNeed(unittest.TestCase):
+
+    def test_few_distinct_vectors(self):
+        cb = _global_codebook(8)
+        rng = np.random.default_rng(4)
+        stream = bytes(rng.choice(np.arange(100, 120), 3000).astype(np.uint8))
+        n_codes, snr = codebook_need(stream, cb, 8, 30.0)
+        self.assertEqual((n_codes, snr), (32, float("inf")))
+        reenc_cb, enc = reencode_bank_vq(stream, cb, 8, n_codes=n_codes)
+        self.assertEqual(len(reenc_cb), 32 * 8)
+        self.assertLess(max(enc), 32)
+    
+    def test_threshold(self):
+        cb = _global_codebook(4)
+        stream = _banks(1, 4000)[0]
+        self.assertEqual(codebook_need(stream, cb, 4, 100.0), (256, float("inf")))
+        n_codes, snr = codebook_need(stream, cb, 4, 0.0)
+        self.assertEqual(n_codes, 64)
+        self.assertGreater(snr, 0.0)
+        n_mid, snr_mid = codebook_need(stream, cb, 4, snr + 3.0)
+        self.assertGreater(n_mid, 64)
+        self.assertGreaterEqual(snr_mid, snr + 3.0)
+    
+    def test_codebook_needs(self):
+        cb = _global_codebook(8)
+        streams = {3: bytes([5] * 500), 7: _banks(1, 2000)[0]}
+        res = codebook_needs(streams, cb, 8, 30.0, workers=1)
+        self.assertEqual(sorted(res), [3, 7])
+        self.assertEqual(res[3], codebook_need(streams[3], cb, 8, 30.0))
+
+if __name__ == '__main__':
+    unittest.main()
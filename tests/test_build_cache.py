@@ -0,0 +1,212 @@
+"""Tests for the incremental build directory (build_cache + build_xex_sync)."""
+import unittest
+import sys
+import os
+import stat
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build_cache import (BankVQCache, BUILD_MANIFEST, XEX_FILE, load_manifest,
+                         save_manifest, sync_build_dir, input_digest,
+                         cached_xex, record_xex)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class TestSyncBuildDir(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.stage = os.path.join(self.tmp, "stage")
+        self.build = os.path.join(self.tmp, "build")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _stage(self, files):
+        shutil.rmtree(self.stage, ignore_errors=True)
+        for rel, data in files.items():
+            _write(os.path.join(self.stage, rel), data)
+
+    def _sync(self, files):
+        self._stage(files)
+        manifest = load_manifest(self.build)
+        result = sync_build_dir(self.stage, self.build, manifest)
+        save_manifest(self.build, manifest)
+        return result
+
+    def test_unchanged_files_not_rewritten(self):
+        changed, _ = self._sync({"A.asm": b"a", "sub/B.asm": b"b"})
+        self.assertEqual(changed, ["A.asm", "sub/B.asm"])
+        path = os.path.join(self.build, "A.asm")
+        before = os.stat(path)
+
+        changed, removed = self._sync({"A.asm": b"a", "sub/B.asm": b"b2"})
+        self.assertEqual(changed, ["sub/B.asm"])
+        self.assertEqual(removed, [])
+        after = os.stat(path)
+        self.assertEqual((after.st_ino, after.st_mtime_ns), (before.st_ino, before.st_mtime_ns))
+        self.assertEqual(_read(os.path.join(self.build, "sub/B.asm")), b"b2")
+
+    def test_stale_files_removed(self):
+        self._sync({"A.asm": b"a", "old/X.bin": b"x"})
+        _write(os.path.join(self.build, XEX_FILE), b"xex")
+        changed, removed = self._sync({"A.asm": b"a"})
+        self.assertEqual((changed, removed), ([], ["old/X.bin"]))
+        self.assertFalse(os.path.exists(os.path.join(self.build, "old")))
+        self.assertTrue(os.path.exists(os.path.join(self.build, XEX_FILE)))
+        self.assertTrue(os.path.exists(os.path.join(self.build, BUILD_MANIFEST)))
+
+    def test_external_edit_detected(self):
+        self._sync({"A.asm": b"a"})
+        path = os.path.join(self.build, "A.asm")
+        _write(path, b"edited")
+        os.utime(path, ns=(1, 1))
+        changed, _ = self._sync({"A.asm": b"a"})
+        self.assertEqual(changed, ["A.asm"])
+        self.assertEqual(_read(path), b"a")
+
+    def test_cached_xex(self):
+        self._sync({"A.asm": b"a"})
+        manifest = load_manifest(self.build)
+        digest = input_digest(manifest, "A.asm", "/nonexistent/mads")
+        self.assertIsNone(cached_xex(self.build, manifest, digest))
+        _write(os.path.join(self.build, XEX_FILE), b"xex")
+        record_xex(self.build, manifest, digest)
+        manifest = load_manifest(self.build)
+        self.assertIsNotNone(cached_xex(self.build, manifest, digest))
+        self.assertNotEqual(input_digest(manifest, "B.asm", "/nonexistent/mads"), digest)
+
+        self._sync({"A.asm": b"changed"})
+        manifest = load_manifest(self.build)
+        self.assertNotEqual(input_digest(manifest, "A.asm", "/nonexistent/mads"), digest)
+        record_xex(self.build, manifest, None)
+        self.assertIsNone(cached_xex(self.build, load_manifest(self.build), digest))
+
+
+class TestBankVQCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_roundtrip_and_prune(self):
+        cache = BankVQCache(self.tmp)
+        k1 = cache.key(b"\x01\x02", [0x10] * 8, 4)
+        k2 = cache.key(b"\x01\x03", [0x10] * 8, 4)
+        self.assertNotEqual(k1, k2)
+        self.assertNotEqual(k1, cache.key(b"\x01\x02", [0x10] * 8, 8))
+        self.assertIsNone(cache.get(k1, 2))
+        cache.put(k1, b"\x10" * 8, b"\x00\x01")
+        cache.put(k2, b"\x11" * 8, b"\x01\x01")
+
+        cache = BankVQCache(self.tmp)
+        self.assertEqual(cache.get(k1, 2), (b"\x10" * 8, b"\x00\x01"))
+        cache.prune()
+        self.assertEqual(os.listdir(self.tmp), [k1 + ".bin"])
+
+    def test_json_entries_kept_apart(self):
+        cache = BankVQCache(self.tmp)
+        key = cache.key(b"\x01\x02", [0x10] * 8, 4, analysis=30.0)
+        self.assertIsNone(cache.get_json(key))
+        cache.put_json(key, [64, 31.5])
+        cache.put(key, b"\x10" * 8, b"\x00\x01")
+
+        cache = BankVQCache(self.tmp)
+        self.assertEqual(cache.get_json(key), [64, 31.5])
+        cache.prune()
+        self.assertEqual(os.listdir(self.tmp), [key + ".json"])
+
+
+class TestIncrementalBuild(unittest.TestCase):
+    """build_xex_sync with a stub assembler that counts its runs."""
+
+    def setUp(self):
+        import build
+        import runtime
+        from state import state
+        from vq_convert import VQResult
+        self.build = build
+        self.state = state
+        self.tmp = tempfile.mkdtemp()
+        self.vq_dir = os.path.join(self.tmp, "vq_output")
+        os.makedirs(self.vq_dir)
+        for name in ("VQ_CFG.asm", "VQ_LO.asm", "VQ_HI.asm", "VQ_BLOB.asm",
+                     "VQ_INDICES.asm", "SAMPLE_DIR.asm"):
+            _write(os.path.join(self.vq_dir, name), f"; {name}\n".encode())
+
+        self.log = os.path.join(self.tmp, "runs.log")
+        self.mads = os.path.join(self.tmp, "mads")
+        with open(self.mads, "w") as f:
+            f.write("#!/bin/sh\n"
+                    f"echo run >> '{self.log}'\n"
+                    'out="${2#-o:}"\n'
+                    'cat *.asm > "$out"\n')
+        os.chmod(self.mads, os.stat(self.mads).st_mode | stat.S_IEXEC)
+
+        self._saved = (state.vq.converted, state.vq.result,
+                       build.find_mads, runtime.get_app_dir, runtime.get_asm_dir)
+        asm_dir = runtime.get_asm_dir()
+        state.vq.converted = True
+        state.vq.result = VQResult(success=True, output_dir=self.vq_dir)
+        build.find_mads = lambda: self.mads
+        runtime.get_app_dir = lambda: self.tmp
+        runtime.get_asm_dir = lambda: asm_dir
+
+    def tearDown(self):
+        import runtime
+        (self.state.vq.converted, self.state.vq.result,
+         self.build.find_mads, runtime.get_app_dir, runtime.get_asm_dir) = self._saved
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _runs(self):
+        if not os.path.exists(self.log):
+            return 0
+        with open(self.log) as f:
+            return len(f.readlines())
+
+    def _build(self, song):
+        xex = os.path.join(self.tmp, "out.xex")
+        result = self.build.build_xex_sync(song, xex)
+        self.assertTrue(result.success, result.error_message)
+        return _read(xex)
+
+    @unittest.skipIf(os.name != "posix", "stub assembler is a shell script")
+    def test_assembler_skipped_when_unchanged(self):
+        from data_model import Song
+        song = Song()
+        song.memory_config = "64 KB"
+        song.title = "First"
+        first = self._build(song)
+        self.assertEqual(self._runs(), 1)
+
+        info = os.path.join(self.tmp, ".tmp", "build", "SONG_INFO.asm")
+        player = os.path.join(self.tmp, ".tmp", "build", "song_player.asm")
+        player_mtime = os.stat(player).st_mtime_ns
+
+        self.assertEqual(self._build(song), first)
+        self.assertEqual(self._runs(), 1)
+
+        song.title = "Second"
+        second = self._build(song)
+        self.assertEqual(self._runs(), 2)
+        self.assertNotEqual(second, first)
+        self.assertIn(b"SECOND", _read(info).upper())
+        self.assertEqual(os.stat(player).st_mtime_ns, player_mtime)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, ".tmp", "build_stage")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,423 @@
+"""Tests for the cycle analyzer's 6502 core and its timer/IRQ loop."""
+import unittest
+import sys
+import os
+import random
+import shutil
+import struct
+import tempfile
+from unittest import mock
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from cycle_analyzer import analyzer, cpu6502
+from cycle_analyzer.cpu6502 import Cpu6502, OPCODES, INTERRUPT
+from cycle_analyzer.atari_system import (AtariSystem, TickStats, read_tick_trace,
+                                         AUDF1, AUDCTL, STIMER_W, IRQEN_W, RANDOM_R,
+                                         DMACTL, DLISTL, DLISTH, PAL_SCANLINES,
+                                         NTSC_SCANLINES, DmaProfile, dma_profile,
+                                         display_list_ops, compute_dma_table)
+from cycle_analyzer.xex_loader import parse_xex, load_into_memory
+
+try:
+    from py65.devices.mpu6502 import MPU
+except ImportError:     # reference emulator for the differential tests only
+    MPU = None
+
+
+def _random_program(seed):
+    """64 KB of documented opcodes, so any byte can be executed."""
+    rng = random.Random(seed)
+    opcodes = sorted(OPCODES)
+    return bytearray(rng.choice(opcodes) for _ in range(0x10000))
+
+
+def _state(cpu, cycles):
+    return (cpu.pc, cpu.a, cpu.x, cpu.y, cpu.sp, cpu.p, cycles)
+
+
+@unittest.skipUnless(MPU, "py65 not installed")
+class TestCpuAgainstPy65(unittest.TestCase):
+    """Random code (self-modifying, decimal mode, ...) against py65."""
+
+    def _pair(self, seed):
+        memory = _random_program(seed)
+        ref = MPU(memory=list(memory), pc=0x2000)
+        # py65 counts DEC abs as 3 cycles; the NMOS 6502 takes 6
+        ref.cycletime = list(ref.cycletime)
+        ref.cycletime[0xCE] = 6
+        cpu = Cpu6502(memory)
+        cpu.pc, cpu.p, cpu.sp = ref.pc, ref.p, ref.sp
+        return ref, cpu
+
+    def test_single_steps(self):
+        for seed in range(3):
+            ref, cpu = self._pair(seed)
+            for _ in range(3000):
+                ref.step()
+                cpu.step()
+                self.assertEqual(_state(cpu, cpu.cycles),
+                                 _state(ref, ref.processorCycles))
+            self.assertEqual(cpu.memory, bytearray(ref.memory))
+
+    def test_translated_runs(self):
+        # Translate every jump target at once, and end runs at random
+        # cycle counts so limits fall inside traces
+        rng = random.Random(7)
+        with mock.patch.object(cpu6502, "_HOT_ENTRY", 1):
+            for seed in range(3):
+                ref, cpu = self._pair(100 + seed)
+                for _ in range(300):
+                    limit = cpu.cycles + rng.randint(1, 120)
+                    cpu.run(limit)
+                    while ref.processorCycles < limit:
+                        ref.step()
+                    self.assertEqual(_state(cpu, cpu.cycles),
+                                     _state(ref, ref.processorCycles))
+                self.assertEqual(cpu.memory, bytearray(ref.memory))
+
+    def test_loop_translation(self):
+        # LDX #0; loop: INX; TXA; STA $3000,X; BNE loop; BRK
+        program = bytes([0xA2, 0x00, 0xE8, 0x8A, 0x9D, 0x00, 0x30, 0xD0, 0xF9, 0x00])
+        memory = bytearray(0x10000)
+        memory[0x2000:0x2000 + len(program)] = program
+        cpu = Cpu6502(memory)
+        cpu.pc = 0x2000
+        cpu.run(2 + 255 * 12 + 11)
+        self.assertEqual(cpu.pc, 0x2009)
+        self.assertEqual(cpu.cycles, 2 + 255 * 12 + 11)
+        self.assertEqual(memory[0x3001:0x3100], bytes(range(1, 256)))
+
+
+def _xex(segments, run_addr):
+    data = b"\xff\xff"
+    for start, payload in segments + [(0x02E0, struct.pack("<H", run_addr))]:
+        data += struct.pack("<HH", start, start + len(payload) - 1) + payload
+    return data
+
+
+# Timer at 28 * 100 cycles; the main loop samples RANDOM, the handler logs
+# RANDOM and idles for a count that depends on the main loop's progress
+_MAIN = bytes([
+    0xA9, 0x00, 0x8D, 0x08, 0xD2,     # LDA #0 / STA AUDCTL
+    0xA9, 0x63, 0x8D, 0x00, 0xD2,     # LDA #99 / STA AUDF1
+    0x8D, 0x09, 0xD2,                 # STA STIMER
+    0xA9, 0x01, 0x8D, 0x0E, 0xD2,     # LDA #1 / STA IRQEN
+    0x58,                             # CLI
+    0xAD, 0x0A, 0xD2,                 # loop: LDA RANDOM
+    0x8D, 0x00, 0x31,                 # STA $3100
+    0xEE, 0x00, 0x30,                 # INC $3000
+    0x4C, 0x13, 0x20,                 # JMP loop
+])
+_HANDLER = bytes([
+    0x48, 0x8A, 0x48,                 # PHA / TXA / PHA
+    0xAD, 0x0A, 0xD2,                 # LDA RANDOM
+    0xAE, 0x01, 0x30,                 # LDX $3001
+    0x9D, 0x00, 0x32,                 # STA $3200,X
+    0xEE, 0x01, 0x30,                 # INC $3001
+    0xAD, 0x00, 0x30, 0x29, 0x03,     # LDA $3000 / AND #3
+    0xAA, 0xCA, 0x10, 0xFD,           # TAX / wait: DEX / BPL wait
+    0xA9, 0x00, 0x8D, 0x0E, 0xD2,     # LDA #0 / STA IRQEN
+    0xA9, 0x01, 0x8D, 0x0E, 0xD2,     # LDA #1 / STA IRQEN
+    0x68, 0xAA, 0x68, 0x40,           # PLA / TAX / PLA / RTI
+])
+
+
+def _stepped_ticks(data, frame_cycles, frames):
+    """The timer/IRQ loop one instruction at a time, as a reference."""
+    cpu = Cpu6502()
+    load_into_memory(cpu.memory, parse_xex(data))
+    cpu.pc, cpu.p = 0x2000, 0x34
+    t = {"period": 0, "counter": 0, "enabled": False, "audf1": 0,
+         "audctl": 0, "frame_cycle": 0}
+
+    def period():
+        t["period"] = (114 if t["audctl"] & 0x40 else 28) * (t["audf1"] + 1)
+
+    cpu.hook_write(AUDF1, lambda a, v, c: t.update(audf1=v) or period())
+    cpu.hook_write(AUDCTL, lambda a, v, c: t.update(audctl=v) or period())
+    cpu.hook_write(STIMER_W, lambda a, v, c: t.update(counter=t["period"]))
+    cpu.hook_write(IRQEN_W, lambda a, v, c: t.update(enabled=bool(v & 1)))
+    cpu.hook_read(RANDOM_R, lambda a, c: (t["frame_cycle"] * 7 + 13) & 0xFF)
+
+    ticks = []
+    for frame in range(frames):
+        t["frame_cycle"] = 0
+        tick = 0
+        while t["frame_cycle"] < frame_cycles:
+            elapsed = cpu.step()
+            t["frame_cycle"] += elapsed
+            if t["period"] and t["enabled"]:
+                t["counter"] -= elapsed
+                while t["counter"] <= 0:
+                    t["counter"] += t["period"]
+                    if cpu.p & INTERRUPT:
+                        continue
+                    entry = cpu.cycles
+                    cpu.irq()
+                    while True:
+                        opcode = cpu.memory[cpu.pc]
+                        cpu.step()
+                        if opcode == 0x40:
+                            break
+                    cost = cpu.cycles - entry
+                    ticks.append((frame, tick, cost))
+                    tick += 1
+                    t["frame_cycle"] += cost
+                    t["counter"] -= cost
+    return ticks, cpu.memory
+
+
+class TestAtariSystemTiming(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_matches_single_stepping(self):
+        data = _xex([(0x2000, _MAIN), (0x2100, _HANDLER), (0xFFFE, b"\x00\x21")],
+                    0x2000)
+        xex = os.path.join(self.tmp, "test.xex")
+        trace = os.path.join(self.tmp, "ticks.bin")
+        with open(xex, "wb") as f:
+            f.write(data)
+        system = AtariSystem(is_pal=True)
+        stats = system.run_analysis(xex, max_frames=4,
+                                    stats=TickStats(histogram_bin=8, trace_path=trace))
+        ticks = list(read_tick_trace(trace))
+
+        expected, memory = _stepped_ticks(data, system.frame_cycles, 4)
+        self.assertGreater(len(expected), 40)
+        self.assertEqual([(t.frame, t.tick_in_frame, t.handler_cycles) for t in ticks],
+                         expected)
+        self.assertTrue(all(t.timer_period == 2800 for t in ticks))
+        self.assertEqual(system.memory[0x3000:0x3300], memory[0x3000:0x3300])
+
+        # Song position is zero page $9D/$8D, never written here: one row
+        costs = [cost for _, _, cost in expected]
+        self.assertEqual(list(stats.rows()),
+                         [(0, 0, max(costs), sum(costs) / len(costs), len(costs))])
+        self.assertEqual((stats.n_ticks, stats.timer_period), (len(costs), 2800))
+        self.assertEqual(sum(stats.histogram), len(costs))
+        self.assertGreater(stats.histogram[max(costs) // 8], 0)
+
+    def test_resume_from_songline_snapshots(self):
+        xex = os.path.join(self.tmp, "song.xex")
+        with open(xex, "wb") as f:
+            f.write(_SONG_XEX)
+        full_trace = os.path.join(self.tmp, "full.bin")
+        snapshots = []
+        full = AtariSystem().run_analysis(xex, max_frames=100,
+                                          stats=TickStats(16, full_trace),
+                                          on_songline=snapshots.append)
+        self.assertEqual([s.memory[0x9D] for s in snapshots], [0, 0, 1, 2, 3, 4])
+        self.assertEqual(snapshots[0].frame, 0)
+
+        # Each songline measured on its own, the last to where the run stops
+        merged = TickStats(16)
+        traced = []
+        ends = [s.frame for s in snapshots[1:]] + [100]
+        for n, (snapshot, end) in enumerate(zip(snapshots, ends)):
+            trace = os.path.join(self.tmp, f"part{n}.bin")
+            merged.merge(AtariSystem().resume(snapshot, end, stats=TickStats(16, trace)))
+            traced += read_tick_trace(trace)
+        self.assertEqual(traced, list(read_tick_trace(full_trace)))
+        self.assertEqual(list(merged.rows()), list(full.rows()))
+        self.assertEqual(list(merged.histogram), list(full.histogram))
+        self.assertEqual((merged.n_ticks, merged.timer_period),
+                         (full.n_ticks, full.timer_period))
+
+
+# A song of 5 songlines of 40 rows, a row per tick; the handler's cost
+# depends on RANDOM. The run ends when the songline wraps to 0.
+_SONG_MAIN = bytes([
+    0xA9, 0x00, 0x8D, 0x08, 0xD2,     # LDA #0 / STA AUDCTL
+    0xA9, 0x63, 0x8D, 0x00, 0xD2,     # LDA #99 / STA AUDF1
+    0x8D, 0x09, 0xD2,                 # STA STIMER
+    0xA9, 0x01, 0x8D, 0x0E, 0xD2,     # LDA #1 / STA IRQEN
+    0x85, 0x8F, 0x58,                 # STA playing / CLI
+    0xAD, 0x0A, 0xD2,                 # loop: LDA RANDOM
+    0x8D, 0x00, 0x31,                 # STA $3100
+    0xEE, 0x00, 0x30,                 # INC $3000
+    0x4C, 0x15, 0x20,                 # JMP loop
+])
+_SONG_HANDLER = bytes([
+    0x48, 0x8A, 0x48,                 # PHA / TXA / PHA
+    0xAD, 0x0A, 0xD2, 0x29, 0x07,     # LDA RANDOM / AND #7
+    0xAA, 0xCA, 0x10, 0xFD,           # TAX / wait: DEX / BPL wait
+    0xE6, 0x8D, 0xA5, 0x8D,           # INC row / LDA row
+    0xC9, 0x28, 0xD0, 0x10,           # CMP #40 / BNE done
+    0xA9, 0x00, 0x85, 0x8D,           # LDA #0 / STA row
+    0xE6, 0x9D, 0xA5, 0x9D,           # INC songline / LDA songline
+    0xC9, 0x05, 0xD0, 0x04,           # CMP #5 / BNE done
+    0xA9, 0x00, 0x85, 0x9D,           # LDA #0 / STA songline
+    0xA9, 0x00, 0x8D, 0x0E, 0xD2,     # done: LDA #0 / STA IRQEN
+    0xA9, 0x01, 0x8D, 0x0E, 0xD2,     # LDA #1 / STA IRQEN
+    0x68, 0xAA, 0x68, 0x40,           # PLA / TAX / PLA / RTI
+])
+_SONG_XEX = _xex([(0x2000, _SONG_MAIN), (0x2100, _SONG_HANDLER),
+                  (0xFFFE, b"\x00\x21")], 0x2000)
+
+
+class TestPartitionedAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.xex = os.path.join(self.tmp, "song.xex")
+        with open(self.xex, "wb") as f:
+            f.write(_SONG_XEX)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _analyze(self, name, **kwargs):
+        trace = os.path.join(self.tmp, name)
+        result = analyzer.run_cycle_analysis(self.xex, histogram_bin=16,
+                                             trace_path=trace, **kwargs)
+        with open(trace, "rb") as f:
+            return result, f.read()
+
+    def test_segment_starts(self):
+        frames = [0, 10, 20, 30, 40, 50, 95]
+        self.assertEqual(analyzer._segment_starts(frames, 100, 1), [0])
+        self.assertEqual(analyzer._segment_starts(frames, 100, 2), [0, 5])
+        self.assertEqual(analyzer._segment_starts(frames, 100, 4), [0, 3, 5, 6])
+        self.assertEqual(analyzer._segment_starts([0, 5], 100, 8), [0, 1])
+
+    def test_cached_parallel_run_matches_serial(self):
+        serial, serial_trace = self._analyze("serial.bin", workers=1)
+        self.assertGreater(serial.n_ticks, 150)
+
+        cache = os.path.join(self.tmp, "cache")
+        seeded, _ = self._analyze("seed.bin", workers=2, cache_dir=cache)
+        self.assertEqual(seeded.rows, serial.rows)
+        self.assertEqual(len(os.listdir(cache)), 2)
+
+        # Cache hit: no serial run in this process, the ranges go to the pool
+        with mock.patch.object(AtariSystem, "run_analysis",
+                               side_effect=AssertionError("serial run")):
+            parallel, parallel_trace = self._analyze("parallel.bin", workers=2,
+                                                     cache_dir=cache)
+        self.assertEqual(parallel.rows, serial.rows)
+        self.assertEqual(parallel.handler_histogram, serial.handler_histogram)
+        self.assertEqual((parallel.n_ticks, parallel.timer_period),
+                         (serial.n_ticks, serial.timer_period))
+        self.assertEqual(parallel_trace, serial_trace)
+        self.assertEqual(sorted(os.listdir(self.tmp)),
+                         ["cache", "parallel.bin", "seed.bin", "serial.bin", "song.xex"])
+
+    def test_unusable_pool_falls_back_to_serial(self):
+        cache = os.path.join(self.tmp, "cache")
+        serial, serial_trace = self._analyze("serial.bin", workers=1, cache_dir=cache)
+        with mock.patch("concurrent.futures.ProcessPoolExecutor",
+                        side_effect=OSError("no processes")):
+            result, trace = self._analyze("fallback.bin", workers=4, cache_dir=cache)
+        self.assertEqual(result.rows, serial.rows)
+        self.assertEqual(trace, serial_trace)
+
+
+def _add_ticks(stats, ticks):
+    """Feed (frame, tick, songline, row, cycles, period) ticks frame by frame."""
+    frames = {}
+    for frame, _, sl, rw, cost, period in ticks:
+        frames.setdefault(frame, []).append(((sl << 8) | rw, cost, period))
+    for frame, log in frames.items():
+        stats.add_frame(frame, log)
+
+
+class TestTickStats(unittest.TestCase):
+
+    def test_aggregation_and_trace(self):
+        rng = random.Random(3)
+        ticks = [(f, t, rng.randrange(3), rng.randrange(64), rng.randint(50, 400), 900)
+                 for f in range(20) for t in range(30)]
+        fd, trace = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            stats = TickStats(histogram_bin=100, trace_path=trace)
+            _add_ticks(stats, ticks)
+            stats.close()
+            self.assertEqual([tuple(vars(t).values()) for t in read_tick_trace(trace)],
+                             ticks)
+        finally:
+            os.remove(trace)
+
+        by_row = {}
+        for _, _, sl, rw, cost, _ in ticks:
+            by_row.setdefault((sl, rw), []).append(cost)
+        self.assertEqual(list(stats.rows()),
+                         [(sl, rw, max(c), sum(c) / len(c), len(c))
+                          for (sl, rw), c in sorted(by_row.items())])
+        self.assertEqual(list(stats.histogram),
+                         [sum(1 for t in ticks if t[4] // 100 == b) for b in range(5)])
+        self.assertEqual(stats.n_ticks, len(ticks))
+
+    def test_merge(self):
+        rng = random.Random(4)
+        ticks = [(f, t, rng.randrange(3), rng.randrange(64), rng.randint(50, 900), 900)
+                 for f in range(20) for t in range(30)]
+        whole, head, rest = TickStats(100), TickStats(100), TickStats(100)
+        _add_ticks(whole, ticks)
+        _add_ticks(head, [t for t in ticks if t[0] < 10])
+        _add_ticks(rest, [t for t in ticks if t[0] >= 10])
+        head.merge(rest)
+        self.assertEqual(list(head.rows()), list(whole.rows()))
+        self.assertEqual(list(head.histogram), list(whole.histogram))
+        self.assertEqual((head.n_ticks, head.timer_period),
+                         (whole.n_ticks, whole.timer_period))
+
+
+def _display(dl_addr, dl, dmactl=0x22):
+    memory = bytearray(0x10000)
+    memory[dl_addr:dl_addr + len(dl)] = dl
+    memory[DLISTL], memory[DLISTH] = dl_addr & 0xFF, dl_addr >> 8
+    memory[DMACTL] = dmactl
+    return memory
+
+
+class TestDmaProfile(unittest.TestCase):
+
+    def test_budgets_match_window_scan(self):
+        rng = random.Random(5)
+        for _ in range(20):
+            table = [rng.randint(9, 100) for _ in range(rng.choice((262, 312)))]
+            profile = DmaProfile(np.array(table))
+            for period in (1, 113, 114, 115, 448, 2800, 40000, 80000):
+                span = -(-period // 114)
+                sums = [sum(table[(s + d) % len(table)] for d in range(span))
+                        for s in range(len(table))]
+                self.assertEqual(profile.budgets(period),
+                                 (max(sums), min(sums), sum(sums) // len(table)))
+        self.assertEqual(profile.budgets(0), (0, 0, 0))
+
+    def test_player_display(self):
+        # 24 blank lines, mode 2 with LMS, 3 more mode 2 lines, JVB
+        dl = bytes([0x70, 0x70, 0x70, 0x42, 0x00, 0x30, 0x02, 0x02, 0x02, 0x41, 0x00, 0x20])
+        memory = _display(0x2000, dl)
+        self.assertEqual(display_list_ops(memory), bytes([0x70] * 3 + [0x42, 2, 2, 2]))
+        table = compute_dma_table(memory)
+        self.assertEqual(len(table), PAL_SCANLINES)
+        expected = [9] * PAL_SCANLINES
+        for line in range(24, 56):
+            # Font every line; DL fetch and character names on the first
+            expected[line] += 40 + (1 + 40 if line % 8 == 0 else 0)
+        self.assertEqual(table, expected)
+
+        # Same display elsewhere in memory, split by a JMP: same profile
+        moved = _display(0x4000, bytes([0x70, 0x70, 0x70, 0x42, 0x00, 0x50, 0x02,
+                                        0x01, 0x00, 0x41]))
+        moved[0x4100:0x4105] = bytes([0x02, 0x02, 0x41, 0x00, 0x40])
+        self.assertIs(dma_profile(moved), dma_profile(memory))
+        self.assertIsNot(dma_profile(memory, is_pal=False), dma_profile(memory))
+        self.assertEqual(len(dma_profile(memory, is_pal=False).table), NTSC_SCANLINES)
+
+        # Display list DMA off: memory refresh only
+        self.assertEqual(compute_dma_table(_display(0x2000, dl, dmactl=0x02)),
+                         [9] * PAL_SCANLINES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -184,6 +184,51 @@ class TestProjectSaveLoad(unittest.TestCase):
         # But VQ settings should be preserved
         self.assertEqual(es2.vq_rate, 7917)
 
+    def _make_vq_output(self, with_meta: bool = True) -> str:
+        """Create a fake converter output directory."""
+        import vq_cache
+        out = os.path.join(self.test_dir, "fake_vq_output")
+        os.makedirs(out)
+        with open(os.path.join(out, "VQ_BLOB.asm"), "w") as f:
+            f.write(" .byte $01,$02\n")
+        if with_meta:
+            vq_cache.write_output_meta(out, "ab" * 32, {"size_bytes": 2},
+                                       {"rate": 7917})
+        return out
+
+    def test_vq_output_embedded(self):
+        """Hashed VQ output is embedded and restored into vq_output/."""
+        import vq_cache
+        out = self._make_vq_output()
+        path = os.path.join(self.test_dir, "vq_embed.pvq")
+
+        ok, msg = save_project(Song(), EditorState(vq_converted=True), path,
+                               self.work_dir, vq_output_dir=out)
+        self.assertTrue(ok, msg)
+        with zipfile.ZipFile(path) as zf:
+            self.assertIn("vq_output/VQ_BLOB.asm", zf.namelist())
+            self.assertIn("vq_output/" + vq_cache.OUTPUT_META_FILE,
+                          zf.namelist())
+
+        # Extracted for the auto-conversion, which checks the hash first
+        _, es2, _ = load_project(path, self.work_dir)
+        self.assertFalse(es2.vq_converted)
+        meta = vq_cache.read_output_meta(self.work_dir.vq_output)
+        self.assertEqual(meta["key"], "ab" * 32)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.work_dir.vq_output, "VQ_BLOB.asm")))
+
+    def test_vq_output_without_meta_not_embedded(self):
+        """Output without a content hash cannot be validated, so skip it."""
+        out = self._make_vq_output(with_meta=False)
+        path = os.path.join(self.test_dir, "vq_nometa.pvq")
+
+        save_project(Song(), EditorState(), path, self.work_dir,
+                     vq_output_dir=out)
+        with zipfile.ZipFile(path) as zf:
+            self.assertFalse(any(n.startswith("vq_output/")
+                                 for n in zf.namelist()))
+
     def test_pvq_extension_auto_added(self):
         """Extension should be auto-added if missing."""
         song = Song()
@@ -0,0 +1,426 @@
+"""Tests for the optimizer's compressed song timeline and mode search."""
+import unittest
+import sys
+import os
+import random
+import itertools
+import shutil
+import tempfile
+from unittest import mock
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import optimize
+from optimize import (_Timeline, _Segment, _irq_cost, _count_overrun_irqs,
+                      _overrun_candidates, _count_overrun_irqs_involving,
+                      _worst_signature, _simulate_song, _assign_modes,
+                      _greedy_overrun_fix, _exact_overrun_fix,
+                      InstrumentAnalysis, OptimizeResult, AnalysisCache,
+                      analyze_instruments, predict_overruns, _simulate_songline)
+
+
+def _random_rows(seed, n_rows=300, n_inst=6):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n_rows):
+        segs = []
+        for _ in range(rng.randint(1, 3)):
+            active = [(rng.randrange(n_inst), rng.random() < 0.5)
+                      for _ in range(rng.randint(0, 4))]
+            segs.append(_Segment(n_irqs=rng.randint(0, 200), active=active))
+        rows.append(segs)
+    return rows
+
+
+def _reference(rows, mode_map, inst_idx, period):
+    """Per-segment rescan (the uncompressed formulation)."""
+    total = participating = fixed = 0
+    if_raw = dict(mode_map)
+    if_raw[inst_idx] = True
+    for segs in rows:
+        for seg in segs:
+            cost = _irq_cost(seg.active, mode_map, 8, False)
+            if cost <= period:
+                continue
+            total += seg.n_irqs
+            if any(i == inst_idx for i, _ in seg.active):
+                participating += seg.n_irqs
+                if _irq_cost(seg.active, if_raw, 8, False) <= period:
+                    fixed += seg.n_irqs
+    return total, participating, fixed
+
+
+class TestTimeline(unittest.TestCase):
+
+    def test_matches_segment_rescan(self):
+        for seed in range(5):
+            rows = _random_rows(seed)
+            timeline = _Timeline()
+            for segs in rows:
+                timeline.add_row(segs)
+            timeline.finish()
+            self.assertLess(len(timeline), sum(len(s) for s in rows))
+            mode_map = {0: True, 3: True}
+            for period in (150.0, 180.0, 200.0):
+                participating, fixed = _overrun_candidates(
+                    timeline, mode_map, 8, False, period)
+                for inst_idx in range(6):
+                    total, part, fix = _reference(rows, mode_map, inst_idx, period)
+                    self.assertEqual(_count_overrun_irqs(
+                        timeline, mode_map, 8, False, period), total)
+                    self.assertEqual((participating[inst_idx], fixed[inst_idx]),
+                                     (part, fix))
+                    self.assertEqual(_count_overrun_irqs_involving(
+                        timeline, mode_map, inst_idx, 8, False, period), (part, fix))
+
+    def test_worst_signature_first_wins(self):
+        timeline = _Timeline()
+        timeline.add_row([_Segment(10, [(1, False)]), _Segment(5, [(2, False)])])
+        timeline.add_row([_Segment(7, [(2, False), (1, False)])])
+        timeline.add_row([_Segment(3, [(0, False), (0, False)])])
+        timeline.finish()
+        self.assertEqual(len(timeline), 4)
+        self.assertEqual(list(timeline.irqs), [10, 5, 7, 3])
+        self.assertEqual(list(timeline.counts[3]), [2, 0, 0])
+        pct, n_ch = _worst_signature(timeline, {}, 8, False, 100.0)
+        self.assertEqual(n_ch, 2)
+        self.assertAlmostEqual(pct, _irq_cost([(1, False), (2, False)], {}, 8, False))
+
+    def test_no_song(self):
+        timeline = _simulate_song(None, {}, 15834, 50)
+        self.assertFalse(timeline)
+        self.assertEqual(_count_overrun_irqs(timeline, {}, 8, False, 100.0), 0)
+
+
+def _result(timeline, extras, headroom, period):
+    """OptimizeResult with one 1 KB VQ instrument per entry of extras."""
+    result = OptimizeResult()
+    for i, extra in enumerate(extras):
+        a = InstrumentAnalysis(index=i, name=f"i{i}", vq_size=1024,
+                               raw_size_aligned=1024 + extra)
+        a.cpu_saving = 53 / 8 - 20 / 256
+        result.analyses.append(a)
+    result.total_vq_size = 1024 * len(extras) + 2048
+    result.total_raw_size = result.total_vq_size + sum(extras)
+    result.memory_budget = result.total_vq_size + headroom
+    result.cpu.sample_rate = 15834
+    result.cpu.total_overrun_irqs = _count_overrun_irqs(timeline, {}, 8, False, period)
+    result.cpu.overrun = result.cpu.total_overrun_irqs > 0
+    return result
+
+
+class TestModeSearch(unittest.TestCase):
+    PERIOD = 110.0      # one VQ channel overruns, one RAW channel fits
+
+    def _timeline(self, rows):
+        timeline = _Timeline()
+        for segs in rows:
+            timeline.add_row(segs)
+        return timeline.finish()
+
+    def test_beats_greedy(self):
+        timeline = self._timeline([[_Segment(1000, [(0, False)])],
+                                   [_Segment(600, [(1, False)])],
+                                   [_Segment(500, [(2, False)])]])
+        result = _result(timeline, [8192, 5120, 5120], 10240, self.PERIOD)
+        active = result.analyses
+        greedy = _greedy_overrun_fix(timeline, active, {0: False, 1: False, 2: False},
+                                     10240, 8, False, self.PERIOD)
+        self.assertEqual([i for i, _ in greedy], [0])
+
+        mode_map = {0: False, 1: False, 2: False}
+        _assign_modes(result, mode_map, timeline, 2048, 8, False, self.PERIOD)
+        self.assertEqual(mode_map, {0: False, 1: True, 2: True})
+        self.assertEqual(result.analyses[1].reason, "fixes 600 overrun IRQs")
+        self.assertTrue(result.mode_search_optimal)
+        self.assertEqual(result.mode_search_gap, 0)
+        self.assertIn("1000 overrun IRQs remain", result.summary)
+        self.assertIn("mode assignment optimal", result.summary)
+
+    def test_greedy_only(self):
+        timeline = self._timeline([[_Segment(1000, [(0, False)])],
+                                   [_Segment(600, [(1, False)])]])
+        result = _result(timeline, [8192, 5120], 10240, self.PERIOD)
+        mode_map = {0: False, 1: False}
+        saved = optimize.MODE_SEARCH_TIME_BUDGET
+        optimize.MODE_SEARCH_TIME_BUDGET = 0
+        try:
+            _assign_modes(result, mode_map, timeline, 2048, 8, False, self.PERIOD)
+        finally:
+            optimize.MODE_SEARCH_TIME_BUDGET = saved
+        self.assertEqual(mode_map, {0: True, 1: False})
+        self.assertIsNone(result.mode_search_optimal)
+        self.assertNotIn("optimal", result.summary)
+
+    def test_matches_brute_force(self):
+        for seed in range(20):
+            rng = random.Random(seed)
+            n_inst = 7
+            rows = [[_Segment(rng.randint(1, 300),
+                              [(rng.randrange(n_inst), rng.random() < 0.4)
+                               for _ in range(rng.randint(1, 4))])]
+                    for _ in range(12)]
+            timeline = self._timeline(rows)
+            extras = [rng.choice([256, 1024, 2048, 4096]) for _ in range(n_inst)]
+            headroom = rng.choice([2048, 4096, 8192])
+            period = rng.choice([140.0, 160.0, 180.0])
+            result = _result(timeline, extras, headroom, period)
+            mode_map = {i: False for i in range(n_inst)}
+            greedy = [i for i, _ in _greedy_overrun_fix(
+                timeline, result.analyses, mode_map, headroom, 8, False, period)]
+            chosen, left, lower, optimal = _exact_overrun_fix(
+                timeline, result.analyses, mode_map, headroom, greedy,
+                8, False, period, 5.0)
+            self.assertTrue(optimal)
+            self.assertLessEqual(lower, left)
+            self.assertLessEqual(sum(extras[i] for i in chosen), headroom)
+            self.assertEqual(_count_overrun_irqs(
+                timeline, {i: True for i in chosen}, 8, False, period), left)
+            self.assertLessEqual(left, _count_overrun_irqs(
+                timeline, {i: True for i in greedy}, 8, False, period))
+
+            best = min(
+                (_count_overrun_irqs(timeline, {i: True for i in subset}, 8, False, period),
+                 sum(extras[i] for i in subset))
+                for r in range(n_inst + 1)
+                for subset in itertools.combinations(range(n_inst), r)
+                if sum(extras[i] for i in subset) <= headroom)
+            self.assertEqual((left, sum(extras[i] for i in chosen)), best)
+
+
+class TestCycleModel(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.asm = os.path.join(self.tmp, 'asm')
+        shutil.copytree(os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), 'asm'), self.asm)
+        self.cache_path = os.path.join(self.tmp, 'cycle_model.json')
+        patcher = mock.patch.object(optimize, '_calibration', optimize._Calibration())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _refresh(self, asm_dir=None):
+        return optimize.refresh_cycle_models(asm_dir or self.asm, self.cache_path)
+
+    def test_costs_from_handler_source(self):
+        self._refresh()
+        model = optimize._cycle_model(8, False)
+        self.assertNotEqual(model, optimize._constant_model(8, False))
+        self.assertEqual((model.overhead, model.inactive), (28 + 15, 8))
+        # Pitch and volume scaling cost cycles, RAW is cheaper than VQ
+        self.assertLess(model.channel[(False, False)], model.channel[(False, True)])
+        self.assertLess(model.channel[(True, True)], model.channel[(False, True)])
+        self.assertLess(model.channel[(False, False)],
+                        optimize._cycle_model(8, True).channel[(False, False)])
+        self.assertEqual(_irq_cost([(0, True), (1, False)], {1: True}, 8, False),
+                         model.overhead + 2 * model.inactive
+                         + model.channel[(False, True)] + model.channel[(True, False)])
+
+    def test_calibration_cached_by_source_hash(self):
+        self.assertTrue(self._refresh())
+        self.assertTrue(os.path.exists(self.cache_path))
+        models = dict(optimize._calibration.models)
+        self.assertEqual(len(models), 8)
+        self.assertFalse(self._refresh())
+
+        # A new session reads the saved models instead of calibrating
+        with mock.patch.object(optimize, '_calibration', optimize._Calibration()), \
+                mock.patch.object(optimize, 'calibrate_cycle_models',
+                                  side_effect=AssertionError):
+            self.assertTrue(self._refresh())
+            self.assertEqual(optimize._calibration.models, models)
+
+        # Editing the handler recalibrates
+        path = os.path.join(self.asm, 'tracker', 'tracker_irq_speed.asm')
+        with open(path) as f:
+            source = f.read()
+        with open(path, 'w') as f:
+            f.write(source.replace('Tracker_IRQ:\n', 'Tracker_IRQ:\n    nop\n'))
+        self.assertTrue(self._refresh())
+        self.assertEqual(optimize._cycle_model(8, True).overhead,
+                         models[(8, True)].overhead + 2)
+
+    def test_constants_without_player_source(self):
+        self._refresh(os.path.join(self.tmp, 'missing'))
+        self.assertEqual(optimize._cycle_model(4, True),
+                         optimize._constant_model(4, True))
+        self.assertFalse(os.path.exists(self.cache_path))
+
+
+def _song(seed=0, n_songlines=40, n_patterns=12, n_inst=5):
+    from data_model import Song, Songline, Pattern, Instrument
+    rng = random.Random(seed)
+    song = Song()
+    song.patterns = []
+    for _ in range(n_patterns):
+        pat = Pattern(length=32)
+        for row in pat.rows:
+            if rng.random() < 0.3:
+                row.note = rng.randint(1, 36)
+                row.instrument = rng.randrange(n_inst)
+        song.patterns.append(pat)
+    song.songlines = [Songline(patterns=[rng.randrange(n_patterns) for _ in range(4)])
+                      for _ in range(n_songlines)]
+    song.instruments = [
+        Instrument(name=f"i{i}", sample_rate=22050,
+                   sample_data=np.zeros(rng.randint(2000, 30000), dtype=np.float32))
+        for i in range(n_inst)]
+    return song
+
+
+class TestAnalysisCache(unittest.TestCase):
+
+    def _sizes(self, song):
+        return {i: optimize.compute_raw_size(inst.sample_data, 22050, 15834)
+                for i, inst in enumerate(song.instruments)}
+
+    def _assert_same(self, a, b):
+        self.assertEqual(list(a.irqs), list(b.irqs))
+        self.assertTrue((a.counts == b.counts).all())
+
+    def test_edits_resimulate_affected_songlines(self):
+        song = _song()
+        cache = AnalysisCache()
+        sim = lambda c: _simulate_song(song, self._sizes(song), 15834, 50,
+                                       instruments=song.instruments, cache=c)
+        self._assert_same(sim(cache), sim(None))
+        self.assertEqual(cache.misses, 40)
+
+        cache.hits = cache.misses = 0
+        self._assert_same(sim(cache), sim(None))
+        self.assertEqual((cache.hits, cache.misses), (40, 0))
+
+        # Edit one pattern: its songlines (and any whose entry state changed)
+        used = sum(1 for sl in song.songlines if 3 in sl.patterns)
+        row = song.patterns[3].rows[5]
+        row.note, row.instrument = 13, 2
+        cache.hits = cache.misses = 0
+        self._assert_same(sim(cache), sim(None))
+        self.assertGreaterEqual(cache.misses, used)
+        self.assertLess(cache.misses, 40)
+
+        # Instrument size and base note edits invalidate their songlines
+        song.instruments[1].sample_data = np.zeros(50000, dtype=np.float32)
+        song.instruments[4].base_note = 13
+        self._assert_same(sim(cache), sim(None))
+        self.assertEqual(len(cache.songlines), 40)
+
+    def test_sizes_follow_audio_array(self):
+        song = _song()
+        cache = AnalysisCache()
+        first = analyze_instruments(song.instruments, 15834, 8, 1 << 20,
+                                    song=song, cache=cache)
+        self.assertEqual(len(cache.sizes), 5)
+        song.instruments[0].sample_data = np.zeros(1000, dtype=np.float32)
+        second = analyze_instruments(song.instruments, 15834, 8, 1 << 20,
+                                     song=song, cache=cache)
+        fresh = analyze_instruments(song.instruments, 15834, 8, 1 << 20,
+                                    song=song, cache=AnalysisCache())
+        self.assertNotEqual(first.analyses[0].raw_size, second.analyses[0].raw_size)
+        self.assertEqual([(a.raw_size, a.vq_size, a.duration_ms) for a in second.analyses],
+                         [(a.raw_size, a.vq_size, a.duration_ms) for a in fresh.analyses])
+        self.assertEqual(second.summary, fresh.summary)
+
+    def test_prediction_follows_modes(self):
+        song = _song()
+        cache = AnalysisCache()
+        vq = predict_overruns(song, 15834, 2, cache=cache)
+        for inst in song.instruments:
+            inst.use_vq = False
+        raw = predict_overruns(song, 15834, 2, cache=cache)
+        self.assertLess(raw.peak_pct, vq.peak_pct)
+        self.assertLessEqual(raw.overrun_irqs, vq.overrun_irqs)
+        self.assertGreater(vq.overrun_irqs, 0)
+        self.assertTrue(vq.vq_in_overruns)
+        self.assertFalse(raw.vq_in_overruns)
+        song.songlines = []
+        self.assertIsNone(predict_overruns(song, 15834, 2, cache=cache))
+
+class TestOverrunPrediction(unittest.TestCase):
+
+    def _reference(self, song, vector_size):
+        """Per-row worst IRQ cost, songline by songline."""
+        sizes = {i: optimize.compute_raw_size(inst.sample_data, 22050, 15834)
+                 for i, inst in enumerate(song.instruments)}
+        mode_map = {i: not inst.use_vq for i, inst in enumerate(song.instruments)}
+        channels = ((None, 0, False),) * 4
+        per_songline = []
+        for sl in song.songlines:
+            patterns = [song.get_pattern(p) for p in sl.patterns]
+            _, channels, rows = _simulate_songline(
+                patterns, channels, int(sl.speed * 15834 / 50), sizes, song.instruments)
+            per_songline.append([max(_irq_cost(list(sig), mode_map, vector_size,
+                                               song.volume_control) for sig in row)
+                                 for row in rows])
+        return per_songline
+
+    def test_rows_match_songline_walk(self):
+        song = _song(seed=4)
+        for inst in song.instruments[::2]:
+            inst.use_vq = False
+        cache = AnalysisCache()
+        for _ in range(2):      # cold, then from the cache
+            prediction = predict_overruns(song, 15834, 4, cache=cache)
+            reference = self._reference(song, 4)
+            self.assertEqual([list(c) for c in prediction.row_cycles], reference)
+            self.assertEqual(
+                [list(prediction.overrun_rows(k)) for k in range(len(reference))],
+                [[r for r, c in enumerate(rows) if c > prediction.budget]
+                 for rows in reference])
+        k, row, cycles = prediction.first_overrun()
+        self.assertEqual(cycles, reference[k][row])
+        self.assertTrue(all(c <= prediction.budget for rows in reference[:k] for c in rows))
+        self.assertEqual(len(prediction.overrun_rows(len(reference))), 0)
+
+    def test_budget_follows_display_dma(self):
+        song = _song()
+        period = optimize.CPU_CLOCK_PAL / 15834
+        screen = predict_overruns(song, 15834, 2, cache=AnalysisCache())
+        # Worst scanline: refresh, DL fetch, char names and font of mode 2
+        self.assertEqual(screen.dma_cycles, 9 + 1 + 40 + 40)
+        self.assertAlmostEqual(screen.budget, period - 90)
+        song.screen_control = False
+        blank = predict_overruns(song, 15834, 2, use_banking=True,
+                                 cache=AnalysisCache())
+        self.assertEqual(blank.dma_cycles, 9)
+        self.assertAlmostEqual(blank.budget,
+                               period - 9 - optimize.BANKING_OVERHEAD_CYCLES)
+        self.assertLessEqual(blank.overrun_irqs, screen.overrun_irqs)
+        self.assertEqual(optimize._dma_cycles(True, False, 448), 4 * 9)
+
+    def test_optimizer_uses_same_budget(self):
+        song = _song(seed=2)
+        for rate, screen in ((3958, True), (7917, True), (7917, False)):
+            song.screen_control = screen
+            result = analyze_instruments(song.instruments, rate, 8, 1 << 20,
+                                         song=song, screen_control=screen,
+                                         cache=AnalysisCache())
+            for a in result.analyses:
+                song.instruments[a.index].use_vq = not a.suggest_raw
+            prediction = predict_overruns(song, rate, 8, cache=AnalysisCache())
+            self.assertAlmostEqual(result.cpu.irq_period, prediction.budget)
+            self.assertIn(f"CPU peak: {prediction.peak_pct:.0f}%", result.summary)
+            if prediction.overrun_irqs:
+                self.assertIn(f"{prediction.overrun_irqs} overrun IRQs remain",
+                              result.summary)
+
+    def test_advice_when_raw_cannot_help(self):
+        self.assertIn("RAW", optimize.overrun_advice(True, True))
+        self.assertIn("screen off", optimize.overrun_advice(False, True))
+        self.assertNotIn("screen", optimize.overrun_advice(False, False))
+        song = _song()
+        for inst in song.instruments:
+            inst.use_vq = False
+        result = analyze_instruments(song.instruments, 15834, 2, 1 << 20,
+                                     song=song, cache=AnalysisCache())
+        self.assertIn("remain", result.summary)
+        self.assertIn(optimize.overrun_advice(False, True), result.summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
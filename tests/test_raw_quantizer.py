@@ -0,0 +1,100 @@
+"""Tests for the noise-shaped RAW quantizer (RawEncoder.quantize)."""
+import unittest
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "vq_converter"))
+
+import numpy as np
+
+from pokey_vq.encoders.raw import RawEncoder, weighted_noise_filter
+from pokey_vq.core.pokey_table import POKEY_VOLTAGE_TABLE, POKEY_VOLTAGE_TABLE_FULL
+
+
+def _reference_first_order(audio, table):
+    """Straightforward per-sample error feedback (searchsorted per sample)."""
+    table = np.asarray(table, dtype=np.float64)
+    table_max = table[-1]
+    scaled = ((np.asarray(audio, dtype=np.float64) + 1.0) / 2.0) * table_max
+    out = np.zeros(len(scaled), dtype=np.uint8)
+    error = 0.0
+    for i, x in enumerate(scaled):
+        target = x + error
+        val = min(max(target, 0.0), table_max)
+        idx = int(np.searchsorted(table, val))
+        if idx > len(table) - 1:
+            idx = len(table) - 1
+        elif idx > 0 and abs(val - table[idx - 1]) < abs(val - table[idx]):
+            idx -= 1
+        out[i] = idx
+        error = target - table[idx]
+    return out
+
+
+def _signal(n=4000, rate=15000):
+    t = np.arange(n) / rate
+    noise = np.random.default_rng(3).normal(0, 0.05, n)
+    return np.clip(0.8 * np.sin(2 * np.pi * 300 * t) + noise, -1, 1).astype(np.float32)
+
+
+def _lf_noise(audio, idx, table, rate, cutoff=2000):
+    """Quantization noise power below cutoff Hz."""
+    table_max = table.max()
+    recon = table[idx] / table_max * 2.0 - 1.0
+    spec = np.abs(np.fft.rfft(recon - audio)) ** 2
+    freqs = np.fft.rfftfreq(len(audio), 1.0 / rate)
+    return spec[freqs < cutoff].sum()
+
+
+class TestRawQuantize(unittest.TestCase):
+
+    def test_plain_nearest_level(self):
+        audio = _signal()
+        idx = RawEncoder.quantize(audio, POKEY_VOLTAGE_TABLE)
+        scaled = (audio + 1.0) / 2.0 * POKEY_VOLTAGE_TABLE.max()
+        nearest = np.argmin(np.abs(scaled[:, None] - POKEY_VOLTAGE_TABLE[None, :]), axis=1)
+        np.testing.assert_array_equal(idx, nearest)
+
+    def test_first_order_matches_reference(self):
+        audio = _signal()
+        for table in (POKEY_VOLTAGE_TABLE, POKEY_VOLTAGE_TABLE_FULL):
+            np.testing.assert_array_equal(
+                RawEncoder.quantize(audio, table, noise_shaping=True),
+                _reference_first_order(audio, table))
+        np.testing.assert_array_equal(
+            RawEncoder.quantize(audio, POKEY_VOLTAGE_TABLE, noise_shaping='first'),
+            RawEncoder.quantize(audio, POKEY_VOLTAGE_TABLE, noise_shaping=True))
+
+    def test_higher_order_filters_shape_noise(self):
+        audio = _signal()
+        plain = RawEncoder.quantize(audio, POKEY_VOLTAGE_TABLE)
+        base = _lf_noise(audio, plain, POKEY_VOLTAGE_TABLE, 15000)
+        for mode in ('first', 'second', 'weighted'):
+            idx = RawEncoder.quantize(audio, POKEY_VOLTAGE_TABLE,
+                                      noise_shaping=mode, rate=15000)
+            self.assertLessEqual(idx.max(), 15)
+            self.assertLess(_lf_noise(audio, idx, POKEY_VOLTAGE_TABLE, 15000), base, mode)
+
+    def test_custom_coefficients(self):
+        audio = _signal(500)
+        np.testing.assert_array_equal(
+            RawEncoder.quantize(audio, POKEY_VOLTAGE_TABLE, noise_shaping=(2.0, -1.0)),
+            RawEncoder.quantize(audio, POKEY_VOLTAGE_TABLE, noise_shaping='second'))
+
+    def test_weighted_filter_notch(self):
+        c = weighted_noise_filter(15000)
+        w0 = 2 * np.pi * 3000 / 15000
+        z = np.exp(1j * w0)
+        ntf = 1 - sum(ck * z ** -(k + 1) for k, ck in enumerate(c))
+        self.assertAlmostEqual(abs(ntf), 0.0, places=9)
+
+    def test_invalid_filter(self):
+        with self.assertRaises(ValueError):
+            RawEncoder.quantize(_signal(10), POKEY_VOLTAGE_TABLE, noise_shaping='bogus')
+        with self.assertRaises(ValueError):
+            RawEncoder.quantize(_signal(10), POKEY_VOLTAGE_TABLE, noise_shaping='weighted')
+
+
+if __name__ == '__main__':
+    unittest.main()
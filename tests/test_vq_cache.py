@@ -0,0 +1,148 @@
+"""Tests for the content-addressed VQ conversion cache."""
+import unittest
+import sys
+import os
+import time
+import tempfile
+import shutil
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vq_cache import (VQCache, compute_key, file_digests, META_FILE,
+                      write_output_meta, read_output_meta)
+
+
+PARAMS = {'rate': 3958, 'vector_size': 8, 'smoothness': 0.0,
+          'enhance': "on", 'seed': 0}
+
+
+class _TmpDirTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _file(self, name, data: bytes):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _output_dir(self, name="out", payload=b"x" * 100):
+        d = os.path.join(self.tmp, name)
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, "VQ_BLOB.asm"), 'wb') as f:
+            f.write(payload)
+        with open(os.path.join(d, "SAMPLE_DIR.asm"), 'w') as f:
+            f.write("SAMPLE_COUNT = 1\n")
+        return d
+
+
+class TestComputeKey(_TmpDirTest):
+
+    def test_stable(self):
+        a = self._file("000.wav", b"abc")
+        self.assertEqual(compute_key([a], [0], PARAMS), compute_key([a], [0], PARAMS))
+
+    def test_content_changes_key(self):
+        a = self._file("000.wav", b"abc")
+        k1 = compute_key([a], [0], PARAMS)
+        self._file("000.wav", b"abd")
+        self.assertNotEqual(k1, compute_key([a], [0], PARAMS))
+
+    def test_modes_change_key(self):
+        a = self._file("000.wav", b"abc")
+        self.assertNotEqual(compute_key([a], [0], PARAMS), compute_key([a], [1], PARAMS))
+
+    def test_each_param_changes_key(self):
+        a = self._file("000.wav", b"abc")
+        base = compute_key([a], [0], PARAMS)
+        for name, value in (('rate', 7917), ('vector_size', 4), ('smoothness', 10.0),
+                            ('enhance', "off"), ('seed', 1)):
+            p = dict(PARAMS, **{name: value})
+            self.assertNotEqual(base, compute_key([a], [0], p), name)
+
+    def test_file_names_do_not_change_key(self):
+        # save_project renames samples to their slot number (007.wav -> 002.wav)
+        a, b = self._file("007.wav", b"abc"), self._file("002.wav", b"abc")
+        c = self._file("000.wav", b"xyz")
+        self.assertEqual(compute_key([c, a], [0, 0], PARAMS),
+                         compute_key([c, b], [0, 0], PARAMS))
+        self.assertEqual(file_digests([c, a]), file_digests([c, b]))
+        self.assertNotEqual(compute_key([c, a], [0, 0], PARAMS),
+                            compute_key([a, c], [0, 0], PARAMS))
+
+    def test_no_seed_not_cacheable(self):
+        a = self._file("000.wav", b"abc")
+        self.assertIsNone(compute_key([a], [0], dict(PARAMS, seed=None)))
+
+    def test_missing_file_not_cacheable(self):
+        self.assertIsNone(compute_key([os.path.join(self.tmp, "nope.wav")], [0], PARAMS))
+
+
+class TestVQCache(_TmpDirTest):
+
+    def test_miss(self):
+        cache = VQCache(os.path.join(self.tmp, "cache"))
+        self.assertIsNone(cache.get("deadbeef", os.path.join(self.tmp, "dest")))
+        self.assertIsNone(cache.get("", os.path.join(self.tmp, "dest")))
+
+    def test_put_get_roundtrip(self):
+        cache = VQCache(os.path.join(self.tmp, "cache"))
+        src = self._output_dir()
+        cache.put("k1", src, stats={'size_bytes': 1234}, params=PARAMS)
+        dest = os.path.join(self.tmp, "dest")
+        os.makedirs(dest)
+        with open(os.path.join(dest, "stale.asm"), 'w') as f:
+            f.write("old")
+        entry = cache.get("k1", dest)
+        self.assertIsNotNone(entry)
+        self.assertEqual(entry.stats['size_bytes'], 1234)
+        self.assertEqual(sorted(os.listdir(dest)), ["SAMPLE_DIR.asm", "VQ_BLOB.asm"])
+        self.assertNotIn(META_FILE, os.listdir(dest))
+
+    def test_lru_eviction(self):
+        cache = VQCache(os.path.join(self.tmp, "cache"), max_bytes=10 ** 9)
+        for i in range(3):
+            cache.put(f"k{i}", self._output_dir(f"o{i}", b"y" * 1000))
+            time.sleep(0.01)
+        # Touch k0 so k1 becomes least recently used
+        cache.get("k0", os.path.join(self.tmp, "dest"))
+        one = cache.entries()[0].size_bytes
+        evicted = cache.evict(max_bytes=2 * one)
+        self.assertEqual(evicted, ["k1"])
+        self.assertEqual({e.key for e in cache.entries()}, {"k0", "k2"})
+
+    def test_put_enforces_limit(self):
+        cache = VQCache(os.path.join(self.tmp, "cache"), max_bytes=1)
+        cache.put("k0", self._output_dir())
+        self.assertEqual(cache.entries(), [])
+
+    def test_purge(self):
+        cache = VQCache(os.path.join(self.tmp, "cache"))
+        cache.put("aaaa", self._output_dir("o1"))
+        cache.put("bbbb", self._output_dir("o2"))
+        self.assertEqual(cache.purge(["aa"]), 1)
+        self.assertEqual([e.key for e in cache.entries()], ["bbbb"])
+        self.assertEqual(cache.purge(), 1)
+        self.assertEqual(cache.entries(), [])
+
+
+class TestOutputMeta(_TmpDirTest):
+    def test_roundtrip(self):
+        d = self._output_dir()
+        write_output_meta(d, "k1", {"size_bytes": 5}, PARAMS)
+        meta = read_output_meta(d)
+        self.assertEqual(meta["key"], "k1")
+        self.assertEqual(meta["stats"]["size_bytes"], 5)
+
+    def test_missing_or_corrupt(self):
+        d = self._output_dir()
+        self.assertIsNone(read_output_meta(d))
+        with open(os.path.join(d, "vq_meta.json"), 'w') as f:
+            f.write("{not json")
+        self.assertIsNone(read_output_meta(d))
+
+
+if __name__ == '__main__':
+    unittest.main()
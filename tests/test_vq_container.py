@@ -0,0 +1,294 @@
+"""Tests for the VQ_DATA.bin binary container."""
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "vq_converter"))
+
+import numpy as np
+
+from pokey_vq.utils.vq_container import (
+    write_container, open_container, VQContainer, CONTAINER_FILE, SECTION_ALIGN)
+from pokey_vq.utils.mads_exporter import MADSExporter
+from pokey_vq.core.pokey_table import POKEY_VOLTAGE_TABLE
+
+
+class TestContainerFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, CONTAINER_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_roundtrip(self):
+        samples = [{"mode": "VQ", "index_start": 0, "index_end": 3},
+                   {"mode": "RAW"},
+                   {"mode": "VQ", "index_start": 3, "index_end": 5},
+                   {"mode": "RAW"}]
+        raw = {1: bytes(range(256)) * 2, 3: b"\x11" * 256}
+        write_container(self.path, b"\x10\x11\x12", bytes([0, 1, 2, 1, 0]),
+                        raw_blocks=raw, samples=samples,
+                        vq_lens=bytes(256), meta={"rate": 7917.0})
+        with VQContainer(self.path) as c:
+            self.assertEqual(bytes(c.codebook), b"\x10\x11\x12")
+            self.assertEqual(bytes(c.vq_stream(0)), bytes([0, 1, 2]))
+            self.assertEqual(bytes(c.vq_stream(2)), bytes([1, 0]))
+            self.assertEqual({i: bytes(b) for i, b in c.raw_blocks().items()}, raw)
+            self.assertEqual(sorted(c.vq_streams()), [0, 2])
+            self.assertEqual(c.header["rate"], 7917.0)
+            self.assertIsInstance(c.indices, memoryview)
+            for name, (offset, _length) in c.header["sections"].items():
+                self.assertEqual(offset % SECTION_ALIGN, 0, name)
+
+    def test_mmap(self):
+        write_container(self.path, b"\x10" * 8, b"\x00\x00",
+                        samples=[{"mode": "VQ", "index_start": 0, "index_end": 2}])
+        c = VQContainer(self.path, use_mmap=True)
+        self.assertEqual(bytes(c.vq_stream(0)), b"\x00\x00")
+        c.close()
+
+    def test_invalid(self):
+        self.assertIsNone(open_container(self.tmp))
+        with open(self.path, "wb") as f:
+            f.write(b"not a container")
+        self.assertIsNone(open_container(self.tmp))
+
+
+class _ConverterOutput(unittest.TestCase):
+    """Exporter output (.asm files + container) for a VQ and a RAW instrument."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        rng = np.random.default_rng(1)
+        codebook = [rng.uniform(0, 1, 8) for _ in range(16)]
+        indices = rng.integers(0, 16, 100)
+        audio = rng.uniform(-0.5, 0.5, 1500).astype(np.float32)
+        bounds = [(0, 800), (800, 1500)]
+        asm = os.path.join(cls.tmp, "VQ.asm")
+
+        exporter = MADSExporter()
+        exporter.export(asm, codebook, indices, POKEY_VOLTAGE_TABLE,
+                        fast=True, channels=1)
+        raw_labels = exporter.export_raw_samples(asm, bounds, audio, [0, 1])
+        vq_map = {0: (0, 100)}
+        exporter.export_sample_directory_mixed(
+            asm, 2, vq_stream_map=vq_map, raw_labels=raw_labels,
+            sample_modes=[0, 1], sample_names=["a", "b"])
+        data = exporter.last_export
+        write_container(os.path.join(cls.tmp, CONTAINER_FILE),
+                        data["codebook"], data["indices"],
+                        raw_blocks=exporter.last_raw_blocks,
+                        samples=[{"mode": "VQ", "index_start": 0, "index_end": 100},
+                                 {"mode": "RAW"}],
+                        vq_lens=data["vq_lens"], vq_offsets=data["vq_offsets"])
+        with open(os.path.join(cls.tmp, "conversion_info.json"), "w") as f:
+            json.dump({"samples": [{"mode": "VQ", "index_start": 0, "index_end": 100},
+                                   {"mode": "RAW"}]}, f)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+
+class TestConsumers(_ConverterOutput):
+    """Container contents match what the ASM parsers recover."""
+
+    def test_build_reader_matches_asm(self):
+        import build
+        codebook, streams, raw = build._read_vq_container(self.tmp)
+        self.assertEqual(bytes(codebook),
+                         bytes(build._parse_vq_blob(os.path.join(self.tmp, "VQ_BLOB.asm"))))
+        asm_streams = build._extract_vq_streams(
+            os.path.join(self.tmp, "VQ_INDICES.asm"),
+            os.path.join(self.tmp, "SAMPLE_DIR.asm"), 2)
+        self.assertEqual({i: bytes(v) for i, v in streams.items()}, asm_streams)
+        self.assertEqual({i: bytes(v) for i, v in raw.items()},
+                         build._extract_raw_blocks(os.path.join(self.tmp, "RAW_SAMPLES.asm")))
+
+    def test_player_reader_matches_asm(self):
+        from pokey_emulator.vq_player import VQPlayer, SongData
+        player = VQPlayer()
+        fast = SongData()
+        player._load_vq_files(fast, self.tmp, None)
+        os.rename(os.path.join(self.tmp, CONTAINER_FILE),
+                  os.path.join(self.tmp, "moved.bin"))
+        try:
+            slow = SongData()
+            player._load_vq_files(slow, self.tmp, None)
+        finally:
+            os.rename(os.path.join(self.tmp, "moved.bin"),
+                      os.path.join(self.tmp, CONTAINER_FILE))
+        self.assertEqual(bytes(fast.codebook), bytes(slow.codebook))
+        self.assertEqual(len(fast.instruments), len(slow.instruments))
+        for a, b in zip(fast.instruments, slow.instruments):
+            self.assertEqual(a.is_vq, b.is_vq)
+            self.assertEqual(bytes(a.stream_data[a.start_offset:a.end_offset]),
+                             bytes(b.stream_data[b.start_offset:b.end_offset]))
+
+    def test_player_zero_copy_slices(self):
+        from pokey_emulator.vq_player import VQPlayer, SongData
+        song = SongData()
+        VQPlayer()._load_vq_files(song, self.tmp, None)
+        self.assertIsNotNone(song.backing)
+        vq, raw = song.instruments
+        for inst in (vq, raw):
+            self.assertIsInstance(inst.stream_data, memoryview)
+            self.assertEqual(inst.start_offset, 0)
+            self.assertEqual(inst.end_offset, len(inst.stream_data))
+        self.assertEqual(len(vq.stream_data), 100)
+        self.assertEqual(len(raw.stream_data) % 256, 0)
+        self.assertIs(vq.stream_data.obj, raw.stream_data.obj)
+        del vq, raw
+        song.close()
+        self.assertIsNone(song.backing)
+        self.assertEqual(song.instruments, [])
+
+    def test_rewrite_while_loaded(self):
+        from pokey_emulator.vq_player import VQPlayer, SongData
+        song = SongData()
+        VQPlayer()._load_vq_files(song, self.tmp, None)
+        before = bytes(song.instruments[0].stream_data)
+        path = os.path.join(self.tmp, CONTAINER_FILE)
+        with VQContainer(path) as c:
+            blob = bytes(c.buffer)
+        shutil.copy(path, path + ".bak")
+        try:
+            write_container(path, b"", b"")
+            # The loaded song still sees the old data
+            self.assertEqual(bytes(song.instruments[0].stream_data), before)
+        finally:
+            song.close()
+            os.replace(path + ".bak", path)
+        with VQContainer(path) as c:
+            self.assertEqual(bytes(c.buffer), blob)
+
+
+class TestBinaryIncludes(_ConverterOutput):
+    """Build-side .bin + `ins` emission."""
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir, ignore_errors=True)
+
+    def _read(self, name, mode="r"):
+        with open(os.path.join(self.build_dir, name), mode) as f:
+            return f.read()
+
+    def test_vq_data_wrappers(self):
+        import build
+        written = build._emit_binary_vq_data(self.build_dir, self.tmp)
+        self.assertEqual(sorted(written),
+                         ["RAW_SAMPLES.asm", "VQ_BLOB.asm", "VQ_INDICES.asm"])
+        blob = build._parse_vq_blob(os.path.join(self.tmp, "VQ_BLOB.asm"))
+        self.assertEqual(self._read("VQ_BLOB.bin", "rb"), bytes(blob))
+        self.assertIn(f"VQ_BLOB_LEN = {len(blob)}\nVQ_BLOB\n    ins 'VQ_BLOB.bin'",
+                      self._read("VQ_BLOB.asm"))
+        raw = build._extract_raw_blocks(os.path.join(self.tmp, "RAW_SAMPLES.asm"))[1]
+        raw_asm = self._read("RAW_SAMPLES.asm")
+        self.assertIn(f"RAW_INST_01\n    ins 'RAW_SAMPLES.bin',$0000,${len(raw):04X}\n"
+                      "RAW_INST_01_END", raw_asm)
+        self.assertEqual(self._read("RAW_SAMPLES.bin", "rb"), raw)
+        # Size estimate follows the included files
+        self.assertEqual(build._count_asm_bytes(
+            os.path.join(self.build_dir, "VQ_INDICES.asm")), 100)
+        self.assertEqual(build._count_asm_bytes(
+            os.path.join(self.build_dir, "RAW_SAMPLES.asm")), len(raw) + 128)
+
+    def test_no_container(self):
+        import build
+        self.assertEqual(build._emit_binary_vq_data(self.build_dir, self.build_dir), [])
+
+    def test_bank_data_files(self):
+        import build
+        from bank_packer import pack_into_banks
+        streams = {0: bytes(range(200)) * 10}
+        raw = {1: b"\x11" * 512}
+        pack = pack_into_banks([(0, 2000), (1, 512)], max_banks=4,
+                               codebook_size=256, vq_instruments={0})
+        cbs = {b: b"\x10" * 256 for b in range(pack.n_banks_used)}
+        for binary in (False, True):
+            d = os.path.join(self.build_dir, str(binary))
+            os.makedirs(d)
+            build._generate_bank_data_files(d, pack, streams, raw, cbs, {}, 256,
+                                            binary=binary)
+        for b in range(pack.n_banks_used):
+            name = f"BANK_DATA_{b}"
+            text = build._parse_asm_bytes(os.path.join(self.build_dir, "False", name + ".asm"))
+            self.assertEqual(self._read(os.path.join("True", name + ".bin"), "rb"), text)
+            self.assertIn(f"ins '{name}.bin'", self._read(os.path.join("True", name + ".asm")))
+
+
+def _find_mads():
+    try:
+        import build
+        return build.find_mads()
+    except Exception:
+        return None
+
+
+@unittest.skipUnless(_find_mads(), "MADS not available")
+class TestAssembledXex(_ConverterOutput):
+    """The assembled XEX is the same with `ins` and .byte text data."""
+
+    def setUp(self):
+        import build
+        import runtime
+        from state import state
+        from vq_convert import VQResult
+        with open(os.path.join(self.tmp, "VQ_CFG.asm"), "w") as f:
+            f.write("PLAY_RATE = $04\nCHANNELS = 4\nAUDCTL_VAL = $00\n"
+                    "AUDF1_VAL = PLAY_RATE\nAUDC1_MASK = $10\nAUDC2_MASK = $10\n"
+                    "IRQ_MASK = 1\nALGO_FIXED = 1\nMIN_VECTOR = 8\nMAX_VECTOR = 8\n"
+                    "CODEBOOK_SIZE = 256\nMULTI_SAMPLE = 1\nPITCH_CONTROL = 1\n")
+        self.build = build
+        self.state = state
+        self.app_dir = tempfile.mkdtemp()
+        mads, asm_dir = build.find_mads(), runtime.get_asm_dir()
+        self._saved = (state.vq.converted, state.vq.result, build.BINARY_DATA_INCLUDES,
+                       build.find_mads, runtime.get_app_dir, runtime.get_asm_dir)
+        state.vq.converted = True
+        state.vq.result = VQResult(success=True, output_dir=self.tmp)
+        build.find_mads = lambda: mads
+        runtime.get_app_dir = lambda: self.app_dir
+        runtime.get_asm_dir = lambda: asm_dir
+
+    def tearDown(self):
+        import runtime
+        (self.state.vq.converted, self.state.vq.result,
+         self.build.BINARY_DATA_INCLUDES, self.build.find_mads,
+         runtime.get_app_dir, runtime.get_asm_dir) = self._saved
+        shutil.rmtree(self.app_dir, ignore_errors=True)
+
+    def _xex(self, memory_config, binary):
+        from data_model import Song, Instrument
+        self.build.BINARY_DATA_INCLUDES = binary
+        song = Song()
+        song.memory_config = memory_config
+        song.instruments = [
+            Instrument(name=name, sample_rate=22050,
+                       sample_data=np.zeros(n, dtype=np.float32))
+            for name, n in (("a", 800), ("b", 700))]
+        xex = os.path.join(self.app_dir, f"{binary}.xex")
+        result = self.build.build_xex_sync(song, xex)
+        self.assertTrue(result.success, result.error_message)
+        with open(xex, "rb") as f:
+            return f.read()
+
+    def test_same_xex(self):
+        for memory_config in ("64 KB", "128 KB"):
+            with self.subTest(memory_config=memory_config):
+                self.assertEqual(self._xex(memory_config, True),
+                                 self._xex(memory_config, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""Tests for incremental single-instrument VQ re-encoding."""
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "vq_converter"))
+
+import numpy as np
+import soundfile as sf
+
+from pokey_vq.encoders.vq import VQEncoder
+from pokey_vq.cli import incremental
+
+RATE = 4000
+VEC = 4
+
+
+def _tone(freq, n=2000, amp=0.5):
+    t = np.arange(n) / RATE
+    return (amp * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def _config():
+    return {"rate": float(RATE), "min_vector": VEC, "max_vector": VEC,
+            "lambda_val": 0.01, "alpha": 0.0, "constrained": False,
+            "channels": 1, "voltage": "off", "fast": True, "enhance": False,
+            "raw_size_bytes": 0}
+
+
+class _IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # Shared codebook trained on two tones
+        a, b = _tone(220), _tone(330)
+        enc = VQEncoder(rate=RATE, min_len=VEC, max_len=VEC, codebook_size=32,
+                        max_iterations=3, channels=1,
+                        sample_boundaries=[(0, len(a)), (len(a), len(a) + len(b))],
+                        seed=0)
+        _, decoded, _, codebook, indices = enc.run(np.concatenate([a, b]), RATE)
+        n_a = len(a) // VEC
+        self.codebook = codebook
+        incremental.save_state(
+            self.tmp, codebook, [indices[:n_a], indices[n_a:]], [0, 1],
+            [0, 0], ["a.wav", "b.wav"],
+            [incremental.instrument_snr(a, decoded[:len(a)]),
+             incremental.instrument_snr(b, decoded[len(a):])],
+            _config())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _wav(self, name, audio):
+        path = os.path.join(self.tmp, name)
+        sf.write(path, audio, RATE)
+        return path
+
+
+class TestState(_IncrementalTest):
+
+    def test_roundtrip(self):
+        state = incremental.load_state(self.tmp)
+        self.assertEqual(len(state["codebook"]), len(self.codebook))
+        for x, y in zip(state["codebook"], self.codebook):
+            np.testing.assert_allclose(x, y)
+        self.assertEqual(state["vq_orig_indices"], [0, 1])
+        self.assertEqual(state["sample_names"], ["a.wav", "b.wav"])
+        self.assertEqual(state["config"]["min_vector"], VEC)
+
+    def test_missing_state(self):
+        self.assertIsNone(incremental.load_state(os.path.join(self.tmp, "nope")))
+
+
+class TestReencode(_IncrementalTest):
+
+    def test_replace_instrument(self):
+        path = self._wav("b2.wav", _tone(330, n=1200))
+        stats = incremental.reencode_instrument(self.tmp, path, 1)
+        self.assertIsNotNone(stats)
+        state = incremental.load_state(self.tmp)
+        self.assertEqual(len(state["inst_indices"][1]), 1200 // VEC)
+        self.assertEqual(len(state["inst_indices"][0]), 2000 // VEC)
+        with open(os.path.join(self.tmp, "SAMPLE_DIR.asm")) as f:
+            sdir = f.read()
+        self.assertIn("VQ_INDICES+$01F4", sdir)   # instrument 1 starts at 500
+        self.assertIn("b2.wav", sdir)
+        self.assertEqual(stats["vq_size_bytes"],
+                         sum(len(v) for v in self.codebook) + 500 + 300)
+        from pokey_vq.utils.vq_container import open_container
+        with open_container(self.tmp) as c:
+            self.assertEqual(len(c.vq_stream(1)), 300)
+            self.assertEqual(c.samples[0]["index_end"], 500)
+
+    def test_append_instrument(self):
+        path = self._wav("c.wav", _tone(220, n=800))
+        self.assertIsNotNone(incremental.reencode_instrument(self.tmp, path, 2))
+        state = incremental.load_state(self.tmp)
+        self.assertEqual(state["vq_orig_indices"], [0, 1, 2])
+        self.assertEqual(state["sample_modes"], [0, 0, 0])
+
+    def test_quality_drop_needs_retrain(self):
+        noise = np.random.default_rng(0).uniform(-1, 1, 2000).astype(np.float32)
+        path = self._wav("noise.wav", noise)
+        before = incremental.load_state(self.tmp)["inst_indices"][1]
+        self.assertIsNone(incremental.reencode_instrument(self.tmp, path, 1))
+        # Nothing written on fallback
+        np.testing.assert_array_equal(
+            incremental.load_state(self.tmp)["inst_indices"][1], before)
+
+    def test_out_of_range_slot_rejected(self):
+        path = self._wav("x.wav", _tone(220))
+        self.assertIsNone(incremental.reencode_instrument(self.tmp, path, 5))
+
+
+class TestFindIncremental(unittest.TestCase):
+    """Tracker-side detection of a single changed instrument."""
+
+    def setUp(self):
+        import vq_convert, vq_cache
+        self.vq_cache = vq_cache
+        self.tmp = tempfile.mkdtemp()
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.tmp, f"{i}.wav")
+            sf.write(path, _tone(200 + 50 * i), RATE)
+            self.files.append(path)
+        self.params = {"rate": RATE, "seed": 0}
+        self.out = os.path.join(self.tmp, "out")
+        os.makedirs(self.out)
+        vq_cache.write_output_meta(self.out, "k", params=self.params,
+                                   inputs=vq_cache.file_digests(self.files),
+                                   modes=[0, 0, 1])
+        self.conv = vq_convert.VQConverter(vq_convert.VQState(),
+                                           cache=vq_cache.VQCache(os.path.join(self.tmp, "c")))
+        self.conv._sample_modes = [0, 0, 1]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_single_change_detected(self):
+        sf.write(self.files[1], _tone(440), RATE)
+        self.assertEqual(self.conv._find_incremental(self.files, self.out, self.params), 1)
+
+    def test_unchanged_or_settings_changed(self):
+        self.assertIsNone(self.conv._find_incremental(self.files, self.out, self.params))
+        sf.write(self.files[1], _tone(440), RATE)
+        self.assertIsNone(self.conv._find_incremental(
+            self.files, self.out, {"rate": RATE, "seed": 1}))
+
+    def test_raw_change_not_incremental(self):
+        sf.write(self.files[2], _tone(440), RATE)
+        self.assertIsNone(self.conv._find_incremental(self.files, self.out, self.params))
+
+
+if __name__ == '__main__':
+    unittest.main()
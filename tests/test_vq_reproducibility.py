@@ -0,0 +1,109 @@
+"""Tests for deterministic (seeded) VQ codebook training."""
+import unittest
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "vq_converter"))
+
+import numpy as np
+
+from pokey_vq.encoders.vq import VQEncoder, VariableCodebookGenerator
+
+
+def _test_audio(n=2000, seed=1):
+    """Deterministic test signal: two sines + a little noise."""
+    t = np.arange(n) / 4000.0
+    noise = np.random.default_rng(seed).normal(0, 0.05, n)
+    return (0.5 * np.sin(2 * np.pi * 220 * t)
+            + 0.3 * np.sin(2 * np.pi * 587 * t) + noise).astype(np.float32)
+
+
+def _run(seed, lbg=False, audio=None):
+    enc = VQEncoder(rate=4000, min_len=4, max_len=4, codebook_size=32,
+                    max_iterations=3, channels=1, lbg_init=lbg, seed=seed)
+    audio = _test_audio() if audio is None else audio
+    _, _, _, codebook, indices = enc.run(audio, 4000)
+    return codebook, indices
+
+
+class TestSeededTraining(unittest.TestCase):
+
+    def test_same_seed_identical_output(self):
+        cb1, idx1 = _run(seed=7)
+        cb2, idx2 = _run(seed=7)
+        np.testing.assert_array_equal(idx1, idx2)
+        self.assertEqual(len(cb1), len(cb2))
+        for a, b in zip(cb1, cb2):
+            np.testing.assert_array_equal(a, b)
+
+    def test_same_seed_identical_output_lbg(self):
+        cb1, idx1 = _run(seed=3, lbg=True)
+        cb2, idx2 = _run(seed=3, lbg=True)
+        np.testing.assert_array_equal(idx1, idx2)
+        for a, b in zip(cb1, cb2):
+            np.testing.assert_array_equal(a, b)
+
+    def test_different_seed_differs(self):
+        cb1, _ = _run(seed=1)
+        cb2, _ = _run(seed=2)
+        self.assertFalse(all(np.array_equal(a, b) for a, b in zip(cb1, cb2)))
+
+    def test_global_random_state_untouched(self):
+        np.random.seed(123)
+        expected = np.random.random()
+        np.random.seed(123)
+        _run(seed=5)
+        self.assertEqual(np.random.random(), expected)
+
+    def test_generator_rng_is_isolated(self):
+        g1 = VariableCodebookGenerator(16, 4, 4, 0.01, seed=9)
+        g2 = VariableCodebookGenerator(16, 4, 4, 0.01, seed=9)
+        self.assertEqual(g1.rng.integers(1 << 30), g2.rng.integers(1 << 30))
+
+    def test_asm_export_byte_identical(self):
+        from pokey_vq.utils.mads_exporter import MADSExporter
+        from pokey_vq.core.pokey_table import POKEY_VOLTAGE_TABLE
+        outputs = []
+        for _ in range(2):
+            cb, idx = _run(seed=11)
+            with tempfile.TemporaryDirectory() as d:
+                MADSExporter().export(os.path.join(d, "out.asm"), cb, idx,
+                                      POKEY_VOLTAGE_TABLE, fast=True, channels=1)
+                with open(os.path.join(d, "VQ_BLOB.asm")) as f:
+                    blob = f.read()
+                with open(os.path.join(d, "VQ_INDICES.asm")) as f:
+                    ind = f.read()
+                outputs.append((blob, ind))
+        self.assertEqual(outputs[0], outputs[1])
+
+
+class TestKMeansPPInit(unittest.TestCase):
+
+    def _init(self, min_len, max_len, seed=4):
+        g = VariableCodebookGenerator(32, min_len, max_len, 0.01, seed=seed)
+        audio = np.clip((_test_audio() + 1.0) / 2.0, 0.0, 1.0)
+        return g._initialize_kmeans_pp(audio)
+
+    def test_size_lengths_and_determinism(self):
+        entries = self._init(2, 8)
+        self.assertEqual(len(entries), 32)
+        self.assertTrue(all(2 <= len(e) <= 8 for e in entries))
+        for a, b in zip(entries, self._init(2, 8)):
+            np.testing.assert_array_equal(a, b)
+
+    def test_centroids_distinct(self):
+        # D^2 weighting never re-picks a vector that is already a centroid
+        entries = self._init(4, 4)
+        unique = {tuple(np.round(e, 12)) for e in entries}
+        self.assertEqual(len(unique), len(entries))
+
+    def test_short_audio(self):
+        g = VariableCodebookGenerator(8, 16, 16, 0.01, seed=0)
+        entries = g._initialize_kmeans_pp(np.full(10, 0.5))
+        self.assertEqual(len(entries), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,10 @@
 """6502 Cycle Analyzer for MADS-syntax assembly.
 
 Preprocesses MADS source (icl includes, .if/.ifdef/.elif/.else/.endif
-conditionals, symbol = value definitions, .macro/.endm), then counts
-exact cycle costs per instruction and reports per-path totals.
+conditionals, symbol = value definitions, .macro/.endm expansion), then
+counts exact cycle costs per instruction and reports the shortest and
+longest path between labels over the basic-block graph, including the
+per-channel, per-mode WCET table of the IRQ handler (handler_wcet).
 
 IMPORTANT: For accurate results, either:
   1. Process the top-level file (song_player.asm) which includes everything, or
@@ -32,13 +34,14 @@ Usage:
     # Detailed section analysis
     python tools/asm_cycles.py asm/song_player.asm \\
         <defines as above> -I asm \\
-        -s Tracker_IRQ @skip_ch0
+        -s ch0_raw_pitch ch0_skip
 
     # Annotated listing with per-instruction cycle counts
     python tools/asm_cycles.py asm/song_player.asm \\
         <defines as above> -I asm --annotate
 """
 
+import functools
 import re
 import os
 import sys
@@ -183,6 +186,7 @@ class DmaModel:
     # resolution, 1 cycle for double-line. We'll offer this as a flag.
 
     @classmethod
+    @functools.lru_cache(maxsize=None)
     def cycles_per_scanline(cls, mode='gr0', is_first_of_row=False,
                             is_display=True, pm_enabled=False):
         """Return CPU cycles available on one scanline."""
@@ -201,8 +205,10 @@ class DmaModel:
         return max(total, 0)
 
     @classmethod
+    @functools.lru_cache(maxsize=None)
     def effective_ratio(cls, mode='gr0', scenario='average'):
-        """Return fraction of machine cycles available to CPU.
+        """Return fraction of machine cycles available to CPU (cached per
+        mode and scenario).
 
         Scenarios:
           'average'  - weighted average across full frame
@@ -346,6 +352,21 @@ class MadsPreprocessor:
                 macro_body = []
                 continue
 
+            # Macro invocation: NAME arg1, arg2 — the call line stays in
+            # the output (it marks where the expansion starts), followed by
+            # the body with :1, :2, ... replaced by the arguments
+            parts = code.split(None, 1)
+            if parts and parts[0].upper() in self.macros:
+                args = re.split(r'\s*,\s*|\s+', parts[1].strip()) if len(parts) > 1 else []
+                body = [re.sub(r':(\d+)',
+                               lambda a: (args[int(a.group(1)) - 1]
+                                          if 0 < int(a.group(1)) <= len(args)
+                                          else a.group(0)), b)
+                        for b in self.macros[parts[0].upper()]]
+                output.append((line, source_file, line_num))
+                output.extend(self._process_lines(body, source_file, base_dir))
+                continue
+
             # Include: icl "path"
             m = re.match(r'icl\s+"([^"]+)"', code, re.I)
             if m:
@@ -502,8 +523,9 @@ class MadsPreprocessor:
 class InstructionParser:
     """Parse 6502 instructions, detect addressing modes via symbol resolution."""
 
-    def __init__(self, symbols):
+    def __init__(self, symbols, macros=()):
         self.symbols = symbols
+        self.macros = {m.upper() for m in macros}
         self.unresolved: Set[str] = set()  # track unknown symbols
 
     def parse_line(self, line):
@@ -515,14 +537,22 @@ class InstructionParser:
         label = None
         rest = stripped
 
-        # Symbol definition line: NAME = expr
-        if '=' in rest:
-            eq_pos = rest.index('=')
-            before = rest[:eq_pos].strip()
-            if re.match(r'^@?\w+$', before):
-                if not any(rest.upper().startswith(m + ' ') for m in ALL_MNEMONICS):
-                    return self._label_only(before, line,
-                                            is_smc=('= *' in rest))
+        # Symbol definition line: [.def] NAME = expr.  "NAME = *" labels the
+        # next instruction; "NAME = *+n" labels its operand, which other code
+        # patches (self-modifying code); "NAME = OTHER" aliases a label.
+        m = re.match(r'^(?:\.def\s+)?(@?\w+)\s*=\s*(.+)$', rest, re.I)
+        if m and not any(rest.upper().startswith(mn + ' ') for mn in ALL_MNEMONICS):
+            name, expr = m.group(1), m.group(2).replace(' ', '')
+            info = self._label_only(name, line, is_smc=expr.startswith('*+'))
+            if re.match(r'^@?[A-Za-z_]\w*$', expr) and expr not in self.symbols:
+                info['alias'] = expr
+            return info
+
+        # Macro call (expanded by the preprocessor right after this line)
+        if rest.split(None, 1)[0].upper() in self.macros:
+            info = self._label_only(None, line)
+            info['macro'] = rest.split(None, 1)[0].upper()
+            return info
 
         # Label at start of line
         m = re.match(r'^(@?\w+):?\s*(.*)', rest)
@@ -582,6 +612,7 @@ class InstructionParser:
             'is_jump': False, 'is_return': False,
             'raw_line': line, 'is_smc': is_smc,
             'page_cross_possible': False,
+            'alias': None, 'macro': None,
         }
 
     def _detect_mode(self, mn, op):
@@ -669,7 +700,21 @@ class InstructionParser:
 # ============================================================================
 
 class PathAnalyzer:
-    """Enumerate code paths between labels, compute cycle costs."""
+    """Cycle costs of the code paths between labels.
+
+    The listing is split into basic blocks once (a block starts at every
+    label, macro expansion and instruction after a branch/jump/return);
+    the shortest and longest path between two points is then a dynamic
+    program over the blocks instead of an enumeration of every branch
+    combination.  Loops are followed once (a path never revisits a block).
+
+    Self-modifying code: a label defined as "NAME = *+n" marks the
+    instruction after it as patched at run time.  path_bounds() takes
+    smc={NAME: target} to say what the patch makes it do — a label or a
+    list of labels for JMP (each one a possible successor), True/False for
+    a branch that is always/never taken.  Unpatched, an instruction does
+    what its source says.
+    """
 
     def __init__(self, parsed):
         self.lines = parsed
@@ -677,6 +722,195 @@ class PathAnalyzer:
         for i, info in enumerate(parsed):
             if info and info.get('label'):
                 self.label_idx[info['label']] = i
+        self._build_blocks()
+
+    # --- CFG ---------------------------------------------------------------
+
+    def _build_blocks(self):
+        lines = self.lines
+        self.instrs = [i for i, info in enumerate(lines)
+                       if info and info.get('mnemonic')]
+        # line index -> index of the first instruction at or after it
+        self._next_instr = [None] * (len(lines) + 1)
+        nxt = None
+        for i in range(len(lines) - 1, -1, -1):
+            if lines[i] and lines[i].get('mnemonic'):
+                nxt = i
+            self._next_instr[i] = nxt
+
+        leaders = set(self.instrs[:1])
+        for i, info in enumerate(lines):
+            if not info:
+                continue
+            if info.get('mnemonic') is None:
+                if (info.get('label') or info.get('macro')) \
+                        and self._next_instr[i] is not None:
+                    leaders.add(self._next_instr[i])
+            elif (info['is_branch'] or info['is_jump'] or info['is_return']) \
+                    and self._next_instr[i + 1] is not None:
+                leaders.add(self._next_instr[i + 1])
+
+        # blocks[leader] = [instruction line indices]
+        self.blocks: Dict[int, List[int]] = {}
+        current = None
+        for i in self.instrs:
+            if i in leaders:
+                current = self.blocks[i] = []
+            current.append(i)
+
+    def resolve(self, point):
+        """Instruction index of a label (following aliases) or line index."""
+        seen = set()
+        while isinstance(point, str):
+            if point in seen or point not in self.label_idx:
+                return None
+            seen.add(point)
+            info = self.lines[self.label_idx[point]]
+            point = info.get('alias') or self.label_idx[point]
+        if point is None or not 0 <= point < len(self.lines):
+            return None
+        return self._next_instr[point]
+
+    def _edges(self, block, smc):
+        """[(kind, successor, cycles, taken)] leaving a block.
+
+        kind is 'next' (plain fall-through), 'branch', 'jump', 'call' or
+        'exit'; successor is the next block's leader (None = path ends).
+        """
+        last = block[-1]
+        info = self.lines[last]
+        follow = self._next_instr[last + 1]
+        patch = smc.get(last)
+
+        if info['is_branch']:
+            tgt = self.resolve(info.get('branch_target'))
+            edges = []
+            if patch is not False:
+                edges.append(('branch', tgt, info['cycles_taken'], True))
+            if patch is not True:
+                edges.append(('branch', follow, info['cycles'], False))
+            return edges
+        if info['mnemonic'] == 'JMP' and info['mode'] == 'abs':
+            targets = patch if patch is not None else info['operand'].strip()
+            if isinstance(targets, str):
+                targets = [targets]
+            return [('jump', self.resolve(t), info['cycles'], True)
+                    for t in targets]
+        if info['mnemonic'] == 'JSR':
+            return [('call', follow, info['cycles'], True)]
+        if info['is_jump'] or info['is_return']:
+            return [('exit', None, info['cycles'], False)]
+        return [('next', follow, 0, False)]
+
+    def _body_cycles(self, block):
+        last = self.lines[block[-1]]
+        control = last['is_branch'] or last['is_jump'] or last['is_return']
+        body = block[:-1] if control else block
+        return sum(self.lines[i]['cycles'] for i in body)
+
+    def _solve(self, start, end, smc, avoid, longest, calls=frozenset()):
+        """Best path from instruction `start`; returns (cycles, choice map).
+
+        choice[leader] is the edge taken out of that block (with the cost of
+        the subroutine for 'call' edges), or None if no path reaches an end.
+        """
+        choice = {}
+        best_at = {}
+        on_path = set()
+
+        def visit(b):
+            if b in best_at:
+                return best_at[b]
+            on_path.add(b)
+            best = None
+            for kind, succ, cyc, taken in self._edges(self.blocks[b], smc):
+                call = None
+                if kind == 'call':
+                    callee = self.resolve(self.lines[self.blocks[b][-1]]['operand'].strip())
+                    if callee is None or callee in calls:
+                        continue
+                    call = self._solve(callee, None, smc, avoid, longest,
+                                       calls | {callee})
+                    if call[0] is None:
+                        continue
+                    cyc += call[0]
+                if succ is None or succ == end:
+                    total = cyc
+                elif succ in on_path or succ in avoid or succ not in self.blocks:
+                    continue
+                else:
+                    tail = visit(succ)
+                    if tail is None:
+                        continue
+                    total = cyc + tail
+                if best is None or (total > best[0] if longest else total < best[0]):
+                    best = (total, (kind, succ, cyc, taken, call))
+            on_path.discard(b)
+            if best is None:
+                best_at[b] = None
+            else:
+                best_at[b] = self._body_cycles(self.blocks[b]) + best[0]
+                choice[b] = best[1]
+            return best_at[b]
+
+        if start is None or start not in self.blocks or start in avoid:
+            return None, {}
+        return visit(start), (start, end, choice)
+
+    def _path(self, cycles, solution):
+        """Rebuild the trace of a _solve() result."""
+        start, end, choice = solution
+        trace, choices = [], {}
+        b = start
+        while True:
+            kind, succ, cyc, taken, call = choice[b]
+            block = self.blocks[b]
+            control = kind != 'next'
+            for i in (block[:-1] if control else block):
+                info = self.lines[i]
+                trace.append((f"{info['mnemonic']:4s} {info['operand']}", info['cycles']))
+            if control:
+                info = self.lines[block[-1]]
+                desc = f"{info['mnemonic']:4s} {info['operand']}"
+                if kind == 'branch':
+                    choices[info['branch_target']] = taken
+                    if taken:
+                        desc += " [TAKEN]"
+                trace.append((desc, info['cycles_taken'] if kind == 'branch' and taken
+                              else info['cycles']))
+                if call is not None:
+                    sub = self._path(*call)
+                    trace.extend(sub['trace'])
+                    choices.update(sub['choices'])
+            if succ is None or succ == end:
+                break
+            b = succ
+        return {'cycles': cycles, 'trace': trace, 'choices': choices}
+
+    def path_bounds(self, start, end=None, smc=None, avoid=()):
+        """Shortest and longest path from `start` to `end`.
+
+        start/end/avoid are labels or line indices; a path ends on reaching
+        `end` or a return (or a jump out of the listing).  Paths never enter
+        the blocks in `avoid`.  Returns (shortest, longest) as dicts with
+        'cycles', 'trace' [(desc, cycles)] and 'choices' {branch target:
+        taken}, or None when no path exists.
+        """
+        patches = {}
+        for name, value in (smc or {}).items():
+            i = self.resolve(name)
+            if i is not None:
+                patches[i] = value
+        s = self.resolve(start)
+        e = self.resolve(end) if end is not None else None
+        if end is not None and e is None:
+            return None
+        blocked = {self.resolve(a) for a in avoid}
+        lo = self._solve(s, e, patches, blocked, longest=False)
+        hi = self._solve(s, e, patches, blocked, longest=True)
+        if lo[0] is None or hi[0] is None:
+            return None
+        return self._path(*lo), self._path(*hi)
 
     def trace_path(self, start, end, branch_taken=None):
         """Trace one path. Returns (total_cycles, [(desc, cycles)])."""
@@ -751,120 +985,138 @@ class PathAnalyzer:
 
         return total, trace
 
-    def enumerate_paths(self, start, end, max_branches=10):
-        """Enumerate all branch combinations. Returns sorted by cycles."""
-        si = self.label_idx.get(start, 0)
-        ei = self.label_idx.get(end, len(self.lines))
+    def enumerate_paths(self, start, end, smc=None):
+        """Shortest and longest path (one entry if they cost the same),
+        sorted by cycles."""
+        bounds = self.path_bounds(start, end, smc)
+        if bounds is None:
+            return []
+        lo, hi = bounds
+        return [lo] if lo['cycles'] == hi['cycles'] else [lo, hi]
 
-        # Collect branch targets reachable from start
-        targets = []
-        for i in range(si, min(ei + 100, len(self.lines))):
-            info = self.lines[i]
-            if info and info.get('is_branch') and info.get('branch_target'):
-                t = info['branch_target']
-                if t not in targets:
-                    targets.append(t)
-        targets = targets[:max_branches]
 
-        if not targets:
-            cyc, tr = self.trace_path(start, end)
-            return [{'cycles': cyc, 'trace': tr, 'choices': {}}]
+# ============================================================================
+# IRQ HANDLER WCET
+# ============================================================================
 
-        results = []
-        seen_cycles = set()
-        for bits in range(1 << len(targets)):
-            choices = {t: bool(bits & (1 << j)) for j, t in enumerate(targets)}
-            cyc, tr = self.trace_path(start, end, choices)
-            if cyc >= 0 and cyc not in seen_cycles:
-                seen_cycles.add(cyc)
-                results.append({'cycles': cyc, 'trace': tr, 'choices': choices})
+# Tick handlers process_row.asm patches into each channel's chN_tick_jmp
+HANDLER_MODES = ('vq_no_pitch', 'vq_pitch', 'raw_no_pitch', 'raw_pitch')
+IRQ_ENTRY_CYCLES = 7    # 6502 interrupt sequence: push PC and P, fetch vector
 
-        results.sort(key=lambda r: r['cycles'])
-        return results
 
+def _channel_starts(analyzer, channels):
+    """Line index of the macro call that expands each channel's code."""
+    starts = {}
+    for n in channels:
+        i = analyzer.label_idx[f'ch{n}_tick_jmp']
+        while i >= 0 and not (analyzer.lines[i] and analyzer.lines[i].get('macro')):
+            i -= 1
+        if i >= 0:
+            starts[n] = i
+    return starts
 
-# ============================================================================
-# IRQ SUMMARY (with fixed channel detection)
-# ============================================================================
 
-def irq_summary(parsed, defines):
-    """Auto-detect and summarize the IRQ handler with accurate DMA model."""
-    labels = [p['label'] for p in parsed if p and p.get('label')]
+def _cycles(bounds):
+    return (bounds[0]['cycles'], bounds[1]['cycles']) if bounds else None
 
-    if 'Tracker_IRQ' not in labels:
-        return "  Tracker_IRQ label not found."
 
-    skips = sorted([l for l in labels if l.startswith('@skip_ch')])
-    if not skips:
-        return "  No @skip_chN labels found."
+def handler_wcet(parsed):
+    """Per-channel, per-mode cycle bounds of the Tracker_IRQ handler.
 
+    Returns {'entry': (min, max), 'exit': (min, max), 'channels':
+    [{'inactive': (min, max), 'vq_no_pitch': (min, max), ...}, ...]},
+    or None if the listing has no Tracker_IRQ with chN_tick_jmp dispatch.
+    'entry' runs from the interrupt (IRQ_ENTRY_CYCLES included) to the
+    first channel, 'exit' from the last channel's chN_skip through RTI.
+    A channel runs from its macro expansion to its chN_skip: 'inactive'
+    without reaching the dispatch JMP, each mode with the JMP patched to
+    that mode's handler.  min is the common tick, max the boundary tick.
+    """
     analyzer = PathAnalyzer(parsed)
-    lines = []
-
-    # Channel analysis:
-    # Ch0: Tracker_IRQ → @skip_ch0  (includes save regs + IRQEN overhead)
-    # Ch1: @skip_ch0 → @skip_ch1    (the section AFTER skip_ch0)
-    # Ch2: @skip_ch1 → @skip_ch2
-    # Ch3: @skip_ch2 → @skip_ch3
-    # Exit: @skip_ch3 → RTI         (restore regs)
-    #
-    # The overhead (save regs, IRQEN) is inside Ch0's range.
-    # Each "channel" section includes the channel-inactive test + skip.
-
-    ch_ranges = []
-    ch_ranges.append(('Tracker_IRQ', skips[0], 'Ch0 (incl overhead)'))
-    for i in range(len(skips) - 1):
-        ch_ranges.append((skips[i], skips[i+1], f'Ch{i+1}'))
-
-    for start, end, desc in ch_ranges:
-        paths = analyzer.enumerate_paths(start, end)
-        if paths:
-            lines.append(f"    {desc:30s}: "
-                         f"{paths[0]['cycles']:3d} - {paths[-1]['cycles']:3d} cyc")
-
-    # Exit overhead (restore regs + RTI after last skip)
-    exit_overhead = 0
-    ei = analyzer.label_idx.get(skips[-1], 0)
-    for i in range(ei, min(ei + 15, len(parsed))):
-        info = parsed[i]
-        if info and info.get('mnemonic'):
-            exit_overhead += info['cycles']
-            if info['is_return']:
-                break
-
-    lines.append(f"    {'Exit (restore + RTI)':30s}: {exit_overhead:3d} cyc")
+    channels = sorted(int(m.group(1)) for m in
+                      (re.match(r'^ch(\d+)_tick_jmp$', l) for l in analyzer.label_idx)
+                      if m)
+    starts = _channel_starts(analyzer, channels)
+    if 'Tracker_IRQ' not in analyzer.label_idx or not channels \
+            or len(starts) != len(channels):
+        return None
 
-    # Full handler: Tracker_IRQ → last skip + exit
-    full_paths = analyzer.enumerate_paths('Tracker_IRQ', skips[-1])
-    if full_paths:
-        full_min = full_paths[0]['cycles'] + exit_overhead
-        full_max = full_paths[-1]['cycles'] + exit_overhead
+    entry = _cycles(analyzer.path_bounds('Tracker_IRQ', starts[channels[0]]))
+    exit_ = _cycles(analyzer.path_bounds(f'ch{channels[-1]}_skip'))
+    if entry is None or exit_ is None:
+        return None
+    table = {'entry': (entry[0] + IRQ_ENTRY_CYCLES, entry[1] + IRQ_ENTRY_CYCLES),
+             'exit': exit_, 'channels': []}
+
+    for n in channels:
+        dispatch, skip = f'ch{n}_tick_jmp', f'ch{n}_skip'
+        row = {'inactive': _cycles(analyzer.path_bounds(
+            starts[n], skip, avoid=[dispatch]))}
+        head = _cycles(analyzer.path_bounds(starts[n], dispatch, avoid=[skip]))
+        for mode in HANDLER_MODES:
+            target = f'ch{n}_{mode}'
+            tail = _cycles(analyzer.path_bounds(dispatch, skip, smc={dispatch: target}))
+            if head and tail and analyzer.resolve(target) is not None:
+                row[mode] = (head[0] + tail[0], head[1] + tail[1])
+        table['channels'].append(row)
+    return table
+
+
+def handler_bounds(parsed):
+    """(min, max) cycles of the whole handler, any channel in any mode."""
+    analyzer = PathAnalyzer(parsed)
+    smc = {l: [l[:-len('tick_jmp')] + mode for mode in HANDLER_MODES]
+           for l in analyzer.label_idx if re.match(r'^ch\d+_tick_jmp$', l)}
+    full = _cycles(analyzer.path_bounds('Tracker_IRQ', None, smc))
+    if full is None:
+        return None
+    return full[0] + IRQ_ENTRY_CYCLES, full[1] + IRQ_ENTRY_CYCLES
 
-        lines.append(f"\n    FULL HANDLER: {full_min} - {full_max} cycles")
 
-        # Identify common scenarios
-        # Smallest = all channels inactive
-        # Common fast = 4ch active, no boundary (2nd path per channel)
-        lines.append(f"    All inactive:  {full_min} cycles")
-        lines.append(f"    Worst case:    {full_max} cycles")
+# ============================================================================
+# IRQ SUMMARY
+# ============================================================================
 
-        # Page-cross potential
-        pc_count = sum(1 for p in parsed if p and p.get('page_cross_possible'))
-        if pc_count > 0:
-            lines.append(f"\n    Note: {pc_count} instructions with potential "
-                         f"+1 page-cross penalty")
+def irq_summary(parsed, defines):
+    """Auto-detect and summarize the IRQ handler with accurate DMA model."""
+    labels = [p['label'] for p in parsed if p and p.get('label')]
 
-        # Unresolved symbols
-        ip = InstructionParser(parsed[0]['_symbols'] if parsed and parsed[0] and '_symbols' in parsed[0] else {})
-        # Skip — we'll check this externally
+    if 'Tracker_IRQ' not in labels:
+        return "  Tracker_IRQ label not found."
 
-        # CPU budget table
-        lines.append(f"\n    CPU Budget (handler max = {full_max} cycles):")
-        lines.append(f"\n    --- GR.0 Text Screen (avg 63% CPU efficiency) ---")
-        lines.append(DmaModel.budget_table(full_min, full_max, 'gr0'))
+    table = handler_wcet(parsed)
+    if table is None:
+        return "  No chN_tick_jmp channel dispatch found."
 
-        lines.append(f"\n    --- Blank Screen / DMA Off (92% CPU efficiency) ---")
-        lines.append(DmaModel.budget_table(full_min, full_max, 'blank'))
+    lines = []
+    fmt = lambda b: f"{b[0]:3d}-{b[1]:<3d}" if b else f"{'-':^7s}"
+    lines.append(f"    {'Entry (IRQ + save + IRQEN)':30s}: "
+                 f"{fmt(table['entry'])} cyc")
+    lines.append(f"\n    {'Channel':8s} {'inactive':>8s}"
+                 + ''.join(f" {m:>12s}" for m in HANDLER_MODES))
+    for n, row in enumerate(table['channels']):
+        lines.append(f"    {'Ch' + str(n):8s} {fmt(row['inactive']):>8s}"
+                     + ''.join(f" {fmt(row.get(m)):>12s}" for m in HANDLER_MODES))
+    lines.append(f"\n    {'Exit (restore + RTI)':30s}: {fmt(table['exit'])} cyc")
+
+    full_min, full_max = handler_bounds(parsed)
+    lines.append(f"\n    FULL HANDLER: {full_min} - {full_max} cycles")
+    lines.append(f"    All inactive:  {full_min} cycles")
+    lines.append(f"    Worst case:    {full_max} cycles")
+
+    # Page-cross potential
+    pc_count = sum(1 for p in parsed if p and p.get('page_cross_possible'))
+    if pc_count > 0:
+        lines.append(f"\n    Note: {pc_count} instructions with potential "
+                     f"+1 page-cross penalty")
+
+    # CPU budget table
+    lines.append(f"\n    CPU Budget (handler max = {full_max} cycles):")
+    lines.append(f"\n    --- GR.0 Text Screen (avg 63% CPU efficiency) ---")
+    lines.append(DmaModel.budget_table(full_min, full_max, 'gr0'))
+
+    lines.append(f"\n    --- Blank Screen / DMA Off (92% CPU efficiency) ---")
+    lines.append(DmaModel.budget_table(full_min, full_max, 'blank'))
 
     return '\n'.join(lines)
 
@@ -949,7 +1201,7 @@ def process_config(input_path, include_dirs, defines, pre_includes):
     """Process one configuration. Returns (pp, source_lines, parsed)."""
     pp = build_preprocessor(input_path, include_dirs, defines, pre_includes)
     source_lines = pp.process_file(input_path)
-    ip = InstructionParser(pp.symbols)
+    ip = InstructionParser(pp.symbols, pp.macros)
     parsed = [ip.parse_line(l[0]) for l in source_lines]
 
     # Check for unresolved symbols
@@ -1046,31 +1298,10 @@ Examples:
             pp, src, parsed = process_config(
                 args.input, include_dirs, merged, args.pre_include)
 
-            labels = [p['label'] for p in parsed if p and p.get('label')]
-            if 'Tracker_IRQ' not in labels:
-                continue
-
-            skips = sorted([l for l in labels if l.startswith('@skip_ch')])
-            if not skips:
+            bounds = handler_bounds(parsed)
+            if bounds is None:
                 continue
-
-            analyzer = PathAnalyzer(parsed)
-            paths = analyzer.enumerate_paths('Tracker_IRQ', skips[-1])
-            if not paths:
-                continue
-
-            # Exit overhead
-            exit_ov = 0
-            ei = analyzer.label_idx.get(skips[-1], 0)
-            for i in range(ei, min(ei + 15, len(parsed))):
-                info = parsed[i]
-                if info and info.get('mnemonic'):
-                    exit_ov += info['cycles']
-                    if info['is_return']:
-                        break
-
-            mn = paths[0]['cycles'] + exit_ov
-            mx = paths[-1]['cycles'] + exit_ov
+            mn, mx = bounds
 
             avg_ratio = DmaModel.effective_ratio('gr0', 'average')
             worst_ratio = DmaModel.effective_ratio('gr0', 'worst')
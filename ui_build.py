@@ -1061,6 +1061,12 @@ def build_status_bar():
             dpg.add_separator()
             dpg.add_text(tag="validation_tooltip_text", default_value="Validated automatically when BUILD is clicked")
         dpg.add_spacer(width=20)
+        dpg.add_text(tag="cpu_indicator", default_value="", color=(100, 200, 100))
+        with dpg.tooltip("cpu_indicator"):
+            dpg.add_text("Peak IRQ load (current RAW/VQ modes)", color=(255, 255, 150))
+            dpg.add_separator()
+            dpg.add_text(tag="cpu_tooltip_text", default_value="")
+        dpg.add_spacer(width=20)
         dpg.add_text(tag="focus_indicator", default_value="Focus: EDITOR", color=(100, 150, 200))
 
 
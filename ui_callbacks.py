@@ -1564,7 +1564,9 @@ def _prepare_conversion_files(instruments, used_indices=None) -> tuple:
                 if len(original_audio.shape) > 1:
                     original_audio = original_audio.mean(axis=1)
                 processed = run_pipeline(original_audio, sr, inst.effects)
-                proc_path = working_path.replace('.wav', '_proc.wav')
+                # Named by slot, like the project file stores the sample
+                proc_path = os.path.join(os.path.dirname(working_path),
+                                         f"{i:03d}_proc.wav")
                 sf.write(proc_path, processed, sr)
                 input_files.append(proc_path)
                 proc_files.append(proc_path)
@@ -1648,6 +1650,7 @@ def on_optimize_click(sender, app_data):
         use_banking=use_banking,
         banking_budget=banking_budget,
         max_banks=n_banks,
+        screen_control=state.song.screen_control,
     )
     
     # Apply suggestions directly to instrument checkboxes
@@ -300,9 +300,13 @@ def do_autosave():
             vq_vector_size=state.vq.vector_size,
             vq_smoothness=state.vq.smoothness,
             vq_enhance=state.vq.settings.enhance,
+            vq_used_only=state.vq.settings.used_only,
+            vq_seed=state.vq.settings.seed,
         )
         
-        save_project(state.song, editor_state, str(filename), file_io.work_dir)
+        vq_output_dir = state.vq.output_dir if state.vq.is_valid else None
+        save_project(state.song, editor_state, str(filename), file_io.work_dir,
+                     vq_output_dir=vq_output_dir)
         
         # Restore original path and modified flag - autosave is invisible to user
         state.song.file_path = original_path
@@ -20,6 +20,11 @@ _preview_callback = None
 _select_callback = None
 _effects_callback = None
 
+# Latest optimize.predict_overruns() result, and the overrun rows the
+# pattern editor last drew as (songline, rows)
+_overrun_prediction = None
+_drawn_overruns = (None, frozenset())
+
 def set_instrument_callbacks(preview_cb, select_cb, effects_cb=None):
     """Set callbacks for instrument list buttons."""
     global _preview_callback, _select_callback, _effects_callback
@@ -35,6 +40,8 @@ def refresh_all():
     refresh_song_editor()
     refresh_pattern_info()
     refresh_instruments()
+    # Predict first: the editor and validation indicator show its overruns
+    update_cpu_indicator(redraw=False)
     refresh_editor()
     update_controls()
     update_validation_indicator()
@@ -406,9 +413,14 @@ def _update_vq_ui():
 
 def refresh_editor():
     """Refresh pattern editor grid."""
+    global _drawn_overruns
     ptns = state.get_patterns()
     patterns = [state.song.get_pattern(p) for p in ptns]
     max_len = state.song.max_pattern_length(state.songline)
+    overruns = frozenset()
+    if _overrun_prediction is not None:
+        overruns = frozenset(int(r) for r in _overrun_prediction.overrun_rows(state.songline))
+    _drawn_overruns = (state.songline, overruns)
     
     half = G.visible_rows // 2
     start_row = max(0, state.row - half)
@@ -439,6 +451,8 @@ def refresh_editor():
                     theme = "theme_song_row_playing"
                 elif is_cursor_row:
                     theme = "theme_song_row_cursor"
+                elif row_idx in overruns:
+                    theme = "theme_song_row_overrun"
                 elif is_highlight:
                     theme = "theme_song_row_highlight"
                 else:
@@ -677,6 +691,10 @@ def update_validation_indicator():
         return
     
     errors, warnings, first_issue = quick_validate_song()
+    cpu_issue = _overrun_issue()
+    if cpu_issue:
+        warnings += 1
+        first_issue = first_issue or cpu_issue
     
     if errors > 0:
         # Red - errors found
@@ -698,6 +716,75 @@ def update_validation_indicator():
             dpg.set_value("validation_tooltip_text", "Song is ready for export")
 
 
+def _predict_overruns():
+    """Predict per-row CPU overruns of the song (None if unavailable)."""
+    global _overrun_prediction
+    from optimize import predict_overruns
+
+    settings = state.vq.settings
+    try:
+        _overrun_prediction = predict_overruns(
+            state.song, settings.rate, settings.vector_size,
+            use_banking=state.song.memory_config != "64 KB")
+    except Exception as e:
+        logger.debug(f"Overrun prediction unavailable: {e}")
+        _overrun_prediction = None
+    return _overrun_prediction
+
+
+def _overrun_issue():
+    """Validation message for the first predicted overrun row, or None."""
+    first = _overrun_prediction.first_overrun() if _overrun_prediction else None
+    if first is None:
+        return None
+    songline, row, cycles = first
+    return (f"Songline {songline} row {row}: CPU overrun "
+            f"({cycles:.0f} of {_overrun_prediction.budget:.0f} cycles)")
+
+
+def update_cpu_indicator(redraw: bool = True):
+    """Update the live CPU headroom indicator in the status bar.
+
+    Peak IRQ load of the song with the instruments' current RAW/VQ modes,
+    predicted without building (optimize.predict_overruns). The
+    optimizer's analysis cache makes this cheap enough to poll: only
+    songlines edited since the last call are simulated again. Rows
+    predicted to overrun are flagged in the pattern editor and the
+    validation indicator; with redraw=False the caller redraws those
+    itself (refresh_all).
+    """
+    if not dpg.does_item_exist("cpu_indicator"):
+        return
+    from optimize import overrun_advice
+
+    issue = _overrun_issue()
+    prediction = _predict_overruns()
+    if redraw:
+        if _overrun_issue() != issue:
+            update_validation_indicator()
+        rows = prediction.overrun_rows(state.songline) if prediction else ()
+        if _drawn_overruns != (state.songline, frozenset(int(r) for r in rows)):
+            refresh_editor()
+    if prediction is None:
+        dpg.set_value("cpu_indicator", "")
+        return
+
+    peak, overruns = prediction.peak_pct, prediction.overrun_irqs
+    if overruns:
+        color = (255, 100, 100)
+        ms = overruns / state.vq.settings.rate * 1000
+        tip = (f"{overruns} overrun IRQs ({ms:.0f}ms of glitches).\n"
+               f"{_overrun_issue()}\n"
+               f"{overrun_advice(prediction.vq_in_overruns, state.song.screen_control)}")
+    else:
+        color = (255, 200, 100) if peak > 90 else (100, 200, 100)
+        tip = f"{100 - peak:.0f}% of the IRQ budget left at the busiest moment"
+    dpg.configure_item("cpu_indicator", color=color)
+    dpg.set_value("cpu_indicator", f"CPU {peak:.0f}%")
+    if dpg.does_item_exist("cpu_tooltip_text"):
+        dpg.set_value("cpu_tooltip_text", tip)
+
+
 # =============================================================================
 # VISUALIZATION — channel VU bars + frequency spectrum
 # =============================================================================
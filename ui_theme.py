@@ -208,6 +208,12 @@ def create_themes():
             dpg.add_theme_color(dpg.mvThemeCol_Button, (30, 50, 35))
             dpg.add_theme_color(dpg.mvThemeCol_Text, (80, 200, 100))
     
+    # Row number of a row predicted to overrun the CPU budget (red)
+    with dpg.theme(tag="theme_song_row_overrun"):
+        with dpg.theme_component(dpg.mvButton):
+            dpg.add_theme_color(dpg.mvThemeCol_Button, (60, 25, 25))
+            dpg.add_theme_color(dpg.mvThemeCol_Text, (255, 100, 100))
+    
     # Empty/inactive row number
     with dpg.theme(tag="theme_song_row_empty"):
         with dpg.theme_component(dpg.mvButton):
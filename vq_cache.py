@@ -0,0 +1,401 @@
+"""POKEY VQ Tracker - Content-Addressed VQ Conversion Cache
+
+Stores complete converter output directories (.tmp/vq_output contents)
+keyed by a hash of everything that determines the output:
+
+  - processed instrument audio (the exact WAV bytes fed to the converter)
+    by instrument slot; file names are not part of the key, so a project
+    whose samples were renamed by save/load still hits
+  - per-instrument VQ/RAW modes
+  - conversion settings (rate, vector size, smoothness, enhance, seed, ...)
+  - converter version and cache format version
+
+A cache hit restores the output directory by file copy, so re-opening a
+project or re-converting after a pattern-only edit is instant.
+
+The cache lives in .tmp/vq_cache/<key>/ (NOT cleared by new/load project).
+Total size is bounded; least-recently-used entries are evicted first.
+
+Conversions without a fixed seed are non-deterministic and never cached.
+
+CLI:
+    python vq_cache.py list            # show entries (newest use first)
+    python vq_cache.py stats           # total size / entry count
+    python vq_cache.py purge [KEY ...] # delete all entries, or given keys
+    python vq_cache.py prune --max-mb N  # apply LRU limit now
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("tracker.vq_cache")
+
+CACHE_DIR = "vq_cache"
+CACHE_FORMAT_VERSION = 2
+META_FILE = "cache_meta.json"
+OUTPUT_META_FILE = "vq_meta.json"  # Written into the converter output dir itself
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+
+_HASH_CHUNK = 1 << 20
+
+
+def converter_version() -> str:
+    """Version string of the pokey_vq converter (part of the cache key)."""
+    try:
+        import pokey_vq
+        return getattr(pokey_vq, "__version__", "unknown")
+    except Exception:
+        return "unknown"
+
+
+def compute_key(input_files: List[str], sample_modes: Optional[List[int]],
+                params: Dict) -> Optional[str]:
+    """Compute the content hash for a conversion.
+
+    Args:
+        input_files: WAV files fed to the converter (processed audio), one
+            per instrument slot
+        sample_modes: Per-instrument mode flags (0=VQ, 1=RAW)
+        params: Conversion parameters that affect output (rate, seed, ...)
+
+    Returns:
+        Hex digest, or None if the conversion is not cacheable
+        (no seed -> non-deterministic, or an input file is unreadable).
+    """
+    if params.get("seed") is None:
+        return None
+
+    h = hashlib.sha256()
+    header = {
+        "format": CACHE_FORMAT_VERSION,
+        "converter": converter_version(),
+        "params": params,
+        "modes": [int(bool(m)) for m in (sample_modes or [])],
+        "n_inputs": len(input_files),
+    }
+    h.update(json.dumps(header, sort_keys=True).encode("utf-8"))
+
+    for slot, path in enumerate(input_files):
+        h.update(b"\0%d\0" % slot)
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(_HASH_CHUNK)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+        except OSError as e:
+            logger.warning(f"compute_key: cannot read {path}: {e}")
+            return None
+
+    return h.hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    """One cached conversion (metadata from cache_meta.json)."""
+    key: str
+    path: str
+    size_bytes: int = 0          # On-disk size of the entry
+    created: float = 0.0
+    last_used: float = 0.0
+    stats: Dict = field(default_factory=dict)
+    params: Dict = field(default_factory=dict)
+
+
+class VQCache:
+    """Size-bounded LRU cache of VQ converter output directories."""
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    # -------------------------------------------------------------------------
+    # Lookup / store
+    # -------------------------------------------------------------------------
+
+    def get(self, key: Optional[str], dest_dir: str) -> Optional[CacheEntry]:
+        """Restore cached output for key into dest_dir.
+
+        dest_dir is replaced entirely. Returns the entry on hit, None on miss.
+        """
+        if not key:
+            return None
+        entry = self._read_entry(key)
+        if entry is None:
+            return None
+        try:
+            if os.path.isdir(dest_dir):
+                shutil.rmtree(dest_dir)
+            shutil.copytree(entry.path, dest_dir,
+                            ignore=shutil.ignore_patterns(META_FILE))
+        except OSError as e:
+            logger.warning(f"Cache restore failed for {key[:12]}: {e}")
+            return None
+
+        entry.last_used = time.time()
+        self._write_meta(entry)
+        logger.info(f"VQ cache hit: {key[:12]}")
+        return entry
+
+    def put(self, key: Optional[str], src_dir: str, stats: Dict = None,
+            params: Dict = None) -> Optional[CacheEntry]:
+        """Store the contents of src_dir under key, then enforce size limit."""
+        if not key or not os.path.isdir(src_dir):
+            return None
+        os.makedirs(self.root, exist_ok=True)
+        final = os.path.join(self.root, key)
+        staging = final + ".tmp"
+        try:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging)
+            shutil.copytree(src_dir, staging)
+            if os.path.isdir(final):
+                shutil.rmtree(final)
+            os.replace(staging, final)
+        except OSError as e:
+            logger.warning(f"Cache store failed for {key[:12]}: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return None
+
+        now = time.time()
+        entry = CacheEntry(key=key, path=final, size_bytes=_dir_size(final),
+                           created=now, last_used=now,
+                           stats=dict(stats or {}), params=dict(params or {}))
+        self._write_meta(entry)
+        self.evict()
+        return entry
+
+    # -------------------------------------------------------------------------
+    # Inspection / maintenance
+    # -------------------------------------------------------------------------
+
+    def entries(self) -> List[CacheEntry]:
+        """All valid entries, most recently used first."""
+        if not os.path.isdir(self.root):
+            return []
+        result = []
+        for name in os.listdir(self.root):
+            if name.endswith(".tmp"):
+                continue
+            entry = self._read_entry(name)
+            if entry is not None:
+                result.append(entry)
+        result.sort(key=lambda e: e.last_used, reverse=True)
+        return result
+
+    def total_size(self) -> int:
+        return sum(e.size_bytes for e in self.entries())
+
+    def evict(self, max_bytes: Optional[int] = None) -> List[str]:
+        """Delete least-recently-used entries until total <= max_bytes.
+
+        Returns list of evicted keys.
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(e.size_bytes for e in entries)
+        evicted = []
+        while entries and total > limit:
+            victim = entries.pop()  # least recently used
+            shutil.rmtree(victim.path, ignore_errors=True)
+            total -= victim.size_bytes
+            evicted.append(victim.key)
+            logger.info(f"VQ cache evict: {victim.key[:12]} ({victim.size_bytes} bytes)")
+        return evicted
+
+    def purge(self, keys: Optional[List[str]] = None) -> int:
+        """Delete given keys (prefixes allowed), or everything. Returns count."""
+        removed = 0
+        for entry in self.entries():
+            if keys is None or any(entry.key.startswith(k) for k in keys):
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _read_entry(self, key: str) -> Optional[CacheEntry]:
+        path = os.path.join(self.root, key)
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.isfile(meta_path):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        return CacheEntry(key=key, path=path,
+                          size_bytes=int(meta.get("size_bytes", 0)),
+                          created=float(meta.get("created", 0.0)),
+                          last_used=float(meta.get("last_used", 0.0)),
+                          stats=meta.get("stats", {}),
+                          params=meta.get("params", {}))
+
+    def _write_meta(self, entry: CacheEntry):
+        meta = {
+            "format": CACHE_FORMAT_VERSION,
+            "key": entry.key,
+            "size_bytes": entry.size_bytes,
+            "created": entry.created,
+            "last_used": entry.last_used,
+            "stats": entry.stats,
+            "params": entry.params,
+        }
+        try:
+            with open(os.path.join(entry.path, META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+        except OSError as e:
+            logger.warning(f"Cache meta write failed for {entry.key[:12]}: {e}")
+
+
+def file_digests(input_files: List[str]) -> Optional[List[str]]:
+    """Per-file sha256 of instrument slot + bytes (None if a file is unreadable).
+
+    Lets an incremental conversion find which single instrument changed.
+    """
+    digests = []
+    for slot, path in enumerate(input_files):
+        h = hashlib.sha256(b"%d\0" % slot)
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(_HASH_CHUNK)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+        except OSError:
+            return None
+        digests.append(h.hexdigest())
+    return digests
+
+
+def write_output_meta(output_dir: str, key: str, stats: Dict = None,
+                      params: Dict = None, inputs: Optional[List[str]] = None,
+                      modes: Optional[List[int]] = None,
+                      incremental: bool = False) -> bool:
+    """Tag a finished converter output directory with its content key.
+
+    Makes the directory self-describing: it can be embedded in a .pvq and
+    later reused in place when the recomputed key still matches.
+    inputs/modes (per-file digests and VQ/RAW flags) allow an incremental
+    re-encode when exactly one instrument changed; incremental marks output
+    produced that way (kept out of the shared cache).
+    """
+    meta = {
+        "format": CACHE_FORMAT_VERSION,
+        "key": key,
+        "converter": converter_version(),
+        "stats": dict(stats or {}),
+        "params": dict(params or {}),
+        "inputs": list(inputs or []),
+        "modes": [int(bool(m)) for m in (modes or [])],
+        "incremental": bool(incremental),
+    }
+    try:
+        with open(os.path.join(output_dir, OUTPUT_META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return True
+    except OSError as e:
+        logger.warning(f"Output meta write failed in {output_dir}: {e}")
+        return False
+
+
+def read_output_meta(output_dir: str) -> Optional[Dict]:
+    """Read the vq_meta.json tag of an output directory (None if absent/bad)."""
+    path = os.path.join(output_dir, OUTPUT_META_FILE)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not isinstance(meta, dict) or not meta.get("key"):
+        return None
+    return meta
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def default_cache_root() -> str:
+    """Cache location inside the application's .tmp working directory."""
+    import runtime
+    return os.path.join(runtime.get_app_dir(), ".tmp", CACHE_DIR)
+
+
+def get_default_cache() -> VQCache:
+    return VQCache(default_cache_root())
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Inspect or purge the VQ conversion cache")
+    ap.add_argument("--dir", default=None,
+                    help="Cache directory (default: <app>/.tmp/vq_cache)")
+    sub = ap.add_subparsers(dest="cmd")
+    sub.add_parser("list", help="List cache entries (most recently used first)")
+    sub.add_parser("stats", help="Show total cache size")
+    p_purge = sub.add_parser("purge", help="Delete entries (all if no keys)")
+    p_purge.add_argument("keys", nargs="*", help="Key prefixes to delete")
+    p_prune = sub.add_parser("prune", help="Evict LRU entries above a size limit")
+    p_prune.add_argument("--max-mb", type=float,
+                         default=DEFAULT_MAX_BYTES / (1024 * 1024),
+                         help="Size limit in MB (default: %(default).0f)")
+    args = ap.parse_args(argv)
+
+    cache = VQCache(args.dir or default_cache_root())
+    cmd = args.cmd or "list"
+
+    if cmd == "list":
+        entries = cache.entries()
+        if not entries:
+            print(f"Cache empty: {cache.root}")
+            return 0
+        print(f"{'KEY':14s} {'SIZE':>10s} {'ATARI':>10s}  LAST USED            SETTINGS")
+        for e in entries:
+            used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e.last_used))
+            p = e.params
+            settings = (f"r{p.get('rate', '?')} v{p.get('vector_size', '?')} "
+                        f"s{p.get('smoothness', '?')} seed={p.get('seed', '?')}")
+            print(f"{e.key[:12]:14s} {e.size_bytes:>10,d} "
+                  f"{e.stats.get('size_bytes', 0):>10,d}  {used}  {settings}")
+    elif cmd == "stats":
+        entries = cache.entries()
+        total = sum(e.size_bytes for e in entries)
+        print(f"{cache.root}: {len(entries)} entries, {total:,} bytes "
+              f"(limit {cache.max_bytes:,})")
+    elif cmd == "purge":
+        n = cache.purge(args.keys or None)
+        print(f"Removed {n} entr{'y' if n == 1 else 'ies'}")
+    elif cmd == "prune":
+        evicted = cache.evict(int(args.max_mb * 1024 * 1024))
+        print(f"Evicted {len(evicted)} entr{'y' if len(evicted) == 1 else 'ies'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
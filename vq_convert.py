@@ -16,8 +16,9 @@ from typing import Optional, List
 from dataclasses import dataclass, field
 
 import runtime
+import vq_cache
 from constants import (VQ_RATE_DEFAULT, VQ_VECTOR_DEFAULT, VQ_SMOOTHNESS_DEFAULT,
-                       VQ_VECTOR_SIZES)
+                       VQ_SEED_DEFAULT, VQ_VECTOR_SIZES)
 
 # Valid vector sizes (must be even for ASM nibble-packing)
 VALID_VECTOR_SIZES = {2, 4, 8, 16}
@@ -102,6 +103,7 @@ class VQArgs:
     smoothness: float = 0.0
     codebook: int = 256
     iterations: int = 50
+    seed: Optional[int] = VQ_SEED_DEFAULT  # None = non-deterministic training
     
     # Vector settings
     min_vector: int = 8
@@ -114,6 +116,7 @@ class VQArgs:
     constrained: bool = False
     enhance: str = "on"
     no_enhance: bool = False
+    noise_shaping: str = "auto"  # RAW instruments: auto/off/first/second/weighted
     
     # Output options
     wav: str = "off"
@@ -142,6 +145,7 @@ class VQSettings:
     enhance: bool = True
     memory_limit: int = 0  # DEPRECATED — computed from song settings now. Kept for load compat.
     used_only: bool = False  # Only convert/optimize instruments used in song
+    seed: int = VQ_SEED_DEFAULT  # Codebook training seed (reproducible output)
     
     def __post_init__(self):
         if self.vector_size not in VALID_VECTOR_SIZES:
@@ -169,6 +173,8 @@ class VQResult:
     # Per-instrument sizes (populated after conversion)
     inst_vq_sizes: List[int] = field(default_factory=list)    # VQ compressed bytes per inst
     inst_raw_sizes: List[int] = field(default_factory=list)    # RAW bytes per inst (at target rate)
+    cache_key: str = ""          # Content hash of inputs + settings ("" = not cacheable)
+    from_cache: bool = False     # True if restored from the conversion cache
 
 
 # ============================================================================
@@ -246,8 +252,9 @@ class VQState:
 class VQConverter:
     """Converts WAV files to VQ format using pokey_vq (direct import)."""
     
-    def __init__(self, vq_state: VQState):
+    def __init__(self, vq_state: VQState, cache: Optional[vq_cache.VQCache] = None):
         self.vq_state = vq_state
+        self.cache = cache if cache is not None else vq_cache.get_default_cache()
         self.logger = logging.getLogger("tracker.vq_convert")
     
     def _queue_output(self, text: str):
@@ -315,28 +322,144 @@ class VQConverter:
             self._fail(f"pokey_vq not available: {_import_error}")
             return
         
-        # Prepare output directory (clean first to prevent stale files from prior runs)
+        settings = self.vq_state.settings
+        params = conversion_params(settings)
+        
+        # Content key of inputs + settings ("" = not cacheable)
+        cache_key = vq_cache.compute_key(input_files, self._sample_modes, params) or ""
+        
         app_dir = runtime.get_app_dir()
         asm_output_dir = os.path.join(app_dir, ".tmp", "vq_output")
-        if os.path.isdir(asm_output_dir):
-            import shutil
-            shutil.rmtree(asm_output_dir)
-        os.makedirs(asm_output_dir, exist_ok=True)
         
-        settings = self.vq_state.settings
+        # Output dir already holds this exact conversion (e.g. embedded in the
+        # loaded .pvq) -> reuse in place, no copy, no retrain
+        if self._restore_in_place(cache_key, asm_output_dir, params):
+            return
+        
+        # Content-addressed cache: identical inputs + settings -> instant restore
+        if self._restore_from_cache(cache_key, asm_output_dir):
+            return
+        
         output_name = os.path.join(asm_output_dir,
             f"multi_{len(input_files)}-r{settings.rate}-v{settings.vector_size}"
             f"-s{settings.smoothness}" + ("-enh" if settings.enhance else ""))
         
+        # Exactly one VQ instrument changed since the conversion in
+        # asm_output_dir -> re-encode it against the existing codebook
+        changed_idx = self._find_incremental(input_files, asm_output_dir, params)
+        if changed_idx is not None:
+            self.vq_state._is_converting = True
+            thread = threading.Thread(
+                target=self._run_incremental,
+                args=(input_files, changed_idx, asm_output_dir, output_name, cache_key),
+                daemon=True
+            )
+            thread.start()
+            return
+        
+        # Prepare output directory (clean first to prevent stale files from prior runs)
+        self._clean_output_dir(asm_output_dir)
+        
         # Run in background thread (conversion is CPU-heavy)
         self.vq_state._is_converting = True
         thread = threading.Thread(
             target=self._run_conversion,
-            args=(input_files, asm_output_dir, output_name),
+            args=(input_files, asm_output_dir, output_name, cache_key),
             daemon=True
         )
         thread.start()
     
+    @staticmethod
+    def _clean_output_dir(asm_output_dir: str):
+        if os.path.isdir(asm_output_dir):
+            import shutil
+            shutil.rmtree(asm_output_dir)
+        os.makedirs(asm_output_dir, exist_ok=True)
+    
+    def _input_modes(self, n_inputs: int) -> List[int]:
+        """Per-input VQ/RAW flags, padded to the input count (0=VQ)."""
+        modes = [int(bool(m)) for m in self._sample_modes[:n_inputs]]
+        return modes + [0] * (n_inputs - len(modes))
+    
+    def _find_incremental(self, input_files: List[str], asm_output_dir: str,
+                          params: dict) -> Optional[int]:
+        """Index of the single changed (or appended) VQ instrument, else None.
+        
+        Requires the previous conversion in asm_output_dir to have used the
+        same settings and instrument modes.
+        """
+        meta = vq_cache.read_output_meta(asm_output_dir)
+        if meta is None or meta.get('params') != params:
+            return None
+        old_inputs = meta.get('inputs') or []
+        old_modes = meta.get('modes') or []
+        new_inputs = vq_cache.file_digests(input_files)
+        if not old_inputs or not new_inputs:
+            return None
+        modes = self._input_modes(len(input_files))
+        
+        if len(new_inputs) == len(old_inputs):
+            if modes != old_modes:
+                return None
+            changed = [i for i, (a, b) in enumerate(zip(old_inputs, new_inputs)) if a != b]
+        elif (len(new_inputs) == len(old_inputs) + 1
+              and new_inputs[:-1] == old_inputs and modes[:-1] == old_modes):
+            changed = [len(old_inputs)]
+        else:
+            return None
+        
+        if len(changed) != 1 or modes[changed[0]]:
+            return None
+        return changed[0]
+    
+    def _restore_in_place(self, cache_key: str, asm_output_dir: str, params: dict) -> bool:
+        """Reuse asm_output_dir if its vq_meta.json matches cache_key."""
+        if not cache_key:
+            return False
+        meta = vq_cache.read_output_meta(asm_output_dir)
+        if meta is None or meta.get('key') != cache_key:
+            return False
+        stats = meta.get('stats', {})
+        # Seed the cache too, so the result survives the next project load.
+        # Incremental results depend on edit history, not only on content,
+        # so they are never shared through the cache.
+        if not meta.get('incremental'):
+            self.cache.put(cache_key, asm_output_dir, stats=stats, params=params)
+        self._complete_restored(cache_key, asm_output_dir, stats, "embedded project data")
+        return True
+    
+    def _restore_from_cache(self, cache_key: str, asm_output_dir: str) -> bool:
+        """Restore a previous identical conversion. Returns True on hit."""
+        if not cache_key:
+            return False
+        entry = self.cache.get(cache_key, asm_output_dir)
+        if entry is None:
+            return False
+        self._complete_restored(cache_key, asm_output_dir, entry.stats, "cache")
+        return True
+    
+    def _complete_restored(self, cache_key: str, asm_output_dir: str,
+                           stats: dict, source: str):
+        """Finish a conversion synchronously from already-available output."""
+        result = VQResult(output_dir=asm_output_dir, cache_key=cache_key,
+                          from_cache=True)
+        result = self._parse_results(asm_output_dir, result)
+        result.vq_data_size = stats.get('size_bytes', 0)
+        result.vq_only_size = stats.get('vq_size_bytes', 0)
+        result.raw_only_size = stats.get('raw_size_bytes', 0)
+        result.success = True
+        
+        self._queue_output(f"Restored conversion from {source} ({cache_key[:12]})\n")
+        self._queue_output(f"Output: {asm_output_dir}\n")
+        if result.vq_data_size > 0:
+            self._queue_output(f"Atari data: {format_size(result.vq_data_size)}\n")
+        
+        self.vq_state.output_dir = asm_output_dir
+        self.vq_state.converted = True
+        self.vq_state.result = result
+        self.vq_state.completion_result = result
+        self.vq_state.conversion_complete = True
+    
     def _fail(self, message: str):
         """Report immediate failure."""
         self.logger.error(f"Conversion failed: {message}")
@@ -346,9 +469,10 @@ class VQConverter:
         self.vq_state.completion_result = result
         self.vq_state.conversion_complete = True
     
-    def _run_conversion(self, input_files: List[str], asm_output_dir: str, output_name: str):
+    def _run_conversion(self, input_files: List[str], asm_output_dir: str, output_name: str,
+                        cache_key: str = ""):
         """Run PokeyVQBuilder directly (background thread)."""
-        result = VQResult()
+        result = VQResult(cache_key=cache_key)
         
         try:
             from pokey_vq.cli.builder import PokeyVQBuilder
@@ -361,26 +485,29 @@ class VQConverter:
             self._queue_output(f"Settings: rate={settings.rate}, "
                                f"vec={settings.vector_size}, "
                                f"smooth={settings.smoothness}, "
-                               f"enhance={'on' if settings.enhance else 'off'}\n")
+                               f"enhance={'on' if settings.enhance else 'off'}, "
+                               f"seed={settings.seed}\n")
             self._queue_output("-" * 60 + "\n")
             
+            params = conversion_params(settings)
             args = VQArgs(
                 input=input_files,
                 output=output_name,
                 player="vq_multi_channel",
-                rate=settings.rate,
-                channels=1,
-                optimize="speed",
+                rate=params['rate'],
+                channels=params['channels'],
+                optimize=params['optimize'],
                 no_player=True,
-                quality=50.0,
-                smoothness=float(settings.smoothness),
-                codebook=256,
-                iterations=50,
-                min_vector=settings.vector_size,
-                max_vector=settings.vector_size,
-                lbg=False,
-                voltage="off",
-                enhance="on" if settings.enhance else "off",
+                quality=params['quality'],
+                smoothness=params['smoothness'],
+                codebook=params['codebook'],
+                iterations=params['iterations'],
+                seed=params['seed'],
+                min_vector=params['vector_size'],
+                max_vector=params['vector_size'],
+                lbg=params['lbg'],
+                voltage=params['voltage'],
+                enhance=params['enhance'],
                 wav="off",
                 sample_modes=self._sample_modes,
             )
@@ -429,6 +556,18 @@ class VQConverter:
                     
                     result.success = True
                     self.vq_state.output_dir = result.output_dir
+                    if cache_key:
+                        stats = {
+                            'size_bytes': result.vq_data_size,
+                            'vq_size_bytes': result.vq_only_size,
+                            'raw_size_bytes': result.raw_only_size,
+                        }
+                        vq_cache.write_output_meta(
+                            asm_output_dir, cache_key, stats=stats, params=params,
+                            inputs=vq_cache.file_digests(input_files),
+                            modes=self._input_modes(len(input_files)))
+                        self.cache.put(cache_key, asm_output_dir,
+                                       stats=stats, params=params)
                     self._queue_output("\n" + "=" * 60 + "\n")
                     self._queue_output(f"SUCCESS: Conversion complete!\n")
                     self._queue_output(f"Output: {result.output_dir}\n")
@@ -462,6 +601,72 @@ class VQConverter:
             self.vq_state.completion_result = result
             self.vq_state.conversion_complete = True
     
+    def _run_incremental(self, input_files: List[str], inst_idx: int,
+                         asm_output_dir: str, output_name: str, cache_key: str = ""):
+        """Re-encode one instrument against the existing codebook (background thread).
+        
+        Falls back to a full conversion if the codebook no longer fits
+        (segmental SNR check in pokey_vq.cli.incremental) or on any error.
+        """
+        import time
+        stats = None
+        stream = self._make_stream()
+        start = time.time()
+        self._queue_output(f"Instrument {inst_idx} changed: re-encoding against "
+                           f"existing codebook...\n")
+        try:
+            from pokey_vq.cli.incremental import reencode_instrument
+            with redirect_stdout(stream), redirect_stderr(stream):
+                stats = reencode_instrument(asm_output_dir, input_files[inst_idx], inst_idx)
+        except Exception as e:
+            self._queue_output(f"\nIncremental re-encode failed: {e}\n")
+            stats = None
+        finally:
+            stream.flush()
+        
+        if stats is None:
+            self._queue_output("Falling back to full conversion\n")
+            self._queue_output("-" * 60 + "\n")
+            self._clean_output_dir(asm_output_dir)
+            self._run_conversion(input_files, asm_output_dir, output_name, cache_key)
+            return
+        
+        result = VQResult(output_dir=asm_output_dir, cache_key=cache_key)
+        try:
+            result = self._parse_results(asm_output_dir, result)
+            result.vq_data_size = stats.get('size_bytes', 0)
+            result.vq_only_size = stats.get('vq_size_bytes', 0)
+            result.raw_only_size = stats.get('raw_size_bytes', 0)
+            result.success = True
+            if cache_key:
+                meta_stats = {
+                    'size_bytes': result.vq_data_size,
+                    'vq_size_bytes': result.vq_only_size,
+                    'raw_size_bytes': result.raw_only_size,
+                }
+                vq_cache.write_output_meta(
+                    asm_output_dir, cache_key, stats=meta_stats,
+                    params=conversion_params(self.vq_state.settings),
+                    inputs=vq_cache.file_digests(input_files),
+                    modes=self._input_modes(len(input_files)),
+                    incremental=True)
+            self._queue_output(f"SUCCESS: Incremental re-encode in "
+                               f"{time.time() - start:.2f}s "
+                               f"(segSNR {stats.get('segmental_snr_db', 0):.1f} dB)\n")
+            self._queue_output(f"Atari data: {format_size(result.vq_data_size)}\n")
+        except Exception as e:
+            result.success = False
+            result.error_message = str(e)
+            self._queue_output(f"\nERROR: {result.error_message}\n")
+        finally:
+            self.vq_state._is_converting = False
+            if result.success:
+                self.vq_state.output_dir = asm_output_dir
+                self.vq_state.converted = True
+                self.vq_state.result = result
+            self.vq_state.completion_result = result
+            self.vq_state.conversion_complete = True
+    
     def _list_directory(self, path: str):
         """List directory contents for debugging."""
         self._queue_output(f"\nContents of {path}:\n")
@@ -502,6 +707,28 @@ class VQConverter:
         return result
 
 
+def conversion_params(settings: VQSettings) -> dict:
+    """Converter parameters for the given UI settings.
+    
+    Single source of truth for both the VQArgs passed to PokeyVQBuilder and
+    the conversion cache key: everything here affects the converter output.
+    """
+    return {
+        'rate': settings.rate,
+        'vector_size': settings.vector_size,
+        'smoothness': float(settings.smoothness),
+        'enhance': "on" if settings.enhance else "off",
+        'seed': settings.seed,
+        'channels': 1,
+        'optimize': "speed",
+        'quality': 50.0,
+        'codebook': 256,
+        'iterations': 50,
+        'lbg': False,
+        'voltage': "off",
+    }
+
+
 def format_size(size_bytes: int) -> str:
     """Format byte size for display."""
     if size_bytes < 1024:
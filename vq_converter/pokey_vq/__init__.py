@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+# Converter version. Part of the tracker's VQ cache key: bump when encoder
+# or exporter output changes for identical input + settings.
+__version__ = "2.0.0"
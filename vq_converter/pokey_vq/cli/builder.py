@@ -15,9 +15,13 @@ from ..encoders.vq import VQEncoder
 from ..encoders.raw import RawEncoder
 from ..utils.quality import calculate_rmse, calculate_psnr, calculate_lsd
 from ..utils.mads_exporter import MADSExporter
+from ..utils.vq_container import write_container, CONTAINER_FILE
+from ..utils.asm_emit import byte_lines
 from ..core.pokey_table import POKEY_VOLTAGE_TABLE_DUAL, POKEY_VOLTAGE_TABLE_FULL, POKEY_MAP_FULL, POKEY_VOLTAGE_TABLE
 
-from .helpers import get_valid_pal_rates, scan_directory_for_audio, merge_samples
+from .helpers import (get_valid_pal_rates, scan_directory_for_audio, merge_samples, enhance_instrument,
+                      select_export_table)
+from . import incremental
 
 class PokeyVQBuilder:
     def __init__(self, args):
@@ -297,6 +301,8 @@ class PokeyVQBuilder:
         print(f"  Iterations:  {self.args.iterations}")
         print(f"  Vector Len:  {self.args.min_vector} - {self.args.max_vector}")
         print(f"  LBG Init:    {'Enabled' if self.args.lbg else 'Disabled'}")
+        seed = getattr(self.args, 'seed', None)
+        print(f"  Seed:        {seed if seed is not None else 'Random'}")
         
         vol_state = "Active" if self.args.voltage.lower() == 'on' else "Disabled"
         print(f"  Voltage:     {vol_state} (POKEY Hardware Levels)")
@@ -416,25 +422,7 @@ class PokeyVQBuilder:
             # Global normalization would let loud instruments starve quiet ones
             # of POKEY levels (only 16 levels available).
             for b_idx, (b_start, b_end) in enumerate(self.sample_boundaries):
-                seg = audio[b_start:b_end].copy()
-                
-                # 1. High-Pass Filter (50 Hz) - remove DC offset and sub-bass rumble
-                if len(seg) > 12:  # need enough samples for filter
-                    sos = scipy.signal.butter(2, 50, 'hp', fs=sr, output='sos')
-                    seg = scipy.signal.sosfilt(sos, seg)
-                
-                # 2. Gain + Soft Limiter — boost quiet content, prevent clipping
-                input_gain_db = 6.0
-                linear_gain = 10 ** (input_gain_db / 20.0)
-                seg = seg * linear_gain
-                seg = np.tanh(seg)
-                
-                # 3. Per-instrument normalize to full range
-                max_val = np.max(np.abs(seg))
-                if max_val > 0:
-                    seg = seg / max_val
-                
-                audio[b_start:b_end] = seg
+                audio[b_start:b_end] = enhance_instrument(audio[b_start:b_end], sr)
             
             print(f"      - Per-instrument: HP 50Hz + gain +6dB + tanh + normalize")
             print(f"      - {len(self.sample_boundaries)} instruments enhanced independently")
@@ -533,7 +521,8 @@ class PokeyVQBuilder:
                     constrained=(self.args.voltage.lower() == 'on'), 
                     lbg_init=self.args.lbg,
                     channels=self.args.channels,
-                    sample_boundaries=self.sample_boundaries
+                    sample_boundaries=self.sample_boundaries,
+                    seed=getattr(self.args, 'seed', None)
                 )
             
             # Define export path
@@ -666,7 +655,8 @@ class PokeyVQBuilder:
                     "min_vector": self.args.min_vector,
                     "max_vector": self.args.max_vector,
                     "channels": self.args.channels,
-                    "algorithm": self.args.algo
+                    "algorithm": self.args.algo,
+                    "seed": getattr(self.args, 'seed', None)
                 },
                 "stats": {
                     "size_bytes": actual_size,
@@ -690,6 +680,31 @@ class PokeyVQBuilder:
                 json.dump(json_data, f, indent=4)
             print(f"      - Saved Metadata: {json_path}")
 
+            # Codebook state for incremental single-instrument re-encode
+            if (encoder is not None and self.args.algo != 'raw'
+                    and len(vq_index_boundaries) == len(self.sample_boundaries)):
+                inst_indices = [np.asarray(indices[s:e]) for s, e in vq_index_boundaries]
+                snrs = [incremental.instrument_snr(audio[b0:b1], decoded[b0:b1])
+                        for b0, b1 in self.sample_boundaries]
+                incremental.save_state(
+                    self.output_subdir, codebook, inst_indices,
+                    self._vq_orig_indices, [
+                        int(bool(sample_modes[i])) if i < len(sample_modes) else 0
+                        for i in range(n_total)],
+                    self._all_names, snrs, {
+                        "rate": float(self.actual_rate),
+                        "min_vector": self.args.min_vector,
+                        "max_vector": self.args.max_vector,
+                        "lambda_val": float(self.lambda_val),
+                        "alpha": float(self.alpha_val),
+                        "constrained": self.args.voltage.lower() == 'on',
+                        "channels": self.args.channels,
+                        "voltage": self.args.voltage,
+                        "fast": bool(self.args.fast or self.args.optimize == 'speed'),
+                        "enhance": self.args.enhance.lower() == 'on',
+                        "raw_size_bytes": int(getattr(self, 'raw_only_size', 0)),
+                    })
+
         # --- Final Stats ---
         if not has_any_vq:
             # All-RAW: no VQ stats
@@ -1021,13 +1036,8 @@ class PokeyVQBuilder:
             with open(out_path, "w") as f:
                 f.write(f"RAW_DATA_LEN = {len(raw_bytes)}\n")
                 f.write("RAW_DATA\n")
-                
-                # Write .byte chunks
-                chunk_size = 16
-                for i in range(0, len(raw_bytes), chunk_size):
-                    chunk = raw_bytes[i:i+chunk_size]
-                    bytes_str = ",".join([f"${b:02X}" for b in chunk])
-                    f.write(f" .byte {bytes_str}\n")
+                if len(raw_bytes):
+                    f.write(byte_lines(raw_bytes) + "\n")
                     
             print(f"Saved MADS ASM: {out_path}")
         except IOError as e:
@@ -1045,15 +1055,7 @@ class PokeyVQBuilder:
         exporter = MADSExporter()
         
         # Select Table
-        if self.args.channels == 1:
-             table = POKEY_VOLTAGE_TABLE
-             map_full = None
-        elif self.args.voltage.lower() == 'on' and 'POKEY_VOLTAGE_TABLE_FULL' in globals():
-             table = POKEY_VOLTAGE_TABLE_FULL
-             map_full = POKEY_MAP_FULL
-        else:
-             table = POKEY_VOLTAGE_TABLE_DUAL
-             map_full = None
+        table, map_full = select_export_table(self.args.channels, self.args.voltage)
         # Always prebake $10 (AUDC volume-only mode bit) into sample data.
         # The IRQ handler uses conditional assembly:
         #   VOLUME_CONTROL=0: direct STA to AUDC (no ORA needed, saves 2 cycles/ch)
@@ -1086,19 +1088,23 @@ class PokeyVQBuilder:
                 merged_audio = getattr(self, '_merged_audio', None)
                 if merged_audio is not None:
                     # Noise shaping: effective when Nyquist >> audible band
-                    use_ns = self.actual_rate >= 6000
+                    ns_mode = getattr(self.args, 'noise_shaping', 'auto')
+                    if ns_mode == 'auto':
+                        ns_mode = 'first' if self.actual_rate >= 6000 else 'off'
+                    use_ns = ns_mode != 'off'
                     raw_labels = exporter.export_raw_samples(
                         self.output_asm, all_boundaries,
                         merged_audio, sample_modes,
                         sample_names=all_names,
                         audc_prebake=audc_prebake,
-                        noise_shaping=use_ns)
+                        noise_shaping=ns_mode if use_ns else False,
+                        rate=self.actual_rate)
                     n_raw = sum(1 for m in sample_modes if m)
                     total_pages = sum(info[2] for info in raw_labels.values())
                     raw_data_bytes = total_pages * 256
                     self.actual_data_size += raw_data_bytes
                     self.raw_only_size = raw_data_bytes
-                    ns_str = " [noise-shaped]" if use_ns else ""
+                    ns_str = f" [noise-shaped: {ns_mode}]" if use_ns else ""
                     print(f"      - Exported RAW_SAMPLES.asm ({n_raw} RAW instruments, {total_pages} pages, {raw_data_bytes} bytes){ns_str}")
 
             # Pre-compute VQ stream offsets for VQ instruments
@@ -1143,6 +1149,10 @@ class PokeyVQBuilder:
                 sample_names=all_names)
             print(f"      - Exported SAMPLE_DIR.asm ({len(all_boundaries)} instruments: "
                   f"{len(vq_stream_map)} VQ + {len(raw_labels)} RAW)")
+
+            # Same data as one binary file for in-process consumers
+            self._write_container(exporter, len(all_boundaries), vq_stream_map,
+                                  sample_modes)
         
         # Generate RAW_SAMPLES.asm stub if none generated
         raw_samples_path = os.path.join(os.path.dirname(self.output_asm), "RAW_SAMPLES.asm")
@@ -1151,6 +1161,29 @@ class PokeyVQBuilder:
                 f.write("; RAW_SAMPLES.asm - Page-aligned raw AUDC data for RAW instruments\n")
                 f.write("; (Empty - all instruments use VQ compression)\n")
 
+    def _write_container(self, exporter, n_instruments, vq_stream_map, sample_modes):
+        """Write VQ_DATA.bin next to the .asm files (see utils/vq_container)."""
+        samples = []
+        for i in range(n_instruments):
+            if sample_modes and i < len(sample_modes) and sample_modes[i]:
+                samples.append({"mode": "RAW"})
+            else:
+                start, end = vq_stream_map.get(i, (0, 0))
+                samples.append({"mode": "VQ", "index_start": int(start),
+                                "index_end": int(end)})
+        data = exporter.last_export
+        path = os.path.join(os.path.dirname(self.output_asm), CONTAINER_FILE)
+        size = write_container(
+            path, data["codebook"], data["indices"],
+            raw_blocks=getattr(exporter, "last_raw_blocks", {}),
+            samples=samples,
+            vq_lens=data["vq_lens"], vq_offsets=data["vq_offsets"],
+            meta={"rate": float(self.actual_rate),
+                  "min_vector": self.args.min_vector,
+                  "max_vector": self.args.max_vector,
+                  "channels": self.args.channels})
+        print(f"      - Exported {CONTAINER_FILE} ({size} bytes)")
+
     def _generate_config(self, build_cwd):
         """Generate VQ_CFG.asm in the build directory."""
         print(f"  > Generating VQ_CFG.asm...")
@@ -1201,7 +1234,8 @@ class PokeyVQBuilder:
         if self.args.algo == 'raw':
             artifacts = ["RAW_DATA.asm", "VQ_CFG.asm"]
         else:
-            artifacts = ["VQ_LENS.asm", "VQ_LO.asm", "VQ_HI.asm", "VQ_BLOB.asm", "VQ_INDICES.asm", "VQ_CFG.asm", "RAW_SAMPLES.asm"]
+            artifacts = ["VQ_LENS.asm", "VQ_LO.asm", "VQ_HI.asm", "VQ_BLOB.asm", "VQ_INDICES.asm", "VQ_CFG.asm", "RAW_SAMPLES.asm",
+                         CONTAINER_FILE]
         
         if self.args.channels == 1 and not (self.args.fast or self.args.optimize == 'speed'):
             artifacts.append("LUT_NIBBLES.asm")
@@ -3,6 +3,9 @@ import soundfile as sf
 import scipy.signal
 import numpy as np
 
+from ..core.pokey_table import (POKEY_VOLTAGE_TABLE, POKEY_VOLTAGE_TABLE_DUAL,
+                                POKEY_VOLTAGE_TABLE_FULL, POKEY_MAP_FULL)
+
 def get_valid_pal_rates():
     """Returns a dict of {divisor: rate_hz} for PAL POKEY."""
     PAL_FREQ = 1773447
@@ -103,3 +106,46 @@ def merge_samples(input_files, target_sr, alignment=1):
     print(f"    Total: {len(merged_audio)} samples ({len(merged_audio)/target_sr:.2f}s) from {len(boundaries)} files")
     
     return merged_audio, boundaries, names
+
+
+def enhance_instrument(seg, sr):
+    """
+    Apply the per-instrument enhancement chain used by --enhance on.
+    
+    HP 50Hz + gain +6dB + tanh soft limit + normalize to full range.
+    Each instrument is processed independently so quiet instruments keep
+    the full 16 POKEY levels (per-note volume handles relative loudness).
+    """
+    seg = np.array(seg, copy=True)
+    
+    # 1. High-Pass Filter (50 Hz) - remove DC offset and sub-bass rumble
+    if len(seg) > 12:  # need enough samples for filter
+        sos = scipy.signal.butter(2, 50, 'hp', fs=sr, output='sos')
+        seg = scipy.signal.sosfilt(sos, seg)
+    
+    # 2. Gain + Soft Limiter — boost quiet content, prevent clipping
+    input_gain_db = 6.0
+    linear_gain = 10 ** (input_gain_db / 20.0)
+    seg = seg * linear_gain
+    seg = np.tanh(seg)
+    
+    # 3. Per-instrument normalize to full range
+    max_val = np.max(np.abs(seg)) if len(seg) else 0
+    if max_val > 0:
+        seg = seg / max_val
+    
+    return seg
+
+
+def select_export_table(channels, voltage):
+    """
+    Pick the POKEY quantization table used by MADSExporter.export().
+    
+    Returns:
+        (table, map_full) - map_full is None unless dual-channel full map
+    """
+    if channels == 1:
+        return POKEY_VOLTAGE_TABLE, None
+    if str(voltage).lower() == 'on':
+        return POKEY_VOLTAGE_TABLE_FULL, POKEY_MAP_FULL
+    return POKEY_VOLTAGE_TABLE_DUAL, None
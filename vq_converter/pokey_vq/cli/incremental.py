@@ -0,0 +1,275 @@
+"""
+pokey_vq/cli/incremental.py - Incremental single-instrument re-encode.
+
+A full conversion trains the shared codebook over all VQ instruments. When
+only one instrument's audio changes (e.g. an edited effects chain), the
+existing codebook is usually still a good fit: re-run only the Viterbi
+segmentation of that instrument against the stored codebook and splice its
+indices into VQ_INDICES. No k-means, so this takes well under a second.
+
+The builder saves what is needed for this as vq_state.npz next to
+conversion_info.json (float codebook, per-instrument index streams,
+per-instrument segmental SNR). reencode_instrument() returns None whenever
+a full retrain is warranted: no state, RAW instrument, or the new audio
+fits the codebook clearly worse than the trained instruments do.
+"""
+
+import os
+import json
+import numpy as np
+
+from ..encoders.vq import VQEncoder
+from ..utils.quality import calculate_segmental_snr, calculate_snr
+from ..utils.mads_exporter import MADSExporter
+from ..utils.vq_container import write_container, open_container, CONTAINER_FILE
+from .helpers import merge_samples, enhance_instrument, select_export_table
+
+STATE_FILE = "vq_state.npz"
+STATE_VERSION = 1
+
+# Full retrain if the re-encoded instrument's segmental SNR falls more than
+# this far below the mean SNR of the instruments the codebook was trained on.
+SNR_TOLERANCE_DB = 3.0
+
+# Segmental SNR frame size (shorter instruments use plain SNR)
+_SEG_FRAME = 256
+
+
+def instrument_snr(original, decoded):
+    """Quality of one instrument's encoding in dB (segmental SNR)."""
+    if len(original) > _SEG_FRAME:
+        return float(calculate_segmental_snr(original, decoded, frame_size=_SEG_FRAME))
+    return float(np.clip(calculate_snr(original, decoded), -10, 50))
+
+
+def save_state(output_dir, codebook, inst_indices, vq_orig_indices,
+               sample_modes, sample_names, snrs, config):
+    """
+    Save the data needed for incremental re-encoding.
+
+    Args:
+        output_dir: Converter output directory
+        codebook: List of codebook vectors (0..1 domain)
+        inst_indices: Per-VQ-instrument index arrays (VQ order)
+        vq_orig_indices: VQ order -> original instrument index
+        sample_modes: Per-instrument mode flags for ALL instruments (0=VQ, 1=RAW)
+        sample_names: Per-instrument names for ALL instruments
+        snrs: Per-VQ-instrument segmental SNR (VQ order)
+        config: Encoder/export settings (rate, vectors, lambda, alpha, ...)
+    """
+    counts = [len(ix) for ix in inst_indices]
+    stream = (np.concatenate(inst_indices) if inst_indices
+              else np.array([], dtype=np.int32))
+    np.savez(
+        os.path.join(output_dir, STATE_FILE),
+        version=np.int32(STATE_VERSION),
+        codebook_flat=np.concatenate([np.asarray(v, dtype=np.float64) for v in codebook]),
+        codebook_lens=np.array([len(v) for v in codebook], dtype=np.int32),
+        indices=stream.astype(np.int32),
+        index_counts=np.array(counts, dtype=np.int32),
+        vq_orig_indices=np.array(vq_orig_indices, dtype=np.int32),
+        sample_modes=np.array([int(bool(m)) for m in sample_modes], dtype=np.int32),
+        sample_names=np.array(sample_names, dtype=str),
+        snr=np.array(snrs, dtype=np.float64),
+        config=np.array(json.dumps(config)),
+    )
+
+
+def load_state(output_dir):
+    """Load vq_state.npz as a dict of Python lists (None if absent/invalid)."""
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != STATE_VERSION:
+                return None
+            lens = data["codebook_lens"]
+            flat = data["codebook_flat"]
+            offsets = np.concatenate([[0], np.cumsum(lens)])
+            codebook = [flat[offsets[i]:offsets[i + 1]] for i in range(len(lens))]
+            stream = data["indices"]
+            counts = data["index_counts"]
+            bounds = np.concatenate([[0], np.cumsum(counts)])
+            return {
+                "codebook": codebook,
+                "inst_indices": [stream[bounds[i]:bounds[i + 1]] for i in range(len(counts))],
+                "vq_orig_indices": [int(x) for x in data["vq_orig_indices"]],
+                "sample_modes": [int(x) for x in data["sample_modes"]],
+                "sample_names": [str(x) for x in data["sample_names"]],
+                "snr": [float(x) for x in data["snr"]],
+                "config": json.loads(str(data["config"])),
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def reencode_instrument(output_dir, input_file, inst_idx,
+                        tolerance_db=SNR_TOLERANCE_DB):
+    """
+    Re-encode one instrument against the stored codebook, in place.
+
+    Args:
+        output_dir: Converter output directory holding vq_state.npz
+        input_file: New audio for the instrument
+        inst_idx: Original instrument index. == instrument count appends
+                  a new VQ instrument.
+        tolerance_db: Allowed segmental SNR drop vs the trained instruments
+
+    Returns:
+        Stats dict (size_bytes, vq_size_bytes, raw_size_bytes,
+        segmental_snr_db, reference_snr_db), or None if a full retrain
+        is needed. Output files are only touched on success.
+    """
+    state = load_state(output_dir)
+    if state is None:
+        print("  > Incremental: no codebook state, full conversion needed")
+        return None
+
+    cfg = state["config"]
+    modes = state["sample_modes"]
+    n_total = len(modes)
+    if inst_idx > n_total or (inst_idx < n_total and modes[inst_idx]):
+        print(f"  > Incremental: instrument {inst_idx} is not a VQ instrument slot")
+        return None
+
+    rate = cfg["rate"]
+    align = cfg["min_vector"] if cfg["min_vector"] == cfg["max_vector"] else 1
+    audio, _bounds, names = merge_samples([input_file], rate, alignment=align)
+    if audio is None or len(audio) == 0:
+        return None
+    if cfg.get("enhance"):
+        audio = enhance_instrument(audio, rate)
+
+    codebook = state["codebook"]
+    encoder = VQEncoder(
+        rate=rate,
+        min_len=cfg["min_vector"],
+        max_len=cfg["max_vector"],
+        lambda_val=cfg["lambda_val"],
+        codebook_size=len(codebook),
+        vq_alpha=cfg["alpha"],
+        constrained=cfg.get("constrained", False),
+        channels=cfg["channels"],
+    )
+    indices, decoded = encoder.encode(audio, codebook)
+
+    # Quality gate: compare against how well the codebook fits the
+    # instruments it was trained on
+    snr = instrument_snr(audio, decoded)
+    reference = float(np.mean(state["snr"])) if state["snr"] else snr
+    print(f"  > Incremental: instrument {inst_idx} segSNR {snr:.2f} dB "
+          f"(codebook reference {reference:.2f} dB)")
+    if snr < reference - tolerance_db:
+        print(f"  > Incremental: quality drop > {tolerance_db:.1f} dB, full retrain needed")
+        return None
+
+    # Splice the new indices in (replace) or append a new instrument
+    inst_indices = state["inst_indices"]
+    vq_orig = state["vq_orig_indices"]
+    snrs = state["snr"]
+    sample_names = state["sample_names"]
+    if inst_idx < n_total:
+        slot = vq_orig.index(inst_idx)
+        inst_indices[slot] = indices
+        snrs[slot] = snr
+        sample_names[inst_idx] = names[0]
+    else:
+        modes.append(0)
+        vq_orig.append(inst_idx)
+        inst_indices.append(indices)
+        snrs.append(snr)
+        sample_names.append(names[0])
+        n_total += 1
+
+    stream = np.concatenate(inst_indices)
+    table, map_full = select_export_table(cfg["channels"], cfg.get("voltage", "off"))
+    exporter = MADSExporter()
+    asm_path = os.path.join(output_dir, "VQ.asm")
+    vq_size = exporter.export(asm_path, codebook, stream, table, map_full,
+                              fast=cfg["fast"], channels=cfg["channels"],
+                              audc_prebake=True)
+
+    vq_stream_map = {}
+    pos = 0
+    for orig_idx, ix in zip(vq_orig, inst_indices):
+        vq_stream_map[orig_idx] = (pos, pos + len(ix))
+        pos += len(ix)
+    # RAW_SAMPLES.asm is unchanged; only its labels are referenced here
+    raw_labels = {i: (f"RAW_INST_{i:02d}", f"RAW_INST_{i:02d}_END", 0)
+                  for i in range(n_total) if modes[i]}
+    exporter.export_sample_directory_mixed(
+        asm_path, n_total,
+        vq_stream_map=vq_stream_map,
+        raw_labels=raw_labels,
+        sample_modes=modes,
+        sample_names=sample_names)
+
+    _rewrite_container(output_dir, exporter, modes, vq_stream_map, cfg)
+
+    raw_size = cfg.get("raw_size_bytes", 0)
+    stats = {
+        "size_bytes": vq_size + raw_size,
+        "vq_size_bytes": vq_size,
+        "raw_size_bytes": raw_size,
+        "segmental_snr_db": round(snr, 2),
+        "reference_snr_db": round(reference, 2),
+    }
+    _update_conversion_info(output_dir, input_file, inst_idx, vq_stream_map, stats)
+
+    save_state(output_dir, codebook, inst_indices, vq_orig, modes,
+               sample_names, snrs, cfg)
+    return stats
+
+
+def _rewrite_container(output_dir, exporter, modes, vq_stream_map, cfg):
+    """Rewrite VQ_DATA.bin with the new indices, keeping its RAW blocks."""
+    old = open_container(output_dir)
+    raw_blocks = {}
+    meta = {}
+    if old is not None:
+        with old:
+            raw_blocks = {i: bytes(b) for i, b in old.raw_blocks().items()}
+            meta = {k: v for k, v in old.header.items()
+                    if k not in ("samples", "sections")}
+    else:
+        meta = {"rate": float(cfg["rate"]), "min_vector": cfg["min_vector"],
+                "max_vector": cfg["max_vector"], "channels": cfg["channels"]}
+    samples = []
+    for i, mode in enumerate(modes):
+        if mode:
+            samples.append({"mode": "RAW"})
+        else:
+            start, end = vq_stream_map.get(i, (0, 0))
+            samples.append({"mode": "VQ", "index_start": int(start),
+                            "index_end": int(end)})
+    data = exporter.last_export
+    write_container(os.path.join(output_dir, CONTAINER_FILE),
+                    data["codebook"], data["indices"], raw_blocks=raw_blocks,
+                    samples=samples, vq_lens=data["vq_lens"],
+                    vq_offsets=data["vq_offsets"], meta=meta)
+
+
+def _update_conversion_info(output_dir, input_file, inst_idx, vq_stream_map, stats):
+    """Patch index ranges and sizes in conversion_info.json."""
+    path = os.path.join(output_dir, "conversion_info.json")
+    try:
+        with open(path, "r") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return
+    samples = info.setdefault("samples", [])
+    if inst_idx >= len(samples):
+        samples.append({"original_file": os.path.basename(input_file), "mode": "VQ"})
+    samples[inst_idx]["original_file"] = os.path.basename(input_file)
+    samples[inst_idx]["original_path"] = input_file
+    for orig_idx, (start, end) in vq_stream_map.items():
+        if orig_idx < len(samples):
+            samples[orig_idx]["index_start"] = int(start)
+            samples[orig_idx]["index_end"] = int(end)
+    info_stats = info.setdefault("stats", {})
+    info_stats["size_bytes"] = stats["size_bytes"]
+    info_stats["vq_size_bytes"] = stats["vq_size_bytes"]
+    info_stats["state"] = "incremental"
+    with open(path, "w") as f:
+        json.dump(info, f, indent=4)
@@ -135,6 +135,10 @@ Parameters Detail:
     group.add_argument('--lbg', '-l', action='store_true', 
                        help='Use LBG/K-Means++ initialization (Slower, better quality)')
 
+    group.add_argument('--seed', type=int, default=None,
+                       help='RNG seed for codebook training. Same input + settings + seed\n'
+                            'give byte-identical output. Default: random')
+
     # Advanced / Legacy
     group.add_argument('-i', '--iterations', type=int, default=50, 
                        help='Max VQ iterations. Default: 50')
@@ -151,6 +155,12 @@ Parameters Detail:
     group.add_argument('-v', '--voltage', type=str, choices=['on', 'off'], default='off',
                        help='Constrain VQ to POKEY voltage levels. (Default: off)')
     
+    group.add_argument('--noise-shaping', type=str, default='auto',
+                       choices=['auto', 'off', 'first', 'second', 'weighted'],
+                       help='Noise shaping filter for RAW instruments.\n'
+                            'auto = first-order at rates >= 6000 Hz, else off.\n'
+                            'second = 2nd-order, weighted = psychoacoustic 3rd-order')
+    
     # Legacy -c / --constrained needs to be handled if we want to support it
     group.add_argument('--constrained', action='store_true', help=argparse.SUPPRESS)
                        
@@ -26,7 +26,7 @@ class VQEncoder(Encoder):
                  lambda_val=0.01, codebook_size=256, 
                  max_iterations=50, max_time=300,
                  vq_alpha=0.0, constrained=False, lbg_init=False,
-                 channels=2, sample_boundaries=None):
+                 channels=2, sample_boundaries=None, seed=None):
         super().__init__(f"VQVariable_{rate}Hz_Len{min_len}-{max_len}_L{lambda_val}_A{vq_alpha}{'_Cnst' if constrained else ''}{'_Mono' if channels==1 else ''}")
         self.rate = rate
         self.min_len = min_len
@@ -42,6 +42,9 @@ class VQEncoder(Encoder):
         self.channels = channels
         # Multi-sample: list of (start, end) tuples in sample units
         self.sample_boundaries = sample_boundaries if sample_boundaries else []
+        # RNG seed for codebook training. Same input + settings + seed gives
+        # byte-identical VQ_BLOB/VQ_INDICES (None = non-deterministic).
+        self.seed = seed
         
     def run(self, audio, sr, bin_export_path=None, fast=False):
         # 1. Preprocess
@@ -80,7 +83,8 @@ class VQEncoder(Encoder):
             self.constrained,
             self.lbg_init,
             channels=self.channels,
-            sample_boundaries=self.sample_boundaries
+            sample_boundaries=self.sample_boundaries,
+            seed=self.seed
         )
         
         codebook_entries, indices = generator.train(
@@ -135,7 +139,35 @@ class VQEncoder(Encoder):
             
         return size, decoded_resampled, elapsed, codebook_entries, indices
 
+    def encode(self, audio, codebook_entries):
+        """
+        Encode audio against an existing codebook (no training).
+
+        Used for incremental re-encoding of a single instrument: the shared
+        codebook stays fixed, only the Viterbi segmentation is recomputed.
 
+        Args:
+            audio: Samples in -1..1 at self.rate (already aligned to min_len
+                   for fixed-length vectors)
+            codebook_entries: Codebook vectors in the 0..1 domain
+
+        Returns:
+            (indices, decoded) - decoded is in -1..1, same length as audio
+        """
+        audio_norm = np.clip((np.asarray(audio) + 1.0) / 2.0, 0.0, 1.0)
+        generator = VariableCodebookGenerator(
+            len(codebook_entries),
+            self.min_len,
+            self.max_len,
+            self.lambda_val,
+            self.vq_alpha,
+            self.constrained,
+            channels=self.channels,
+            seed=self.seed
+        )
+        indices, _cost, _segmentation = generator._viterbi(audio_norm, codebook_entries)
+        decoded = self._reconstruct(codebook_entries, indices, len(audio_norm))
+        return indices, (decoded - 0.5) * 2.0
 
     def _reconstruct(self, codebook_entries, indices, total_samples):
         output = np.zeros(total_samples, dtype=np.float32)
@@ -378,7 +410,7 @@ class VQEncoder(Encoder):
 
 
 class VariableCodebookGenerator:
-    def __init__(self, size, min_len, max_len, lambda_val, vq_alpha=0.0, constrained=False, lbg_init=False, channels=2, sample_boundaries=None):
+    def __init__(self, size, min_len, max_len, lambda_val, vq_alpha=0.0, constrained=False, lbg_init=False, channels=2, sample_boundaries=None, seed=None):
         self.size = size
         self.min_len = min_len
         self.max_len = max_len
@@ -388,6 +420,11 @@ class VariableCodebookGenerator:
         self.lbg_init = lbg_init
         self.channels = channels
         
+        # Isolated RNG: never touch global np.random / random state, so
+        # training is reproducible and independent of other callers.
+        self.rng = np.random.default_rng(seed)
+        self.seed = seed
+        
         # Multi-sample boundaries: set of end positions where vectors must terminate
         self.boundary_ends = set()
         if sample_boundaries:
@@ -430,8 +467,8 @@ class VariableCodebookGenerator:
         else:
              # Initialize codebook with random segments from audio
              for i in range(self.size):
-                 l = np.random.choice(possible_lengths)
-                 start = np.random.randint(0, len(audio) - l)
+                 l = int(self.rng.choice(possible_lengths))
+                 start = int(self.rng.integers(0, len(audio) - l))
                  segment = audio[start : start + l]
                  entries.append(segment)
             
@@ -440,7 +477,10 @@ class VariableCodebookGenerator:
         t_start = time.time()
         
         for iteration in range(max_iterations):
-            if time.time() - t_start > max_time:
+            # A wall-clock cutoff would make the result depend on machine
+            # speed, so seeded runs are bounded by max_iterations only.
+            if self.seed is None and time.time() - t_start > max_time:
+                print(f"    Time limit ({max_time}s) reached after {iteration} iterations; stopping early.")
                 break
                 
             print(f"Iteration {iteration+1}/{max_iterations}...")
@@ -600,76 +640,62 @@ class VariableCodebookGenerator:
     def _initialize_kmeans_pp(self, audio):
         """
         K-Means++ initialization for variable length segments.
+
+        Draws a pool of size*20 random segments, then picks centroids with
+        probability proportional to the squared distance to the nearest
+        already-picked centroid of the same length. A running min-distance
+        array over the whole pool is updated with one matrix operation per
+        pick, so the cost is O(K * pool) numpy work instead of Python loops.
+        Pool vectors whose length has no centroid yet count as distance 1000.
         """
-        import random
+        rng = self.rng
         
-        # 1. Harvest a candidate pool
+        # 1. Harvest a candidate pool (lengths + start offsets)
         pool_size = self.size * 20 # Large pool
-        pool = []
-        possible_lengths = list(range(self.min_len, self.max_len + 1))
-        
-        for _ in range(pool_size):
-            l = random.choice(possible_lengths)
-            if len(audio) > l:
-                start = random.randint(0, len(audio) - l)
-                pool.append(audio[start:start+l])
+        possible_lengths = np.arange(self.min_len, self.max_len + 1)
+        lengths = rng.choice(possible_lengths, size=pool_size)
+        lengths = lengths[lengths < len(audio)]
         
-        if not pool:
+        if len(lengths) == 0:
             return [np.zeros(self.min_len)] * self.size
-
+        
+        starts = rng.integers(0, len(audio) - lengths + 1)
+        
+        # Group pool by vector length: {l: (pool positions, (n_l, l) matrix)}
+        groups = {}
+        for l in np.unique(lengths):
+            pos = np.flatnonzero(lengths == l)
+            windows = np.lib.stride_tricks.sliding_window_view(audio, int(l))
+            groups[int(l)] = (pos, windows[starts[pos]])
+        
+        # Squared distance of each pool vector to its nearest compatible centroid
+        min_dist = np.full(len(lengths), 1000.0) # Large constant
+        
+        def pick(i):
+            l = int(lengths[i])
+            vec = np.array(audio[starts[i]:starts[i] + l])
+            pos, mat = groups[l]
+            d = np.sum((mat - vec) ** 2, axis=1)
+            min_dist[pos] = np.minimum(min_dist[pos], d)
+            return vec
+        
         # 2. Pick first centroid
-        entries = []
-        first = random.choice(pool)
-        entries.append(first)
+        entries = [pick(int(rng.integers(len(lengths))))]
         
-        # 3. Pick remaining
+        # 3. Pick remaining (D^2 weighted)
         for _ in range(1, self.size):
-            # Optimization: approximate K-Means++
-            # Sample a chunk of candidates
-            candidates = random.sample(pool, 100) 
-            
-            # Calculate distance of each candidate to the NEAREST existing centroid
-            dists = []
-            valid_candidates = []
-            
-            for cand in candidates:
-                cand_len = len(cand)
-                compatible_entries = [e for e in entries if len(e) == cand_len]
-                
-                if not compatible_entries:
-                     min_dist = 1000.0 # Large constant
-                else:
-                     # Min dist to compatible
-                     min_dist = float('inf')
-                     for e in compatible_entries:
-                         d = np.sum((cand - e)**2)
-                         if d < min_dist:
-                             min_dist = d
-                
-                dists.append(min_dist)
-                valid_candidates.append(cand)
-            
-            # Probabilistic Selection (Weighted Random)
-            total_dist = sum(dists)
-            if total_dist == 0:
-                 best_candidate = random.choice(candidates)
+            total_dist = min_dist.sum()
+            if total_dist <= 0:
+                chosen = int(rng.integers(len(lengths)))
             else:
-                 probs = np.array([d / total_dist for d in dists])
-                 probs_sum = np.sum(probs)
-                 if probs_sum > 0:
-                     probs = probs / probs_sum
-                 
-                 chosen_idx = np.random.choice(len(valid_candidates), p=probs)
-                 best_candidate = valid_candidates[chosen_idx]
-            
-            entries.append(best_candidate)
+                chosen = int(rng.choice(len(lengths), p=min_dist / total_dist))
+            entries.append(pick(chosen))
             
         return entries
             
     def _adapt_codebook(self, entries, audio, segmentation_map):
-        used_indices = set(segmentation_map.keys())
-        all_indices = set(range(len(entries)))
-        dead_indices = list(all_indices - used_indices)
+        used_indices = sorted(segmentation_map.keys())
+        dead_indices = sorted(set(range(len(entries))) - set(used_indices))
         
         if not dead_indices:
             return entries
@@ -694,7 +720,7 @@ class VariableCodebookGenerator:
             dead_idx = dead_indices[i]
             worst_err, worst_idx = errors[i]
             victim_vec = entries[worst_idx]
-            noise = np.random.normal(0, 0.01, size=len(victim_vec))
+            noise = self.rng.normal(0, 0.01, size=len(victim_vec))
             entries[dead_idx] = victim_vec + noise
             entries[worst_idx] = victim_vec - noise
             
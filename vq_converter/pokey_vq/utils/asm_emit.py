@@ -0,0 +1,84 @@
+"""
+pokey_vq/utils/asm_emit.py - Fast MADS data emission.
+
+Formats whole byte arrays as `.byte $XX,...` lines with NumPy: every line
+is assembled as a row of an ASCII character matrix and the text is decoded
+once, instead of one f-string per byte. Used by the converter's exporter
+and by the tracker's build step (song and bank data files).
+
+For bulk data the build can skip text entirely: write_binary() + ins_line()
+keep the label in the .asm file and let MADS insert the bytes verbatim.
+"""
+
+import numpy as np
+
+_HEX = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+
+
+def _as_uint8(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return np.frombuffer(data, dtype=np.uint8)
+    return np.asarray(data).astype(np.uint8, copy=False).ravel()
+
+
+def _rows(values, prefix):
+    """Text of full-width rows: values is (n_rows, per_line) uint8."""
+    n_rows, per_line = values.shape
+    cells = np.empty((n_rows, per_line, 4), dtype=np.uint8)
+    cells[:, :, 0] = ord("$")
+    cells[:, :, 1] = _HEX[values >> 4]
+    cells[:, :, 2] = _HEX[values & 0x0F]
+    cells[:, :, 3] = ord(",")
+    cells[:, -1, 3] = ord("\n")
+    pre = np.frombuffer(prefix.encode("ascii"), dtype=np.uint8)
+    text = np.concatenate(
+        [np.broadcast_to(pre, (n_rows, len(pre))), cells.reshape(n_rows, -1)], axis=1)
+    return text.tobytes().decode("ascii")
+
+
+def byte_lines(data, per_line=16, prefix=" .byte "):
+    """
+    Format bytes as MADS data lines.
+
+    Args:
+        data: bytes-like or integer array (values are taken modulo 256)
+        per_line: Values per line
+        prefix: Text before the values on each line (directive + indent)
+
+    Returns:
+        The lines joined by newlines, without a trailing newline (empty
+        string for empty data) -- same as "\\n".join() of per-line strings.
+    """
+    values = _as_uint8(data)
+    n = len(values)
+    if n == 0:
+        return ""
+    n_full = n // per_line
+    parts = []
+    if n_full:
+        parts.append(_rows(values[:n_full * per_line].reshape(n_full, per_line), prefix))
+    if n % per_line:
+        parts.append(_rows(values[n_full * per_line:].reshape(1, -1), prefix))
+    return "".join(parts)[:-1]
+
+
+def write_asm(path, parts):
+    """Write text parts joined by newlines with a single buffered write."""
+    with open(path, "w", buffering=1 << 20) as f:
+        f.write("\n".join(parts))
+
+
+def ins_line(bin_name, offset=None, length=None, indent="    "):
+    """MADS `ins` directive that includes bin_name (or a byte range of it)."""
+    line = f"{indent}ins '{bin_name}'"
+    if offset is not None:
+        line += f",${offset:04X}"
+        if length is not None:
+            line += f",${length:04X}"
+    return line
+
+
+def write_binary(path, data):
+    """Write a data block for inclusion via ins_line()."""
+    with open(path, "wb") as f:
+        f.write(data)
@@ -2,6 +2,24 @@ import numpy as np
 import os
 import time
 
+from .asm_emit import byte_lines
+
+
+def quantize_nearest(values, table):
+    """
+    Index of the nearest table level for each value (ties go to the upper
+    level; values above the table map to its last entry).
+    """
+    table = np.asarray(table, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    idx = np.searchsorted(table, values)
+    top = len(table) - 1
+    below = np.clip(idx - 1, 0, top)
+    at = np.clip(idx, 0, top)
+    use_below = ((idx > 0) & (idx <= top)
+                 & (np.abs(values - table[below]) < np.abs(values - table[at])))
+    return np.where(idx > top, top, np.where(use_below, below, at)).astype(np.int64)
+
 class MADSExporter:
     """
     Exports VQVariable Codebook and Indices to Atari MADS Assembler format.
@@ -27,96 +45,64 @@ class MADSExporter:
             channels: 1 for single channel, 2 for dual channel
             audc_prebake: If True, store $10|vol (AUDC-ready). If False, store raw 0-15.
         """
-        print(f"DEBUG: MADSExporter.export called with fast={fast}, channels={channels}")
-        
         # Quantization Table normalization
         table = pokey_table_dual
         if len(table) > 0 and table[-1] > 0: 
             table = table / table[-1]
         
-        lengths = []
-        blob_offsets = [] 
-        blob_bytes = bytearray()
-        
-        current_offset = 0
+        lengths = [len(vec) for vec in codebook_entries]
         
         # 1. Build Blob and Tables
-        for vec in codebook_entries:
-            lengths.append(len(vec))
+        # Quantize all codebook samples at once (nearest table level)
+        if codebook_entries:
+            flat = np.concatenate([np.asarray(vec, dtype=np.float64) for vec in codebook_entries])
+        else:
+            flat = np.zeros(0)
+        levels = quantize_nearest(flat, table)
+        
+        # Per-sample bytes in the player's format
+        if channels == 1:
+            vol = (levels & 0x0F).astype(np.uint8)
+            if fast:
+                # 1 byte per sample (unpacked), optionally pre-masked for AUDC
+                per_sample = vol | 0x10 if audc_prebake else vol
+            else:
+                per_sample = vol
+        else:
+            if pokey_map_full is not None:
+                # Full map case (Standard): byte = (Ch2 << 4) | Ch1
+                byte_val = np.asarray(pokey_map_full)[levels]
+                v_ch2 = (byte_val >> 4) & 0x0F
+                v_ch1 = byte_val & 0x0F
+            else:
+                # Standard Balanced (Fallback): Ch1 gets the larger half
+                v_ch2 = levels // 2
+                v_ch1 = levels - v_ch2
+            if fast:
+                # Interleaved: 2 bytes per sample, ready for AUDC1/AUDC2
+                per_sample = np.stack([0x10 | v_ch1, 0x10 | v_ch2], axis=1).astype(np.uint8)
+            else:
+                # Packed: 1 byte per sample
+                # Player extracts: AND #$0F = Ch1 (low nibble), LSR x4 = Ch2 (high nibble)
+                per_sample = ((v_ch2 << 4) | v_ch1).astype(np.uint8)
+        
+        blob_offsets = []
+        chunks = []
+        current_offset = 0
+        pos = 0
+        for n in lengths:
             blob_offsets.append(current_offset)
-            
-            # Single Channel Packing Buffer
-            nibble_buffer = None
-            
-            # Quantize each sample in vector
-            for val in vec:
-                # 1. Determine Channel Values
-                idx = np.searchsorted(table, val)
-                if idx == len(table): idx = len(table) - 1
-                elif idx > 0 and np.abs(val - table[idx-1]) < np.abs(val - table[idx]): idx -= 1
-
-                if channels == 1:
-                    # --- Single Channel ---
-                    if fast:
-                        # 1 byte per sample (unpacked)
-                        vol = idx & 0x0F
-                        byte_val = vol | 0x10 if audc_prebake else vol
-                        blob_bytes.append(byte_val)
-                    else:
-                        # --- Single Channel Packing (Size Optimized) ---
-                        # idx is the value (0-15) directly (assuming linear table passed)
-                        nibble = idx & 0x0F
-                        
-                        if nibble_buffer is None:
-                            # Store Low Nibble (Frame T) - even samples
-                            nibble_buffer = nibble
-                        else:
-                            # Pack High Nibble (Frame T+1) - odd samples
-                            # Byte format: [Hi=T+1 | Lo=T]
-                            packed = (nibble << 4) | nibble_buffer
-                            blob_bytes.append(packed)
-                            nibble_buffer = None
-                        
-                else:
-                    # --- Dual Channel ---
-                    if pokey_map_full is not None:
-                        # Full map case (Standard)
-                        byte_val = pokey_map_full[idx]
-                        # Standard Full Map: byte = (Ch2 << 4) | Ch1
-                        v_ch2 = (byte_val >> 4) & 0x0F
-                        v_ch1 = byte_val & 0x0F
-                        mask_ch1 = 0x10
-                        mask_ch2 = 0x10
-                    else:
-                        # Standard Balanced (Fallback)
-                        v1 = idx // 2
-                        v2 = idx - v1
-                        # Mapping: Ch1=v2, Ch2=v1 (Low->Ch1, High->Ch2)
-                        v_ch1 = v2
-                        v_ch2 = v1
-                        mask_ch1 = 0x10
-                        mask_ch2 = 0x10
-    
-                    # 2. Store (Fast/Interleaved vs Packed)
-                    if fast:
-                        # Interleaved: 2 bytes per sample (pre-masked for AUDC)
-                        # This format is ready to write directly to AUDC1/AUDC2
-                        blob_bytes.append(mask_ch1 | v_ch1)  # AUDC1 value
-                        blob_bytes.append(mask_ch2 | v_ch2)  # AUDC2 value
-                    else:
-                        # Packed: 1 byte per sample
-                        # Player extracts: AND #$0F = Ch1 (low nibble), LSRÃ—4 = Ch2 (high nibble)
-                        packed = (v_ch2 << 4) | v_ch1
-                        blob_bytes.append(packed)
-            
-            # Handle Odd Lengths (Single Channel)
-            if channels == 1 and nibble_buffer is not None:
-                # Pad with 0 for last nibble
-                packed = (0 << 4) | nibble_buffer
-                blob_bytes.append(packed)
-
-            # Update Offsets based on ACTUAL bytes written
-            current_offset = len(blob_bytes)
+            vec = per_sample[pos:pos + n]
+            pos += n
+            if channels == 1 and not fast:
+                # Nibble-pack: [Hi=T+1 | Lo=T]; odd length pads high nibble with 0
+                if n % 2:
+                    vec = np.append(vec, np.uint8(0))
+                vec = (vec[1::2] << 4) | vec[0::2]
+            vec = np.ascontiguousarray(vec, dtype=np.uint8).ravel()
+            chunks.append(vec)
+            current_offset += len(vec)
+        blob_bytes = bytearray(np.concatenate(chunks).tobytes() if chunks else b"")
             
         # Pad tables to 256 entries IF size < 256
         target_size = len(lengths)
@@ -125,6 +111,14 @@ class MADSExporter:
             while len(lengths) < 256:
                 lengths.append(0)
                 blob_offsets.append(0)
+
+        # Keep the binary form for the VQ_DATA.bin container
+        self.last_export = {
+            "codebook": bytes(blob_bytes),
+            "vq_lens": bytes(l & 0xFF for l in lengths),
+            "vq_offsets": b"".join((o & 0xFFFF).to_bytes(2, "little") for o in blob_offsets),
+            "indices": np.asarray(indices).astype(np.uint8).tobytes(),
+        }
             
         # 2. Prepare Output Directory
         output_dir = os.path.dirname(filepath)
@@ -132,19 +126,14 @@ class MADSExporter:
         
         # Helper for byte arrays
         def to_mads_array(label, data):
-            out = []
-            out.append(f"{label}")
-            for i in range(0, len(data), 16):
-                chunk = data[i:i+16]
-                bytes_str = ",".join(f"${b:02X}" for b in chunk)
-                out.append(f" .byte {bytes_str}")
-            return "\n".join(out)
+            if len(data) == 0:
+                return label
+            return f"{label}\n{byte_lines(data)}"
             
         def write_asm(filename, content):
             full_path = os.path.join(output_dir, filename)
             with open(full_path, 'w') as f:
                 f.write(content)
-            # print(f"Saved MADS ASM: {full_path}")
 
         # 3. Generate Split Files
         
@@ -178,7 +167,7 @@ class MADSExporter:
         
         # VQ_INDICES.asm
         lines = [f"VQ_INDICES_LEN = {len(indices)}"]
-        lines.append(to_mads_array("VQ_INDICES", indices.astype(np.uint8)))
+        lines.append(to_mads_array("VQ_INDICES", np.asarray(indices).astype(np.uint8)))
         write_asm("VQ_INDICES.asm", "\n".join(lines))
         
         # FIX: Generate LUT for single-channel player optimization
@@ -210,15 +199,18 @@ class MADSExporter:
         return len(blob_bytes) + len(indices)
 
     def export_raw_samples(self, filepath, sample_boundaries, audio, sample_modes,
-                           sample_names=None, audc_prebake=True, noise_shaping=False):
+                           sample_names=None, audc_prebake=True, noise_shaping=False,
+                           rate=None):
         """Generate RAW_SAMPLES.asm with page-aligned volume data for RAW instruments.
 
         Uses RawEncoder.quantize() for optimal quantization against the POKEY
-        voltage table, with optional 1st-order noise shaping.
+        voltage table, with optional error-feedback noise shaping.
 
         Args:
             audc_prebake: If True, store $10|vol. If False, store raw 0-15.
-            noise_shaping: If True, use error-feedback noise shaping.
+            noise_shaping: False, True/'first', 'second', 'weighted' or
+                feedback coefficients (see RawEncoder.quantize).
+            rate: Sample rate in Hz (needed by 'weighted' noise shaping)
 
         Returns:
             dict: {inst_idx: (label_start, label_end, n_pages)} for RAW instruments
@@ -231,6 +223,7 @@ class MADSExporter:
             output_dir = "."
 
         raw_labels = {}
+        self.last_raw_blocks = {}
         lines = []
         lines.append("; RAW_SAMPLES.asm - Page-aligned sample data for RAW instruments")
         lines.append("; Generated by PokeyVQ")
@@ -254,7 +247,7 @@ class MADSExporter:
 
             # Quantize using shared RawEncoder method (single-channel 16-level table)
             vol_indices = RawEncoder.quantize(segment, POKEY_VOLTAGE_TABLE,
-                                             noise_shaping=noise_shaping)
+                                             noise_shaping=noise_shaping, rate=rate)
 
             # Store as volume bytes (0-15) or pre-baked AUDC ($10|vol)
             if audc_prebake:
@@ -270,15 +263,14 @@ class MADSExporter:
                 audc_bytes = np.concatenate([audc_bytes, pad])
 
             raw_labels[i] = (label, label_end, n_pages)
+            self.last_raw_blocks[i] = np.asarray(audc_bytes, dtype=np.uint8).tobytes()
 
             lines.append(f"; Instrument {i}: {name} ({n_samples} samples, {n_pages} pages)")
             lines.append(f"    .align $100       ; page-align to 256 bytes")
             lines.append(f"{label}")
 
-            for offset in range(0, len(audc_bytes), 16):
-                chunk = audc_bytes[offset:offset + 16]
-                hex_str = ",".join(f"${b:02X}" for b in chunk)
-                lines.append(f" .byte {hex_str}")
+            if len(audc_bytes):
+                lines.append(byte_lines(audc_bytes))
 
             lines.append(f"{label_end}")
             lines.append("")
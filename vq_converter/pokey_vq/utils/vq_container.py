@@ -0,0 +1,231 @@
+"""
+pokey_vq/utils/vq_container.py - Binary container for converter output.
+
+The MADS .asm files are the assembler's input, but re-tokenizing their
+.byte lines is slow for in-process consumers (tracker player, banking
+build). The converter therefore also writes VQ_DATA.bin: the same bytes
+in one memory-mappable file.
+
+Layout (little endian):
+    0   4   magic b"PVQB"
+    4   4   format version (u32)
+    8   4   JSON header length (u32)
+    12  N   JSON header (utf-8)
+    ... zero padding to SECTION_ALIGN
+    sections, each starting SECTION_ALIGN-aligned
+
+JSON header:
+    "sections": {name: [offset, length]}  offsets relative to file start
+        codebook     VQ_BLOB bytes (as exported, AUDC-ready)
+        vq_lens      VQ_LENS table (256 bytes)
+        vq_offsets   codebook byte offset per vector (u16 LE, 256 entries)
+        indices      VQ_INDICES stream
+        raw          RAW instrument blocks (page-aligned, concatenated)
+    "samples": per instrument, in instrument order
+        {"mode": "VQ", "index_start", "index_end"}
+        {"mode": "RAW", "raw_offset", "raw_length"}   (relative to "raw")
+    any extra metadata passed by the writer (rate, vector size, ...)
+"""
+
+import os
+import json
+import mmap
+import struct
+
+CONTAINER_FILE = "VQ_DATA.bin"
+MAGIC = b"PVQB"
+FORMAT_VERSION = 1
+SECTION_ALIGN = 256  # page alignment keeps RAW blocks page-aligned in the file
+
+_PREFIX = struct.Struct("<4sII")
+SECTION_NAMES = ("codebook", "vq_lens", "vq_offsets", "indices", "raw")
+
+
+def _align(n, a=SECTION_ALIGN):
+    return (n + a - 1) // a * a
+
+
+def write_container(path, codebook, indices, raw_blocks=None, samples=None,
+                    vq_lens=b"", vq_offsets=b"", meta=None):
+    """
+    Write a VQ_DATA.bin container.
+
+    Args:
+        path: Output file path
+        codebook: VQ_BLOB bytes
+        indices: VQ_INDICES bytes
+        raw_blocks: {inst_idx: bytes} page-aligned RAW data
+        samples: Per-instrument dicts {"mode": "VQ", "index_start",
+                 "index_end"} or {"mode": "RAW"} (RAW offsets are filled in)
+        vq_lens: VQ_LENS bytes
+        vq_offsets: Per-vector codebook offsets as u16 LE bytes
+        meta: Extra JSON-serializable header fields
+
+    Returns:
+        Total file size in bytes.
+    """
+    raw_blocks = raw_blocks or {}
+    samples = [dict(s) for s in (samples or [])]
+
+    raw = bytearray()
+    for i, s in enumerate(samples):
+        if s.get("mode", "VQ").upper() == "RAW":
+            block = bytes(raw_blocks.get(i, b""))
+            s["raw_offset"] = len(raw)
+            s["raw_length"] = len(block)
+            raw += block
+            raw += bytes(_align(len(raw)) - len(raw))
+
+    payloads = {
+        "codebook": bytes(codebook),
+        "vq_lens": bytes(vq_lens),
+        "vq_offsets": bytes(vq_offsets),
+        "indices": bytes(indices),
+        "raw": bytes(raw),
+    }
+
+    # Section offsets depend on the header length and vice versa: lay out
+    # relative to the data start, then fix up once the header size is known.
+    header = dict(meta or {})
+    header["samples"] = samples
+    rel = {}
+    pos = 0
+    for name in SECTION_NAMES:
+        rel[name] = pos
+        pos = _align(pos + len(payloads[name]))
+
+    data_start = 0
+    while True:
+        header["sections"] = {name: [data_start + rel[name], len(payloads[name])]
+                              for name in SECTION_NAMES}
+        blob = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        needed = _align(_PREFIX.size + len(blob))
+        if needed == data_start:
+            break
+        data_start = needed
+
+    # Write-then-rename: a reader may have the old file mapped, and
+    # truncating a mapped file in place faults the reader.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(blob)))
+        f.write(blob)
+        for name in SECTION_NAMES:
+            offset, _length = header["sections"][name]
+            f.write(bytes(offset - f.tell()))
+            f.write(payloads[name])
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return size
+
+
+class VQContainer:
+    """Read-only view of a VQ_DATA.bin container.
+
+    All section accessors return memoryview slices of one underlying
+    buffer (file bytes, or an mmap with use_mmap=True): nothing is parsed
+    or copied. Close (or use as a context manager) to release an mmap;
+    views taken from it must not be used afterwards.
+    """
+
+    def __init__(self, path, use_mmap=False):
+        self.path = path
+        self._file = None
+        self._mmap = None
+        if use_mmap:
+            self._file = open(path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buf = memoryview(self._mmap)
+        else:
+            with open(path, "rb") as f:
+                self._buf = memoryview(f.read())
+
+        if len(self._buf) < _PREFIX.size:
+            self.close()
+            raise ValueError(f"{path}: too short for a VQ container")
+        magic, version, hlen = _PREFIX.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path}: not a v{FORMAT_VERSION} VQ container")
+        end = _PREFIX.size + hlen
+        self.header = json.loads(bytes(self._buf[_PREFIX.size:end]).decode("utf-8"))
+        self.samples = self.header.get("samples", [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            if self._buf is not None:
+                self._buf.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            # Section views still alive: the mapping is released with them
+            pass
+        self._buf = None
+        self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def buffer(self):
+        """The whole container as a memoryview."""
+        return self._buf
+
+    def section(self, name):
+        """memoryview of a section (empty if absent)."""
+        offset, length = self.header.get("sections", {}).get(name, (0, 0))
+        return self._buf[offset:offset + length]
+
+    @property
+    def codebook(self):
+        return self.section("codebook")
+
+    @property
+    def indices(self):
+        return self.section("indices")
+
+    @property
+    def vq_lens(self):
+        return self.section("vq_lens")
+
+    def is_raw(self, inst_idx):
+        return self.samples[inst_idx].get("mode", "VQ").upper() == "RAW"
+
+    def vq_stream(self, inst_idx):
+        """Index stream slice of a VQ instrument."""
+        s = self.samples[inst_idx]
+        return self.section("indices")[s.get("index_start", 0):s.get("index_end", 0)]
+
+    def raw_block(self, inst_idx):
+        """Page-aligned AUDC bytes of a RAW instrument."""
+        s = self.samples[inst_idx]
+        off = s.get("raw_offset", 0)
+        return self.section("raw")[off:off + s.get("raw_length", 0)]
+
+    def vq_streams(self):
+        """{inst_idx: memoryview} for VQ instruments with a non-empty stream."""
+        return {i: self.vq_stream(i) for i in range(len(self.samples))
+                if not self.is_raw(i) and self.samples[i].get("index_end", 0)
+                > self.samples[i].get("index_start", 0)}
+
+    def raw_blocks(self):
+        """{inst_idx: memoryview} for RAW instruments."""
+        return {i: self.raw_block(i) for i in range(len(self.samples))
+                if self.is_raw(i) and self.samples[i].get("raw_length", 0)}
+
+
+def open_container(output_dir, use_mmap=False):
+    """Open output_dir/VQ_DATA.bin, or return None if absent/invalid."""
+    path = os.path.join(output_dir, CONTAINER_FILE)
+    if not os.path.isfile(path):
+        return None
+    try:
+        return VQContainer(path, use_mmap=use_mmap)
+    except (OSError, ValueError):
+        return None